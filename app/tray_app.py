@@ -10,9 +10,33 @@ from typing import Optional
 import pystray
 from PIL import Image, ImageDraw
 from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver
 
-from service.file_rename_handler import FileRenameHandler
-from utils.config_manager import WatchRule, get_wait_time, get_watch_rules
+from service.bundler import Bundler
+from service.collision import VersionIndex
+from service.content_hash import HashCache
+from service.content_sniff import ContentSniffer
+from service.file_rename_handler import FileRenameHandler, reports_close_write
+from service.io_scheduler import DeviceScheduler
+from service.readiness import ReadinessEstimator
+from service.retry_scheduler import RetryScheduler
+from service.stream_compression import CompressionPool
+from service.target_index import TargetIndex, TargetIndexEventHandler
+from service.target_layout import DirectoryCache
+from service.target_manifest import ManifestRegistry
+from service.target_spool import TargetSpool
+from service.throttle import ThrottleRegistry
+from service.transfer_ledger import TransferLedger
+from utils.config_manager import (
+    WatchRule,
+    get_handler_settings,
+    get_ledger_settings,
+    get_retry_settings,
+    get_spool_settings,
+    get_wait_time,
+    get_watch_rules,
+)
+from utils.log_aggregator import LogAggregator, create_log_aggregator
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +48,14 @@ class TrayApp:
         self.watch_rules: list[WatchRule] = get_watch_rules()
         self.observer: Optional[Observer] = None  # type: ignore[assignment]
         self.icon: Optional[pystray.Icon] = None  # type: ignore[assignment]
+        self.ledger: Optional[TransferLedger] = None
+        self.log_summary: Optional[LogAggregator] = None
+        self.retry_scheduler: Optional[RetryScheduler] = None
+        self.spool: Optional[TargetSpool] = None
+        self.io_scheduler: Optional[DeviceScheduler] = None
+        self.compressor: Optional[CompressionPool] = None
+        self.bundler: Optional[Bundler] = None
+        self.handlers: list[tuple[FileRenameHandler, Path]] = []
         self._validate_watch_rules()
 
     def _validate_watch_rules(self) -> None:
@@ -44,19 +76,51 @@ class TrayApp:
 
     def _reject_move_loops(self) -> None:
         """移動先が監視フォルダと同一の場合は無限ループになるため終了する"""
-        sources = {rule.source.resolve() for rule in self.watch_rules}
-        looped = [
-            target.directory
-            for rule in self.watch_rules
-            for target in rule.targets
-            if target.directory.resolve() in sources
-        ]
+        looped = []
+        nested = []
+        for rule in self.watch_rules:
+            for target in rule.targets:
+                watched = self._watched_as(target.directory.resolve())
+                if watched == "source":
+                    looped.append(target.directory)
+                elif watched == "nested":
+                    # サブディレクトリも監視する場合は、配下の移動先も監視対象になる
+                    nested.append(target.directory)
 
-        if looped:
+        if looped or nested:
             for directory in looped:
                 logger.error(f"移動先が監視フォルダと同一です: {directory}")
+            for directory in nested:
+                logger.error(f"移動先がサブディレクトリも監視するフォルダの配下です: {directory}")
             sys.exit(1)
 
+    def _watched_as(self, directory: Path) -> Optional[str]:
+        """フォルダが監視されるかを返す
+
+        source: 監視元そのもの / nested: 監視元のサブディレクトリとして監視される /
+        None: 監視されない。監視元のパターンを指定した場合は一致するフォルダを監視元とする。
+        """
+        watched = None
+        for rule in self.watch_rules:
+            base = rule.source.resolve()
+            if not directory.is_relative_to(base):
+                continue
+            if rule.source_glob is None:
+                relative = "" if directory == base else directory.relative_to(base).as_posix()
+            else:
+                # パターンより前のディレクトリ自体は監視元ではない
+                split = None
+                if directory != base:
+                    split = rule.source_glob.split(directory.relative_to(base).as_posix())
+                if split is None:
+                    continue
+                relative = split[1]
+            if not relative:
+                return "source"
+            if rule.recursive:
+                watched = "nested"
+        return watched
+
     def _create_icon_image(self) -> Image.Image:
         """タスクトレイ用のアイコン画像を作成"""
         # 64x64の画像を作成
@@ -114,28 +178,238 @@ class TrayApp:
     def start_watching(self) -> None:
         """ファイル監視を開始"""
         wait_time = get_wait_time()
+        settings = get_handler_settings()
+        self.ledger = self._open_ledger()
+        self.log_summary = create_log_aggregator()
+        self.log_summary.start()
+        self.retry_scheduler = self._create_retry_scheduler()
+        target_index = (
+            TargetIndex(settings.target_index_refresh) if settings.target_index else None
+        )
+        # 退避した分を届ける時の keep_both の連番も全ての監視元と共有する
+        versions = VersionIndex()
+        # 移動先ごとの同時転送数・転送量の制限は全ての監視元で共有する
+        throttles = ThrottleRegistry()
+        hash_cache = HashCache(settings.hash_cache_size)
+        manifests = ManifestRegistry()
+        self.spool = self._open_spool(target_index, versions, throttles, manifests)
+        directories = DirectoryCache()
+        sniffer = ContentSniffer(settings.sniff_bytes, settings.sniff_cache_size)
+        self.compressor = CompressionPool(settings.compression_workers)
+        self.bundler = self._start_bundler(
+            settings.bundle_dir, throttles, target_index, manifests, versions
+        )
+        if settings.workers_per_device > 0:
+            self.io_scheduler = DeviceScheduler(settings.workers_per_device)
         observer = Observer()
+        close_events = settings.close_write and reports_close_write(observer)
+        if close_events:
+            logger.info("書き込み完了をファイルのクローズの通知で判定します")
 
         handlers = []
         for rule in self.watch_rules:
-            event_handler = FileRenameHandler(list(rule.targets), wait_time)
-            observer.schedule(event_handler, str(rule.source), recursive=False)
-            logger.info(f"フォルダ監視を開始しました: {rule.source}")
+            event_handler = FileRenameHandler(
+                list(rule.targets),
+                wait_time,
+                ledger=self.ledger,
+                log_summary=self.log_summary,
+                negative_cache_size=settings.negative_cache_size,
+                negative_cache_dir=settings.negative_cache_dir,
+                early_rule_check=settings.early_rule_check,
+                retry_scheduler=self.retry_scheduler,
+                spool=self.spool,
+                throttles=throttles,
+                io_scheduler=self.io_scheduler,
+                fanout=rule.fanout,
+                hash_cache=hash_cache,
+                manifests=manifests,
+                compressor=self.compressor,
+                bundler=self.bundler,
+                directories=directories,
+                target_index=target_index,
+                versions=versions,
+                sniffer=sniffer,
+                close_events=close_events,
+                ignore=rule.ignore,
+                source=rule.source,
+                recursive=rule.recursive,
+                source_glob=rule.source_glob,
+                # 書き込みの傾向は監視元ごとに異なるため、学習結果は共有しない
+                # （パターンで指定した監視元は同じ用途のフォルダのため、まとめて学習する）
+                readiness=(
+                    ReadinessEstimator(wait_time, settings.wait_min, settings.wait_max)
+                    if settings.adaptive_wait
+                    else None
+                ),
+            )
+            if self.retry_scheduler is not None:
+                self.retry_scheduler.register(rule.source, event_handler.retry_file)
+            if rule.source_glob is None:
+                observer.schedule(event_handler, str(rule.source), recursive=rule.recursive)
+                logger.info(f"フォルダ監視を開始しました: {rule.source}")
+            else:
+                # 一致するフォルダごとではなく、パターンより前のディレクトリを1つの監視で
+                # 受け持つ（後から作られたフォルダも監視し直さずに対象になる）
+                observer.schedule(event_handler, str(rule.source), recursive=True)
+                logger.info(
+                    f"フォルダ監視を開始しました: {rule.source / rule.source_glob.pattern}"
+                )
             handlers.append((event_handler, rule.source))
 
+        if target_index is not None and settings.target_index_watch:
+            self._watch_targets(observer, target_index)
+
         self.observer = observer
+        self.handlers = handlers
         observer.start()
+        if self.retry_scheduler is not None:
+            self.retry_scheduler.start()
 
         # 取りこぼしを防ぐため、監視開始後に既存ファイルを処理する
         for event_handler, source in handlers:
             event_handler.process_existing_files(source)
 
+    def _watch_targets(self, observer: BaseObserver, target_index: TargetIndex) -> None:
+        """移動先ディレクトリを監視し、他のプロセスによる変更をファイル名の一覧に反映する"""
+        handler = TargetIndexEventHandler(target_index)
+        directories = {target.directory for rule in self.watch_rules for target in rule.targets}
+        for directory in sorted(directories):
+            if not directory.is_dir():
+                continue
+            # layoutN のサブディレクトリも含めて監視する
+            observer.schedule(handler, str(directory), recursive=True)
+            logger.info(f"移動先の一覧の更新のため監視します: {directory}")
+
+    def _open_ledger(self) -> Optional[TransferLedger]:
+        """設定が有効なら移動記録の台帳を開く（開けない場合は記録せずに続行）"""
+        settings = get_ledger_settings()
+        if not settings.enabled:
+            return None
+
+        ledger = TransferLedger(settings.db_path, settings.retention_days)
+        try:
+            ledger.start()
+        except Exception as e:
+            logger.error(f"移動記録を開けませんでした: {settings.db_path}, エラー: {e}")
+            return None
+        return ledger
+
+    def _open_spool(
+        self,
+        target_index: Optional[TargetIndex] = None,
+        versions: Optional[VersionIndex] = None,
+        throttles: Optional[ThrottleRegistry] = None,
+        manifests: Optional[ManifestRegistry] = None,
+    ) -> Optional[TargetSpool]:
+        """設定が有効なら到達できない移動先への退避を開始する"""
+        settings = get_spool_settings()
+        if not settings.enabled:
+            return None
+
+        spool = TargetSpool(
+            settings.spool_dir,
+            settings.max_bytes,
+            probe_base_delay=settings.probe_base_delay,
+            probe_max_delay=settings.probe_max_delay,
+            flush_workers=settings.flush_workers,
+            ledger=self.ledger,
+            target_index=target_index,
+            versions=versions,
+            throttles=throttles,
+            manifests=manifests,
+        )
+        # 退避したファイルも通常の移動と同じ制限・検証・マニフェストの指定で送る
+        spool.start([target for rule in self.watch_rules for target in rule.targets])
+        return spool
+
+    def _start_bundler(
+        self,
+        bundle_dir: Path,
+        throttles: ThrottleRegistry,
+        target_index: Optional[TargetIndex] = None,
+        manifests: Optional[ManifestRegistry] = None,
+        versions: Optional[VersionIndex] = None,
+    ) -> Optional[Bundler]:
+        """bundle_secondsN を指定した移動先があれば、まとめて送る処理を開始する"""
+        rules = [target for rule in self.watch_rules for target in rule.targets]
+        if not any(target.bundle_seconds > 0 for target in rules):
+            return None
+
+        bundler = Bundler(
+            bundle_dir,
+            compressor=self.compressor,
+            throttles=throttles,
+            target_index=target_index,
+            manifests=manifests,
+            versions=versions,
+        )
+        bundler.start(rules)
+        return bundler
+
+    def _create_retry_scheduler(self) -> Optional[RetryScheduler]:
+        """設定が有効なら移動失敗時の再試行スケジューラを生成する"""
+        settings = get_retry_settings()
+        if not settings.enabled:
+            return None
+
+        return RetryScheduler(
+            settings.state_path,
+            quarantine_dir=settings.quarantine_dir,
+            max_attempts=settings.max_attempts,
+            base_delay=settings.base_delay,
+            max_delay=settings.max_delay,
+        )
+
     def stop_watching(self) -> None:
         """ファイル監視を停止"""
         if self.observer:
             self.observer.stop()
             self.observer.join()
             logger.info("フォルダ監視を停止しました")
+        for event_handler, source in self.handlers:
+            event_handler.save_unmatched()
+            stats = event_handler.stats()
+            logger.info(
+                f"書き込み完了の判定（{source}）: クローズの通知 {stats['close_write']}件"
+                f" / 更新なし {stats['settled']}件 / 待機 {stats['polled']}件"
+                f" / 準備できず {stats['not_ready']}件"
+            )
+            if event_handler.readiness is not None:
+                for ext, profile in event_handler.readiness.stats().items():
+                    logger.debug(
+                        f"学習した書き込み完了までの時間（{source}, {ext or '拡張子なし'}）:"
+                        f" {profile['settle']:.2f}秒 / {profile['samples']:.0f}件"
+                    )
+        self.handlers = []
+        if self.retry_scheduler is not None:
+            self.retry_scheduler.close()
+            self.retry_scheduler = None
+        if self.io_scheduler is not None:
+            # キューに積まれた移動を終えてから、退避・記録を閉じる
+            self.io_scheduler.close()
+            self.io_scheduler = None
+        if self.bundler is not None:
+            # 溜めているファイルを送り切ってから圧縮スレッドを止める
+            self.bundler.close()
+            self.bundler = None
+        if self.compressor is not None:
+            self.compressor.close()
+            self.compressor = None
+        if self.spool is not None:
+            for directory, stats in self.spool.stats().items():
+                if stats["spooled_files"]:
+                    logger.warning(
+                        f"退避中のファイルを残して終了します: {stats['spooled_files']}件"
+                        f"（移動先: {directory}）"
+                    )
+            self.spool.close()
+            self.spool = None
+        if self.log_summary is not None:
+            self.log_summary.close()
+            self.log_summary = None
+        if self.ledger is not None:
+            self.ledger.close()
+            self.ledger = None
 
     def run(self) -> None:
         """アプリケーションを実行"""
@@ -0,0 +1,82 @@
+"""配信時の圧縮のスループットと圧縮率を形式・レベルごとに計測する
+
+使用例:
+    python -m benchmarks.bench_compression
+    python -m benchmarks.bench_compression --input C:\\path\\to\\sample.log --workers 4
+
+--input を指定しない場合は、ログのような圧縮の効くデータを生成して計測する。
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import measure, print_table
+from service.stream_compression import CompressionPool, compress_file, zstd_available
+
+LEVELS = {"gzip": [1, 6, 9], "zstd": [1, 3, 9, 19]}
+
+
+def make_sample(path: Path, size: int) -> Path:
+    """ログのような、単語の繰り返しが多いデータを生成する"""
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(2000)]
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        while written < size:
+            line = f"2026-10-19 12:00:{rng.randrange(60):02d} INFO " + " ".join(
+                rng.choices(words, k=12)
+            )
+            written += f.write(line + "\n")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="圧縮のスループットと圧縮率を計測します")
+    parser.add_argument("--input", type=Path, help="計測に使うファイル（既定: 生成したデータ）")
+    parser.add_argument("--size-mb", type=int, default=64, help="生成するデータの大きさ（MB）")
+    parser.add_argument("--workers", type=int, default=0, help="圧縮スレッド数（0でコア数）")
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返し回数（既定: 3）")
+    args = parser.parse_args(argv)
+
+    codecs = ["gzip"] + (["zstd"] if zstd_available() else [])
+    pool = CompressionPool(args.workers)
+    rows = []
+    with tempfile.TemporaryDirectory() as work:
+        source = args.input or make_sample(Path(work) / "sample.log", args.size_mb * 1024 * 1024)
+        size = source.stat().st_size
+        for codec in codecs:
+            for level in LEVELS[codec]:
+                dst = Path(work) / f"out.{codec}{level}"
+                seconds = measure(
+                    lambda codec=codec, level=level, dst=dst: compress_file(
+                        source, dst, codec, level, pool
+                    ),
+                    args.repeat,
+                )
+                compressed = dst.stat().st_size
+                rows.append(
+                    [
+                        codec,
+                        str(level),
+                        f"{size / seconds / 1024 / 1024:.0f} MB/s",
+                        f"{compressed / size * 100:.1f}%",
+                    ]
+                )
+                dst.unlink()
+    pool.close()
+
+    print(
+        f"入力: {size / 1024 / 1024:.0f} MB / スレッド: {pool.workers}"
+        f" / 繰り返し: {args.repeat}回"
+    )
+    if not zstd_available():
+        print("zstd は使えないため計測していません")
+    print_table(["形式", "レベル", "スループット", "圧縮後の大きさ"], rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""移動先でのファイル名の組み立てにかかる時間を、方式ごとに1件あたりで計測する
+
+使用例:
+    python -m benchmarks.bench_rename
+    python -m benchmarks.bench_rename --count 200000 --repeat 5
+
+比較する方式:
+    suffix      サフィックスを付ける従来の方式（_build_target_name）
+    template    設定の読み込み時に解析済みのテンプレート（RenameTemplate.render）
+    format      ファイルごとにテンプレート文字列を str.format で解析し直す方式
+"""
+
+import argparse
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from benchmarks.common import measure, print_table
+from service.file_rename_handler import FileRenameHandler
+from utils.config_manager import TargetRule
+from utils.rename_template import RenameTemplate
+
+TEMPLATE = "{date:%Y%m%d}_{g1}_{counter:06d}{ext}"
+REGEX = re.compile(r"^(\w+)-(\d+)")
+
+
+def make_names(count: int) -> list[Path]:
+    """regex に一致する、件数分のファイル名を作る"""
+    return [Path(f"invoice-{i:06d}.pdf") for i in range(count)]
+
+
+def naive_render(path: Path) -> str:
+    """比較用: 毎回テンプレートを解析し、正規表現にも一致させて組み立てる"""
+    match = REGEX.search(path.name)
+    counter = naive_render.counter = getattr(naive_render, "counter", 0) + 1
+    return TEMPLATE.format(
+        date=datetime.now(), g1=match.group(1), counter=counter, ext=path.suffix
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ファイル名の組み立ての時間を計測します")
+    parser.add_argument("--count", type=int, default=100000, help="組み立てる件数（既定: 100000）")
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返し回数（既定: 3）")
+    args = parser.parse_args(argv)
+
+    names = make_names(args.count)
+    suffix_rule = TargetRule(
+        directory=Path("target"),
+        filenames=frozenset(),
+        suffix="_renamed",
+        pattern=re.compile("_renamed$"),
+    )
+    template_rule = TargetRule(
+        directory=Path("target"),
+        filenames=frozenset(),
+        suffix="",
+        pattern=None,
+        filename_regex=REGEX,
+        template=RenameTemplate(TEMPLATE, REGEX),
+    )
+    with patch.object(FileRenameHandler, "_ensure_target_dirs"):
+        handler = FileRenameHandler([suffix_rule], wait_time=0)
+
+    cases = {
+        "suffix": lambda: [handler._build_target_name(path, suffix_rule) for path in names],
+        "template": lambda: [handler._build_target_name(path, template_rule) for path in names],
+        "format": lambda: [naive_render(path) for path in names],
+    }
+    rows = []
+    for label, func in cases.items():
+        seconds = measure(func, args.repeat)
+        rows.append(
+            [
+                label,
+                f"{seconds / args.count * 1e6:.2f} µs",
+                f"{args.count / seconds:,.0f} 件/秒",
+            ]
+        )
+
+    print(f"件数: {args.count} / テンプレート: {TEMPLATE} / 繰り返し: {args.repeat}回")
+    print_table(["方式", "1件あたり", "スループット"], rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
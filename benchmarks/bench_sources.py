@@ -0,0 +1,154 @@
+"""多数の監視元を監視し始めるまでの時間とメモリを、監視元の指定方法ごとに計測する
+
+使用例:
+    python -m benchmarks.bench_sources
+    python -m benchmarks.bench_sources --sources 5000 --repeat 1
+
+比較する方式:
+    per-source  監視元ごとに [WatchN] を書いた場合（ハンドラ・監視を監視元の数だけ作る）
+    handlers    per-source のうち、ハンドラの作成と既存ファイルの確認のみ（監視は登録しない）
+    glob        processing_dir = drops/* のように1つのパターンで指定した場合
+                （ハンドラ・監視は1つで、パターンより前のディレクトリを監視する）
+
+それぞれ、ハンドラの作成・監視の登録・開始・既存ファイルの確認（空のフォルダ）までの
+時間と、その間に確保したメモリ（tracemalloc）・増えたスレッド数を表示する。
+Linux では監視1つにつき inotify のインスタンスを1つ使うため、per-source は
+上限（fs.inotify.max_user_instances、既定128）を超えると開始できない。その場合も
+handlers で監視以外の分の時間・メモリは比べられる。
+"""
+
+import argparse
+import re
+import sys
+import tempfile
+import threading
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Optional
+
+from watchdog.observers import Observer
+
+from benchmarks.common import measure, print_table
+from service.file_rename_handler import FileRenameHandler
+from utils.config_manager import TargetRule
+from utils.source_glob import SourceGlob
+
+TARGET_COUNT = 3
+
+
+def make_sources(base: Path, count: int) -> list[Path]:
+    """監視元のフォルダを件数分作る"""
+    sources = [base / f"PC-{i:05d}" for i in range(count)]
+    for source in sources:
+        source.mkdir(parents=True)
+    return sources
+
+
+def make_targets(directory: Path) -> list[TargetRule]:
+    """正規表現で振り分ける移動先と、全ファイルを受け入れる移動先"""
+    rules = [
+        TargetRule(
+            directory=directory / f"target{i}",
+            filenames=frozenset(),
+            suffix="",
+            pattern=None,
+            filename_regex=re.compile(rf"\.ext{i}$"),
+        )
+        for i in range(TARGET_COUNT - 1)
+    ]
+    rules.append(
+        TargetRule(directory=directory / "other", filenames=frozenset(), suffix="", pattern=None)
+    )
+    return rules
+
+
+def start_per_source(
+    observer: Observer, sources: list[Path], targets: list[TargetRule], watch: bool = True
+) -> list[FileRenameHandler]:
+    handlers = []
+    for source in sources:
+        handler = FileRenameHandler(list(targets), wait_time=0, source=source)
+        if watch:
+            observer.schedule(handler, str(source), recursive=False)
+        handlers.append((handler, source))
+    if watch:
+        observer.start()
+    for handler, source in handlers:
+        handler.process_existing_files(source)
+    return [handler for handler, _ in handlers]
+
+
+def start_glob(
+    observer: Observer, base: Path, targets: list[TargetRule]
+) -> list[FileRenameHandler]:
+    handler = FileRenameHandler(
+        list(targets), wait_time=0, source=base, source_glob=SourceGlob("PC-*")
+    )
+    observer.schedule(handler, str(base), recursive=True)
+    observer.start()
+    handler.process_existing_files(base)
+    return [handler]
+
+
+def run_case(start: Callable[[Observer], list[FileRenameHandler]], repeat: int) -> list[str]:
+    """開始までの時間・メモリ・スレッド数を計測する（開始できない場合は理由を返す）"""
+    running: list[Observer] = []
+    # 計測したメモリに含めるため、停止するまでハンドラを保持しておく
+    handlers: list[FileRenameHandler] = []
+
+    def stop() -> None:
+        handlers.clear()
+        while running:
+            observer = running.pop()
+            observer.stop()
+            if observer.is_alive():
+                observer.join()
+
+    def func() -> None:
+        observer = Observer()
+        running.append(observer)
+        handlers.extend(start(observer))
+
+    threads_before = threading.active_count()
+    try:
+        seconds = measure(func, repeat, setup=stop)
+        threads = threading.active_count() - threads_before
+        stop()
+
+        tracemalloc.start()
+        func()
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stop()
+    except OSError as e:
+        stop()
+        return ["-", "-", "-", f"開始できません（{e}）"]
+    return [f"{seconds * 1000:.0f} ms", f"{memory / 1024 / 1024:.1f} MB", str(threads), ""]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="監視元の数に対する開始時間とメモリを計測します")
+    parser.add_argument("--sources", type=int, default=2000, help="監視元の数（既定: 2000）")
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返し回数（既定: 3）")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp:
+        base = Path(temp) / "drops"
+        sources = make_sources(base, args.sources)
+        targets = make_targets(Path(temp))
+        cases = {
+            "per-source": lambda observer: start_per_source(observer, sources, targets),
+            "handlers": lambda observer: start_per_source(
+                observer, sources, targets, watch=False
+            ),
+            "glob": lambda observer: start_glob(observer, base, targets),
+        }
+        rows = [[label, *run_case(start, args.repeat)] for label, start in cases.items()]
+
+    print(f"監視元: {args.sources}フォルダ / 移動先: {TARGET_COUNT}件 / 繰り返し: {args.repeat}回")
+    print_table(["方式", "開始まで", "メモリ", "スレッド", "備考"], rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""ベンチマーク共通の計測ヘルパー"""
+
+import os
+import time
+from pathlib import Path
+from typing import Callable
+
+
+def make_file(path: Path, size: int) -> Path:
+    """ランダムな内容で指定サイズのファイルを作る"""
+    chunk = os.urandom(min(size, 1024 * 1024))
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            written = f.write(chunk[:remaining])
+            remaining -= written
+    return path
+
+
+def measure(
+    func: Callable[[], object],
+    repeat: int = 5,
+    setup: Callable[[], object] | None = None,
+) -> float:
+    """func を repeat 回実行し、最も速かった回の秒数を返す（setup は計測に含めない）"""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def print_table(headers: list[str], rows: list[list[str]]) -> None:
+    """結果を列を揃えて表示する"""
+    widths = [max(len(h), *(len(r[i]) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths, strict=True)))
+    for row in rows:
+        print("  ".join(value.ljust(w) for value, w in zip(row, widths, strict=True)))
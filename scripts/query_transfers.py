@@ -0,0 +1,60 @@
+"""移動記録（SQLite台帳）を検索するコマンド
+
+使用例:
+    python -m scripts.query_transfers --name report.md
+    python -m scripts.query_transfers --since 2026-10-13 --until 2026-10-14
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from service.transfer_ledger import query_transfers
+from utils.config_manager import get_ledger_settings
+
+
+def parse_time(value: str) -> float:
+    """YYYY-MM-DD または YYYY-MM-DDTHH:MM[:SS] をUNIX時刻に変換"""
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ファイルの移動記録を検索します")
+    parser.add_argument("--name", help="移動元のファイル名（大文字小文字を区別しない）")
+    parser.add_argument("--source", help="移動元ディレクトリ")
+    parser.add_argument("--target", help="移動先ディレクトリ")
+    parser.add_argument("--since", type=parse_time, help="この日時以降（例: 2026-10-13）")
+    parser.add_argument("--until", type=parse_time, help="この日時より前（例: 2026-10-14）")
+    parser.add_argument("--limit", type=int, default=100, help="最大表示件数（既定: 100）")
+    parser.add_argument("--db", type=Path, help="台帳ファイル（既定: config.ini の db_path）")
+    args = parser.parse_args(argv)
+
+    db_path = args.db if args.db is not None else get_ledger_settings().db_path
+    if not db_path.exists():
+        print(f"移動記録が見つかりません: {db_path}", file=sys.stderr)
+        return 1
+
+    records = query_transfers(
+        db_path,
+        name=args.name,
+        source=args.source,
+        target=args.target,
+        since=args.since,
+        until=args.until,
+        limit=args.limit,
+    )
+    for record in records:
+        moved_at = datetime.fromtimestamp(record.moved_at).strftime("%Y-%m-%d %H:%M:%S")
+        target = Path(record.target) / record.target_name
+        line = f"{moved_at}\t{record.status}\t{Path(record.source) / record.name}\t{target}"
+        if record.digest is not None:
+            line += f"\t{record.digest}"
+        print(line)
+
+    print(f"{len(records)}件", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from service.collision import (
+    COLLISION_KEEP_BOTH,
+    COLLISION_SKIP_IF_NEWER,
+    VersionIndex,
+)
+from service.file_transfer import move_file
+from service.stream_compression import EXTENSIONS, CompressionPool, compress_file, resolve_codec
+from service.target_index import TargetIndex
+from service.target_manifest import ManifestRegistry
+from service.throttle import ThrottleRegistry
+from utils.config_manager import TargetRule
+
+logger = logging.getLogger(__name__)
+
+# 溜めているファイルのディレクトリに置く、移動先を記録したファイル
+TARGET_MARKER = ".target"
+# 送信中のファイルを移す先のディレクトリ名の接尾辞
+FLUSHING_SUFFIX = ".flushing"
+
+
+@dataclass
+class PendingBundle:
+    """1つの移動先へまとめて送るために溜めているファイル"""
+
+    rule: TargetRule
+    staging_dir: Path
+    files: int = 0
+    bytes: int = 0
+    # 最初のファイルを溜めた時刻（time.monotonic）。空の場合はNone
+    started_at: Optional[float] = None
+    sequence: int = 0
+    # 溜める処理と、送信のために溜めたファイルを切り離す処理の排他
+    staging_lock: threading.Lock = field(default_factory=threading.Lock)
+    flush_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class Bundler:
+    """小さなファイルを移動先ごとに溜め、1つの tar（と索引）にまとめて届ける
+
+    溜めたファイルは staging_dir 配下に移動先ごとのディレクトリを作って保存するため、
+    再起動後も引き継がれる。ルールの bundle_seconds 秒が経つか bundle_max_bytes に
+    達したら、ルールの compress に従って圧縮した tar として送る。manifestN を指定した
+    移動先では、届けた tar と索引をマニフェストに追記する。
+    """
+
+    def __init__(
+        self,
+        staging_dir: Path,
+        compressor: Optional[CompressionPool] = None,
+        throttles: Optional[ThrottleRegistry] = None,
+        target_index: Optional[TargetIndex] = None,
+        manifests: Optional[ManifestRegistry] = None,
+        versions: Optional[VersionIndex] = None,
+    ) -> None:
+        self.staging_dir: Path = staging_dir
+        self.compressor: CompressionPool = compressor or CompressionPool()
+        self.throttles: ThrottleRegistry = throttles or ThrottleRegistry()
+        # 届けた tar と索引を移動先のファイル名の一覧に反映する（無効な場合はNone）
+        self.target_index: Optional[TargetIndex] = target_index
+        # 未指定の場合はまとめて送る処理の間でのみ移動先ごとのマニフェストを共有する
+        self.manifests: ManifestRegistry = manifests or ManifestRegistry()
+        # keep_both で溜めている同じ名前のファイルと重ならない連番を決める
+        self.versions: VersionIndex = versions or VersionIndex()
+        self._pending: dict[str, PendingBundle] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, rules: list[TargetRule]) -> None:
+        """前回溜めたままのファイルを読み込み、送信スレッドを開始する"""
+        with self._condition:
+            for rule in rules:
+                if rule.bundle_seconds > 0:
+                    self._bundle_for(rule)
+        self._load()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="Bundler", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """送信スレッドを停止し、溜めているファイルを全て送る"""
+        if self._thread is not None:
+            with self._condition:
+                self._stopping = True
+                self._condition.notify()
+            self._thread.join()
+            self._thread = None
+        for bundle in list(self._pending.values()):
+            self._flush(bundle)
+
+    def add(self, path: Path, rule: TargetRule, target_name: str) -> Optional[str]:
+        """ファイルを溜め、tar 内での名前を返す（移動元からは取り除かれる）
+
+        同じ名前のファイルを溜めている場合はルールの collision に従う。skip_if_newer で
+        溜めているものの方が新しい場合は溜めずにNoneを返す（移動元はそのまま残る）。
+        """
+        size = path.stat().st_size
+        with self._condition:
+            bundle = self._bundle_for(rule)
+
+        with bundle.staging_lock:
+            bundle.staging_dir.mkdir(parents=True, exist_ok=True)
+            marker = bundle.staging_dir / TARGET_MARKER
+            if not marker.exists():
+                marker.write_text(str(rule.directory), encoding="utf-8")
+            staged_path = bundle.staging_dir / target_name
+            replaced = None
+            if staged_path.exists():
+                if rule.collision == COLLISION_KEEP_BOTH:
+                    staged_path = self.versions.next_path(staged_path, Path.exists)
+                elif rule.collision == COLLISION_SKIP_IF_NEWER and (
+                    staged_path.stat().st_mtime_ns >= path.stat().st_mtime_ns
+                ):
+                    return None
+                else:
+                    replaced = staged_path.stat().st_size
+            shutil.move(str(path), str(staged_path))
+
+            with self._condition:
+                # overwrite の場合、同じ名前のファイルは後から来たものに置き換わる
+                if replaced is None:
+                    bundle.files += 1
+                else:
+                    bundle.bytes -= replaced
+                bundle.bytes += size
+                if bundle.started_at is None:
+                    bundle.started_at = time.monotonic()
+                self._condition.notify()
+        return staged_path.name
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """移動先ごとの溜めているファイル数とバイト数を返す"""
+        with self._condition:
+            return {
+                key: {"files": bundle.files, "bytes": bundle.bytes}
+                for key, bundle in self._pending.items()
+            }
+
+    def _bundle_for(self, rule: TargetRule) -> PendingBundle:
+        """移動先の溜め込み状態を取得する（呼び出し元でロックを保持すること）"""
+        key = str(rule.directory)
+        bundle = self._pending.get(key)
+        if bundle is None:
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            bundle = PendingBundle(rule=rule, staging_dir=self.staging_dir / digest)
+            self._pending[key] = bundle
+        return bundle
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                due = self._due_bundles()
+                while not due and not self._stopping:
+                    self._condition.wait(self._next_timeout())
+                    due = self._due_bundles()
+                if self._stopping:
+                    return
+
+            for bundle in due:
+                self._flush(bundle)
+
+    def _due_bundles(self) -> list[PendingBundle]:
+        now = time.monotonic()
+        return [
+            b
+            for b in self._pending.values()
+            if b.started_at is not None
+            and (
+                now - b.started_at >= b.rule.bundle_seconds
+                or b.bytes >= b.rule.bundle_max_bytes > 0
+            )
+        ]
+
+    def _next_timeout(self) -> Optional[float]:
+        deadlines = [
+            b.started_at + b.rule.bundle_seconds
+            for b in self._pending.values()
+            if b.started_at is not None
+        ]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _flush(self, bundle: PendingBundle) -> None:
+        """溜めているファイルを1つの tar にまとめて移動先へ送る"""
+        with bundle.flush_lock:
+            flushing = bundle.staging_dir.with_name(bundle.staging_dir.name + FLUSHING_SUFFIX)
+            with bundle.staging_lock, self._condition:
+                # 前回送れなかった分が無ければ、溜めているファイルを送信用に切り離す
+                if not flushing.exists() and bundle.files and bundle.staging_dir.exists():
+                    bundle.staging_dir.rename(flushing)
+                    bundle.files = 0
+                    bundle.bytes = 0
+                # 切り離せなかったファイルは次の間隔で送る
+                bundle.started_at = time.monotonic() if bundle.files else None
+            if not flushing.exists():
+                return
+
+            try:
+                self._deliver(bundle, flushing)
+            except Exception as e:
+                logger.error(
+                    f"まとめたファイルの送信に失敗しました: {bundle.rule.directory}, エラー: {e}"
+                )
+                with self._condition:
+                    # 次の間隔で送り直す
+                    bundle.started_at = time.monotonic()
+                return
+            shutil.rmtree(flushing, ignore_errors=True)
+
+    def _deliver(self, bundle: PendingBundle, flushing: Path) -> None:
+        files = sorted(_staged_files(flushing), key=lambda p: p.stat().st_mtime_ns)
+        if not files:
+            return
+
+        rule = bundle.rule
+        bundle.sequence += 1
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        name = f"bundle_{stamp}_{os.getpid()}_{bundle.sequence:04d}.tar"
+        tar_path = flushing / f".{name}"
+        throttle = self.throttles.get(rule)
+        try:
+            index = _write_tar(tar_path, files)
+            if rule.compress is not None:
+                codec = resolve_codec(rule.compress)
+                name += EXTENSIONS[codec]
+                target_path = rule.directory / name
+                _, digest = compress_file(
+                    tar_path,
+                    target_path,
+                    codec,
+                    rule.compress_level,
+                    self.compressor,
+                    throttle,
+                    rule.verify,
+                    compute_digest=rule.manifest,
+                )
+            else:
+                target_path = rule.directory / name
+                digest = move_file(
+                    tar_path, target_path, throttle, rule.verify, compute_digest=rule.manifest
+                )
+        finally:
+            # 送れなかった tar は次回作り直す（溜めたファイルに混ざらないよう消す）
+            tar_path.unlink(missing_ok=True)
+
+        # 索引は tar が届いてから置くため、索引があれば tar は揃っている
+        index_path = rule.directory / f"{name}.index.json"
+        temp_index = index_path.with_name(f".{index_path.name}.part")
+        temp_index.write_text(
+            json.dumps({"bundle": name, "files": index}, ensure_ascii=False, indent=1),
+            encoding="utf-8",
+        )
+        os.replace(temp_index, index_path)
+        if self.target_index is not None:
+            self.target_index.add(target_path)
+            self.target_index.add(index_path)
+        if rule.manifest:
+            self.manifests.record(rule.directory, target_path, digest)
+            self.manifests.record(rule.directory, index_path)
+        logger.info(f"ファイルをまとめて送りました: {len(files)}件 -> {target_path}")
+
+    def _load(self) -> None:
+        """前回溜めたままのファイルを読み込み、すぐに送る対象にする"""
+        if not self.staging_dir.exists():
+            return
+
+        for entry in self.staging_dir.iterdir():
+            marker = entry / TARGET_MARKER
+            if not marker.is_file():
+                continue
+            directory = Path(marker.read_text(encoding="utf-8"))
+            files = _staged_files(entry)
+            if not files:
+                continue
+            with self._condition:
+                bundle = self._pending.get(str(directory))
+                if bundle is None:
+                    # 設定から外れた移動先は、圧縮せずにまとめて送る
+                    bundle = self._bundle_for(_fallback_rule(directory))
+                if not entry.name.endswith(FLUSHING_SUFFIX):
+                    bundle.files = len(files)
+                    bundle.bytes = sum(p.stat().st_size for p in files)
+                # 前回の終了時に送れなかった分なので、時間を待たずに送る
+                bundle.started_at = 0.0
+            logger.info(
+                f"溜めたままのファイルを引き継ぎました: {len(files)}件（移動先: {directory}）"
+            )
+
+
+def _staged_files(directory: Path) -> list[Path]:
+    """溜めているファイル（移動先の記録を除く）"""
+    return [p for p in directory.iterdir() if p.is_file() and p.name != TARGET_MARKER]
+
+
+def _write_tar(tar_path: Path, files: list[Path]) -> list[dict[str, object]]:
+    """ファイルを tar にまとめ、各ファイルの位置を記録した索引を返す"""
+    index: list[dict[str, object]] = []
+    with tarfile.open(tar_path, "w", format=tarfile.PAX_FORMAT) as tar:
+        for path in files:
+            info = tar.gettarinfo(str(path), arcname=path.name)
+            with open(path, "rb") as f:
+                tar.addfile(info, f)
+            # データは512バイト単位に詰めて書かれるため、書き込み後の位置から逆算する
+            blocks = -(-info.size // tarfile.BLOCKSIZE)
+            index.append(
+                {
+                    "name": path.name,
+                    "size": info.size,
+                    "mtime": info.mtime,
+                    # 非圧縮の tar 内でのデータの開始位置（この位置から size バイト）
+                    "offset": tar.offset - blocks * tarfile.BLOCKSIZE,
+                }
+            )
+    return index
+
+
+def _fallback_rule(directory: Path) -> TargetRule:
+    return TargetRule(
+        directory=directory, filenames=frozenset(), suffix="", pattern=None, bundle_seconds=1.0
+    )
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# 移動先に同じ名前のファイルがある場合の扱い
+# overwrite: 上書きする / keep_both: 連番を付けて両方残す
+# skip_if_newer: 移動先の方が新しい（または同じ）場合は移動しない
+COLLISION_OVERWRITE = "overwrite"
+COLLISION_KEEP_BOTH = "keep_both"
+COLLISION_SKIP_IF_NEWER = "skip_if_newer"
+
+# 連番付きのファイル名の拡張子を除いた部分（report_12 -> report, 12）
+VERSIONED_STEM = re.compile(r"^(.+)_(\d+)$")
+
+
+def versioned_name(name: str, version: int) -> str:
+    """連番を付けたファイル名（report.csv -> report_1.csv）"""
+    path = Path(name)
+    return f"{path.stem}_{version}{path.suffix}"
+
+
+def _base_name(name: str) -> tuple[str, int]:
+    """連番付きのファイル名を元の名前と連番に分ける（連番が無い場合は0）"""
+    path = Path(name)
+    matched = VERSIONED_STEM.match(path.stem)
+    if matched is None:
+        return name, 0
+    return f"{matched.group(1)}{path.suffix}", int(matched.group(2))
+
+
+@dataclass
+class VersionCounters:
+    """1つの移動先ディレクトリの、元の名前ごとの使用済みの最大の連番"""
+
+    counts: dict[str, int] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class VersionIndex:
+    """keep_both で付ける連番を、移動先ディレクトリごとのカウンタから決める
+
+    ディレクトリごとに最初の1回だけ os.scandir で既存の連番を読み取り、以降は
+    カウンタを進めるだけで次の名前が決まる（name_1, name_2, ... を順に確かめない）。
+    他のプロセスが同じ連番を作っていた場合に備え、決めた名前は1回だけ存在を確かめ、
+    使われていれば次の連番に進む。全ての監視元・ワーカーで共有する。
+    連番の付け方は naming（名前と連番から連番付きの名前を作る）と parse（連番付きの
+    名前を元の名前と連番に分ける。連番が無い場合は0）で変えられる。
+    """
+
+    def __init__(
+        self,
+        max_directories: int = 4096,
+        naming: Callable[[str, int], str] = versioned_name,
+        parse: Callable[[str], tuple[str, int]] = _base_name,
+    ) -> None:
+        self.max_directories: int = max_directories
+        self.naming: Callable[[str, int], str] = naming
+        self.parse: Callable[[str], tuple[str, int]] = parse
+        self._directories: OrderedDict[str, VersionCounters] = OrderedDict()
+        self._lock = threading.Lock()
+        self.scans: int = 0
+
+    def next_path(self, path: Path, exists: Callable[[Path], bool]) -> Path:
+        """path と衝突しない、連番を付けた移動先のパスを返す"""
+        counters = self._counters(path.parent)
+        key = os.path.normcase(path.name)
+        with counters.lock:
+            while True:
+                version = counters.counts.get(key, 0) + 1
+                counters.counts[key] = version
+                candidate = path.with_name(self.naming(path.name, version))
+                if not exists(candidate):
+                    return candidate
+                logger.debug(f"連番付きの名前が既に使われています: {candidate}")
+
+    def _counters(self, directory: Path) -> VersionCounters:
+        key = str(directory)
+        with self._lock:
+            counters = self._directories.get(key)
+            if counters is not None:
+                self._directories.move_to_end(key)
+                return counters
+            counters = VersionCounters(self._scan(directory))
+            self._directories[key] = counters
+            if len(self._directories) > self.max_directories:
+                self._directories.popitem(last=False)
+            return counters
+
+    def _scan(self, directory: Path) -> dict[str, int]:
+        """ディレクトリを1回だけ読み、元の名前ごとの最大の連番を求める"""
+        counts: dict[str, int] = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    base, version = self.parse(entry.name)
+                    if version:
+                        base = os.path.normcase(base)
+                        counts[base] = max(counts.get(base, 0), version)
+        except FileNotFoundError:
+            pass
+        self.scans += 1
+        return counts
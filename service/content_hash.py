@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# 内容の比較に使うハッシュ
+HASH_ALGORITHM = "sha256"
+
+
+def file_digest(path: Path) -> str:
+    """ファイルを少しずつ読んでハッシュ値を求める"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, HASH_ALGORITHM).hexdigest()
+
+
+class HashCache:
+    """移動先ファイルのハッシュ値を (パス, サイズ, 更新時刻) ごとに覚えておく
+
+    内容が変わればサイズか更新時刻が変わるため、同じファイルを何度も読まずに済む。
+    max_entries を超えた分は古いものから捨てる。
+    """
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self.max_entries: int = max_entries
+        self._digests: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def digest(self, path: Path) -> str:
+        """ファイルのハッシュ値を返す（内容が変わっていなければ前回の値を使う）"""
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._digests.get(key)
+            if cached is not None:
+                self._digests.move_to_end(key)
+                return cached
+
+        digest = file_digest(path)
+        if self.max_entries > 0:
+            with self._lock:
+                self._digests[key] = digest
+                if len(self._digests) > self.max_entries:
+                    self._digests.popitem(last=False)
+        return digest
+
+    def is_duplicate(self, source: Path, target: Path) -> bool:
+        """移動先に同じ内容のファイルが既にあるか（サイズが違えば読まずにFalse）"""
+        try:
+            target_size = target.stat().st_size
+        except FileNotFoundError:
+            return False
+        if source.stat().st_size != target_size:
+            return False
+        return file_digest(source) == self.digest(target)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import codecs
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+logger = logging.getLogger(__name__)
+
+# 判定に読むファイル先頭の大きさ（tar の ustar は257バイト目にある）
+DEFAULT_HEADER_SIZE = 4096
+
+# (種類, 先頭からの位置, バイト列)。上から順に判定する
+SIGNATURES: tuple[tuple[str, int, bytes], ...] = (
+    ("pdf", 0, b"%PDF-"),
+    ("png", 0, b"\x89PNG\r\n\x1a\n"),
+    ("jpeg", 0, b"\xff\xd8\xff"),
+    ("gif", 0, b"GIF87a"),
+    ("gif", 0, b"GIF89a"),
+    ("tiff", 0, b"II*\x00"),
+    ("tiff", 0, b"MM\x00*"),
+    ("zip", 0, b"PK\x03\x04"),
+    ("zip", 0, b"PK\x05\x06"),
+    ("gzip", 0, b"\x1f\x8b"),
+    ("zstd", 0, b"\x28\xb5\x2f\xfd"),
+    ("bzip2", 0, b"BZh"),
+    ("xz", 0, b"\xfd7zXZ\x00"),
+    ("7z", 0, b"7z\xbc\xaf\x27\x1c"),
+    ("tar", 257, b"ustar"),
+    ("sqlite", 0, b"SQLite format 3\x00"),
+    ("ole", 0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"),
+    ("exe", 0, b"MZ"),
+    ("elf", 0, b"\x7fELF"),
+    ("xml", 0, b"<?xml"),
+)
+# RIFF 形式は8バイト目からの4バイトで種類が決まる
+RIFF_TYPES = {b"WAVE": "wav", b"WEBP": "webp", b"AVI ": "avi"}
+TEXT_BOMS = (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+# キャッシュのキー（パス, サイズ, 更新時刻）
+SniffKey = tuple[str, int, int]
+
+
+def detect(header: bytes) -> Optional[str]:
+    """ファイル先頭のバイト列から種類を判定する（判定できない場合はNone）"""
+    for kind, offset, magic in SIGNATURES:
+        if header.startswith(magic, offset):
+            return kind
+    if header.startswith(b"RIFF") and header[8:12] in RIFF_TYPES:
+        return RIFF_TYPES[header[8:12]]
+    if _is_text(header):
+        return "text"
+    return None
+
+
+def _is_text(header: bytes) -> bool:
+    """NUL を含まない UTF-8（BOM 付きの UTF-16 を含む）ならテキストとみなす"""
+    if not header:
+        return False
+    if header.startswith(TEXT_BOMS):
+        return True
+    if b"\x00" in header:
+        return False
+    try:
+        # 読んだ範囲の末尾で途切れた文字は不正とみなさない
+        codecs.getincrementaldecoder("utf-8")().decode(header, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+class ContentSniffer:
+    """ファイル先頭の決まったバイト数だけを読んで種類を判定し、結果を覚えておく
+
+    読み込みは1ファイルにつき1回（書き込み完了の確認で開いたハンドルがあれば
+    それを使う）。結果は (パス, サイズ, 更新時刻) ごとに max_entries 件まで覚え、
+    同じファイルのイベントが続いたり再試行したりしても読み直さない。
+    """
+
+    def __init__(self, header_size: int = DEFAULT_HEADER_SIZE, max_entries: int = 4096) -> None:
+        self.header_size: int = header_size
+        self.max_entries: int = max_entries
+        self._results: OrderedDict[SniffKey, Optional[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.reads: int = 0
+
+    def sniff(self, path: Path, handle: Optional[BinaryIO] = None) -> Optional[str]:
+        """ファイルの種類を返す（読めない・判定できない場合はNone）"""
+        try:
+            stat = os.fstat(handle.fileno()) if handle is not None else path.stat()
+        except OSError:
+            return None
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        try:
+            header = self._read_header(path, handle)
+        except OSError as e:
+            logger.debug(f"ファイルの種類を判定できませんでした: {path.name}, エラー: {e}")
+            return None
+        kind = detect(header)
+        logger.debug(f"ファイルの種類を判定しました: {path.name} -> {kind or '不明'}")
+
+        with self._lock:
+            self._results[key] = kind
+            if len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return kind
+
+    def _read_header(self, path: Path, handle: Optional[BinaryIO]) -> bytes:
+        self.reads += 1
+        if handle is not None:
+            handle.seek(0)
+            return handle.read(self.header_size)
+        with open(path, "rb") as f:
+            return f.read(self.header_size)
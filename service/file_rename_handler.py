@@ -1,18 +1,52 @@
 from __future__ import annotations
 
 import ctypes
+import hashlib
+import json
 import logging
-import shutil
+import os
+import threading
 import time
-from pathlib import Path
-from typing import Optional
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, fields
+from pathlib import Path, PurePosixPath
+from typing import Callable, Iterator, Optional, Pattern
 
-from watchdog.events import FileSystemEventHandler, FileSystemEvent
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
 
+from service.bundler import Bundler
+from service.collision import (
+    COLLISION_KEEP_BOTH,
+    COLLISION_OVERWRITE,
+    COLLISION_SKIP_IF_NEWER,
+    VersionIndex,
+)
+from service.content_hash import HashCache
+from service.content_sniff import ContentSniffer
+from service.file_transfer import Destination, fan_out_file, move_file
+from service.io_scheduler import DeviceScheduler
+from service.readiness import ReadinessEstimator
+from service.retry_scheduler import RetryScheduler
+from service.stream_compression import EXTENSIONS, CompressionPool, compress_file, resolve_codec
+from service.target_index import TargetIndex
+from service.target_layout import LAYOUT_FLAT, DirectoryCache, shard_dir
+from service.target_manifest import ManifestRegistry
+from service.target_spool import TargetSpool
+from service.throttle import ThrottleRegistry
+from service.transfer_ledger import TransferLedger
 from utils.config_manager import TargetRule
+from utils.log_aggregator import LogAggregator
+from utils.source_glob import SourceGlob
 
 logger = logging.getLogger(__name__)
 
+# 監視開始前からあるファイルのうち、更新からこの秒数以上経ったものは書き込み済みとみなす
+SETTLED_AGE = 60.0
+# 書き込み完了の判定方法（stats() の項目）
+READINESS_KINDS = ("close_write", "settled", "polled", "not_ready")
+# クローズの通知を待つ最短の時間（秒）。wait_time の方が長ければ wait_time だけ待つ
+CLOSE_WAIT_MIN = 0.5
+
 # Windows Shell通知用の定数
 SHCNE_UPDATEDIR = 0x00001000
 SHCNF_PATHW = 0x0005
@@ -27,118 +61,1095 @@ def refresh_windows_folder(folder_path: str) -> None:
         logger.debug(f"フォルダ更新通知に失敗しました: {e}")
 
 
+def reports_close_write(observer: object) -> bool:
+    """オブザーバーが書き込み後のクローズを通知するか（Linux の inotify のみ）"""
+    # inotify のモジュールは Linux 以外では読み込めないため、クラス名で判定する
+    return any(cls.__name__ == "InotifyObserver" for cls in type(observer).__mro__)
+
+
+def _has_conditions(rule: TargetRule) -> bool:
+    """ファイル名以外の条件（種類・相対パス）を指定したルールか"""
+    return bool(rule.content_types) or rule.path_regex is not None
+
+
+@dataclass(frozen=True)
+class RuleIndex:
+    """移動先ルールを判定の優先順ごとに分けたもの（ルールを設定・差し替えた時に1回だけ作る）"""
+
+    # 完全一致のファイル名（小文字）ごとのルール（番号の若い順）
+    by_name: dict[str, tuple[TargetRule, ...]]
+    # regexN を指定したルールと、そのコンパイル済みの正規表現
+    regex: tuple[tuple[Pattern[str], TargetRule], ...]
+    # ファイル名の指定が無く、種類・相対パスだけを指定したルール
+    conditional: tuple[TargetRule, ...]
+    # 何も指定が無く、全ファイルを受け入れるルール
+    catch_all: tuple[TargetRule, ...]
+    # ファイルの種類で振り分けるルールがあるか
+    sniffs: bool
+
+
+def compile_rules(targets: list[TargetRule]) -> RuleIndex:
+    """移動先ルールから判定用の索引を作る"""
+    by_name: dict[str, list[TargetRule]] = {}
+    for rule in targets:
+        for name in sorted(rule.filenames):
+            by_name.setdefault(name, []).append(rule)
+    unnamed = [rule for rule in targets if not rule.filenames and rule.filename_regex is None]
+    return RuleIndex(
+        by_name={name: tuple(rules) for name, rules in by_name.items()},
+        regex=tuple(
+            (rule.filename_regex, rule) for rule in targets if rule.filename_regex is not None
+        ),
+        conditional=tuple(rule for rule in unnamed if _has_conditions(rule)),
+        catch_all=tuple(rule for rule in unnamed if not _has_conditions(rule)),
+        sniffs=any(rule.content_types for rule in targets),
+    )
+
+
+def _stat_key(path: Path) -> Optional[tuple[int, int]]:
+    """書き込みが続いているかを比べるための (サイズ, 更新時刻)。無い場合はNone"""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
 class FileRenameHandler(FileSystemEventHandler):
     """ファイルシステムイベントを処理し、ファイル名を変換するハンドラー"""
 
-    def __init__(self, targets: list[TargetRule], wait_time: float) -> None:
+    def __init__(
+        self,
+        targets: list[TargetRule],
+        wait_time: float,
+        ledger: Optional[TransferLedger] = None,
+        log_summary: Optional[LogAggregator] = None,
+        negative_cache_size: int = 1024,
+        early_rule_check: bool = False,
+        retry_scheduler: Optional[RetryScheduler] = None,
+        spool: Optional[TargetSpool] = None,
+        throttles: Optional[ThrottleRegistry] = None,
+        io_scheduler: Optional[DeviceScheduler] = None,
+        fanout: bool = False,
+        hash_cache: Optional[HashCache] = None,
+        manifests: Optional[ManifestRegistry] = None,
+        compressor: Optional[CompressionPool] = None,
+        bundler: Optional[Bundler] = None,
+        directories: Optional[DirectoryCache] = None,
+        target_index: Optional[TargetIndex] = None,
+        versions: Optional[VersionIndex] = None,
+        sniffer: Optional[ContentSniffer] = None,
+        close_events: bool = False,
+        readiness: Optional[ReadinessEstimator] = None,
+        ignore: Optional[Pattern[str]] = None,
+        source: Optional[Path] = None,
+        recursive: bool = False,
+        source_glob: Optional[SourceGlob] = None,
+        negative_cache_dir: Optional[Path] = None,
+    ) -> None:
         super().__init__()
         self.targets: list[TargetRule] = targets
+        # ファイルごとの判定は移動先ルールを優先順に分けた索引で行う
+        self._rules: RuleIndex = compile_rules(targets)
         self.wait_time: float = wait_time
+        self.ledger: Optional[TransferLedger] = ledger
+        # 未指定の場合は集計せずに全件を個別に出力する
+        self.log_summary: LogAggregator = log_summary or LogAggregator()
+        self.negative_cache_size: int = negative_cache_size
+        self.early_rule_check: bool = early_rule_check
+        self.retry_scheduler: Optional[RetryScheduler] = retry_scheduler
+        self.spool: Optional[TargetSpool] = spool
+        # 未指定の場合はこのハンドラ内でのみ移動先ごとの制限を共有する
+        self.throttles: ThrottleRegistry = throttles or ThrottleRegistry()
+        # 未指定の場合はイベントを受けたスレッドでそのまま移動する
+        self.io_scheduler: Optional[DeviceScheduler] = io_scheduler
+        # 一致する全ての移動先へ届けるか（Falseの場合は最初に一致した移動先のみ）
+        self.fanout: bool = fanout
+        # 未指定の場合はこのハンドラ内でのみ移動先のハッシュ値を覚えておく
+        self.hash_cache: HashCache = hash_cache or HashCache()
+        # 未指定の場合はこのハンドラ内でのみ移動先ごとのマニフェストを共有する
+        self.manifests: ManifestRegistry = manifests or ManifestRegistry()
+        # 未指定の場合はこのハンドラ専用の圧縮スレッドを（必要になった時点で）用意する
+        self.compressor: CompressionPool = compressor or CompressionPool()
+        # 未指定の場合は bundle_secondsN を指定したルールでもファイルを個別に届ける
+        self.bundler: Optional[Bundler] = bundler
+        # 未指定の場合はこのハンドラ内でのみ作成済みのサブディレクトリを覚えておく
+        self.directories: DirectoryCache = directories or DirectoryCache()
+        # 未指定の場合は移動先にファイルがあるかをファイルごとに確認する
+        self.target_index: Optional[TargetIndex] = target_index
+        # 未指定の場合はこのハンドラ内でのみ keep_both の連番を数える
+        self.versions: VersionIndex = versions or VersionIndex()
+        # 未指定の場合はこのハンドラ内でのみファイルの種類の判定結果を覚えておく
+        self.sniffer: ContentSniffer = sniffer or ContentSniffer()
+        # 書き込み後のクローズの通知で書き込み完了を判定するか（Falseの場合は待機して確認する）
+        self.close_events: bool = close_events
+        # 作成を通知され、書き込み後のクローズを待っているファイルと、(期限, 最後に見た
+        # (サイズ, 更新時刻))。移動してきたファイルなどクローズが通知されないものは、
+        # 期限までに書き込みが無ければ待機して確認する処理に回す
+        self._awaiting_close: dict[str, tuple[float, Optional[tuple[int, int]]]] = {}
+        self._awaiting_close_lock = threading.Lock()
+        self._close_timer: Optional[threading.Timer] = None
+        # 書き込み完了をどの方法で判定したかの件数（close_write / polled / not_ready）
+        self._readiness: Counter[str] = Counter()
+        # 未指定の場合は毎回 wait_time だけ待って確認する（書き込み時間を学習しない）
+        self.readiness: Optional[ReadinessEstimator] = readiness
+        # 無視するファイル名（一時ファイルなど）の正規表現。Noneの場合は全てのファイルを処理する
+        self.ignore: Optional[Pattern[str]] = ignore
+        # 監視元ディレクトリ（path_regexN・keep_treeN の相対パスの基準）。Noneの場合はファイル名のみ
+        self.source: Optional[Path] = source
+        # サブディレクトリも監視しているか（既存ファイルの処理でも辿る）
+        self.recursive: bool = recursive
+        # 監視元のパターン。指定した場合は source 配下で一致する全てのディレクトリを、
+        # 同じ移動先ルールで1つのハンドラが受け持つ（Noneの場合は source のみ）
+        self.source_glob: Optional[SourceGlob] = source_glob
+        self._readiness_lock = threading.Lock()
+        # デバイスごとのキューに積んだまま未処理のファイル
+        self._in_flight: set[str] = set()
+        self._in_flight_lock = threading.Lock()
+        # 移動先が無いと判定したファイルの (名前, サイズ, 更新時刻)。古いものから捨てる
+        self._unmatched: OrderedDict[tuple[str, int, int], None] = OrderedDict()
+        self._unmatched_lock = threading.Lock()
+        # 判定結果を保存するファイル。ルールのハッシュ値をファイル名に含めるため、
+        # 設定を変えて起動した場合は以前の判定結果を読まない（Noneの場合は保存しない）
+        self.negative_cache_path: Optional[Path] = (
+            negative_cache_dir / f"unmatched_{self._rules_fingerprint()}.json"
+            if negative_cache_dir is not None and negative_cache_size > 0
+            else None
+        )
+        self._load_unmatched()
         self._ensure_target_dirs()
 
+    def _rules_fingerprint(self) -> str:
+        """移動先の判定に関わる設定（監視元・移動先ルール）のハッシュ値"""
+        rules = [
+            {
+                field.name: (
+                    sorted(map(str, value)) if isinstance(value, frozenset) else str(value)
+                )
+                for field in fields(rule)
+                for value in (getattr(rule, field.name),)
+            }
+            for rule in self.targets
+        ]
+        settings = {
+            "source": str(self.source),
+            "source_glob": self.source_glob.pattern if self.source_glob is not None else None,
+            "fanout": self.fanout,
+            "targets": rules,
+        }
+        encoded = json.dumps(settings, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        return hashlib.sha1(encoded).hexdigest()[:16]
+
+    def _load_unmatched(self) -> None:
+        """前回の起動で保存した判定結果を読み込む"""
+        if self.negative_cache_path is None or not self.negative_cache_path.exists():
+            return
+        try:
+            with open(self.negative_cache_path, encoding="utf-8") as f:
+                keys = [(str(name), int(size), int(mtime)) for name, size, mtime in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(
+                f"移動先なしの判定結果の読み込みに失敗しました: {self.negative_cache_path},"
+                f" エラー: {e}"
+            )
+            return
+
+        with self._unmatched_lock:
+            for key in keys[-self.negative_cache_size :]:
+                self._unmatched[key] = None
+        if keys:
+            logger.debug(f"移動先なしの判定結果を引き継ぎました: {len(self._unmatched)}件")
+
+    def save_unmatched(self) -> None:
+        """判定結果を保存する（次回の起動時の既存ファイルの処理で使う）"""
+        if self.negative_cache_path is None:
+            return
+        with self._unmatched_lock:
+            keys = [list(key) for key in self._unmatched]
+        temp_path = self.negative_cache_path.with_name(self.negative_cache_path.name + ".tmp")
+        try:
+            self.negative_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(keys, f, ensure_ascii=False)
+            os.replace(temp_path, self.negative_cache_path)
+        except OSError as e:
+            logger.error(
+                f"移動先なしの判定結果の保存に失敗しました: {self.negative_cache_path},"
+                f" エラー: {e}"
+            )
+
     def _ensure_target_dirs(self) -> None:
         """全ての移動先ディレクトリの存在を確認し、なければ作成"""
         for rule in self.targets:
             if not rule.directory.exists():
-                rule.directory.mkdir(parents=True, exist_ok=True)
+                try:
+                    rule.directory.mkdir(parents=True, exist_ok=True)
+                except OSError as e:
+                    if self.spool is None:
+                        raise
+                    # ネットワーク上の移動先が切断中の場合は、復旧するまで退避する
+                    logger.error(
+                        f"移動先ディレクトリを作成できません: {rule.directory}, エラー: {e}"
+                    )
+                    self.spool.mark_offline(rule.directory)
+                    continue
                 logger.info(f"移動先ディレクトリを作成しました: {rule.directory}")
 
     def process_existing_files(self, directory: Path) -> None:
-        """監視開始前から存在するファイルを処理する"""
-        for path in sorted(directory.iterdir()):
-            if path.is_file():
-                self._process_file(str(path))
+        """監視開始前から存在するファイルを処理する
+
+        監視元のパターンを指定した場合、directory が source なら一致する全ての監視元を
+        名前順に処理する。
+        """
+        if self.source_glob is not None and directory == self.source:
+            sources = self.source_glob.expand(directory)
+            logger.info(
+                f"監視元のパターンに一致するフォルダ: {len(sources)}件"
+                f"（{directory / self.source_glob.pattern}）"
+            )
+            for source in sources:
+                self._process_tree(source)
+            return
+        self._process_tree(directory)
+
+    def _process_tree(self, directory: Path) -> None:
+        """ディレクトリ内のファイルを処理する
+
+        recursive の場合はサブディレクトリも os.scandir で深さ優先に辿り、一覧を溜めずに
+        見つけた順に処理する（ディレクトリ内は名前順）。更新から SETTLED_AGE 秒以上
+        経ったファイルは書き込み済みとみなして待たない。
+        """
+        pending = [str(directory)]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as iterator:
+                    entries = sorted(iterator, key=lambda entry: entry.name)
+            except OSError as e:
+                logger.warning(f"ディレクトリを読み込めませんでした: {current}, エラー: {e}")
+                continue
+            subdirectories = []
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        if not self._is_ignored(entry.name):
+                            self._process_existing(entry)
+                    elif self.recursive and entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                except OSError as e:
+                    logger.warning(f"ファイルを処理できませんでした: {entry.path}, エラー: {e}")
+            # 名前順に辿るため、後で取り出す方から積む
+            pending.extend(reversed(subdirectories))
+
+    def _process_existing(self, entry: os.DirEntry[str]) -> None:
+        if time.time() - entry.stat().st_mtime >= SETTLED_AGE:
+            self._process_file(entry.path, ready="settled")
+        else:
+            self._process_file(entry.path)
+
+    def _is_ignored(self, name: str) -> bool:
+        """一時ファイルなど、待機も判定もせずに無視するファイルか"""
+        return self.ignore is not None and self.ignore.match(name) is not None
+
+    def _split_source(self, path: str) -> Optional[tuple[str, str]]:
+        """パスを (一致した監視元, 監視元からの相対パス) に分ける（監視元のパターン指定時のみ）"""
+        if self.source_glob is None or self.source is None:
+            return None
+        try:
+            relative = Path(path).relative_to(self.source).as_posix()
+        except ValueError:
+            return None
+        return self.source_glob.split(relative)
+
+    def _is_outside_sources(self, path: str) -> bool:
+        """監視元のパターンに一致するディレクトリの外のファイルか
+
+        パターンを指定した場合は source 全体をサブディレクトリまで監視するため、
+        一致しないディレクトリや（recursive でなければ）監視元のサブディレクトリの
+        イベントもここで除く。
+        """
+        if self.source_glob is None:
+            return False
+        split = self._split_source(path)
+        if split is None or not split[1]:
+            return True
+        return not self.recursive and "/" in split[1]
+
+    def _on_directory_added(self, path: str) -> None:
+        """監視元のパターンに一致するディレクトリが現れたら、中にあるファイルを処理する
+
+        作成直後に書き込まれたファイルや、ファイルごと移動・名前を変えたディレクトリの
+        ファイルはイベントが届かないため、ディレクトリを読んで処理する。
+        """
+        split = self._split_source(path)
+        if split is None or split[1]:
+            return
+        logger.info(f"監視元を追加しました: {path}")
+        self._process_tree(Path(path))
 
     def on_created(self, event: FileSystemEvent) -> None:
         """新規ファイル作成時の処理"""
+        src_path = event.src_path if isinstance(event.src_path, str) else event.src_path.decode()
         if event.is_directory:
+            self._on_directory_added(src_path)
             return
 
-        src_path = event.src_path if isinstance(event.src_path, str) else event.src_path.decode()
+        if self._is_outside_sources(src_path) or self._is_ignored(os.path.basename(src_path)):
+            return
+        if self.close_events:
+            # 書き込んだプロセスがファイルを閉じた通知（on_closed）を待って処理する
+            self._await_close(src_path, _stat_key(Path(src_path)))
+            return
         self._process_file(src_path)
 
-    def on_moved(self, event: FileSystemEvent) -> None:
-        """ファイル移動時の処理"""
+    def on_closed(self, event: FileSystemEvent) -> None:
+        """書き込み後にファイルが閉じられた時の処理（作成を通知されたファイルのみ）"""
         if event.is_directory:
             return
 
+        src_path = event.src_path if isinstance(event.src_path, str) else event.src_path.decode()
+        with self._awaiting_close_lock:
+            if self._awaiting_close.pop(src_path, None) is None:
+                return
+        self._process_file(src_path, ready="close_write")
+
+    def on_deleted(self, event: FileSystemEvent) -> None:
+        """閉じられる前に削除されたファイルは待つのをやめる"""
+        src_path = event.src_path if isinstance(event.src_path, str) else event.src_path.decode()
+        with self._awaiting_close_lock:
+            self._awaiting_close.pop(src_path, None)
+
+    def _await_close(self, path: str, last: Optional[tuple[int, int]]) -> None:
+        """クローズを待つファイルに加え、期限を確かめるタイマーを（無ければ）開始する"""
+        deadline = time.monotonic() + max(self.wait_time, CLOSE_WAIT_MIN)
+        with self._awaiting_close_lock:
+            self._awaiting_close[path] = (deadline, last)
+            self._schedule_close_check()
+
+    def _schedule_close_check(self) -> None:
+        """最も早い期限にタイマーを設定する（呼び出し元でロックを保持すること）"""
+        if self._close_timer is not None or not self._awaiting_close:
+            return
+        deadline = min(deadline for deadline, _ in self._awaiting_close.values())
+        timer = threading.Timer(max(0.0, deadline - time.monotonic()), self._check_awaiting_close)
+        timer.daemon = True
+        self._close_timer = timer
+        timer.start()
+
+    def _check_awaiting_close(self) -> None:
+        """期限までにクローズが通知されなかったファイルを、待機して確認する処理に回す
+
+        期限の間に書き込みが進んでいたファイルは、まだ書き込み中とみなして待ち続ける。
+        """
+        now = time.monotonic()
+        with self._awaiting_close_lock:
+            self._close_timer = None
+            expired = [
+                (path, last)
+                for path, (deadline, last) in self._awaiting_close.items()
+                if deadline <= now
+            ]
+            for path, _ in expired:
+                del self._awaiting_close[path]
+
+        polled: list[str] = []
+        for path, last in expired:
+            current = _stat_key(Path(path))
+            if current is None:
+                # 閉じられる前に削除・移動された
+                continue
+            if current != last:
+                self._await_close(path, current)
+                continue
+            polled.append(path)
+
+        with self._awaiting_close_lock:
+            self._schedule_close_check()
+        for path in polled:
+            logger.debug(f"クローズが通知されないため待機して確認します: {path}")
+            self._process_file(path)
+
+    def on_moved(self, event: FileSystemEvent) -> None:
+        """ファイル移動時の処理"""
         dest_path = (
             event.dest_path if isinstance(event.dest_path, str) else event.dest_path.decode()
         )
+        if event.is_directory:
+            self._on_directory_added(dest_path)
+            return
+
+        # 閉じられる前に名前を変えたファイルは、移動先の名前で処理する
+        src_path = event.src_path if isinstance(event.src_path, str) else event.src_path.decode()
+        with self._awaiting_close_lock:
+            self._awaiting_close.pop(src_path, None)
+        if self._is_outside_sources(dest_path):
+            return
+        # ダウンロードの完了などで一時ファイルから名前を変えたファイルは移動先の名前で判定する
+        if self._is_ignored(os.path.basename(dest_path)):
+            return
         self._process_file(dest_path)
 
     def _wait_for_file_ready(self, path: Path, max_retries: int = 10) -> bool:
         """ファイルの書き込み完了を待つ"""
+        if self.readiness is not None:
+            return self._wait_adaptively(path, self.readiness, max_retries)
+
         for _ in range(max_retries):
             time.sleep(self.wait_time)
             if not path.exists():
                 return False
-            try:
-                # ファイルが読み取り可能か確認
-                with open(path, "rb"):
-                    pass
+            if self._can_open(path):
                 return True
-            except (IOError, PermissionError):
+        return False
+
+    def _wait_adaptively(
+        self, path: Path, readiness: ReadinessEstimator, max_retries: int
+    ) -> bool:
+        """学習した待ち時間で、サイズ・更新時刻が変わらず開けるようになるまで待つ
+
+        書き込みが進んでいる（サイズ・更新時刻が変わった）間は再試行の回数に数えないため、
+        大きなファイルでも書き込み中に諦めない。ただし全体では上限の待ち時間の
+        max_retries 回分までしか待たない（書き込みが終わらないファイルで監視を止めない）。
+        """
+        ext = path.suffix
+        started = time.monotonic()
+        deadline = started + readiness.ceiling * max_retries
+        last = _stat_key(path)
+        # 最終的な状態が最初に見えた時刻（書き込みはそれまでに終わっている）
+        settled_at = started
+        delay = readiness.first_delay(ext)
+        retries = 0
+        while retries < max_retries:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.debug(f"書き込みが続いているため待つのをやめます: {path}")
+                return False
+            time.sleep(min(delay, remaining))
+            current = _stat_key(path)
+            if current is None:
+                return False
+            if current != last:
+                last = current
+                settled_at = time.monotonic()
+                delay = readiness.next_delay(ext, current[0], delay)
                 continue
+            if self._can_open(path):
+                readiness.observe(ext, settled_at - started, current[0])
+                return True
+            retries += 1
+            delay = readiness.backoff(delay)
         return False
 
-    def _process_file(self, file_path: str) -> None:
-        """ファイルを処理してリネームし移動する"""
+    def _can_open(self, path: Path) -> bool:
+        """ファイルが読み取り可能か確認（種類で振り分ける場合は開いたついでに先頭を読む）"""
+        try:
+            with open(path, "rb") as f:
+                if self._sniffs_content():
+                    self.sniffer.sniff(path, f)
+            return True
+        except (IOError, PermissionError):
+            return False
+
+    def stats(self) -> dict[str, int]:
+        """書き込み完了をどの方法で判定したかの件数を返す
+
+        close_write: クローズの通知で待たずに判定 / settled: 監視開始前から更新の無い
+        ファイルを待たずに判定 / polled: 待機して確認 / not_ready: 待機しても準備ができなかった
+        """
+        with self._readiness_lock:
+            return {kind: self._readiness[kind] for kind in READINESS_KINDS}
+
+    def _count_readiness(self, kind: str) -> None:
+        with self._readiness_lock:
+            self._readiness[kind] += 1
+
+    def _process_file(self, file_path: str, ready: Optional[str] = None) -> None:
+        """ファイルを処理してリネームし移動する
+
+        ready は書き込み完了を判定済みの場合の判定方法（close_write / settled）。
+        """
         path = Path(file_path)
+        relative = self._relative_path(path)
+
+        # 以前に移動先なしと判定した、内容の変わっていないファイルは待たずに飛ばす
+        key = self._unmatched_key(path, relative)
+        if key is not None and self._is_known_unmatched(key):
+            logger.debug(f"移動先なしと判定済みのファイルを飛ばします: {relative}")
+            return
+
+        # どのルールにも一致し得ないファイル名なら、書き込み完了を待たずに判定する
+        if self.early_rule_check and self._resolve_rule(path.name, relative=relative) is None:
+            self._report_unmatched(path, key)
+            return
 
-        # ファイル書き込み完了を待つ
-        if not self._wait_for_file_ready(path):
+        if ready is not None:
+            # 書き込み完了を判定済みのため、待たずに処理する
+            self._count_readiness(ready)
+        elif self._wait_for_file_ready(path):
+            self._count_readiness("polled")
+        else:
+            self._count_readiness("not_ready")
             logger.warning(f"ファイルの準備ができませんでした: {path}")
             return
 
         if not path.exists():
             return
 
-        rule = self._resolve_rule(path.name)
-        if rule is None:
+        rules = self._resolve_rules(path.name, path, relative)
+        if not rules:
+            self._report_unmatched(path, self._unmatched_key(path, relative))
+            return
+
+        self._dispatch(path, rules)
+
+    def _dispatch(
+        self, path: Path, rules: list[TargetRule], done: Optional[Callable[[], None]] = None
+    ) -> None:
+        """移動先のデバイスのキューへ移動を依頼する（スケジューラが無ければその場で移動）
+
+        done は移動を終えた（または重複のため依頼しなかった）時点で呼ぶ。
+        """
+        if self.io_scheduler is None:
+            try:
+                self._deliver(path, rules)
+            finally:
+                if done is not None:
+                    done()
+            return
+
+        key = str(path)
+        with self._in_flight_lock:
+            if key in self._in_flight:
+                # 作成と移動のイベントが続いた場合などの重複は1回にまとめる
+                if done is not None:
+                    done()
+                return
+            self._in_flight.add(key)
+
+        def task() -> None:
+            try:
+                self._deliver(path, rules)
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight.discard(key)
+                if done is not None:
+                    done()
+
+        # 複数の移動先へ届ける場合も、読み込みは1回のため最初の移動先のキューで処理する
+        self.io_scheduler.submit(rules[0], task)
+
+    def _deliver(self, path: Path, rules: list[TargetRule]) -> None:
+        if len(rules) == 1:
+            self._move_file(path, rules[0])
+        else:
+            self._fan_out(path, rules)
+
+    def _unmatched_key(self, path: Path, relative: str) -> Optional[tuple[str, int, int]]:
+        """移動先なしの判定結果を覚えておくためのキー（取得できない場合はNone）"""
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return (relative, stat.st_size, stat.st_mtime_ns)
+
+    def _is_known_unmatched(self, key: tuple[str, int, int]) -> bool:
+        with self._unmatched_lock:
+            if key not in self._unmatched:
+                return False
+            self._unmatched.move_to_end(key)
+            return True
+
+    def _report_unmatched(self, path: Path, key: Optional[tuple[str, int, int]]) -> None:
+        """移動先が無いことをログに残し、判定結果を覚えておく"""
+        if self.log_summary.should_log("unmatched", str(path.parent)):
             logger.info(f"移動先が見つかりませんでした: {path.name}")
+
+        if key is None or self.negative_cache_size <= 0:
             return
+        with self._unmatched_lock:
+            self._unmatched[key] = None
+            if len(self._unmatched) > self.negative_cache_size:
+                self._unmatched.popitem(last=False)
 
-        self._move_file(path, rule)
+    def retry_file(self, path: Path, done: Callable[[], None]) -> None:
+        """移動に失敗したファイルを再試行する（RetrySchedulerから呼ばれる）
 
-    def _resolve_rule(self, filename: str) -> Optional[TargetRule]:
+        移動を終えてから done を呼ぶ。デバイスごとのキューで移動する場合も、再び失敗すれば
+        再試行待ちの試行回数を引き継いで再予約される。
+        """
+        rules = (
+            self._resolve_rules(path.name, path, self._relative_path(path))
+            if path.exists()
+            else []
+        )
+        if not rules:
+            done()
+            return
+
+        self._dispatch(path, rules, done)
+
+    def _resolve_rule(
+        self, filename: str, path: Optional[Path] = None, relative: Optional[str] = None
+    ) -> Optional[TargetRule]:
         """ファイル名に対応する移動先ルールを取得（完全一致 > 正規表現 > 全件受け入れの順）"""
-        name = filename.lower()
+        return next(self._matching_rules(filename, path, relative), None)
 
-        for rule in self.targets:
-            if name in rule.filenames:
-                return rule
+    def _resolve_rules(
+        self, filename: str, path: Optional[Path] = None, relative: Optional[str] = None
+    ) -> list[TargetRule]:
+        """ファイルを届ける移動先ルールを取得（fanoutでなければ最初に一致した1件のみ）"""
+        if not self.fanout:
+            rule = self._resolve_rule(filename, path, relative)
+            return [] if rule is None else [rule]
 
-        for rule in self.targets:
-            if rule.filename_regex is not None and rule.filename_regex.search(filename):
-                return rule
+        rules: list[TargetRule] = []
+        for rule in self._matching_rules(filename, path, relative):
+            if rule not in rules:
+                rules.append(rule)
+        return rules
 
-        # ファイル名指定も正規表現指定もないルールは全ファイルを受け入れる
-        for rule in self.targets:
-            if not rule.filenames and rule.filename_regex is None:
-                return rule
+    def _matching_rules(
+        self, filename: str, path: Optional[Path] = None, relative: Optional[str] = None
+    ) -> Iterator[TargetRule]:
+        """ファイル名に一致する移動先ルールを優先順に返す
 
-        return None
+        完全一致 > 正規表現 > 種類・相対パスのみの指定 > 全件受け入れの順。path を省略した
+        場合は（書き込み完了前の判定のため）種類の条件を、relative を省略した場合は相対パスの
+        条件を満たし得るものとして扱う。
+        """
+        index = self._rules
+
+        for rule in index.by_name.get(filename.lower(), ()):
+            if self._conditions_match(rule, path, relative):
+                yield rule
+
+        for regex, rule in index.regex:
+            if regex.search(filename) and self._conditions_match(rule, path, relative):
+                yield rule
+
+        # ファイル名指定も正規表現指定もなく、種類・相対パスだけを指定したルール
+        for rule in index.conditional:
+            if self._conditions_match(rule, path, relative):
+                yield rule
 
-    def _build_target_name(self, path: Path, rule: TargetRule) -> str:
-        """移動先でのファイル名を組み立てる（必要ならサフィックスを付加）"""
-        if rule.pattern is None or rule.pattern.search(path.stem):
+        # ファイル名・正規表現・種類・相対パスのいずれも指定のないルールは全ファイルを受け入れる
+        yield from index.catch_all
+
+    def _relative_path(self, path: Path) -> str:
+        """監視元からの相対パス（/ 区切り）。監視元が不明・監視元の外の場合はファイル名
+
+        監視元のパターンを指定した場合は、一致したそれぞれの監視元からの相対パス。
+        """
+        if self.source is None:
+            return path.name
+        try:
+            relative = path.relative_to(self.source).as_posix()
+        except ValueError:
             return path.name
+        if self.source_glob is not None:
+            split = self.source_glob.split(relative)
+            if split is not None and split[1]:
+                return split[1]
+        return relative
+
+    def _conditions_match(
+        self, rule: TargetRule, path: Optional[Path], relative: Optional[str]
+    ) -> bool:
+        """相対パス・ファイルの種類が移動先の条件を満たすか"""
+        if rule.path_regex is not None and relative is not None:
+            if not rule.path_regex.search(relative):
+                return False
+        return self._content_matches(rule, path)
+
+    def _sniffs_content(self) -> bool:
+        """ファイルの種類で振り分ける移動先があるか"""
+        return self._rules.sniffs
+
+    def _content_matches(self, rule: TargetRule, path: Optional[Path]) -> bool:
+        """ファイルの種類が移動先の条件を満たすか（判定結果は覚えておき、読み直さない）"""
+        if not rule.content_types or path is None:
+            return True
+        return self.sniffer.sniff(path) in rule.content_types
+
+    def _build_target_name(self, path: Path, rule: TargetRule, bundled: bool = False) -> str:
+        """移動先でのファイル名を組み立てる（テンプレート、または必要ならサフィックスを付加）"""
+        if rule.template is not None:
+            match = None
+            if rule.template.uses_match and rule.filename_regex is not None:
+                match = rule.filename_regex.search(path.name)
+            name = rule.template.render(path, match)
+        elif rule.pattern is None or rule.pattern.search(path.stem):
+            name = path.name
+        else:
+            name = f"{path.stem}{rule.suffix}{path.suffix}"
+
+        # まとめて送る場合は tar 全体を圧縮するため、個々のファイル名は変えない
+        if rule.compress is not None and not bundled:
+            # 圧縮して届ける場合は形式の拡張子を付ける（report.md -> report.md.gz）
+            name += EXTENSIONS[resolve_codec(rule.compress)]
+        return name
+
+    def _build_target_path(self, path: Path, rule: TargetRule) -> Path:
+        """移動先のパスを組み立てる（keep_tree・layout に従ってサブディレクトリに分ける）"""
+        name = self._build_target_name(path, rule)
+        directory = rule.directory
+        if rule.keep_tree:
+            # 監視元からの相対ディレクトリを保つ（layout のサブディレクトリはその下に作る）
+            directory = directory.joinpath(*PurePosixPath(self._relative_path(path)).parent.parts)
+        if rule.layout == LAYOUT_FLAT:
+            return directory / name
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            mtime = time.time()
+        return directory / shard_dir(rule, name, mtime) / name
+
+    def _ensure_shard_dir(self, new_path: Path, rule: TargetRule) -> None:
+        """サブディレクトリに置く場合は、置き場所を（初回のみ）作成する"""
+        if new_path.parent != rule.directory:
+            self.directories.ensure(new_path.parent)
+
+    def _target_exists(self, new_path: Path) -> bool:
+        """移動先に同じ名前のファイルがあるか（一覧がある場合はメモリ上で判定する）"""
+        if self.target_index is None:
+            return new_path.exists()
+        return self.target_index.contains(new_path)
 
-        return f"{path.stem}{rule.suffix}{path.suffix}"
+    def _mark_delivered(self, new_path: Path) -> None:
+        if self.target_index is not None:
+            self.target_index.add(new_path)
 
     def _move_file(self, path: Path, rule: TargetRule) -> None:
         """ファイルを移動先ディレクトリへ（必要ならリネームして）移動する"""
-        new_path = rule.directory / self._build_target_name(path, rule)
+        if self._should_bundle(path, rule):
+            self._bundle_file(path, rule)
+            return
 
         try:
-            if new_path.exists():
-                logger.info(f"既存ファイルを上書きします: {new_path}")
+            new_path = self._build_target_path(path, rule)
+        except Exception as e:
+            self._report_unnamed(path, e)
+            return
+
+        if self.spool is not None and not self.spool.is_available(rule.directory):
+            self._spool_file(self.spool, path, new_path, rule)
+            return
+
+        try:
+            target_dir = str(rule.directory)
             source_dir = str(path.parent)
-            shutil.move(str(path), str(new_path))
-            logger.info(f"ファイルを移動しました: {path.name} -> {new_path}")
+            # 圧縮して届ける場合は移動元と移動先の内容が異なるため、重複判定はしない
+            dedup = rule.dedup and rule.compress is None
+            self._ensure_shard_dir(new_path, rule)
+            exists = self._target_exists(new_path)
+            if dedup and exists and self.hash_cache.is_duplicate(path, new_path):
+                self._remove_duplicate(path, new_path, rule)
+                refresh_windows_folder(source_dir)
+                return
+            if exists and rule.collision != COLLISION_OVERWRITE:
+                resolved = self._resolve_collision(path, new_path, rule)
+                if resolved is None:
+                    self._skip_older(path, new_path, rule)
+                    return
+                # keep_both の場合は連番を付けた空いている名前になる
+                exists = resolved == new_path
+                new_path = resolved
+            if exists and self.log_summary.should_log("overwrite", target_dir):
+                logger.info(f"既存ファイルを上書きします: {new_path}")
+            size = path.stat().st_size
+            digest = self._transfer(path, new_path, rule)
+            self._mark_delivered(new_path)
+            if self.log_summary.should_log("moved", target_dir):
+                logger.info(f"ファイルを移動しました: {path.name} -> {new_path}")
+            if digest is not None:
+                logger.debug(f"コピー先の内容を確認しました: {new_path}（{digest}）")
+            if self.ledger is not None:
+                self.ledger.record(path, new_path, size, digest=digest)
+            if rule.manifest:
+                self._record_manifest(rule, new_path, digest)
             # エクスプローラーの表示を更新
             refresh_windows_folder(source_dir)
-            refresh_windows_folder(str(rule.directory))
+            refresh_windows_folder(str(new_path.parent))
         except Exception as e:
             logger.error(f"ファイルの移動に失敗しました: {path} -> {new_path}, エラー: {e}")
+            # 作成済みと覚えていたサブディレクトリが外部で削除された場合に作り直す
+            self.directories.discard(new_path.parent)
+            if self.spool is not None and path.exists() and not rule.directory.is_dir():
+                self.spool.mark_offline(rule.directory)
+                self._spool_file(self.spool, path, new_path, rule)
+            elif self.retry_scheduler is not None and path.exists():
+                self.retry_scheduler.schedule(path, str(e))
+
+    def _report_unnamed(self, path: Path, error: Exception) -> None:
+        """移動先のパスを決められなかったことをログに残し、移動元を残して再試行する
+
+        テンプレートから空の名前になった場合など、再試行しても名前が決まらないファイルは
+        上限回数に達した時点で隔離される。
+        """
+        logger.error(f"移動先のファイル名を決められません: {path}, エラー: {error}")
+        if self.retry_scheduler is not None and path.exists():
+            self.retry_scheduler.schedule(path, str(error))
+
+    def _should_bundle(self, path: Path, rule: TargetRule) -> bool:
+        """小さなファイルを溜めてまとめて送る対象か"""
+        if self.bundler is None or rule.bundle_seconds <= 0:
+            return False
+        try:
+            return path.stat().st_size <= rule.bundle_file_limit
+        except OSError:
+            return False
+
+    def _bundle_file(self, path: Path, rule: TargetRule) -> None:
+        """ファイルを溜め、他のファイルと1つの tar にまとめて送る"""
+        assert self.bundler is not None
+        try:
+            new_path = rule.directory / self._build_target_name(path, rule, bundled=True)
+        except Exception as e:
+            self._report_unnamed(path, e)
+            return
+        try:
+            size = path.stat().st_size
+            staged_name = self.bundler.add(path, rule, new_path.name)
+        except Exception as e:
+            logger.error(f"ファイルをまとめる準備に失敗しました: {path}, エラー: {e}")
+            if self.retry_scheduler is not None and path.exists():
+                self.retry_scheduler.schedule(path, str(e))
+            return
+
+        if staged_name is None:
+            # 同じ名前で溜めているファイルの方が新しい（skip_if_newer）
+            self._skip_older(path, new_path, rule)
+            return
+        # keep_both の場合は連番を付けた名前で tar に入る
+        new_path = new_path.with_name(staged_name)
+        if self.log_summary.should_log("moved", str(rule.directory)):
+            logger.info(f"ファイルをまとめて送る対象にしました: {path.name} -> {new_path}")
+        if self.ledger is not None:
+            self.ledger.record(path, new_path, size, status="bundled")
+        refresh_windows_folder(str(path.parent))
+
+    def _transfer(self, path: Path, new_path: Path, rule: TargetRule) -> Optional[str]:
+        """移動先へファイルを届ける（圧縮する場合は圧縮しながらコピーして移動元を削除）"""
+        throttle = self.throttles.get(rule)
+        if rule.compress is None:
+            return move_file(path, new_path, throttle, rule.verify, compute_digest=rule.manifest)
+
+        _, digest = compress_file(
+            path,
+            new_path,
+            resolve_codec(rule.compress),
+            rule.compress_level,
+            self.compressor,
+            throttle,
+            rule.verify,
+            compute_digest=rule.manifest,
+        )
+        path.unlink()
+        return digest
+
+    def _record_manifest(self, rule: TargetRule, new_path: Path, digest: Optional[str]) -> None:
+        """届けたファイルを移動先のマニフェストに追記する（失敗しても移動は成功扱い）"""
+        # 名前の変更で済んだ場合はコピー中のハッシュ値が無いため、覚えているものを使う
+        self.manifests.record(rule.directory, new_path, digest, self.hash_cache.digest)
+
+    def _resolve_collision(self, path: Path, new_path: Path, rule: TargetRule) -> Optional[Path]:
+        """既存のファイルと衝突する場合の移動先を決める（移動しない場合はNone）"""
+        if rule.collision == COLLISION_KEEP_BOTH:
+            return self.versions.next_path(new_path, self._target_exists)
+        if rule.collision == COLLISION_SKIP_IF_NEWER and self._target_is_newer(path, new_path):
+            return None
+        return new_path
+
+    @staticmethod
+    def _target_is_newer(path: Path, new_path: Path) -> bool:
+        """移動先のファイルが移動元と同じか新しいか（移動先が無い場合はFalse）"""
+        try:
+            return new_path.stat().st_mtime_ns >= path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+    def _skip_older(self, path: Path, new_path: Path, rule: TargetRule) -> None:
+        """移動先の方が新しいため移動しない（移動元はそのまま残す）"""
+        if self.log_summary.should_log("skipped", str(rule.directory)):
+            logger.info(f"移動先の方が新しいため移動しませんでした: {path} -> {new_path}")
+        if self.ledger is not None:
+            self.ledger.record(path, new_path, path.stat().st_size, status="skipped")
+
+    def _remove_duplicate(self, path: Path, new_path: Path, rule: TargetRule) -> None:
+        """移動先に同じ内容のファイルがあるため、書き込まずに移動元を削除する"""
+        size = path.stat().st_size
+        path.unlink()
+        if self.log_summary.should_log("duplicate", str(rule.directory)):
+            logger.info(f"同じ内容のファイルが移動先にあるため移動を省略しました: {new_path}")
+        if self.ledger is not None:
+            self.ledger.record(path, new_path, size, status="duplicate")
+
+    def _spool_file(
+        self,
+        spool: TargetSpool,
+        path: Path,
+        new_path: Path,
+        rule: Optional[TargetRule] = None,
+    ) -> None:
+        """到達できない移動先へのファイルを退避する（退避できない場合は再試行に回す）"""
+        try:
+            size = path.stat().st_size
+            if rule is not None and rule.compress is not None:
+                held = self._spool_compressed(spool, path, new_path, rule)
+            else:
+                directory = rule.directory if rule is not None else None
+                collision = rule.collision if rule is not None else COLLISION_OVERWRITE
+                held = spool.hold(path, new_path, directory=directory, collision=collision)
+            if held:
+                if self.ledger is not None:
+                    self.ledger.record(path, new_path, size, status="spooled")
+                return
+            error = "退避領域の上限に達しました"
+        except Exception as e:
+            logger.error(f"ファイルの退避に失敗しました: {path}, エラー: {e}")
+            error = str(e)
+
+        if self.retry_scheduler is not None and path.exists():
+            self.retry_scheduler.schedule(path, error)
+
+    def _spool_compressed(
+        self, spool: TargetSpool, path: Path, new_path: Path, rule: TargetRule
+    ) -> bool:
+        """圧縮したものを退避する（復旧後はそのまま送れば圧縮済みのファイルが届く）"""
+        assert rule.compress is not None
+        spool.spool_dir.mkdir(parents=True, exist_ok=True)
+        # 退避する名前は hold() が new_path から決めるため、一時ファイルは重ならない名前にする
+        temp_path = spool.spool_dir / f"{new_path.name}.{threading.get_ident()}"
+        try:
+            compress_file(
+                path,
+                temp_path,
+                resolve_codec(rule.compress),
+                rule.compress_level,
+                self.compressor,
+            )
+            held = spool.hold(
+                temp_path, new_path, directory=rule.directory, collision=rule.collision
+            )
+        finally:
+            temp_path.unlink(missing_ok=True)
+        if held:
+            path.unlink()
+        return held
+
+    def _fan_out(self, path: Path, rules: list[TargetRule]) -> None:
+        """1回の読み込みでファイルを複数の移動先へ届け、全て届いてから移動元を削除する"""
+        online: list[tuple[TargetRule, Path]] = []
+        offline: list[tuple[TargetRule, Path]] = []
+        duplicates: list[tuple[TargetRule, Path]] = []
+        skipped: list[tuple[TargetRule, Path]] = []
+        try:
+            targets = [(rule, self._build_target_path(path, rule)) for rule in rules]
+        except Exception as e:
+            # 1つでも名前を決められない場合は、どの移動先にも届けず移動元を残す
+            self._report_unnamed(path, e)
+            return
+        for rule, new_path in targets:
+            if self.spool is not None and not self.spool.is_available(rule.directory):
+                offline.append((rule, new_path))
+            else:
+                online.append((rule, new_path))
+
+        try:
+            size = path.stat().st_size
+            # 同じ内容のファイルが既にある移動先へは書き込まない
+            existing: set[Path] = set()
+            for i, (rule, new_path) in reversed(list(enumerate(online))):
+                self._ensure_shard_dir(new_path, rule)
+                if not self._target_exists(new_path):
+                    continue
+                if rule.dedup and self.hash_cache.is_duplicate(path, new_path):
+                    del online[i]
+                    duplicates.append((rule, new_path))
+                    continue
+                resolved = self._resolve_collision(path, new_path, rule)
+                if resolved is None:
+                    del online[i]
+                    skipped.append((rule, new_path))
+                elif resolved == new_path:
+                    existing.add(new_path)
+                else:
+                    online[i] = (rule, resolved)
+            if len(skipped) == len(rules):
+                # どの移動先にも届けない場合は移動元を残す
+                for rule, new_path in skipped:
+                    self._skip_older(path, new_path, rule)
+                return
+
+            for rule, new_path in online:
+                if new_path in existing and self.log_summary.should_log(
+                    "overwrite", str(rule.directory)
+                ):
+                    logger.info(f"既存ファイルを上書きします: {new_path}")
+            source_dir = str(path.parent)
+            digest = fan_out_file(
+                path,
+                [
+                    Destination(new_path, self.throttles.get(rule), rule.delivery, rule.verify)
+                    for rule, new_path in online
+                ],
+                compute_digest=any(rule.manifest for rule, _ in online),
+                # 到達できない移動先の分を退避するまでは移動元を残す
+                remove_source=not offline,
+            )
+        except Exception as e:
+            logger.error(f"ファイルの複数の移動先への配信に失敗しました: {path}, エラー: {e}")
+            for rule, new_path in online:
+                self.directories.discard(new_path.parent)
+                if self.spool is not None and not rule.directory.is_dir():
+                    self.spool.mark_offline(rule.directory)
+            if self.retry_scheduler is not None and path.exists():
+                self.retry_scheduler.schedule(path, str(e))
+            return
+
+        for rule, new_path in duplicates:
+            if self.log_summary.should_log("duplicate", str(rule.directory)):
+                logger.info(f"同じ内容のファイルが移動先にあるため移動を省略しました: {new_path}")
+            if self.ledger is not None:
+                self.ledger.record(path, new_path, size, status="duplicate")
+        for rule, new_path in skipped:
+            if self.log_summary.should_log("skipped", str(rule.directory)):
+                logger.info(f"移動先の方が新しいため届けませんでした: {new_path}")
+            if self.ledger is not None:
+                self.ledger.record(path, new_path, size, status="skipped")
+        for rule, new_path in online:
+            self._mark_delivered(new_path)
+            target_dir = str(rule.directory)
+            if self.log_summary.should_log("moved", target_dir):
+                logger.info(f"ファイルを移動しました: {path.name} -> {new_path}")
+            if self.ledger is not None:
+                self.ledger.record(path, new_path, size, digest=digest)
+            if rule.manifest:
+                self._record_manifest(rule, new_path, digest)
+            refresh_windows_folder(str(new_path.parent))
+        if offline:
+            self._spool_fanned_out(path, offline, size)
+        refresh_windows_folder(source_dir)
+
+    def _spool_fanned_out(
+        self, path: Path, offline: list[tuple[TargetRule, Path]], size: int
+    ) -> None:
+        """到達できない移動先の分の複製を退避してから移動元を削除する
+
+        到達できる移動先へ届け終えてから行うため、配信に失敗して再試行する場合も
+        同じ移動先への複製を重ねて退避しない。
+        """
+        assert self.spool is not None
+        try:
+            for rule, new_path in offline:
+                if not self.spool.hold(
+                    path, new_path, copy=True, directory=rule.directory, collision=rule.collision
+                ):
+                    raise OSError(f"退避領域の上限に達しました: {new_path}")
+                if self.ledger is not None:
+                    self.ledger.record(path, new_path, size, status="spooled")
+            path.unlink()
+        except Exception as e:
+            logger.error(f"到達できない移動先への複製の退避に失敗しました: {path}, エラー: {e}")
+            if self.retry_scheduler is not None and path.exists():
+                self.retry_scheduler.schedule(path, str(e))
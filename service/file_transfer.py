@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from contextlib import ExitStack, nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from service.content_hash import HASH_ALGORITHM, file_digest
+from service.throttle import TransferThrottle
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 転送量を制限する場合の読み書きの単位（制限の粒度になる）
+CHUNK_SIZE = 256 * 1024
+# Linux のコピーオンライト複製（ioctl FICLONE）
+FICLONE = 0x40049409
+
+# 別ボリュームへのコピーの検証方法
+# off: 検証しない / fsync: コピー中にハッシュ値を求め、書き込みをディスクへ確定させる
+# reread: fsync に加えてコピー先を読み直し、ハッシュ値が一致することを確かめる
+VERIFY_OFF = "off"
+VERIFY_FSYNC = "fsync"
+VERIFY_REREAD = "reread"
+
+
+class VerificationError(Exception):
+    """コピー先の内容が移動元と一致しない"""
+
+
+def move_file(
+    src: Path,
+    dst: Path,
+    throttle: Optional[TransferThrottle] = None,
+    verify: str = VERIFY_OFF,
+    compute_digest: bool = False,
+) -> Optional[str]:
+    """ファイルを移動する（制限がある場合は同時転送数と転送量を守る）
+
+    検証付き、または compute_digest を指定して別ボリュームへコピーした場合は、
+    コピー中に求めた内容のハッシュ値を返す。
+    """
+    hashing = verify != VERIFY_OFF or compute_digest
+    if throttle is None and not hashing:
+        shutil.move(str(src), str(dst))
+        return None
+
+    with throttle.slot() if throttle is not None else nullcontext():
+        needs_copy = hashing or (throttle is not None and throttle.limits_bandwidth)
+        if not needs_copy or _same_device(src, dst.parent):
+            # 同じボリューム内ならデータを転送しないため、名前の変更で済ませる
+            shutil.move(str(src), str(dst))
+            return None
+
+        hasher = hashlib.new(HASH_ALGORITHM) if hashing else None
+        copy_stream(src, dst, throttle, verify, hasher)
+        # コピー先の内容を確かめてから移動元を削除する
+        os.remove(src)
+        return hasher.hexdigest() if hasher is not None else None
+
+
+def copy_stream(
+    src: Path,
+    dst: Path,
+    throttle: Optional[TransferThrottle] = None,
+    verify: str = VERIFY_OFF,
+    hasher: Optional[hashlib._Hash] = None,
+) -> int:
+    """ファイルを少しずつ読み書きしてコピーし、コピーしたバイト数を返す
+
+    一時ファイルに書き込んでから置き換えるため、途中で失敗しても既存のコピー先は壊れない。
+    hasher を渡した場合は、読み込んだデータをそのままハッシュ値の計算にも使う。
+    """
+    temp_path = dst.with_name(f".{dst.name}.part")
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    copied = 0
+    try:
+        with open(src, "rb") as fsrc, open(temp_path, "wb") as fdst:
+            while True:
+                read = fsrc.readinto(buffer)
+                if not read:
+                    break
+                if throttle is not None:
+                    throttle.consume(read)
+                if hasher is not None:
+                    hasher.update(view[:read])
+                fdst.write(view[:read])
+                copied += read
+            if verify != VERIFY_OFF:
+                fdst.flush()
+                os.fsync(fdst.fileno())
+        if verify == VERIFY_REREAD and hasher is not None:
+            verify_digest(temp_path, hasher.hexdigest())
+        shutil.copystat(src, temp_path)
+        os.replace(temp_path, dst)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return copied
+
+
+def verify_digest(path: Path, expected: str) -> None:
+    """書き込んだファイルを読み直し、ハッシュ値が一致しなければ VerificationError"""
+    actual = file_digest(path)
+    if actual != expected:
+        raise VerificationError(
+            f"コピー先の内容が移動元と一致しません: {path}（{actual} != {expected}）"
+        )
+
+
+@dataclass(frozen=True)
+class Destination:
+    """複数の移動先へ届ける場合の1つの移動先"""
+
+    path: Path
+    throttle: Optional[TransferThrottle] = None
+    # 移動元と同じボリュームでの届け方（copy / link / reflink）
+    delivery: str = "link"
+    # データを書き込む場合の検証方法（off / fsync / reread）
+    verify: str = VERIFY_OFF
+
+
+def fan_out_file(
+    src: Path,
+    destinations: list[Destination],
+    compute_digest: bool = False,
+    remove_source: bool = True,
+) -> Optional[str]:
+    """1回の読み込みでファイルを複数の移動先へ届け、全て成功してから移動元を削除する
+
+    移動元と同じボリュームの移動先には delivery に従ってハードリンクまたは
+    コピーオンライトの複製を作り、それ以外（および作れなかった移動先）には
+    読み込んだデータを同時に書き込む。いずれかが失敗した場合は、どの移動先にも
+    ファイルを置かず移動元も残す。検証付き、または compute_digest を指定して
+    データを書き込んだ場合は内容のハッシュ値を返す。remove_source が False の場合は
+    全て成功しても移動元を残す（呼び出し元で他の処理を終えてから削除する）。
+    """
+    throttles = {id(d.throttle): d.throttle for d in destinations if d.throttle is not None}
+    # 複数の枠を取るため、スレッド間で取得順を揃えてデッドロックを防ぐ
+    ordered = [throttles[key] for key in sorted(throttles)]
+    temp_paths: list[tuple[Path, Path]] = []
+    try:
+        with ExitStack() as stack:
+            for throttle in ordered:
+                stack.enter_context(throttle.slot())
+
+            streamed: list[tuple[Path, Destination]] = []
+            for destination in destinations:
+                temp_path = destination.path.with_name(f".{destination.path.name}.part")
+                temp_paths.append((temp_path, destination.path))
+                if not _clone(src, temp_path, destination.delivery):
+                    streamed.append((temp_path, destination))
+            hasher = None
+            if streamed and (compute_digest or any(d.verify != VERIFY_OFF for _, d in streamed)):
+                hasher = hashlib.new(HASH_ALGORITHM)
+            if streamed:
+                _tee_stream(src, streamed, hasher)
+
+        for temp_path, dst in temp_paths:
+            os.replace(temp_path, dst)
+    except BaseException:
+        for temp_path, _ in temp_paths:
+            temp_path.unlink(missing_ok=True)
+        raise
+    if remove_source:
+        os.remove(src)
+    return hasher.hexdigest() if hasher is not None else None
+
+
+def _clone(src: Path, temp_path: Path, delivery: str) -> bool:
+    """同じボリューム内ならデータを読まずに複製する（できない場合はFalse）"""
+    if delivery == "copy" or not _same_device(src, temp_path.parent):
+        return False
+    temp_path.unlink(missing_ok=True)
+    if delivery == "reflink":
+        return _reflink(src, temp_path)
+    try:
+        os.link(src, temp_path)
+    except OSError:
+        # ハードリンクに対応しないファイルシステムではコピーする
+        return False
+    return True
+
+
+def _reflink(src: Path, temp_path: Path) -> bool:
+    """コピーオンライトの複製を作る（FICLONE、次に copy_file_range を試す）"""
+    try:
+        with open(src, "rb") as fsrc, open(temp_path, "wb") as fdst:
+            if not _ficlone(fsrc.fileno(), fdst.fileno()):
+                if not _copy_file_range(fsrc.fileno(), fdst.fileno(), os.fstat(fsrc.fileno())):
+                    raise OSError("複製に対応していません")
+        shutil.copystat(src, temp_path)
+    except OSError:
+        # 対応しないファイルシステム・OSでは通常のコピーに切り替える
+        temp_path.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def _ficlone(src_fd: int, dst_fd: int) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError:
+        return False
+    return True
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, stat: os.stat_result) -> bool:
+    """カーネル内でコピーする（ファイルシステムによってはブロックを共有する）"""
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is None:
+        return False
+    remaining = stat.st_size
+    try:
+        while remaining > 0:
+            copied = copy_file_range(src_fd, dst_fd, remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+    except OSError:
+        return False
+    return remaining == 0
+
+
+def _tee_stream(
+    src: Path,
+    streamed: list[tuple[Path, Destination]],
+    hasher: Optional[hashlib._Hash] = None,
+) -> None:
+    """移動元を1回だけ読み、各移動先の一時ファイルへ同じデータを書き込む"""
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    with ExitStack() as stack:
+        fsrc = stack.enter_context(open(src, "rb"))
+        outputs = [
+            (stack.enter_context(open(temp_path, "wb")), destination)
+            for temp_path, destination in streamed
+        ]
+        while True:
+            read = fsrc.readinto(buffer)
+            if not read:
+                break
+            if hasher is not None:
+                hasher.update(view[:read])
+            for fdst, destination in outputs:
+                if destination.throttle is not None:
+                    destination.throttle.consume(read)
+                fdst.write(view[:read])
+        for fdst, destination in outputs:
+            if destination.verify != VERIFY_OFF:
+                fdst.flush()
+                os.fsync(fdst.fileno())
+    for temp_path, destination in streamed:
+        if destination.verify == VERIFY_REREAD and hasher is not None:
+            verify_digest(temp_path, hasher.hexdigest())
+        shutil.copystat(src, temp_path)
+
+
+def _same_device(src: Path, directory: Path) -> bool:
+    try:
+        return os.stat(src).st_dev == os.stat(directory).st_dev
+    except OSError:
+        return False
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from utils.config_manager import TargetRule
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeviceQueue:
+    """1台のデバイス（ボリューム）への処理待ちとワーカー"""
+
+    key: str
+    workers: int
+    tasks: queue.Queue[Optional[Callable[[], None]]] = field(default_factory=queue.Queue)
+    threads: list[threading.Thread] = field(default_factory=list)
+    completed: int = 0
+
+
+class DeviceScheduler:
+    """移動先のデバイス（st_dev）ごとにキューとワーカーを分け、ディスクをまたいで並列に処理する
+
+    同じディスクを指す移動先は1つのキューにまとまり、workers_per_device 本を超えて
+    同時に書き込まない。別のディスクへの処理は互いを待たない。
+    """
+
+    def __init__(self, workers_per_device: int = 2) -> None:
+        self.workers_per_device: int = workers_per_device
+        self._queues: dict[str, DeviceQueue] = {}
+        # 移動先ディレクトリごとのデバイスキー（stat は移動先ごとに1回だけ行う）
+        self._device_keys: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, rule: TargetRule, task: Callable[[], None]) -> None:
+        """移動先のデバイスのキューに処理を積む"""
+        self._queue_for(rule).tasks.put(task)
+
+    def close(self) -> None:
+        """積まれた処理を全て終えてからワーカーを停止する"""
+        with self._lock:
+            queues = list(self._queues.values())
+            self._queues.clear()
+        for device in queues:
+            for _ in device.threads:
+                device.tasks.put(None)
+        for device in queues:
+            for thread in device.threads:
+                thread.join()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """デバイスごとのワーカー数・処理待ち件数・完了件数を返す"""
+        with self._lock:
+            return {
+                key: {
+                    "workers": device.workers,
+                    "queued": device.tasks.qsize(),
+                    "completed": device.completed,
+                }
+                for key, device in self._queues.items()
+            }
+
+    def device_key(self, directory: Path) -> str:
+        """ディレクトリが属するデバイスのキー（取得できない場合はディレクトリ自体）"""
+        cached = self._device_keys.get(str(directory))
+        if cached is not None:
+            return cached
+        try:
+            key = f"dev:{os.stat(directory).st_dev}"
+        except OSError:
+            # 到達できない移動先は復旧後に改めて判定する
+            return f"dir:{directory}"
+        self._device_keys[str(directory)] = key
+        return key
+
+    def _queue_for(self, rule: TargetRule) -> DeviceQueue:
+        key = self.device_key(rule.directory)
+        with self._lock:
+            device = self._queues.get(key)
+            if device is None:
+                # デバイスのワーカー数は、そのデバイスを最初に使うルールの指定で決まる
+                workers = rule.device_workers or self.workers_per_device
+                device = DeviceQueue(key=key, workers=max(1, workers))
+                for i in range(device.workers):
+                    thread = threading.Thread(
+                        target=self._run,
+                        args=(device,),
+                        name=f"DeviceWorker-{key}-{i}",
+                        daemon=True,
+                    )
+                    device.threads.append(thread)
+                    thread.start()
+                self._queues[key] = device
+                logger.info(
+                    f"デバイスごとのワーカーを開始しました: {key}（{device.workers}本）"
+                )
+            return device
+
+    def _run(self, device: DeviceQueue) -> None:
+        while True:
+            task = device.tasks.get()
+            if task is None:
+                return
+            try:
+                task()
+            except Exception as e:
+                logger.error(f"ファイル処理中にエラーが発生しました（{device.key}）: {e}")
+            with self._lock:
+                device.completed += 1
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class WriteProfile:
+    """1つの拡張子について学習した書き込みの傾向"""
+
+    # 最初のイベントから、最終的な状態（サイズ・更新時刻）が現れるまでの秒数の平均（EWMA）
+    settle: float
+    # 書き込みの速さ（バイト/秒）の平均（EWMA）。Noneの場合はまだ分からない
+    rate: Optional[float] = None
+    samples: int = 0
+
+
+class ReadinessEstimator:
+    """監視元ごとに、拡張子別の書き込み完了までの時間を学習して待ち時間を決める
+
+    最初の確認は学習した完了までの時間（未学習の場合は initial）だけ待ってから行い、
+    書き込み中でサイズ・更新時刻が変わっていた場合は、そのサイズを学習した書き込みの
+    速さで割った時間（大きなファイルほど長く）待って確かめ直す。待ち時間は
+    floor〜ceiling の範囲に収める。完了までの時間と速さは指数移動平均（alpha）で学習する。
+    floor はサイズ・更新時刻が変わらないことを確かめる最短の時間でもあり、最初の確認で
+    既に書き終わっていたファイル（完了までの時間が0）も floor として学習する。
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        floor: float = 0.25,
+        ceiling: float = 30.0,
+        alpha: float = 0.3,
+    ) -> None:
+        self.initial: float = initial
+        self.floor: float = floor
+        self.ceiling: float = max(ceiling, floor)
+        self.alpha: float = alpha
+        self._profiles: dict[str, WriteProfile] = {}
+        self._lock = threading.Lock()
+
+    def first_delay(self, ext: str) -> float:
+        """イベントから最初に確認するまでの待ち時間"""
+        with self._lock:
+            profile = self._profiles.get(ext.lower())
+            settle = self.initial if profile is None else profile.settle
+        return self._clamp(settle)
+
+    def next_delay(self, ext: str, size: int, previous: float) -> float:
+        """書き込み中だった場合に、次に確認するまでの待ち時間（サイズに比例）"""
+        with self._lock:
+            profile = self._profiles.get(ext.lower())
+            rate = None if profile is None else profile.rate
+        if rate is None or rate <= 0:
+            # 速さが分からない場合は倍々に延ばす
+            return self._clamp(previous * 2)
+        return self._clamp(size / rate)
+
+    def backoff(self, previous: float) -> float:
+        """変化は無いが開けなかった（ロック中の）場合の待ち時間
+
+        ロックが外れるまでの時間はサイズと関係が無いため、initial より長くは延ばさない。
+        """
+        return min(self._clamp(previous * 2), self._clamp(self.initial))
+
+    def observe(self, ext: str, settle: float, size: int) -> None:
+        """書き込み完了を確認したファイルの、完了までの時間とサイズを学習する"""
+        window = max(settle, self.floor)
+        with self._lock:
+            key = ext.lower()
+            profile = self._profiles.get(key)
+            if profile is None:
+                profile = WriteProfile(settle=window)
+                self._profiles[key] = profile
+            else:
+                profile.settle += self.alpha * (window - profile.settle)
+            # 書き込みの速さは、確認中にサイズ・更新時刻が変わった場合のみ分かる
+            if settle > 0 and size > 0:
+                rate = size / settle
+                if profile.rate is None:
+                    profile.rate = rate
+                else:
+                    profile.rate += self.alpha * (rate - profile.rate)
+            profile.samples += 1
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """拡張子ごとの学習した完了までの時間・書き込みの速さ・件数を返す"""
+        with self._lock:
+            return {
+                ext: {
+                    "settle": profile.settle,
+                    "rate": profile.rate or 0.0,
+                    "samples": profile.samples,
+                }
+                for ext, profile in self._profiles.items()
+            }
+
+    def _clamp(self, seconds: float) -> float:
+        return min(max(seconds, self.floor), self.ceiling)
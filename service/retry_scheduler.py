@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 再試行する処理（ファイルと、再試行を終えたことを知らせる関数を受け取る）
+RetryCallback = Callable[[Path, Callable[[], None]], None]
+
+
+@dataclass
+class RetryItem:
+    """再試行待ちのファイル"""
+
+    path: str
+    attempts: int
+    # 次に再試行する時刻（UNIX時刻。再起動をまたいで保存するため壁時計で持つ）
+    due: float
+    last_error: str = ""
+
+
+class RetryScheduler:
+    """移動に失敗したファイルを指数バックオフ（ジッター付き）で再試行する
+
+    待機は1本のスレッドが次の期限まで眠るだけで、ワーカーを占有しない。
+    再試行待ちの状態は state_path に保存し、再起動後も引き継ぐ。再試行中のファイルは
+    処理から完了を知らされるまで再試行待ちに残し、デバイスごとのキューで移動する場合も
+    試行回数を数え続ける。
+    """
+
+    def __init__(
+        self,
+        state_path: Path,
+        quarantine_dir: Optional[Path] = None,
+        max_attempts: int = 5,
+        base_delay: float = 5.0,
+        max_delay: float = 600.0,
+    ) -> None:
+        self.state_path: Path = state_path
+        self.quarantine_dir: Optional[Path] = quarantine_dir
+        self.max_attempts: int = max_attempts
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self._pending: dict[str, RetryItem] = {}
+        self._heap: list[tuple[float, str]] = []
+        # 監視元ディレクトリごとの再試行処理
+        self._callbacks: dict[str, RetryCallback] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, source_dir: Path, callback: RetryCallback) -> None:
+        """監視元ディレクトリ内のファイルを再試行する処理を登録する
+
+        処理にはファイルと完了を知らせる関数を渡す。処理は（別のスレッドで移動する場合は
+        移動を終えてから）完了を知らせる関数を必ず1回呼ぶこと。それまでは再試行待ちに残し、
+        その間に再び失敗して schedule() が呼ばれた場合は試行回数を引き継ぐ。
+        """
+        self._callbacks[str(source_dir)] = callback
+
+    def start(self) -> None:
+        """保存済みの再試行待ちを読み込み、スケジューラスレッドを開始する"""
+        self._load()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="RetryScheduler", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """スケジューラスレッドを停止する（再試行待ちは保存済み）"""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+    def schedule(self, path: Path, error: str = "") -> None:
+        """ファイルの再試行を予約する（上限回数を超えた場合は隔離する）"""
+        key = str(path)
+        with self._condition:
+            item = self._pending.get(key)
+            attempts = item.attempts + 1 if item is not None else 1
+            if attempts > self.max_attempts:
+                self._pending.pop(key, None)
+                self._save()
+                quarantine = True
+            else:
+                due = time.time() + self._backoff(attempts)
+                self._pending[key] = RetryItem(key, attempts, due, error)
+                heapq.heappush(self._heap, (due, key))
+                self._save()
+                self._condition.notify()
+                quarantine = False
+                logger.warning(
+                    f"移動を再試行します（{attempts}/{self.max_attempts}回目、"
+                    f"{due - time.time():.1f}秒後）: {path}"
+                )
+
+        if quarantine:
+            self._quarantine(path, error)
+
+    def pending(self) -> list[RetryItem]:
+        """再試行待ちの一覧を期限の早い順に返す"""
+        with self._condition:
+            return sorted(self._pending.values(), key=lambda item: item.due)
+
+    def _backoff(self, attempts: int) -> float:
+        """再試行までの待ち時間（上限付きの指数バックオフの半分以上をランダムに選ぶ）"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                item = self._next_due()
+                while item is None and not self._stopping:
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._condition.wait(timeout)
+                    item = self._next_due()
+                # 停止の依頼が無い限り、待機を抜けた時点で期限の来た予約がある
+                if self._stopping or item is None:
+                    return
+
+            self._attempt(item)
+
+    def _next_due(self) -> Optional[RetryItem]:
+        """期限の来た再試行待ちを取り出す（古い予約は読み捨てる）"""
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            due, key = heapq.heappop(self._heap)
+            item = self._pending.get(key)
+            if item is not None and item.due == due:
+                return item
+        return None
+
+    def _attempt(self, item: RetryItem) -> None:
+        """再試行を依頼する。再び失敗した場合は処理側から schedule() が呼ばれる"""
+        path = Path(item.path)
+        # サブディレクトリも監視している場合に備え、最も近い監視元の処理を使う
+        callback = next(
+            (
+                self._callbacks[str(parent)]
+                for parent in path.parents
+                if str(parent) in self._callbacks
+            ),
+            None,
+        )
+        if callback is None:
+            logger.warning(f"監視対象外のため再試行を取り消しました: {path}")
+            self._finish(item)
+            return
+
+        try:
+            callback(path, lambda: self._finish(item))
+        except Exception as e:
+            logger.error(f"再試行中にエラーが発生しました: {path}, エラー: {e}")
+            self._finish(item)
+
+    def _finish(self, item: RetryItem) -> None:
+        """再試行を終えたファイルを、再予約されていなければ（成功・対象外）再試行待ちから外す"""
+        with self._condition:
+            current = self._pending.get(item.path)
+            if current is not None and current.due == item.due:
+                del self._pending[item.path]
+                self._save()
+
+    def _quarantine(self, path: Path, error: str) -> None:
+        """再試行の上限に達したファイルを隔離ディレクトリへ移す"""
+        if self.quarantine_dir is None or not path.exists():
+            logger.error(f"移動を諦めました（{self.max_attempts}回失敗）: {path}, エラー: {error}")
+            return
+
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        destination = self.quarantine_dir / f"{stamp}_{path.name}"
+        try:
+            self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(path), str(destination))
+            logger.error(
+                f"移動を諦めて隔離しました（{self.max_attempts}回失敗）: {path} -> {destination}, "
+                f"エラー: {error}"
+            )
+        except Exception as e:
+            logger.error(f"ファイルの隔離に失敗しました: {path} -> {destination}, エラー: {e}")
+
+    def _load(self) -> None:
+        """保存済みの再試行待ちを読み込む"""
+        if not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                items = [RetryItem(**entry) for entry in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"再試行待ちの読み込みに失敗しました: {self.state_path}, エラー: {e}")
+            return
+
+        with self._condition:
+            for item in items:
+                self._pending[item.path] = item
+                heapq.heappush(self._heap, (item.due, item.path))
+        if items:
+            logger.info(f"再試行待ちを引き継ぎました: {len(items)}件")
+
+    def _save(self) -> None:
+        """再試行待ちを保存する（呼び出し元でロックを保持すること）"""
+        temp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump([asdict(item) for item in self._pending.values()], f, ensure_ascii=False)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"再試行待ちの保存に失敗しました: {self.state_path}, エラー: {e}")
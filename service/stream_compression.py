@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Optional
+
+from service.content_hash import HASH_ALGORITHM
+from service.file_transfer import VERIFY_OFF, VERIFY_REREAD, verify_digest
+from service.throttle import TransferThrottle
+
+_zstd_compress: Optional[Callable[[bytes, int], bytes]]
+try:
+    # Python 3.14 以降の標準ライブラリ
+    from compression import zstd as _zstd  # pyright: ignore[reportMissingImports]
+
+    def _stdlib_zstd_compress(data: bytes, level: int) -> bytes:
+        return _zstd.compress(data, level=level)
+
+    _zstd_compress = _stdlib_zstd_compress
+except ImportError:
+    try:
+        import zstandard as _zstandard  # pyright: ignore[reportMissingImports]
+
+        def _zstandard_compress(data: bytes, level: int) -> bytes:
+            return _zstandard.ZstdCompressor(level=level).compress(data)
+
+        _zstd_compress = _zstandard_compress
+    except ImportError:
+        _zstd_compress = None
+
+logger = logging.getLogger(__name__)
+
+# 並列に圧縮する単位。ブロックごとに独立した gzip メンバー / zstd フレームになり、
+# 連結したものはそのまま通常の .gz / .zst として展開できる
+BLOCK_SIZE = 1024 * 1024
+# 形式ごとの拡張子と、圧縮レベル未指定（0）の場合の既定値
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+_fallback_warned = False
+
+
+def zstd_available() -> bool:
+    return _zstd_compress is not None
+
+
+def resolve_codec(codec: str) -> str:
+    """実際に使う圧縮形式を返す（zstd が使えない環境では gzip）"""
+    global _fallback_warned
+    if codec == "zstd" and not zstd_available():
+        if not _fallback_warned:
+            logger.warning("zstd が使えないため gzip で圧縮します")
+            _fallback_warned = True
+        return "gzip"
+    return codec
+
+
+def compressor_for(codec: str, level: int = 0) -> Callable[[bytes], bytes]:
+    """1ブロックを圧縮する関数を返す"""
+    level = level or DEFAULT_LEVELS[codec]
+    if codec == "zstd":
+        assert _zstd_compress is not None
+        zstd_compress = _zstd_compress
+        return lambda data: zstd_compress(data, level)
+    return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class CompressionPool:
+    """ブロックの圧縮を並列に行うスレッドプール（全ての監視元・ワーカーで共有する）
+
+    zlib / zstd は圧縮中に GIL を手放すため、スレッドでもCPUを並列に使える。
+    """
+
+    def __init__(self, workers: int = 0) -> None:
+        self.workers: int = workers if workers > 0 else (os.cpu_count() or 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable[[bytes], bytes], data: bytes) -> Future[bytes]:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="Compress"
+                )
+            executor = self._executor
+        return executor.submit(func, data)
+
+    def close(self) -> None:
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def compress_file(
+    src: Path,
+    dst: Path,
+    codec: str,
+    level: int,
+    pool: CompressionPool,
+    throttle: Optional[TransferThrottle] = None,
+    verify: str = VERIFY_OFF,
+    compute_digest: bool = False,
+) -> tuple[int, Optional[str]]:
+    """ファイルを圧縮しながらコピーし、書き込んだバイト数と（求めた場合）ハッシュ値を返す
+
+    一時ファイルに書き込んでから置き換えるため、途中で失敗しても既存のコピー先は壊れない。
+    ハッシュ値は圧縮後のデータ（コピー先のファイルの内容）のもの。
+    """
+    compress = compressor_for(codec, level)
+    hasher = hashlib.new(HASH_ALGORITHM) if verify != VERIFY_OFF or compute_digest else None
+    temp_path = dst.with_name(f".{dst.name}.part")
+    # 読み込みが圧縮を追い越しすぎないよう、処理中のブロック数を抑える
+    max_pending = pool.workers * 2
+    written = 0
+    try:
+        with (
+            throttle.slot() if throttle is not None else nullcontext(),
+            open(src, "rb") as fsrc,
+            open(temp_path, "wb") as fdst,
+        ):
+            pending: deque[Future[bytes]] = deque()
+
+            def write_next() -> None:
+                nonlocal written
+                block = pending.popleft().result()
+                if throttle is not None:
+                    throttle.consume(len(block))
+                if hasher is not None:
+                    hasher.update(block)
+                fdst.write(block)
+                written += len(block)
+
+            while data := fsrc.read(BLOCK_SIZE):
+                pending.append(pool.submit(compress, data))
+                if len(pending) >= max_pending:
+                    write_next()
+            while pending:
+                write_next()
+            if verify != VERIFY_OFF:
+                fdst.flush()
+                os.fsync(fdst.fileno())
+        if verify == VERIFY_REREAD and hasher is not None:
+            verify_digest(temp_path, hasher.hexdigest())
+        shutil.copystat(src, temp_path)
+        os.replace(temp_path, dst)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return written, hasher.hexdigest() if hasher is not None else None
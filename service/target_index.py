@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DirectoryListing:
+    """1つの移動先ディレクトリにあるファイル名の一覧"""
+
+    names: set[str] = field(default_factory=set)
+    # 一覧を読み込んだ時刻（time.monotonic）。Noneの場合は未読み込み
+    loaded_at: Optional[float] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class TargetIndex:
+    """移動先ディレクトリごとのファイル名の一覧をメモリに持ち、存在確認を省く
+
+    ディレクトリごとに最初の確認時に os.scandir で1回だけ読み込み、以降は自分の
+    書き込み（add / discard）と、監視している場合は移動先のイベントで更新する。
+    外部での変更に追従するため、refresh_interval 秒より古い一覧は次の確認時に読み直す
+    （0の場合は読み直さない）。全ての監視元・ワーカーで共有する。
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = 300.0,
+        max_directories: int = 4096,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.refresh_interval: float = refresh_interval
+        self.max_directories: int = max_directories
+        self._clock = clock
+        self._listings: OrderedDict[str, DirectoryListing] = OrderedDict()
+        self._lock = threading.Lock()
+        self.scans: int = 0
+
+    def contains(self, path: Path) -> bool:
+        """移動先にファイルがあるか（一覧が無いか古い場合は読み込んでから判定する）"""
+        listing = self._listing(path.parent)
+        with listing.lock:
+            if listing.loaded_at is None or self._is_stale(listing):
+                self._scan(path.parent, listing)
+            return _normalize(path.name) in listing.names
+
+    def add(self, path: Path) -> None:
+        """書き込んだファイルを一覧に加える（未読み込みのディレクトリは読み込み時に反映される）"""
+        listing = self._listing(path.parent)
+        with listing.lock:
+            if listing.loaded_at is not None:
+                listing.names.add(_normalize(path.name))
+
+    def discard(self, path: Path) -> None:
+        """削除・移動されたファイルを一覧から除く"""
+        listing = self._listing(path.parent)
+        with listing.lock:
+            listing.names.discard(_normalize(path.name))
+
+    def invalidate(self, directory: Path) -> None:
+        """ディレクトリの一覧を捨て、次の確認時に読み直す"""
+        with self._lock:
+            self._listings.pop(str(directory), None)
+
+    def _listing(self, directory: Path) -> DirectoryListing:
+        key = str(directory)
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is None:
+                listing = DirectoryListing()
+                self._listings[key] = listing
+                if len(self._listings) > self.max_directories:
+                    self._listings.popitem(last=False)
+            else:
+                self._listings.move_to_end(key)
+            return listing
+
+    def _is_stale(self, listing: DirectoryListing) -> bool:
+        if self.refresh_interval <= 0 or listing.loaded_at is None:
+            return False
+        return self._clock() - listing.loaded_at >= self.refresh_interval
+
+    def _scan(self, directory: Path, listing: DirectoryListing) -> None:
+        """ディレクトリを1回だけ読み、ファイル名の一覧を作り直す（呼び出し元でロックを保持）"""
+        names: set[str] = set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    names.add(_normalize(entry.name))
+        except FileNotFoundError:
+            # まだ作成されていない移動先は空とみなす
+            pass
+        listing.names = names
+        listing.loaded_at = self._clock()
+        self.scans += 1
+        logger.debug(f"移動先の一覧を読み込みました: {directory}（{len(names)}件）")
+
+
+class TargetIndexEventHandler(FileSystemEventHandler):
+    """移動先ディレクトリのイベントで一覧を更新する（他のプロセスによる変更への追従）"""
+
+    def __init__(self, index: TargetIndex) -> None:
+        super().__init__()
+        self.index: TargetIndex = index
+
+    def on_created(self, event: FileSystemEvent) -> None:
+        if not event.is_directory:
+            self.index.add(Path(_decode(event.src_path)))
+
+    def on_deleted(self, event: FileSystemEvent) -> None:
+        if event.is_directory:
+            self.index.invalidate(Path(_decode(event.src_path)))
+        else:
+            self.index.discard(Path(_decode(event.src_path)))
+
+    def on_moved(self, event: FileSystemEvent) -> None:
+        if event.is_directory:
+            self.index.invalidate(Path(_decode(event.src_path)))
+            self.index.invalidate(Path(_decode(event.dest_path)))
+            return
+        self.index.discard(Path(_decode(event.src_path)))
+        self.index.add(Path(_decode(event.dest_path)))
+
+
+def _normalize(name: str) -> str:
+    # Windows ではファイル名の大文字・小文字を区別しないため、存在確認と同じく同一視する
+    return os.path.normcase(name)
+
+
+def _decode(path: str | bytes) -> str:
+    return path if isinstance(path, str) else path.decode()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+
+from utils.config_manager import TargetRule
+
+logger = logging.getLogger(__name__)
+
+# 移動先ディレクトリ直下に置く / ファイルの更新日で分ける / ファイル名のハッシュ値の先頭で分ける
+LAYOUT_FLAT = "flat"
+LAYOUT_DATE = "date"
+LAYOUT_HASH = "hash"
+
+# 日付で分ける場合の階層ごとの書式（年 / 月 / 日 / 時）
+DATE_LEVELS = ("%Y", "%m", "%d", "%H")
+# shard_levels が0の場合の階層数
+DEFAULT_LEVELS = {LAYOUT_DATE: 3, LAYOUT_HASH: 2}
+
+
+def shard_dir(rule: TargetRule, name: str, mtime: float) -> PurePosixPath:
+    """移動先ディレクトリからの、ファイルを置くサブディレクトリの相対パス
+
+    date はファイルの更新日時、hash は移動先でのファイル名の SHA-1 の先頭から決めるため、
+    同じファイルを再試行しても同じ場所に置かれる。
+    """
+    if rule.layout == LAYOUT_FLAT:
+        return PurePosixPath()
+
+    levels = rule.shard_levels or DEFAULT_LEVELS[rule.layout]
+    if rule.layout == LAYOUT_DATE:
+        stamp = datetime.fromtimestamp(mtime)
+        return PurePosixPath(*(stamp.strftime(fmt) for fmt in DATE_LEVELS[:levels]))
+
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+    width = rule.shard_width
+    return PurePosixPath(*(digest[i * width : (i + 1) * width] for i in range(levels)))
+
+
+class DirectoryCache:
+    """作成済みのサブディレクトリを覚えておき、ファイルごとの存在確認を省く
+
+    全ての監視元・ワーカーで共有する。外部で削除されたディレクトリへの移動が
+    失敗した場合は discard() で忘れ、次の移動で作り直す。
+    """
+
+    def __init__(self, max_entries: int = 65536) -> None:
+        self.max_entries: int = max_entries
+        self._known: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ensure(self, directory: Path) -> None:
+        """ディレクトリが無ければ作成する（作成済みと分かっている場合は何もしない）"""
+        key = str(directory)
+        with self._lock:
+            if key in self._known:
+                self._known.move_to_end(key)
+                return
+
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._known[key] = None
+            if len(self._known) > self.max_entries:
+                self._known.popitem(last=False)
+
+    def discard(self, directory: Path) -> None:
+        with self._lock:
+            self._known.pop(str(directory), None)
+
+    def __len__(self) -> int:
+        return len(self._known)
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from service.content_hash import file_digest
+
+logger = logging.getLogger(__name__)
+
+# 移動先ディレクトリに置くマニフェストのファイル名
+MANIFEST_NAME = ".filetransfer-manifest.jsonl"
+# 行数がこの数を超え、かつ有効な件数の COMPACT_RATIO 倍を超えたら詰め直す
+COMPACT_MIN_LINES = 1000
+COMPACT_RATIO = 2
+
+
+class TargetManifest:
+    """移動先ディレクトリに届けたファイルの一覧（名前・サイズ・更新時刻・ハッシュ値）
+
+    1件ごとに JSON Lines で追記するため、利用側は前回読んだ位置以降だけを読めば
+    新しいファイルが分かる。同じ名前の更新や削除で行が溜まったら、最新の内容だけに
+    詰め直して置き換える（置き換え後はファイルが短くなる）。
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        compact_min_lines: int = COMPACT_MIN_LINES,
+        compact_ratio: int = COMPACT_RATIO,
+    ) -> None:
+        self.directory: Path = directory
+        self.path: Path = directory / MANIFEST_NAME
+        self.compact_min_lines: int = compact_min_lines
+        self.compact_ratio: int = compact_ratio
+        # ファイル名ごとの最新の記録と、マニフェストの行数
+        self._entries: Optional[dict[str, dict[str, object]]] = None
+        self._lines: int = 0
+        self._lock = threading.Lock()
+
+    def append(self, name: str, size: int, mtime_ns: int, digest: str) -> None:
+        """届けたファイルを1行追記する"""
+        entry: dict[str, object] = {
+            "name": name,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "digest": digest,
+            "delivered_at": time.time(),
+        }
+        with self._lock:
+            entries = self._load()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            entries[name] = entry
+            self._lines += 1
+            if self._lines > max(self.compact_min_lines, len(entries) * self.compact_ratio):
+                self._compact(entries)
+
+    def entries(self) -> dict[str, dict[str, object]]:
+        """ファイル名ごとの最新の記録を返す"""
+        with self._lock:
+            return dict(self._load())
+
+    def _load(self) -> dict[str, dict[str, object]]:
+        """既存のマニフェストを読み込む（最初の1回だけ）"""
+        if self._entries is not None:
+            return self._entries
+
+        entries: dict[str, dict[str, object]] = {}
+        lines = 0
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中で停止した行は詰め直し時に捨てる
+                        continue
+                    entries[entry["name"]] = entry
+        self._entries = entries
+        self._lines = lines
+        return entries
+
+    def _compact(self, entries: dict[str, dict[str, object]]) -> None:
+        """移動先に残っているファイルの最新の記録だけに詰め直す"""
+        for name in [name for name in entries if not (self.directory / name).exists()]:
+            del entries[name]
+
+        temp_path = self.path.with_name(f"{MANIFEST_NAME}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+        logger.debug(
+            f"マニフェストを詰め直しました: {self.path}（{self._lines}行 -> {len(entries)}行）"
+        )
+        self._lines = len(entries)
+
+
+class ManifestRegistry:
+    """移動先ディレクトリごとのマニフェストを、全ての監視元・ワーカーで共有する"""
+
+    def __init__(self) -> None:
+        self._manifests: dict[str, TargetManifest] = {}
+        self._lock = threading.Lock()
+
+    def get(self, directory: Path) -> TargetManifest:
+        key = str(directory)
+        with self._lock:
+            manifest = self._manifests.get(key)
+            if manifest is None:
+                manifest = TargetManifest(directory)
+                self._manifests[key] = manifest
+            return manifest
+
+    def record(
+        self,
+        directory: Path,
+        path: Path,
+        digest: Optional[str] = None,
+        digest_of: Callable[[Path], str] = file_digest,
+    ) -> None:
+        """届けたファイルを移動先のマニフェストに追記する（失敗しても届けたことは変わらない）
+
+        名前の変更で済んだ場合などコピー中のハッシュ値が無い場合は digest_of で求める。
+        サブディレクトリに置いた場合は移動先ディレクトリからの相対パスで記録する。
+        """
+        try:
+            if digest is None:
+                digest = digest_of(path)
+            stat = path.stat()
+            self.get(directory).append(
+                path.relative_to(directory).as_posix(), stat.st_size, stat.st_mtime_ns, digest
+            )
+        except Exception as e:
+            logger.error(f"マニフェストへの追記に失敗しました: {path}, エラー: {e}")
@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from service.collision import (
+    COLLISION_KEEP_BOTH,
+    COLLISION_OVERWRITE,
+    COLLISION_SKIP_IF_NEWER,
+    VersionIndex,
+)
+from service.file_transfer import move_file
+from service.target_index import TargetIndex
+from service.target_manifest import ManifestRegistry
+from service.throttle import ThrottleRegistry
+from service.transfer_ledger import TransferLedger
+from utils.config_manager import TargetRule
+
+logger = logging.getLogger(__name__)
+
+# 退避先ディレクトリに置く、元の移動先を記録したファイル
+TARGET_MARKER = ".target"
+# 同じ名前で重ねて退避したファイルの、2つ目以降の退避名（report.csv.1.dup）。
+# 送る時に元の名前に戻し、移動先との衝突として collisionN に従って扱う
+DUPLICATE_NAME = re.compile(r"^(.+)\.(\d+)\.dup$")
+
+
+def _spooled_files(spool_dir: Path) -> list[Path]:
+    """退避ディレクトリ内のファイル（移動先の記録を除く。サブディレクトリも含む）"""
+    return [
+        p
+        for p in spool_dir.rglob("*")
+        if p.is_file() and p.relative_to(spool_dir) != Path(TARGET_MARKER)
+    ]
+
+
+@dataclass
+class TargetHealth:
+    """移動先ディレクトリの到達状態"""
+
+    directory: Path
+    spool_dir: Path
+    online: bool = True
+    # 到達できない場合の次回確認時刻（time.monotonic）と、その次の待ち時間
+    next_probe: float = 0.0
+    probe_delay: float = 0.0
+    spooled_files: int = 0
+    spooled_bytes: int = 0
+    flushed_files: int = 0
+    # 移動先に同じ名前のファイルがある場合の扱い（collisionN）
+    collision: str = COLLISION_OVERWRITE
+
+
+class TargetSpool:
+    """到達できない移動先へのファイルをローカルに退避し、復旧後にまとめて送る
+
+    退避したファイルは spool_dir 配下に移動先ごとのディレクトリを作って保存するため、
+    再起動後も引き継がれる。到達できない移動先は指数バックオフで確認し、
+    復旧したら flush_workers 本のスレッドで送り出す。送り出しは通常の移動と同じく
+    移動先ごとの制限（max_concurrencyN / bandwidthN）と検証（verifyN）に従い、
+    manifestN を指定した移動先ではマニフェストに追記する。
+    """
+
+    def __init__(
+        self,
+        spool_dir: Path,
+        max_bytes: int,
+        probe_base_delay: float = 5.0,
+        probe_max_delay: float = 300.0,
+        flush_workers: int = 2,
+        ledger: Optional[TransferLedger] = None,
+        target_index: Optional[TargetIndex] = None,
+        versions: Optional[VersionIndex] = None,
+        throttles: Optional[ThrottleRegistry] = None,
+        manifests: Optional[ManifestRegistry] = None,
+    ) -> None:
+        self.spool_dir: Path = spool_dir
+        self.max_bytes: int = max_bytes
+        self.probe_base_delay: float = probe_base_delay
+        self.probe_max_delay: float = probe_max_delay
+        self.flush_workers: int = flush_workers
+        self.ledger: Optional[TransferLedger] = ledger
+        # 送り出したファイルを移動先のファイル名の一覧に反映する（無効な場合はNone）
+        self.target_index: Optional[TargetIndex] = target_index
+        self.versions: VersionIndex = versions or VersionIndex()
+        # 同じ名前で重ねて退避したファイルの退避名の連番（退避ディレクトリごとに数える）
+        self._duplicates = VersionIndex(naming=_duplicate_name, parse=_duplicate_base)
+        # 未指定の場合は退避したファイルの送り出しの間でのみ制限・マニフェストを共有する
+        self.throttles: ThrottleRegistry = throttles or ThrottleRegistry()
+        self.manifests: ManifestRegistry = manifests or ManifestRegistry()
+        # 移動先ディレクトリごとのルール（制限・検証・マニフェストの指定に使う）
+        self._rules: dict[str, TargetRule] = {}
+        self._targets: dict[str, TargetHealth] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, rules: Optional[list[TargetRule]] = None) -> None:
+        """退避済みのファイルを読み込み、移動先の確認スレッドを開始する
+
+        rules には設定された移動先ルールを渡す（同じ移動先を複数のルールが指す場合は
+        最初のルールの指定に従う）。設定から外れた移動先へは制限・検証なしで送る。
+        """
+        for rule in rules or []:
+            self._rules.setdefault(str(rule.directory), rule)
+        self._load()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="TargetSpool", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """確認スレッドを停止する（退避済みのファイルはそのまま残る）"""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+    def is_available(self, directory: Path) -> bool:
+        """移動先が到達可能とみなせるか（到達できないと判定済みならFalse）"""
+        health = self._targets.get(str(directory))
+        return health is None or health.online
+
+    def mark_offline(self, directory: Path) -> None:
+        """移動先を到達不能として確認の対象にする"""
+        with self._condition:
+            health = self._health(directory)
+            if not health.online:
+                return
+            health.online = False
+            health.probe_delay = self.probe_base_delay
+            health.next_probe = time.monotonic() + health.probe_delay
+            self._condition.notify()
+        logger.warning(f"移動先に到達できません。復旧まで退避します: {directory}")
+
+    def hold(
+        self,
+        path: Path,
+        target_path: Path,
+        copy: bool = False,
+        directory: Optional[Path] = None,
+        collision: str = COLLISION_OVERWRITE,
+    ) -> bool:
+        """ファイルを退避する（退避領域の上限を超える場合はFalse）
+
+        copy が True の場合は移動元を残し、複製を退避する。target_path が移動先
+        ディレクトリ配下のサブディレクトリにある場合は directory に移動先ディレクトリを
+        渡す（復旧後は同じサブディレクトリに届ける）。collision は復旧後に届ける時の
+        移動先での衝突の扱いで、overwrite 以外では同じ名前で退避済みのファイルも残す。
+        """
+        directory = directory if directory is not None else target_path.parent
+        size = path.stat().st_size
+        with self._condition:
+            if self.max_bytes > 0 and self.spooled_bytes() + size > self.max_bytes:
+                logger.error(f"退避領域の上限に達したため退避できません: {path}")
+                return False
+            health = self._health(directory)
+            changed = health.collision != collision
+            health.collision = collision
+
+        health.spool_dir.mkdir(parents=True, exist_ok=True)
+        marker = health.spool_dir / TARGET_MARKER
+        if changed or not marker.exists():
+            marker.write_text(f"{directory}\n{collision}", encoding="utf-8")
+
+        spooled_path = health.spool_dir / target_path.relative_to(directory)
+        spooled_path.parent.mkdir(parents=True, exist_ok=True)
+        replaced = None
+        if spooled_path.exists():
+            if collision == COLLISION_OVERWRITE:
+                # 移動先での上書きと同じく、後から来たものに置き換える
+                replaced = spooled_path.stat().st_size
+            else:
+                spooled_path = self._duplicates.next_path(spooled_path, Path.exists)
+        if copy:
+            shutil.copy2(path, spooled_path)
+        else:
+            shutil.move(str(path), str(spooled_path))
+
+        with self._condition:
+            if replaced is None:
+                health.spooled_files += 1
+            else:
+                health.spooled_bytes -= replaced
+            health.spooled_bytes += size
+        logger.info(
+            f"ファイルを退避しました: {path.name} -> {spooled_path}（移動先: {target_path}）"
+        )
+        return True
+
+    def spooled_bytes(self) -> int:
+        return sum(health.spooled_bytes for health in self._targets.values())
+
+    def stats(self) -> dict[str, dict[str, object]]:
+        """移動先ごとの到達状態と退避状況を返す"""
+        with self._condition:
+            return {
+                key: {
+                    "online": health.online,
+                    "spooled_files": health.spooled_files,
+                    "spooled_bytes": health.spooled_bytes,
+                    "flushed_files": health.flushed_files,
+                }
+                for key, health in self._targets.items()
+            }
+
+    def _health(self, directory: Path) -> TargetHealth:
+        """移動先の状態を取得する（呼び出し元でロックを保持すること）"""
+        key = str(directory)
+        health = self._targets.get(key)
+        if health is None:
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            health = TargetHealth(directory=directory, spool_dir=self.spool_dir / digest)
+            self._targets[key] = health
+        return health
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                due = self._due_targets()
+                while not due and not self._stopping:
+                    self._condition.wait(self._next_timeout())
+                    due = self._due_targets()
+                if self._stopping:
+                    return
+
+            for health in due:
+                self._probe(health)
+
+    def _due_targets(self) -> list[TargetHealth]:
+        now = time.monotonic()
+        return [h for h in self._targets.values() if not h.online and h.next_probe <= now]
+
+    def _next_timeout(self) -> Optional[float]:
+        probes = [h.next_probe for h in self._targets.values() if not h.online]
+        if not probes:
+            return None
+        return max(0.0, min(probes) - time.monotonic())
+
+    def _probe(self, health: TargetHealth) -> None:
+        """移動先を確認し、復旧していれば退避済みのファイルを送る"""
+        if not os.path.isdir(health.directory):
+            with self._condition:
+                health.probe_delay = min(self.probe_max_delay, health.probe_delay * 2)
+                health.next_probe = time.monotonic() + health.probe_delay
+            logger.debug(f"移動先はまだ到達できません: {health.directory}")
+            return
+
+        logger.info(f"移動先が復旧しました: {health.directory}")
+        if self._flush(health):
+            with self._condition:
+                health.online = True
+            # 送信中に退避されたファイルを送る
+            self._flush(health)
+        else:
+            with self._condition:
+                health.probe_delay = self.probe_base_delay
+                health.next_probe = time.monotonic() + health.probe_delay
+
+    def _flush(self, health: TargetHealth) -> bool:
+        """退避済みのファイルを移動先へ送る（全て送れた場合はTrue）"""
+        if not health.spool_dir.exists():
+            return True
+
+        spooled = _spooled_files(health.spool_dir)
+        if not spooled:
+            return True
+        # 同じ名前で重ねて退避したファイルは、先に退避した分を届けてから古い順に届ける
+        # （移動先での衝突の判定が並列の送信と競合しないようにする）
+        duplicates = sorted(
+            (p for p in spooled if DUPLICATE_NAME.match(p.name)), key=_duplicate_order
+        )
+        firsts = [p for p in spooled if not DUPLICATE_NAME.match(p.name)]
+        with ThreadPoolExecutor(
+            max_workers=self.flush_workers, thread_name_prefix="SpoolFlush"
+        ) as executor:
+            results = list(executor.map(lambda p: self._deliver(health, p), firsts))
+        results.extend(self._deliver(health, p) for p in duplicates)
+
+        delivered = sum(results)
+        logger.info(
+            f"退避していたファイルを送りました: {delivered}/{len(spooled)}件 -> {health.directory}"
+        )
+        return delivered == len(spooled)
+
+    def _deliver(self, health: TargetHealth, spooled_path: Path) -> bool:
+        target_path = health.directory / spooled_path.relative_to(health.spool_dir)
+        duplicate = DUPLICATE_NAME.match(target_path.name)
+        if duplicate is not None:
+            target_path = target_path.with_name(duplicate.group(1))
+        status = "flushed"
+        digest: Optional[str] = None
+        try:
+            size = spooled_path.stat().st_size
+            if target_path.parent != health.directory:
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+            if health.collision != COLLISION_OVERWRITE and self._target_exists(target_path):
+                if health.collision == COLLISION_KEEP_BOTH:
+                    target_path = self.versions.next_path(target_path, self._target_exists)
+                elif health.collision == COLLISION_SKIP_IF_NEWER and _is_newer(
+                    target_path, spooled_path
+                ):
+                    status = "skipped"
+            if status == "skipped":
+                # 移動先の方が新しいため届けない（退避したものは残しても送れないため削除する）
+                spooled_path.unlink()
+                logger.info(
+                    f"移動先の方が新しいため退避ファイルを届けませんでした: {target_path}"
+                )
+            else:
+                digest = self._move(health, spooled_path, target_path)
+        except Exception as e:
+            logger.error(
+                f"退避ファイルの送信に失敗しました: {spooled_path} -> {target_path}, エラー: {e}"
+            )
+            return False
+
+        with self._condition:
+            health.spooled_files -= 1
+            health.spooled_bytes -= size
+            if status == "flushed":
+                health.flushed_files += 1
+        if status == "flushed":
+            if self.target_index is not None:
+                self.target_index.add(target_path)
+            rule = self._rules.get(str(health.directory))
+            if rule is not None and rule.manifest:
+                self.manifests.record(health.directory, target_path, digest)
+        if self.ledger is not None:
+            self.ledger.record(spooled_path, target_path, size, status=status, digest=digest)
+        return True
+
+    def _move(self, health: TargetHealth, spooled_path: Path, target_path: Path) -> Optional[str]:
+        """退避したファイルを移動先のルールの制限・検証に従って送る（ハッシュ値を返す）"""
+        rule = self._rules.get(str(health.directory))
+        if rule is None:
+            return move_file(spooled_path, target_path)
+        return move_file(
+            spooled_path,
+            target_path,
+            self.throttles.get(rule),
+            rule.verify,
+            compute_digest=rule.manifest,
+        )
+
+    def _target_exists(self, path: Path) -> bool:
+        if self.target_index is None:
+            return path.exists()
+        return self.target_index.contains(path)
+
+    def _load(self) -> None:
+        """退避済みのファイルを読み込み、その移動先を確認の対象にする"""
+        if not self.spool_dir.exists():
+            return
+
+        for entry in self.spool_dir.iterdir():
+            marker = entry / TARGET_MARKER
+            if not marker.is_file():
+                continue
+            # 1行目が移動先、2行目が衝突の扱い（無い場合は上書き）
+            lines = marker.read_text(encoding="utf-8").splitlines()
+            directory = Path(lines[0])
+            files = _spooled_files(entry)
+            if not files:
+                continue
+            with self._condition:
+                health = self._health(directory)
+                health.collision = lines[1] if len(lines) > 1 else COLLISION_OVERWRITE
+                health.spooled_files = len(files)
+                health.spooled_bytes = sum(p.stat().st_size for p in files)
+                health.online = False
+                health.probe_delay = self.probe_base_delay
+                health.next_probe = 0.0
+            logger.info(
+                f"退避済みのファイルを引き継ぎました: {len(files)}件（移動先: {directory}）"
+            )
+
+
+def _duplicate_name(name: str, version: int) -> str:
+    """同じ名前で退避済みのファイルと重ならない退避名（report.csv.1.dup, report.csv.2.dup, ...）"""
+    return f"{name}.{version}.dup"
+
+
+def _duplicate_base(name: str) -> tuple[str, int]:
+    """退避名を元の名前と連番に分ける（重ねて退避したものでなければ連番は0）"""
+    matched = DUPLICATE_NAME.match(name)
+    if matched is None:
+        return name, 0
+    return matched.group(1), int(matched.group(2))
+
+
+def _duplicate_order(path: Path) -> tuple[str, int]:
+    base, version = _duplicate_base(path.name)
+    return str(path.with_name(base)), version
+
+
+def _is_newer(target_path: Path, spooled_path: Path) -> bool:
+    """移動先のファイルが退避したものと同じか新しいか"""
+    try:
+        return target_path.stat().st_mtime_ns >= spooled_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from utils.config_manager import TargetRule
+
+
+class TokenBucket:
+    """転送量（バイト/秒）を制限するトークンバケット
+
+    consume() は必要な分を先に予約し、不足分だけ呼び出し元を眠らせる。
+    複数スレッドで共有しても合計の転送量が rate を超えない。
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate: float = rate
+        # 一度に流せる量の上限。未指定の場合は1秒分
+        self.capacity: float = capacity if capacity is not None else rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens: float = self.capacity
+        self._updated_at: float = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        """amount バイト分のトークンを使う（足りない場合は溜まるまで待つ）"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            deficit = -self._tokens
+
+        if deficit > 0:
+            self._sleep(deficit / self.rate)
+
+
+class TransferThrottle:
+    """1つの移動先への同時転送数と転送量の制限"""
+
+    def __init__(self, max_concurrency: int = 0, bandwidth: int = 0) -> None:
+        self.max_concurrency: int = max_concurrency
+        self.bandwidth: int = bandwidth
+        self._slots: Optional[threading.BoundedSemaphore] = (
+            threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        )
+        self._bucket: Optional[TokenBucket] = TokenBucket(bandwidth) if bandwidth > 0 else None
+
+    @property
+    def limits_bandwidth(self) -> bool:
+        return self._bucket is not None
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """同時転送数の枠を1つ確保する（上限に達している場合は空くまで待つ）"""
+        if self._slots is None:
+            yield
+            return
+        with self._slots:
+            yield
+
+    def consume(self, amount: int) -> None:
+        """amount バイトの転送分だけ待つ"""
+        if self._bucket is not None:
+            self._bucket.consume(amount)
+
+
+class ThrottleRegistry:
+    """移動先ディレクトリごとの制限を、全ての監視元・ワーカーで共有する"""
+
+    def __init__(self) -> None:
+        self._throttles: dict[str, TransferThrottle] = {}
+        self._lock = threading.Lock()
+
+    def get(self, rule: TargetRule) -> Optional[TransferThrottle]:
+        """ルールの移動先に対応する制限を返す（制限が無い場合はNone）
+
+        同じ移動先を複数のルールが指す場合は、最初に取得したルールの制限を共有する。
+        """
+        if rule.max_concurrency <= 0 and rule.bandwidth <= 0:
+            return None
+
+        key = str(rule.directory)
+        with self._lock:
+            throttle = self._throttles.get(key)
+            if throttle is None:
+                throttle = TransferThrottle(rule.max_concurrency, rule.bandwidth)
+                self._throttles[key] = throttle
+            return throttle
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 記録をまとめて書き込む件数と、書き込みまでの最大待ち時間（秒）
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+# 保持期間を過ぎた記録を削除する間隔（秒）
+PURGE_INTERVAL = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    id INTEGER PRIMARY KEY,
+    moved_at REAL NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    target_name TEXT NOT NULL,
+    size INTEGER,
+    status TEXT NOT NULL,
+    digest TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transfers_name ON transfers (name, moved_at);
+CREATE INDEX IF NOT EXISTS idx_transfers_source ON transfers (source, moved_at);
+CREATE INDEX IF NOT EXISTS idx_transfers_target ON transfers (target, moved_at);
+CREATE INDEX IF NOT EXISTS idx_transfers_moved_at ON transfers (moved_at);
+"""
+
+INSERT_SQL = (
+    "INSERT INTO transfers (moved_at, name, source, target, target_name, size, status, digest) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+@dataclass(frozen=True)
+class TransferRecord:
+    """台帳に記録された1件のファイル移動"""
+
+    moved_at: float
+    name: str
+    source: str
+    target: str
+    target_name: str
+    size: Optional[int]
+    status: str
+    # 検証付きでコピーした場合の内容のハッシュ値（SHA-256）
+    digest: Optional[str] = None
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    """台帳ファイルに接続し、スキーマを用意する"""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    _migrate(conn)
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """以前の版で作成した台帳に不足している列を追加する"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(transfers)")}
+    if "digest" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE transfers ADD COLUMN digest TEXT")
+
+
+class TransferLedger:
+    """ファイル移動の記録をSQLiteへ書き込む台帳
+
+    record() はキューに積むだけで戻り、書き込みは専用スレッドがまとめて1トランザクションで行う。
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        retention_days: int = 90,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ) -> None:
+        self.db_path: Path = db_path
+        self.retention_days: int = retention_days
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self._queue: queue.Queue[Optional[tuple]] = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._last_purge: float = 0.0
+
+    def start(self) -> None:
+        """スキーマを用意し、書き込みスレッドを開始する"""
+        conn = _connect(self.db_path)
+        self._purge_expired(conn)
+        self._thread = threading.Thread(
+            target=self._run, args=(conn,), name="TransferLedger", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"移動記録を開始しました: {self.db_path}")
+
+    def record(
+        self,
+        source: Path,
+        target: Path,
+        size: Optional[int] = None,
+        status: str = "moved",
+        digest: Optional[str] = None,
+    ) -> None:
+        """ファイル移動を記録する（書き込みは非同期）"""
+        self._queue.put(
+            (
+                time.time(),
+                source.name,
+                str(source.parent),
+                str(target.parent),
+                target.name,
+                size,
+                status,
+                digest,
+            )
+        )
+
+    def close(self) -> None:
+        """未書き込みの記録を書き出してスレッドを停止する"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, conn: sqlite3.Connection) -> None:
+        """キューから記録を取り出し、まとめて書き込む"""
+        try:
+            running = True
+            while running:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    self._purge_if_due(conn)
+                    continue
+
+                batch = []
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                running = item is not None
+
+                self._write_batch(conn, batch)
+                self._purge_if_due(conn)
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list[tuple]) -> None:
+        """記録をまとめて1トランザクションで書き込む"""
+        if not batch:
+            return
+        try:
+            with conn:
+                conn.executemany(INSERT_SQL, batch)
+        except sqlite3.Error as e:
+            logger.error(f"移動記録の書き込みに失敗しました（{len(batch)}件）: {e}")
+
+    def _purge_if_due(self, conn: sqlite3.Connection) -> None:
+        if time.monotonic() - self._last_purge >= PURGE_INTERVAL:
+            self._purge_expired(conn)
+
+    def _purge_expired(self, conn: sqlite3.Connection) -> None:
+        """保持期間を過ぎた記録を削除する"""
+        self._last_purge = time.monotonic()
+        if self.retention_days <= 0:
+            return
+
+        cutoff = time.time() - self.retention_days * 86400
+        try:
+            with conn:
+                deleted = conn.execute("DELETE FROM transfers WHERE moved_at < ?", (cutoff,))
+            if deleted.rowcount > 0:
+                logger.info(f"古い移動記録を削除しました: {deleted.rowcount}件")
+        except sqlite3.Error as e:
+            logger.error(f"古い移動記録の削除に失敗しました: {e}")
+
+
+def query_transfers(
+    db_path: Path,
+    name: Optional[str] = None,
+    source: Optional[str] = None,
+    target: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 100,
+) -> list[TransferRecord]:
+    """条件に一致する移動記録を新しい順に取得する（ファイル名は大文字小文字を区別しない）"""
+    conditions = []
+    params: list[object] = []
+    for column, value in (("name", name), ("source", source), ("target", target)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        conditions.append("moved_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("moved_at < ?")
+        params.append(until)
+
+    sql = (
+        "SELECT moved_at, name, source, target, target_name, size, status, digest FROM transfers"
+    )
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY moved_at DESC LIMIT ?"
+    params.append(limit)
+
+    conn = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        return [TransferRecord(*row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
@@ -0,0 +1,271 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+import time
+from pathlib import Path
+
+import pytest
+
+from service.bundler import Bundler
+from service.content_hash import file_digest
+from service.target_index import TargetIndex
+from service.target_manifest import ManifestRegistry
+from utils.config_manager import TargetRule
+
+
+def make_rule(directory: Path, **kwargs) -> TargetRule:
+    """まとめて送るテスト用のTargetRuleを生成"""
+    kwargs.setdefault("bundle_seconds", 60.0)
+    return TargetRule(directory=directory, filenames=frozenset(), suffix="", pattern=None, **kwargs)
+
+
+@pytest.fixture
+def make_bundler(tmp_path):
+    """テスト終了時に停止するBundlerのファクトリ"""
+    bundlers = []
+
+    def _factory(**kwargs) -> Bundler:
+        bundler = Bundler(tmp_path / "bundles", **kwargs)
+        bundlers.append(bundler)
+        return bundler
+
+    yield _factory
+
+    for bundler in bundlers:
+        bundler.close()
+
+
+def wait_until(predicate, timeout: float = 2.0) -> bool:
+    """条件が満たされるまで待つ"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return predicate()
+
+
+def add_files(bundler: Bundler, rule: TargetRule, source: Path, names: list[str]) -> None:
+    source.mkdir(exist_ok=True)
+    for name in names:
+        path = source / name
+        path.write_text(f"content of {name}")
+        bundler.add(path, rule, name)
+
+
+def bundles_in(target: Path, pattern: str = "bundle_*.tar") -> list[Path]:
+    return sorted(target.glob(pattern))
+
+
+class TestBundlerAdd:
+    """ファイルを溜めるテスト"""
+
+    def test_add_moves_file_into_staging(self, make_bundler, tmp_path):
+        """溜めたファイルは移動元から取り除かれる"""
+        target = tmp_path / "target"
+        target.mkdir()
+        bundler = make_bundler()
+        rule = make_rule(target)
+
+        add_files(bundler, rule, tmp_path / "src", ["a.txt", "b.txt"])
+
+        assert list((tmp_path / "src").iterdir()) == []
+        assert list(target.iterdir()) == []
+        stats = bundler.stats()[str(target)]
+        assert stats["files"] == 2
+        assert stats["bytes"] == len("content of a.txt") * 2
+
+    def test_same_name_replaces_staged_file(self, make_bundler, tmp_path):
+        """同じ名前のファイルは後から溜めたものに置き換わる"""
+        target = tmp_path / "target"
+        bundler = make_bundler()
+        rule = make_rule(target)
+
+        add_files(bundler, rule, tmp_path / "src", ["a.txt"])
+        add_files(bundler, rule, tmp_path / "src", ["a.txt"])
+
+        assert bundler.stats()[str(target)]["files"] == 1
+
+    def test_keep_both_stages_versioned_name(self, make_bundler, tmp_path):
+        """keep_both の場合は同じ名前のファイルに連番を付けて両方溜める"""
+        target = tmp_path / "target"
+        target.mkdir()
+        bundler = make_bundler()
+        rule = make_rule(target, collision="keep_both")
+        source = tmp_path / "src"
+        source.mkdir()
+        names = []
+        for content in ("first", "second"):
+            (source / "a.txt").write_text(content)
+            names.append(bundler.add(source / "a.txt", rule, "a.txt"))
+
+        assert names == ["a.txt", "a_1.txt"]
+        # 連番は溜めているディレクトリを1回読んだカウンタから決める
+        assert bundler.versions.scans == 1
+        bundler.close()
+        [bundle] = bundles_in(target)
+        with tarfile.open(bundle) as tar:
+            assert sorted(tar.getnames()) == ["a.txt", "a_1.txt"]
+
+    def test_skip_if_newer_keeps_newer_staged_file(self, make_bundler, tmp_path):
+        """skip_if_newer の場合は溜めているものの方が新しければ溜めずに移動元を残す"""
+        bundler = make_bundler()
+        rule = make_rule(tmp_path / "target", collision="skip_if_newer")
+        source = tmp_path / "src"
+        source.mkdir()
+        (source / "a.txt").write_text("new")
+        bundler.add(source / "a.txt", rule, "a.txt")
+        (source / "a.txt").write_text("old")
+        os.utime(source / "a.txt", (1_000_000, 1_000_000))
+
+        assert bundler.add(source / "a.txt", rule, "a.txt") is None
+        assert (source / "a.txt").read_text() == "old"
+        assert bundler.stats()[str(tmp_path / "target")]["files"] == 1
+
+
+class TestBundlerFlush:
+    """まとめて送るテスト"""
+
+    def test_close_flushes_single_tar_with_index(self, make_bundler, tmp_path):
+        """終了時に溜めたファイルを1つの tar と索引にまとめて送る"""
+        target = tmp_path / "target"
+        target.mkdir()
+        bundler = make_bundler()
+        bundler.start([make_rule(target)])
+        add_files(bundler, make_rule(target), tmp_path / "src", ["a.txt", "b.txt"])
+
+        bundler.close()
+
+        [bundle] = bundles_in(target)
+        with tarfile.open(bundle) as tar:
+            assert sorted(tar.getnames()) == ["a.txt", "b.txt"]
+        index = json.loads((target / f"{bundle.name}.index.json").read_text(encoding="utf-8"))
+        assert index["bundle"] == bundle.name
+        assert sorted(entry["name"] for entry in index["files"]) == ["a.txt", "b.txt"]
+        assert bundler.stats()[str(target)]["files"] == 0
+
+    def test_close_updates_target_index(self, make_bundler, tmp_path):
+        """届けた tar と索引は移動先のファイル名の一覧に反映される"""
+        target = tmp_path / "target"
+        target.mkdir()
+        index = TargetIndex()
+        assert index.contains(target / "a.txt") is False
+        bundler = make_bundler(target_index=index)
+        bundler.start([make_rule(target)])
+        add_files(bundler, make_rule(target), tmp_path / "src", ["a.txt"])
+
+        bundler.close()
+
+        [bundle] = bundles_in(target)
+        assert index.contains(bundle) is True
+        assert index.contains(target / f"{bundle.name}.index.json") is True
+        assert index.scans == 1
+
+    def test_close_records_manifest(self, make_bundler, tmp_path):
+        """manifestN を指定した移動先では、届けた tar と索引をマニフェストに追記する"""
+        target = tmp_path / "target"
+        target.mkdir()
+        manifests = ManifestRegistry()
+        rule = make_rule(target, manifest=True)
+        bundler = make_bundler(manifests=manifests)
+        bundler.start([rule])
+        add_files(bundler, rule, tmp_path / "src", ["a.txt"])
+
+        bundler.close()
+
+        [bundle] = bundles_in(target)
+        entries = manifests.get(target).entries()
+        assert sorted(entries) == sorted([bundle.name, f"{bundle.name}.index.json"])
+        assert entries[bundle.name]["digest"] == file_digest(bundle)
+
+    def test_index_offsets_point_at_file_data(self, make_bundler, tmp_path):
+        """索引の位置から tar を直接読めばファイルの内容が得られる"""
+        target = tmp_path / "target"
+        target.mkdir()
+        bundler = make_bundler()
+        add_files(bundler, make_rule(target), tmp_path / "src", ["a.txt", "b.txt"])
+
+        bundler.close()
+
+        [bundle] = bundles_in(target)
+        index = json.loads((target / f"{bundle.name}.index.json").read_text(encoding="utf-8"))
+        data = bundle.read_bytes()
+        for entry in index["files"]:
+            content = data[entry["offset"] : entry["offset"] + entry["size"]]
+            assert content == f"content of {entry['name']}".encode()
+
+    def test_flushes_when_size_reached(self, make_bundler, tmp_path):
+        """溜めたファイルが上限サイズに達すると時間を待たずに送る"""
+        target = tmp_path / "target"
+        target.mkdir()
+        bundler = make_bundler()
+        rule = make_rule(target, bundle_max_bytes=20)
+        bundler.start([rule])
+
+        add_files(bundler, rule, tmp_path / "src", ["a.txt", "b.txt"])
+
+        assert wait_until(lambda: len(bundles_in(target, "*.index.json")) == 1)
+
+    def test_flushes_after_interval(self, make_bundler, tmp_path):
+        """最初のファイルを溜めてから指定秒数が経つと送る"""
+        target = tmp_path / "target"
+        target.mkdir()
+        bundler = make_bundler()
+        rule = make_rule(target, bundle_seconds=0.05)
+        bundler.start([rule])
+
+        add_files(bundler, rule, tmp_path / "src", ["a.txt"])
+
+        assert wait_until(lambda: len(bundles_in(target, "*.index.json")) == 1)
+
+    def test_compressed_bundle(self, make_bundler, tmp_path):
+        """圧縮を指定した移動先には tar 全体を圧縮して送る"""
+        target = tmp_path / "target"
+        target.mkdir()
+        bundler = make_bundler()
+        rule = make_rule(target, compress="gzip")
+        add_files(bundler, rule, tmp_path / "src", ["a.txt"])
+
+        bundler.close()
+
+        [bundle] = bundles_in(target, "bundle_*.tar.gz")
+        with tarfile.open(fileobj=io.BytesIO(gzip.decompress(bundle.read_bytes()))) as tar:
+            assert tar.getnames() == ["a.txt"]
+        assert (target / f"{bundle.name}.index.json").exists()
+
+    def test_failed_delivery_keeps_files(self, make_bundler, tmp_path):
+        """移動先に送れない場合は溜めたファイルを残し、次回送る"""
+        target = tmp_path / "target"
+        bundler = make_bundler()
+        rule = make_rule(target)
+        add_files(bundler, rule, tmp_path / "src", ["a.txt"])
+
+        bundler.close()
+        assert not target.exists()
+
+        target.mkdir()
+        second = make_bundler()
+        second.start([rule])
+        assert wait_until(lambda: len(bundles_in(target, "*.index.json")) == 1)
+        [bundle] = bundles_in(target)
+        with tarfile.open(bundle) as tar:
+            assert tar.getnames() == ["a.txt"]
+
+
+class TestBundlerRestart:
+    """再起動後の引き継ぎテスト"""
+
+    def test_staged_files_survive_restart(self, make_bundler, tmp_path):
+        """再起動後は溜めたままのファイルを時間を待たずに送る"""
+        target = tmp_path / "target"
+        target.mkdir()
+        rule = make_rule(target)
+        first = Bundler(tmp_path / "bundles")
+        add_files(first, rule, tmp_path / "src", ["a.txt"])
+
+        second = make_bundler()
+        second.start([rule])
+
+        assert wait_until(lambda: len(bundles_in(target, "*.index.json")) == 1)
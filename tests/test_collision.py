@@ -0,0 +1,58 @@
+from pathlib import Path
+
+from service.collision import VersionIndex, versioned_name
+
+
+class TestVersionedName:
+    """連番付きのファイル名のテスト"""
+
+    def test_inserts_version_before_suffix(self):
+        """拡張子の前に連番を付ける"""
+        assert versioned_name("report.csv", 3) == "report_3.csv"
+        assert versioned_name("README", 1) == "README_1"
+
+
+class TestVersionIndex:
+    """連番のカウンタのテスト"""
+
+    def test_first_version_is_one(self, tmp_path):
+        """連番付きのファイルが無い場合は _1 から"""
+        (tmp_path / "report.csv").write_text("x")
+        index = VersionIndex()
+
+        assert index.next_path(tmp_path / "report.csv", Path.exists) == tmp_path / "report_1.csv"
+        assert index.next_path(tmp_path / "report.csv", Path.exists) == tmp_path / "report_2.csv"
+
+    def test_continues_after_existing_versions(self, tmp_path):
+        """既存の最大の連番の次から付ける"""
+        for name in ("report.csv", "report_1.csv", "report_7.csv", "other_9.csv"):
+            (tmp_path / name).write_text("x")
+        index = VersionIndex()
+
+        assert index.next_path(tmp_path / "report.csv", Path.exists) == tmp_path / "report_8.csv"
+        assert index.next_path(tmp_path / "other.csv", Path.exists) == tmp_path / "other_10.csv"
+
+    def test_scans_directory_once(self, tmp_path):
+        """ディレクトリは最初の1回だけ読み、以降は存在確認を1回するだけ"""
+        for version in range(1, 1001):
+            (tmp_path / f"report_{version}.csv").write_text("x")
+        index = VersionIndex()
+        checked = []
+
+        def exists(path: Path) -> bool:
+            checked.append(path)
+            return path.exists()
+
+        for _ in range(3):
+            index.next_path(tmp_path / "report.csv", exists)
+
+        assert index.scans == 1
+        assert checked == [tmp_path / f"report_{v}.csv" for v in (1001, 1002, 1003)]
+
+    def test_skips_names_taken_after_scan(self, tmp_path):
+        """読み込み後に他のプロセスが作った連番は飛ばす"""
+        index = VersionIndex()
+        assert index.next_path(tmp_path / "a.txt", Path.exists) == tmp_path / "a_1.txt"
+        (tmp_path / "a_2.txt").write_text("x")
+
+        assert index.next_path(tmp_path / "a.txt", Path.exists) == tmp_path / "a_3.txt"
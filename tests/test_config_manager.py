@@ -3,7 +3,13 @@ from unittest.mock import patch
 
 import pytest
 
-from utils.config_manager import get_watch_rules
+from utils.config_manager import (
+    get_handler_settings,
+    get_ledger_settings,
+    get_retry_settings,
+    get_spool_settings,
+    get_watch_rules,
+)
 
 
 def write_config(tmp_path: Path, content: str) -> Path:
@@ -271,6 +277,482 @@ target_dir1 = C:\\dest\\A
 
         assert rules[0].targets[0].filename_regex is None
 
+    def test_throttle_options_per_target(self, config_factory):
+        """移動先ごとの同時転送数と転送量の上限が取得される"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+max_concurrency1 = 2
+bandwidth1 = 10M
+target_dir2 = C:\\dest\\B
+bandwidth2 = 512KB
+target_dir3 = C:\\dest\\C
+"""):
+            rules = get_watch_rules()
+
+        targets = rules[0].targets
+        assert (targets[0].max_concurrency, targets[0].bandwidth) == (2, 10 * 1024 * 1024)
+        assert (targets[1].max_concurrency, targets[1].bandwidth) == (0, 512 * 1024)
+        assert (targets[2].max_concurrency, targets[2].bandwidth) == (0, 0)
+
+    def test_fanout_option(self, config_factory):
+        """[WatchN]のfanoutが取得される（既定はFalse）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src1
+target_dir1 = C:\\dest\\A
+fanout = True
+
+[Watch2]
+processing_dir = C:\\src2
+target_dir1 = C:\\dest\\B
+"""):
+            rules = get_watch_rules()
+
+        assert [rule.fanout for rule in rules] == [True, False]
+
+    def test_ignore_defaults(self, config_factory):
+        """既定では一時ファイル・編集中のファイルを無視する（大文字・小文字は区別しない）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+"""):
+            rules = get_watch_rules()
+
+        ignore = rules[0].ignore
+        assert ignore is not None
+        for name in ("a.crdownload", "b.PART", "~$report.docx", "c.tmp", "Thumbs.db"):
+            assert ignore.match(name), name
+        for name in ("report.docx", "part.txt", "tmp.csv"):
+            assert not ignore.match(name), name
+
+    def test_ignore_patterns_per_watch(self, config_factory):
+        """[WatchN]のignoreが既定のパターンに加わり、ignore_defaultsで既定を外せる"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src1
+target_dir1 = C:\\dest\\A
+ignore = *.bak, draft_*
+
+[Watch2]
+processing_dir = C:\\src2
+target_dir1 = C:\\dest\\B
+ignore = *.bak
+ignore_defaults = False
+
+[Watch3]
+processing_dir = C:\\src3
+target_dir1 = C:\\dest\\C
+ignore_defaults = False
+"""):
+            rules = get_watch_rules()
+
+        first, second = rules[0].ignore, rules[1].ignore
+        assert first is not None and second is not None
+        assert first.match("x.bak") and first.match("draft_1.txt")
+        assert first.match("x.tmp")
+        assert second.match("x.bak") and not second.match("x.tmp")
+        assert rules[2].ignore is None
+
+    def test_processing_dir_glob(self, config_factory):
+        """processing_dir のワイルドカードより前を監視元、以降を監視元のパターンとする"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\drops\\PC-*
+target_dir1 = C:\\dest
+[Watch2]
+processing_dir = C:\\src
+target_dir1 = C:\\dest
+"""):
+            rules = get_watch_rules()
+
+        assert rules[0].source == Path(r"C:\drops")
+        assert rules[0].source_glob is not None
+        assert rules[0].source_glob.pattern == "PC-*"
+        assert rules[1].source_glob is None
+
+    def test_recursive_and_subtree_options(self, config_factory):
+        """recursive・path_regexN・keep_treeN が取得される（既定は無効）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+recursive = True
+target_dir1 = C:\\dest\\A
+path_regex1 = ^scanner/
+keep_tree1 = True
+target_dir2 = C:\\dest\\B
+"""):
+            rules = get_watch_rules()
+
+        first, second = rules[0].targets
+        assert rules[0].recursive is True
+        assert first.path_regex is not None
+        assert first.path_regex.pattern == "^scanner/"
+        assert first.keep_tree is True
+        assert (second.path_regex, second.keep_tree) == (None, False)
+
+    def test_delivery_per_target(self, config_factory):
+        """移動先ごとの配信方法が取得される（既定はlink）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+delivery1 = reflink
+target_dir2 = C:\\dest\\B
+delivery2 = COPY
+target_dir3 = C:\\dest\\C
+"""):
+            rules = get_watch_rules()
+
+        assert [t.delivery for t in rules[0].targets] == ["reflink", "copy", "link"]
+
+    def test_verify_per_target(self, config_factory):
+        """移動先ごとの検証方法が取得される（既定はoff）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+verify1 = reread
+target_dir2 = C:\\dest\\B
+verify2 = fsync
+target_dir3 = C:\\dest\\C
+"""):
+            rules = get_watch_rules()
+
+        assert [t.verify for t in rules[0].targets] == ["reread", "fsync", "off"]
+
+    def test_invalid_verify_raises(self, config_factory):
+        """検証方法の指定が無効な場合はValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+verify1 = md5
+"""):
+            with pytest.raises(ValueError, match="検証方法の指定が無効です"):
+                get_watch_rules()
+
+    def test_manifest_per_target(self, config_factory):
+        """移動先ごとのマニフェストの有無が取得される（既定は無効）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+manifest1 = True
+target_dir2 = C:\\dest\\B
+"""):
+            rules = get_watch_rules()
+
+        assert [t.manifest for t in rules[0].targets] == [True, False]
+
+    def test_compress_per_target(self, config_factory):
+        """移動先ごとの圧縮形式とレベルが取得される（既定は圧縮しない）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+compress1 = gzip
+compress_level1 = 9
+target_dir2 = C:\\dest\\B
+compress2 = ZSTD
+target_dir3 = C:\\dest\\C
+"""):
+            rules = get_watch_rules()
+
+        targets = rules[0].targets
+        assert [(t.compress, t.compress_level) for t in targets] == [
+            ("gzip", 9),
+            ("zstd", 0),
+            (None, 0),
+        ]
+
+    def test_invalid_compress_raises(self, config_factory):
+        """圧縮形式の指定が無効な場合はValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+compress1 = bzip2
+"""):
+            with pytest.raises(ValueError, match="圧縮形式の指定が無効です"):
+                get_watch_rules()
+
+    def test_fanout_with_compress_raises(self, config_factory):
+        """fanoutとcompressNは同時に指定できない"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+fanout = True
+target_dir1 = C:\\dest\\A
+compress1 = gzip
+"""):
+            with pytest.raises(ValueError, match="同時に指定できません"):
+                get_watch_rules()
+
+    def test_bundle_per_target(self, config_factory):
+        """移動先ごとのまとめて送る設定が取得される（既定はまとめない）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+bundle_seconds1 = 30
+bundle_max_size1 = 16M
+bundle_file_limit1 = 256K
+target_dir2 = C:\\dest\\B
+"""):
+            rules = get_watch_rules()
+
+        first, second = rules[0].targets
+        assert (first.bundle_seconds, first.bundle_max_bytes, first.bundle_file_limit) == (
+            30.0,
+            16 * 1024**2,
+            256 * 1024,
+        )
+        assert second.bundle_seconds == 0.0
+        assert second.bundle_max_bytes == 64 * 1024**2
+
+    def test_fanout_with_bundle_raises(self, config_factory):
+        """fanoutとbundle_secondsNは同時に指定できない"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+fanout = True
+target_dir1 = C:\\dest\\A
+bundle_seconds1 = 10
+"""):
+            with pytest.raises(ValueError, match="同時に指定できません"):
+                get_watch_rules()
+
+    def test_layout_per_target(self, config_factory):
+        """移動先ごとのファイルの置き方が取得される（既定は flat）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+layout1 = hash
+shard_levels1 = 3
+shard_width1 = 1
+target_dir2 = C:\\dest\\B
+layout2 = DATE
+target_dir3 = C:\\dest\\C
+"""):
+            rules = get_watch_rules()
+
+        assert [(t.layout, t.shard_levels, t.shard_width) for t in rules[0].targets] == [
+            ("hash", 3, 1),
+            ("date", 0, 2),
+            ("flat", 0, 2),
+        ]
+
+    def test_invalid_layout_raises(self, config_factory):
+        """ファイルの置き方の指定が無効な場合はValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+layout1 = random
+"""):
+            with pytest.raises(ValueError, match="ファイルの置き方の指定が無効です"):
+                get_watch_rules()
+
+    def test_too_deep_hash_layout_raises(self, config_factory):
+        """hash の階層数×文字数がハッシュ値の長さを超える場合はValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+layout1 = hash
+shard_width1 = 30
+"""):
+            with pytest.raises(ValueError, match="shard_levels1 / shard_width1"):
+                get_watch_rules()
+
+    def test_collision_per_target(self, config_factory):
+        """移動先ごとの同じ名前のファイルがある場合の扱いが取得される（既定は上書き）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+collision1 = keep_both
+target_dir2 = C:\\dest\\B
+collision2 = Skip_If_Newer
+target_dir3 = C:\\dest\\C
+"""):
+            rules = get_watch_rules()
+
+        assert [t.collision for t in rules[0].targets] == [
+            "keep_both",
+            "skip_if_newer",
+            "overwrite",
+        ]
+
+    def test_invalid_collision_raises(self, config_factory):
+        """同じ名前のファイルがある場合の扱いの指定が無効な場合はValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+collision1 = rename
+"""):
+            with pytest.raises(ValueError, match="扱いの指定が無効です"):
+                get_watch_rules()
+
+    def test_template_per_target(self, config_factory):
+        """移動先ごとの名前のテンプレートが regexN と合わせて解析される"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+regex1 = ^(\\w+)-(\\d+)
+template1 = {g2}_{g1}{ext}
+target_dir2 = C:\\dest\\B
+"""):
+            rules = get_watch_rules()
+
+        first, second = rules[0].targets
+        assert first.template is not None
+        assert first.filename_regex is not None
+        assert first.template.render(Path("a-1.txt"), first.filename_regex.search("a-1.txt")) == (
+            "1_a.txt"
+        )
+        assert second.template is None
+
+    def test_template_keeps_date_format(self, config_factory):
+        """テンプレートの日時の書式（%Y など）は補間されない"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+template1 = {mtime:%Y%m%d}_{name}
+"""):
+            rules = get_watch_rules()
+
+        template = rules[0].targets[0].template
+        assert template is not None
+        assert template.template == "{mtime:%Y%m%d}_{name}"
+
+    def test_template_format_mismatch_raises(self, config_factory):
+        """グループ（文字列）に数値の書式を指定したテンプレートは読み込み時にエラー"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+regex1 = (\\d+)
+template1 = {g1:04d}{ext}
+"""):
+            with pytest.raises(ValueError, match="書式が項目の値に合いません"):
+                get_watch_rules()
+
+    def test_template_counter_requires_keep_both(self, config_factory):
+        """起動ごとに数え直す {counter} は keep_both 以外ではエラー"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+template1 = {counter:04d}{ext}
+"""):
+            with pytest.raises(ValueError, match="keep_both の場合のみ使えます"):
+                get_watch_rules()
+
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+template1 = {counter:04d}{ext}
+collision1 = keep_both
+"""):
+            rules = get_watch_rules()
+
+        template = rules[0].targets[0].template
+        assert template is not None
+        assert template.uses_counter is True
+
+    def test_content_types_per_target(self, config_factory):
+        """移動先ごとのファイルの種類の指定が集合として解析される"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+content_type1 = PDF, zip
+target_dir2 = C:\\dest\\B
+"""):
+            rules = get_watch_rules()
+
+        assert rules[0].targets[0].content_types == frozenset({"pdf", "zip"})
+        assert rules[0].targets[1].content_types == frozenset()
+
+    def test_invalid_content_type_raises(self, config_factory):
+        """不明なファイルの種類はValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+content_type1 = pdf, docx
+"""):
+            with pytest.raises(ValueError, match="ファイルの種類の指定が無効です"):
+                get_watch_rules()
+
+    def test_invalid_template_raises(self, config_factory):
+        """regexN に無いグループを使うテンプレートはValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+template1 = {g1}{ext}
+"""):
+            with pytest.raises(ValueError, match="グループ 1 がありません"):
+                get_watch_rules()
+
+    def test_dedup_per_target(self, config_factory):
+        """移動先ごとの重複判定の有無が取得される（既定は無効）"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+dedup1 = True
+target_dir2 = C:\\dest\\B
+"""):
+            rules = get_watch_rules()
+
+        assert [t.dedup for t in rules[0].targets] == [True, False]
+
+    def test_invalid_delivery_raises(self, config_factory):
+        """配信方法の指定が無効な場合はValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+delivery1 = symlink
+"""):
+            with pytest.raises(ValueError, match="配信方法の指定が無効です"):
+                get_watch_rules()
+
+    def test_device_workers_per_target(self, config_factory):
+        """移動先ごとのデバイスのワーカー数が取得される"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+device_workers1 = 4
+target_dir2 = C:\\dest\\B
+"""):
+            rules = get_watch_rules()
+
+        assert [t.device_workers for t in rules[0].targets] == [4, 0]
+
+    def test_invalid_bandwidth_raises(self, config_factory):
+        """転送量の指定が無効な場合はValueError"""
+        with config_factory("""
+[Watch1]
+processing_dir = C:\\src
+target_dir1 = C:\\dest\\A
+bandwidth1 = fast
+"""):
+            with pytest.raises(ValueError, match="サイズの指定が無効です"):
+                get_watch_rules()
+
     def test_invalid_regex_raises(self, config_factory):
         """不正な正規表現はエラー"""
         import re
@@ -283,3 +765,150 @@ regex1 = [invalid
 """):
             with pytest.raises(re.error):
                 get_watch_rules()
+
+
+class TestGetLedgerSettings:
+    """移動記録設定の解釈テスト"""
+
+    def test_defaults_without_section(self, config_factory):
+        """[Ledger]が無い場合は既定値"""
+        with config_factory("""
+[App]
+wait_time = 0.5
+"""):
+            settings = get_ledger_settings()
+
+        assert settings.enabled is True
+        assert settings.db_path.name == "transfers.db"
+        assert settings.db_path.is_absolute()
+        assert settings.retention_days == 90
+
+    def test_values_from_section(self, config_factory, tmp_path):
+        """[Ledger]の値が反映される"""
+        db_path = tmp_path / "ledger.db"
+        with config_factory(f"""
+[Ledger]
+enabled = False
+db_path = {db_path}
+retention_days = 30
+"""):
+            settings = get_ledger_settings()
+
+        assert settings.enabled is False
+        assert settings.db_path == db_path
+        assert settings.retention_days == 30
+
+
+class TestGetHandlerSettings:
+    """ファイル処理設定の解釈テスト"""
+
+    def test_defaults_without_options(self, config_factory):
+        """設定が無い場合は既定値"""
+        with config_factory("""
+[App]
+wait_time = 0.5
+"""):
+            settings = get_handler_settings()
+
+        assert settings.negative_cache_size == 1024
+        assert settings.negative_cache_dir is not None
+        assert settings.negative_cache_dir.parts[-2:] == ("logs", "unmatched")
+        assert settings.early_rule_check is False
+        assert settings.workers_per_device == 0
+        assert settings.hash_cache_size == 4096
+        assert settings.target_index is False
+        assert settings.target_index_refresh == 300.0
+        assert settings.target_index_watch is False
+        assert settings.adaptive_wait is False
+        assert settings.wait_min == 0.25
+        assert settings.wait_max == 30.0
+        assert settings.close_write is False
+        assert settings.sniff_bytes == 4096
+        assert settings.sniff_cache_size == 4096
+
+    def test_values_from_app_section(self, config_factory):
+        """[App]の値が反映される"""
+        with config_factory("""
+[App]
+negative_cache_size = 10
+negative_cache_dir =
+early_rule_check = True
+workers_per_device = 4
+target_index = True
+target_index_refresh = 0
+target_index_watch = True
+adaptive_wait = True
+wait_min = 0.1
+wait_max = 5
+close_write = True
+sniff_bytes = 8K
+sniff_cache_size = 16
+"""):
+            settings = get_handler_settings()
+
+        assert settings.negative_cache_size == 10
+        assert settings.negative_cache_dir is None
+        assert settings.early_rule_check is True
+        assert settings.workers_per_device == 4
+        assert settings.target_index is True
+        assert settings.target_index_refresh == 0.0
+        assert settings.target_index_watch is True
+        assert settings.adaptive_wait is True
+        assert settings.wait_min == 0.1
+        assert settings.wait_max == 5.0
+        assert settings.close_write is True
+        assert settings.sniff_bytes == 8192
+        assert settings.sniff_cache_size == 16
+
+
+class TestGetRetrySettings:
+    """再試行設定の解釈テスト"""
+
+    def test_defaults_without_section(self, config_factory):
+        """[Retry]が無い場合は既定値で隔離先なし"""
+        with config_factory("""
+[App]
+wait_time = 0.5
+"""):
+            settings = get_retry_settings()
+
+        assert settings.enabled is True
+        assert settings.max_attempts == 5
+        assert settings.state_path.name == "retry_queue.json"
+        assert settings.quarantine_dir is None
+
+    def test_values_from_section(self, config_factory):
+        """[Retry]の値が反映される"""
+        with config_factory("""
+[Retry]
+max_attempts = 3
+base_delay = 1.5
+max_delay = 30
+quarantine_dir = C:\\quarantine
+"""):
+            settings = get_retry_settings()
+
+        assert settings.max_attempts == 3
+        assert settings.base_delay == 1.5
+        assert settings.max_delay == 30.0
+        assert settings.quarantine_dir == Path(r"C:\quarantine")
+
+
+class TestGetSpoolSettings:
+    """退避設定の解釈テスト"""
+
+    def test_values_from_section(self, config_factory, tmp_path):
+        """[Spool]の値が反映され、上限はバイトに換算される"""
+        with config_factory(f"""
+[Spool]
+enabled = True
+spool_dir = {tmp_path}
+max_size_mb = 2
+flush_workers = 4
+"""):
+            settings = get_spool_settings()
+
+        assert settings.spool_dir == tmp_path
+        assert settings.max_bytes == 2 * 1024 * 1024
+        assert settings.flush_workers == 4
+        assert settings.probe_base_delay == 5.0
@@ -0,0 +1,71 @@
+import hashlib
+from unittest.mock import patch
+
+from service.content_hash import HashCache, file_digest
+
+
+class TestFileDigest:
+    """file_digest関数のテスト"""
+
+    def test_returns_sha256(self, tmp_path):
+        """SHA-256のハッシュ値を返す"""
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"content")
+
+        assert file_digest(path) == hashlib.sha256(b"content").hexdigest()
+
+
+class TestHashCache:
+    """HashCacheクラスのテスト"""
+
+    def test_digest_is_cached_until_file_changes(self, tmp_path):
+        """内容が変わらない限り読み直さない"""
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"content")
+        cache = HashCache()
+
+        with patch("service.content_hash.file_digest", wraps=file_digest) as mock_digest:
+            cache.digest(path)
+            cache.digest(path)
+            path.write_bytes(b"changed content")
+            cache.digest(path)
+
+        assert mock_digest.call_count == 2
+
+    def test_oldest_entries_are_evicted(self, tmp_path):
+        """上限を超えた分は古いものから捨てる"""
+        cache = HashCache(max_entries=1)
+        for name in ("a.txt", "b.txt"):
+            (tmp_path / name).write_bytes(name.encode())
+            cache.digest(tmp_path / name)
+
+        with patch("service.content_hash.file_digest", wraps=file_digest) as mock_digest:
+            cache.digest(tmp_path / "a.txt")
+
+        assert mock_digest.call_count == 1
+
+    def test_is_duplicate(self, tmp_path):
+        """同じ内容ならTrue、違う内容ならFalse"""
+        source = tmp_path / "source.txt"
+        source.write_bytes(b"content")
+        same = tmp_path / "same.txt"
+        same.write_bytes(b"content")
+        other = tmp_path / "other.txt"
+        other.write_bytes(b"CONTENT")
+        cache = HashCache()
+
+        assert cache.is_duplicate(source, same) is True
+        assert cache.is_duplicate(source, other) is False
+        assert cache.is_duplicate(source, tmp_path / "missing.txt") is False
+
+    def test_different_size_is_not_read(self, tmp_path):
+        """サイズが違う場合はハッシュ値を求めない"""
+        source = tmp_path / "source.txt"
+        source.write_bytes(b"content")
+        target = tmp_path / "target.txt"
+        target.write_bytes(b"longer content")
+
+        with patch("service.content_hash.file_digest") as mock_digest:
+            assert HashCache().is_duplicate(source, target) is False
+
+        mock_digest.assert_not_called()
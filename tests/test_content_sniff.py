@@ -0,0 +1,100 @@
+import pytest
+
+from service.content_sniff import RIFF_TYPES, SIGNATURES, ContentSniffer, detect
+from utils.config_manager import CONTENT_TYPES
+
+
+class TestDetect:
+    """先頭のバイト列による種類の判定テスト"""
+
+    @pytest.mark.parametrize(
+        "header, kind",
+        [
+            (b"%PDF-1.7\n", "pdf"),
+            (b"\x89PNG\r\n\x1a\n\x00\x00", "png"),
+            (b"\xff\xd8\xff\xe0\x00\x10JFIF", "jpeg"),
+            (b"PK\x03\x04\x14\x00", "zip"),
+            (b"\x1f\x8b\x08\x00", "gzip"),
+            (b"\x00" * 257 + b"ustar\x0000", "tar"),
+            (b"RIFF\x24\x00\x00\x00WAVEfmt ", "wav"),
+            (b"SQLite format 3\x00", "sqlite"),
+            (b"<?xml version='1.0'?>", "xml"),
+        ],
+    )
+    def test_signatures(self, header, kind):
+        """既知のマジックナンバーを判定する"""
+        assert detect(header) == kind
+
+    def test_text(self):
+        """NUL を含まない UTF-8 はテキスト"""
+        assert detect("id,name\n1,山田\n".encode()) == "text"
+
+    def test_truncated_multibyte_is_text(self):
+        """読んだ範囲の末尾で途切れた文字があってもテキスト"""
+        assert detect("山田".encode()[:-1]) == "text"
+
+    def test_binary_and_empty_are_unknown(self):
+        """判定できないバイナリと空のファイルはNone"""
+        assert detect(b"\x00\x01\x02\x03") is None
+        assert detect(b"\x80\x81\xfe") is None
+        assert detect(b"") is None
+
+    def test_all_kinds_are_configurable(self):
+        """判定し得る全ての種類を content_typeN に指定できる"""
+        kinds = {kind for kind, _, _ in SIGNATURES} | set(RIFF_TYPES.values()) | {"text"}
+        assert kinds == set(CONTENT_TYPES)
+
+
+class TestContentSniffer:
+    """判定結果を覚えておくテスト"""
+
+    def test_result_is_cached(self, tmp_path):
+        """同じファイルは読み直さない"""
+        sniffer = ContentSniffer()
+        path = tmp_path / "scan.dat"
+        path.write_bytes(b"%PDF-1.7\n")
+
+        assert sniffer.sniff(path) == "pdf"
+        assert sniffer.sniff(path) == "pdf"
+        assert sniffer.reads == 1
+
+    def test_changed_file_is_read_again(self, tmp_path):
+        """サイズ・更新時刻が変わったファイルは読み直す"""
+        sniffer = ContentSniffer()
+        path = tmp_path / "scan.dat"
+        path.write_bytes(b"%PDF-1.7\n")
+        sniffer.sniff(path)
+
+        path.write_bytes(b"PK\x03\x04 longer content")
+
+        assert sniffer.sniff(path) == "zip"
+        assert sniffer.reads == 2
+
+    def test_reads_only_header_from_given_handle(self, tmp_path):
+        """開いているハンドルから先頭の header_size バイトだけを読む"""
+        sniffer = ContentSniffer(header_size=8)
+        path = tmp_path / "data.bin"
+        path.write_bytes(b"%PDF-1.7" + b"\x00" * 100)
+
+        with open(path, "rb") as f:
+            f.read(4)
+            assert sniffer.sniff(path, f) == "pdf"
+            assert f.tell() == 8
+
+    def test_missing_file_is_unknown(self, tmp_path):
+        """存在しないファイルはNone"""
+        assert ContentSniffer().sniff(tmp_path / "missing") is None
+
+    def test_oldest_results_are_evicted(self, tmp_path):
+        """上限を超えたら古い結果から捨てる"""
+        sniffer = ContentSniffer(max_entries=1)
+        first = tmp_path / "a.txt"
+        second = tmp_path / "b.txt"
+        first.write_text("a")
+        second.write_text("b")
+
+        sniffer.sniff(first)
+        sniffer.sniff(second)
+        sniffer.sniff(first)
+
+        assert sniffer.reads == 3
@@ -1,16 +1,40 @@
+import gzip
+import hashlib
 import logging
+import os
 import re
+import sys
+import time
 from pathlib import Path
-from unittest.mock import mock_open, patch
+from unittest.mock import MagicMock, mock_open, patch
 
 import pytest
-from watchdog.events import FileCreatedEvent, FileMovedEvent
-
-from service.file_rename_handler import FileRenameHandler, refresh_windows_folder
+from watchdog.events import (
+    DirCreatedEvent,
+    DirMovedEvent,
+    FileClosedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileMovedEvent,
+)
+
+from service.file_rename_handler import (
+    FileRenameHandler,
+    compile_rules,
+    refresh_windows_folder,
+    reports_close_write,
+)
+from service.io_scheduler import DeviceScheduler
+from service.readiness import ReadinessEstimator
+from service.retry_scheduler import RetryScheduler
+from service.target_index import TargetIndex
 from utils.config_manager import TargetRule
+from utils.log_aggregator import LogAggregator
+from utils.rename_template import RenameTemplate
+from utils.source_glob import SourceGlob
 
 
-def make_rule(directory, filenames=(), suffix="_renamed", regex=None) -> TargetRule:
+def make_rule(directory, filenames=(), suffix="_renamed", regex=None, **options) -> TargetRule:
     """テスト用のTargetRuleを生成"""
     return TargetRule(
         directory=Path(directory),
@@ -18,6 +42,7 @@ def make_rule(directory, filenames=(), suffix="_renamed", regex=None) -> TargetR
         suffix=suffix,
         pattern=re.compile(f"{suffix}$") if suffix else None,
         filename_regex=re.compile(regex) if regex else None,
+        **options,
     )
 
 
@@ -99,6 +124,17 @@ class TestFileRenameHandlerInit:
             FileRenameHandler(targets, wait_time=0.1)
             assert mock_mkdir.call_count == 2
 
+    def test_unreachable_target_is_marked_offline(self):
+        """移動先を作成できない場合、退避が有効なら到達不能として扱う"""
+        spool = MagicMock()
+        with (
+            patch.object(Path, "exists", return_value=False),
+            patch.object(Path, "mkdir", side_effect=OSError("offline")),
+        ):
+            FileRenameHandler([make_rule(r"C:\test\target")], wait_time=0.1, spool=spool)
+
+        spool.mark_offline.assert_called_once_with(Path(r"C:\test\target"))
+
     def test_ensure_target_dirs_called_on_init(self):
         """初期化時に移動先ディレクトリの確認が呼ばれる"""
         with patch.object(FileRenameHandler, "_ensure_target_dirs") as mock_ensure:
@@ -157,6 +193,86 @@ class TestFileRenameHandlerWaitForFileReady:
         assert result is False
 
 
+class TestFileRenameHandlerAdaptiveWait:
+    """学習した待ち時間による書き込み完了の確認テスト"""
+
+    @pytest.fixture
+    def adaptive_handler(self, make_handler):
+        handler = make_handler()
+        handler.readiness = ReadinessEstimator(0.5, floor=0.01, ceiling=5.0)
+        return handler
+
+    def test_complete_file_is_ready_after_first_probe(self, adaptive_handler, tmp_path):
+        """書き込み済みのファイルは1回の確認で完了とし、次から下限だけ待つ"""
+        path = tmp_path / "memo.txt"
+        path.write_text("memo")
+
+        with patch("service.file_rename_handler.time.sleep") as mock_sleep:
+            assert adaptive_handler._wait_for_file_ready(path) is True
+
+        mock_sleep.assert_called_once_with(0.5)
+        assert adaptive_handler.readiness.first_delay(".txt") == 0.01
+
+    def test_growing_file_does_not_use_up_retries(self, adaptive_handler):
+        """書き込みが進んでいる間は再試行の回数に数えず、止まってから完了とする"""
+        path = Path(r"C:\test\src\scan.tif")
+        stats = [(0, 1), (4096, 2), (8192, 3), (8192, 3)]
+
+        with (
+            patch("service.file_rename_handler._stat_key", side_effect=stats),
+            patch("service.file_rename_handler.time.sleep") as mock_sleep,
+            patch.object(adaptive_handler, "_can_open", return_value=True),
+        ):
+            assert adaptive_handler._wait_for_file_ready(path, max_retries=1) is True
+
+        # 速さが未学習のため倍々に延ばす
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [0.5, 1.0, 2.0]
+        assert adaptive_handler.readiness.stats()[".tif"]["samples"] == 1
+
+    def test_locked_file_gives_up_after_retries(self, adaptive_handler, tmp_path):
+        """変化が無いまま開けない場合は wait_time より間隔を延ばさず、再試行の上限で諦める"""
+        path = tmp_path / "locked.txt"
+        path.write_text("locked")
+
+        with (
+            patch("service.file_rename_handler.time.sleep") as mock_sleep,
+            patch.object(adaptive_handler, "_can_open", return_value=False),
+        ):
+            assert adaptive_handler._wait_for_file_ready(path, max_retries=3) is False
+
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [0.5, 0.5, 0.5]
+
+    def test_endlessly_growing_file_gives_up_at_budget(self, adaptive_handler):
+        """書き込みが終わらないファイルは、上限の待ち時間の再試行回数分で諦める"""
+        path = Path(r"C:\test\src\stream.log")
+        clock = [0.0]
+        sizes = iter(range(1_000_000))
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        with (
+            patch(
+                "service.file_rename_handler._stat_key",
+                side_effect=lambda _: (next(sizes), 0),
+            ),
+            patch("service.file_rename_handler.time.monotonic", side_effect=lambda: clock[0]),
+            patch("service.file_rename_handler.time.sleep", side_effect=sleep),
+        ):
+            assert adaptive_handler._wait_for_file_ready(path, max_retries=2) is False
+
+        # ceiling（5秒）× 2回 を超えて待たない
+        assert clock[0] == pytest.approx(10.0)
+
+    def test_vanished_file_is_not_ready(self, adaptive_handler, tmp_path):
+        """確認までに消えたファイルはFalse"""
+        path = tmp_path / "gone.txt"
+        path.write_text("gone")
+
+        with patch("service.file_rename_handler.time.sleep", side_effect=lambda _: path.unlink()):
+            assert adaptive_handler._wait_for_file_ready(path) is False
+
+
 class TestFileRenameHandlerResolveRule:
     """_resolve_ruleメソッドのテスト"""
 
@@ -254,6 +370,261 @@ class TestFileRenameHandlerResolveRule:
         assert handler._resolve_rule("REPORT_MAGNATE.MD") is None
 
 
+class TestFileRenameHandlerContentRouting:
+    """ファイルの種類による振り分けのテスト"""
+
+    def test_routes_by_content_regardless_of_extension(self, make_handler, tmp_path):
+        """拡張子が違っていても先頭のバイト列で種類の移動先へ振り分ける"""
+        pdf_rule = make_rule(r"C:\test\pdf", content_types=frozenset({"pdf"}))
+        catch_all = make_rule(r"C:\test\other")
+        handler = make_handler([catch_all, pdf_rule])
+        scan = tmp_path / "scan.dat"
+        scan.write_bytes(b"%PDF-1.7\n")
+        note = tmp_path / "note.dat"
+        note.write_text("hello")
+
+        assert handler._resolve_rule(scan.name, scan) is pdf_rule
+        assert handler._resolve_rule(note.name, note) is catch_all
+
+    def test_regex_and_content_must_both_match(self, make_handler, tmp_path):
+        """正規表現と種類の両方を指定した場合は両方に一致した時だけ振り分ける"""
+        rule = make_rule(r"C:\test\zip", regex=r"^export_", content_types=frozenset({"zip"}))
+        handler = make_handler([rule])
+        archive = tmp_path / "export_1.bin"
+        archive.write_bytes(b"PK\x03\x04rest")
+        text = tmp_path / "export_2.bin"
+        text.write_text("not a zip")
+
+        assert handler._resolve_rule(archive.name, archive) is rule
+        assert handler._resolve_rule(text.name, text) is None
+
+    def test_content_rule_may_match_before_ready(self, make_handler):
+        """書き込み完了前（パス無し）の判定では種類の条件は満たし得るものとして扱う"""
+        rule = make_rule(r"C:\test\pdf", content_types=frozenset({"pdf"}))
+        handler = make_handler([rule])
+
+        assert handler._resolve_rule("scan.dat") is rule
+
+    def test_header_is_read_once_per_file(self, make_handler, tmp_path):
+        """書き込み完了の確認で開いたハンドルで1回だけ読み、振り分け・再試行では読み直さない"""
+        rule = make_rule(r"C:\test\pdf", content_types=frozenset({"pdf"}))
+        handler = make_handler([rule])
+        scan = tmp_path / "scan.dat"
+        scan.write_bytes(b"%PDF-1.7\n")
+
+        with patch.object(handler, "_move_file") as mock_move:
+            handler._process_file(str(scan))
+            handler.retry_file(scan, MagicMock())
+
+        assert mock_move.call_count == 2
+        assert handler.sniffer.reads == 1
+
+    def test_no_read_without_content_rules(self, make_handler, tmp_path):
+        """種類で振り分ける移動先が無い場合は先頭を読まない"""
+        handler = make_handler([make_rule(r"C:\test\target")])
+        path = tmp_path / "a.txt"
+        path.write_text("a")
+
+        with patch.object(handler, "_move_file"):
+            handler._process_file(str(path))
+
+        assert handler.sniffer.reads == 0
+
+
+class TestFileRenameHandlerSubtreeRules:
+    """サブディレクトリを監視する場合の相対パスによる振り分けのテスト"""
+
+    def test_path_regex_matches_relative_path(self, make_handler, tmp_path):
+        """監視元からの相対パス（/ 区切り）で振り分ける"""
+        scans = make_rule(r"C:\test\scans", path_regex=re.compile(r"^scanner/"))
+        catch_all = make_rule(r"C:\test\other")
+        handler = make_handler([catch_all, scans])
+        handler.source = tmp_path
+
+        assert handler._resolve_rule("a.pdf", relative="scanner/2024/a.pdf") is scans
+        assert handler._resolve_rule("a.pdf", relative="office/a.pdf") is catch_all
+        assert handler._relative_path(tmp_path / "scanner" / "a.pdf") == "scanner/a.pdf"
+
+    def test_regex_and_path_must_both_match(self, make_handler):
+        """ファイル名の正規表現と相対パスの両方を指定した場合は両方に一致した時だけ"""
+        rule = make_rule(r"C:\test\t", regex=r"\.csv$", path_regex=re.compile(r"^daily/"))
+        handler = make_handler([rule])
+
+        assert handler._resolve_rule("a.csv", relative="daily/a.csv") is rule
+        assert handler._resolve_rule("a.csv", relative="weekly/a.csv") is None
+
+    def test_keep_tree_preserves_relative_directory(self, make_handler, tmp_path):
+        """keep_tree の場合は監視元からの相対ディレクトリを移動先でも保つ"""
+        rule = make_rule(tmp_path / "target", suffix="", keep_tree=True)
+        handler = make_handler([rule])
+        handler.source = tmp_path / "src"
+        path = tmp_path / "src" / "2024" / "03" / "a.txt"
+
+        target = tmp_path / "target"
+        assert handler._build_target_path(path, rule) == target / "2024" / "03" / "a.txt"
+        assert handler._build_target_path(tmp_path / "src" / "b.txt", rule) == target / "b.txt"
+
+    def test_moves_nested_file_keeping_tree(self, make_handler, temp_test_dirs):
+        """サブディレクトリ内のファイルを同じ相対ディレクトリへ移動する"""
+        rule = make_rule(temp_test_dirs["target"], suffix="", keep_tree=True)
+        handler = make_handler([rule])
+        handler.source = temp_test_dirs["src"]
+        handler.recursive = True
+        nested = temp_test_dirs["src"] / "2024" / "03"
+        nested.mkdir(parents=True)
+        (nested / "a.txt").write_text("a")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler.process_existing_files(temp_test_dirs["src"])
+
+        assert (temp_test_dirs["target"] / "2024" / "03" / "a.txt").read_text() == "a"
+        assert not (nested / "a.txt").exists()
+
+    def test_unmatched_files_are_remembered_by_relative_path(self, make_handler, tmp_path):
+        """移動先なしの判定結果は相対パスごとに覚える"""
+        handler = make_handler([make_rule(r"C:\test\t", path_regex=re.compile(r"^in/"))])
+        handler.source = tmp_path
+        (tmp_path / "out").mkdir()
+        (tmp_path / "out" / "a.txt").write_text("a")
+
+        handler._process_file(str(tmp_path / "out" / "a.txt"))
+
+        assert [key[0] for key in handler._unmatched] == ["out/a.txt"]
+
+
+class TestFileRenameHandlerRuleIndex:
+    """移動先ルールの索引のテスト"""
+
+    def test_rules_are_grouped_by_priority(self):
+        """完全一致のファイル名・正規表現・種類などのみ・全件受け入れに分ける"""
+        named = make_rule(r"C:\test\a", filenames=("A.txt", "b.txt"))
+        regex = make_rule(r"C:\test\b", regex=r"\.csv$")
+        typed = make_rule(r"C:\test\c", content_types=frozenset({"pdf"}))
+        catch_all = make_rule(r"C:\test\d")
+
+        index = compile_rules([named, regex, typed, catch_all])
+
+        assert index.by_name == {"a.txt": (named,), "b.txt": (named,)}
+        assert index.regex == ((regex.filename_regex, regex),)
+        assert index.conditional == (typed,)
+        assert index.catch_all == (catch_all,)
+        assert index.sniffs is True
+
+
+class TestFileRenameHandlerSourceGlob:
+    """監視元のパターンを指定したハンドラのテスト"""
+
+    @pytest.fixture
+    def glob_handler(self, make_handler, tmp_path):
+        handler = make_handler()
+        handler.source = tmp_path
+        handler.source_glob = SourceGlob("PC-*")
+        return handler
+
+    def test_events_outside_sources_are_ignored(self, glob_handler, tmp_path):
+        """一致しないフォルダ・監視元のサブディレクトリ・基準ディレクトリ直下は処理しない"""
+        with patch.object(glob_handler, "_process_file") as mock_process:
+            glob_handler.on_created(FileCreatedEvent(str(tmp_path / "PC-01" / "a.txt")))
+            glob_handler.on_created(FileCreatedEvent(str(tmp_path / "server" / "a.txt")))
+            glob_handler.on_created(FileCreatedEvent(str(tmp_path / "PC-01" / "sub" / "a.txt")))
+            glob_handler.on_created(FileCreatedEvent(str(tmp_path / "a.txt")))
+            glob_handler.on_moved(
+                FileMovedEvent(str(tmp_path / "PC-02" / "a.tmp"), str(tmp_path / "x" / "a.txt"))
+            )
+
+        mock_process.assert_called_once_with(str(tmp_path / "PC-01" / "a.txt"))
+
+    def test_recursive_accepts_subdirectories(self, glob_handler, tmp_path):
+        """recursive の場合は監視元のサブディレクトリのファイルも処理する"""
+        glob_handler.recursive = True
+        path = str(tmp_path / "PC-01" / "sub" / "a.txt")
+        with patch.object(glob_handler, "_process_file") as mock_process:
+            glob_handler.on_created(FileCreatedEvent(path))
+
+        mock_process.assert_called_once_with(path)
+
+    def test_relative_path_is_from_matched_source(self, glob_handler, tmp_path):
+        """相対パスはパターンに一致したそれぞれの監視元から数える"""
+        assert glob_handler._relative_path(tmp_path / "PC-01" / "sub" / "a.txt") == "sub/a.txt"
+        assert glob_handler._relative_path(tmp_path / "PC-02" / "b.txt") == "b.txt"
+
+    def test_existing_files_in_all_sources(self, glob_handler, tmp_path):
+        """基準ディレクトリを渡すと、一致する全ての監視元の既存ファイルを処理する"""
+        for name in ("PC-02", "PC-01", "server"):
+            (tmp_path / name).mkdir()
+            (tmp_path / name / "a.txt").write_text(name)
+
+        with patch.object(glob_handler, "_process_file") as mock_process:
+            glob_handler.process_existing_files(tmp_path)
+
+        assert [call.args[0] for call in mock_process.call_args_list] == [
+            str(tmp_path / "PC-01" / "a.txt"),
+            str(tmp_path / "PC-02" / "a.txt"),
+        ]
+
+    def test_new_source_directory_is_scanned(self, glob_handler, tmp_path, caplog):
+        """一致するフォルダが作成・名前の変更で現れたら、中のファイルを処理する"""
+        (tmp_path / "PC-09").mkdir()
+        (tmp_path / "PC-09" / "a.txt").write_text("a")
+        (tmp_path / "other").mkdir()
+
+        with patch.object(glob_handler, "_process_file") as mock_process:
+            with caplog.at_level(logging.INFO):
+                glob_handler.on_created(DirCreatedEvent(str(tmp_path / "PC-09")))
+                glob_handler.on_created(DirCreatedEvent(str(tmp_path / "other")))
+                glob_handler.on_moved(
+                    DirMovedEvent(str(tmp_path / "New folder"), str(tmp_path / "PC-09"))
+                )
+
+        assert [call.args[0] for call in mock_process.call_args_list] == [
+            str(tmp_path / "PC-09" / "a.txt")
+        ] * 2
+        assert "監視元を追加しました" in caplog.text
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify は Linux のみ")
+    def test_new_source_is_watched_without_rescheduling(self, temp_test_dirs):
+        """監視を始めた後に作られた一致するフォルダのファイルも移動する"""
+        from watchdog.observers.inotify import InotifyObserver
+
+        src = temp_test_dirs["src"]
+        handler = FileRenameHandler(
+            [make_rule(temp_test_dirs["target"], suffix="")],
+            wait_time=0.01,
+            source=src,
+            source_glob=SourceGlob("PC-*"),
+        )
+        observer = InotifyObserver()
+        observer.schedule(handler, str(src), recursive=True)
+        observer.start()
+        try:
+            with patch("service.file_rename_handler.refresh_windows_folder"):
+                (src / "PC-new").mkdir()
+                (src / "PC-new" / "report.csv").write_text("a,b")
+                deadline = time.monotonic() + 5
+                while (
+                    not (temp_test_dirs["target"] / "report.csv").exists()
+                    and time.monotonic() < deadline
+                ):
+                    time.sleep(0.01)
+        finally:
+            observer.stop()
+            observer.join()
+
+        assert (temp_test_dirs["target"] / "report.csv").read_text() == "a,b"
+
+    def test_directory_events_without_glob_are_ignored(self, make_handler, tmp_path):
+        """監視元のパターンが無い場合、フォルダのイベントでは何もしない"""
+        handler = make_handler()
+        handler.source = tmp_path
+        (tmp_path / "PC-01").mkdir()
+        (tmp_path / "PC-01" / "a.txt").write_text("a")
+
+        with patch.object(handler, "_process_file") as mock_process:
+            handler.on_created(DirCreatedEvent(str(tmp_path / "PC-01")))
+
+        mock_process.assert_not_called()
+
+
 class TestFileRenameHandlerBuildTargetName:
     """_build_target_nameメソッドのテスト"""
 
@@ -285,6 +656,41 @@ class TestFileRenameHandlerBuildTargetName:
 
         assert handler._build_target_name(Path("file.txt"), rule) == "file_backup.txt"
 
+    def test_build_target_name_uses_template(self, make_handler):
+        """テンプレートが指定されている場合は regexN のグループから名前を組み立てる"""
+        handler = make_handler()
+        regex = re.compile(r"^(\w+)-(\d+)")
+        rule = make_rule(
+            r"C:\test\target",
+            regex=regex.pattern,
+            template=RenameTemplate("{g2}_{g1}{ext}", regex),
+        )
+
+        assert handler._build_target_name(Path("invoice-42.pdf"), rule) == "42_invoice.pdf"
+
+    def test_empty_template_name_keeps_file(self, make_handler, temp_test_dirs, caplog):
+        """テンプレートから名前を決められない場合は例外を出さず、移動元を残して再試行する"""
+        handler = make_handler()
+        handler.retry_scheduler = MagicMock()
+        regex = re.compile(r"^(\d+)?")
+        rule = make_rule(
+            temp_test_dirs["target"],
+            regex=regex.pattern,
+            template=RenameTemplate("{g1}", regex),
+        )
+        test_file = temp_test_dirs["src"] / "report.txt"
+        test_file.write_text("content")
+
+        with caplog.at_level(logging.ERROR):
+            handler._move_file(test_file, rule)
+            handler._fan_out(test_file, [rule, make_rule(temp_test_dirs["other"])])
+
+        assert test_file.exists()
+        assert list(temp_test_dirs["target"].iterdir()) == []
+        assert list(temp_test_dirs["other"].iterdir()) == []
+        assert "移動先のファイル名を決められません" in caplog.text
+        assert handler.retry_scheduler.schedule.call_count == 2
+
 
 class TestFileRenameHandlerProcessExistingFiles:
     """process_existing_filesメソッドのテスト"""
@@ -311,6 +717,41 @@ class TestFileRenameHandlerProcessExistingFiles:
 
         mock_process.assert_not_called()
 
+    def test_recursive_walks_subdirectories_in_name_order(self, make_handler, temp_test_dirs):
+        """recursive の場合はサブディレクトリも名前順に深さ優先で辿る"""
+        handler = make_handler()
+        handler.recursive = True
+        src = temp_test_dirs["src"]
+        (src / "2024" / "03").mkdir(parents=True)
+        (src / "2024" / "03" / "c.txt").write_text("c")
+        (src / "2024" / "b.txt").write_text("b")
+        (src / "a.txt").write_text("a")
+        (src / "z.txt").write_text("z")
+        (src / "2024" / "03" / "d.part").write_text("d")
+        handler.ignore = re.compile(r".*\.part\Z")
+
+        with patch.object(handler, "_process_file") as mock_process:
+            handler.process_existing_files(src)
+
+        processed = [
+            Path(call.args[0]).relative_to(src).as_posix() for call in mock_process.call_args_list
+        ]
+        assert processed == ["a.txt", "z.txt", "2024/b.txt", "2024/03/c.txt"]
+
+    def test_old_existing_files_are_not_polled(self, make_handler, temp_test_dirs):
+        """更新から時間の経った既存ファイルは書き込み済みとみなして待たない"""
+        handler = make_handler()
+        old = temp_test_dirs["src"] / "old.txt"
+        old.write_text("old")
+        os.utime(old, (time.time() - 3600, time.time() - 3600))
+        (temp_test_dirs["src"] / "new.txt").write_text("new")
+
+        with patch.object(handler, "_process_file") as mock_process:
+            handler.process_existing_files(temp_test_dirs["src"])
+
+        assert mock_process.call_args_list[1].kwargs == {"ready": "settled"}
+        assert mock_process.call_args_list[0].kwargs == {}
+
     def test_moves_existing_file_to_target(self, make_handler, temp_test_dirs):
         """既存ファイルが移動先へ移動される"""
         handler = make_handler([make_rule(temp_test_dirs["target"], suffix="")])
@@ -370,6 +811,227 @@ class TestFileRenameHandlerOnMoved:
             mock_process.assert_not_called()
 
 
+class TestFileRenameHandlerIgnore:
+    """一時ファイルなどを無視するテスト"""
+
+    @pytest.fixture
+    def ignoring_handler(self, make_handler):
+        handler = make_handler()
+        handler.ignore = re.compile(r"(?s:.*\.crdownload)\Z|(?s:~\$.*)\Z", re.IGNORECASE)
+        return handler
+
+    def test_created_temporary_file_is_ignored(self, ignoring_handler):
+        """一時ファイルの作成は待機も判定もしない"""
+        with patch.object(ignoring_handler, "_process_file") as mock_process:
+            ignoring_handler.on_created(FileCreatedEvent(r"C:\test\src\file.CRDOWNLOAD"))
+            ignoring_handler.on_created(FileCreatedEvent(str(Path("src") / "~$report.docx")))
+
+        mock_process.assert_not_called()
+
+    def test_ignored_file_is_not_awaited_for_close(self, ignoring_handler):
+        """クローズを待つファイルにも加えない"""
+        ignoring_handler.close_events = True
+
+        ignoring_handler.on_created(FileCreatedEvent(r"C:\test\src\file.crdownload"))
+
+        assert ignoring_handler._awaiting_close == {}
+
+    def test_renamed_from_temporary_name_is_processed(self, ignoring_handler):
+        """一時ファイルから名前を変えたファイルは移動先の名前で処理する"""
+        event = FileMovedEvent(r"C:\test\src\file.crdownload", r"C:\test\src\file.pdf")
+
+        with patch.object(ignoring_handler, "_process_file") as mock_process:
+            ignoring_handler.on_moved(event)
+            ignoring_handler.on_moved(
+                FileMovedEvent(r"C:\test\src\file.pdf", r"C:\test\src\file.crdownload")
+            )
+
+        mock_process.assert_called_once_with(r"C:\test\src\file.pdf")
+
+    def test_existing_temporary_files_are_skipped(self, ignoring_handler, temp_test_dirs):
+        """監視開始前からある一時ファイルも処理しない"""
+        (temp_test_dirs["src"] / "a.crdownload").write_text("a")
+        (temp_test_dirs["src"] / "b.txt").write_text("b")
+
+        with patch.object(ignoring_handler, "_process_file") as mock_process:
+            ignoring_handler.process_existing_files(temp_test_dirs["src"])
+
+        assert [Path(call.args[0]).name for call in mock_process.call_args_list] == ["b.txt"]
+
+
+class TestFileRenameHandlerCloseEvents:
+    """書き込み後のクローズの通知による書き込み完了の判定テスト"""
+
+    def test_created_waits_for_close(self, make_handler):
+        """作成の通知では処理せず、クローズの通知で待たずに処理する"""
+        handler = make_handler()
+        handler.close_events = True
+        path = r"C:\test\src\newfile.txt"
+
+        with patch.object(handler, "_process_file") as mock_process:
+            handler.on_created(FileCreatedEvent(path))
+            mock_process.assert_not_called()
+            handler.on_closed(FileClosedEvent(path))
+
+        mock_process.assert_called_once_with(path, ready="close_write")
+
+    def test_close_without_create_is_ignored(self, make_handler):
+        """作成を通知されていないファイル（既存ファイルの書き換えなど）のクローズは無視"""
+        handler = make_handler()
+        handler.close_events = True
+
+        with patch.object(handler, "_process_file") as mock_process:
+            handler.on_closed(FileClosedEvent(r"C:\test\src\existing.txt"))
+
+        mock_process.assert_not_called()
+
+    def test_deleted_before_close_is_forgotten(self, make_handler):
+        """閉じられる前に削除されたファイルは待つのをやめる"""
+        handler = make_handler()
+        handler.close_events = True
+        path = r"C:\test\src\temp.txt"
+
+        with patch.object(handler, "_process_file") as mock_process:
+            handler.on_created(FileCreatedEvent(path))
+            handler.on_deleted(FileDeletedEvent(path))
+            handler.on_closed(FileClosedEvent(path))
+
+        mock_process.assert_not_called()
+
+    def test_ready_file_is_not_polled(self, make_handler, temp_test_dirs):
+        """クローズが通知されたファイルは待機せずに移動し、判定方法を数える"""
+        handler = make_handler()
+        test_file = temp_test_dirs["src"] / "test.txt"
+        test_file.write_text("content")
+
+        with (
+            patch.object(handler, "_wait_for_file_ready") as mock_wait,
+            patch.object(handler, "_move_file") as mock_move,
+        ):
+            handler._process_file(str(test_file), ready="close_write")
+
+        mock_wait.assert_not_called()
+        mock_move.assert_called_once()
+        assert handler.stats() == {"close_write": 1, "settled": 0, "polled": 0, "not_ready": 0}
+
+    def test_polled_readiness_is_counted(self, make_handler, temp_test_dirs):
+        """待機して確認した場合・準備ができなかった場合も数える"""
+        handler = make_handler()
+        test_file = temp_test_dirs["src"] / "test.txt"
+        test_file.write_text("content")
+
+        with patch.object(handler, "_move_file"):
+            handler._process_file(str(test_file))
+            with patch.object(handler, "_wait_for_file_ready", return_value=False):
+                handler._process_file(str(test_file))
+
+        assert handler.stats() == {"close_write": 0, "settled": 0, "polled": 1, "not_ready": 1}
+
+    def test_unclosed_file_is_polled_after_deadline(self, make_handler, temp_test_dirs):
+        """期限までにクローズが通知されず、書き込みも無いファイルは待機して確認する処理に回す"""
+        handler = make_handler()
+        handler.close_events = True
+        test_file = temp_test_dirs["src"] / "moved.txt"
+        test_file.write_text("content")
+
+        with (
+            patch("service.file_rename_handler.CLOSE_WAIT_MIN", 0.01),
+            patch.object(handler, "_process_file") as mock_process,
+        ):
+            handler.on_created(FileCreatedEvent(str(test_file)))
+            deadline = time.monotonic() + 2
+            while not mock_process.called and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        mock_process.assert_called_once_with(str(test_file))
+        assert handler._awaiting_close == {}
+
+    def test_growing_file_keeps_waiting_for_close(self, make_handler, temp_test_dirs):
+        """期限の間に書き込みが進んだファイルは、まだ書き込み中とみなしてクローズを待つ"""
+        handler = make_handler()
+        handler.close_events = True
+        test_file = temp_test_dirs["src"] / "growing.txt"
+        test_file.write_text("a")
+
+        with patch.object(handler, "_process_file") as mock_process:
+            handler._awaiting_close[str(test_file)] = (0.0, (0, 0))
+            handler._check_awaiting_close()
+            mock_process.assert_not_called()
+            assert str(test_file) in handler._awaiting_close
+            handler.on_closed(FileClosedEvent(str(test_file)))
+
+        mock_process.assert_called_once_with(str(test_file), ready="close_write")
+
+    def test_deleted_file_is_dropped_after_deadline(self, make_handler, temp_test_dirs):
+        """期限までに消えたファイルは待つのをやめる"""
+        handler = make_handler()
+        handler.close_events = True
+        path = str(temp_test_dirs["src"] / "gone.txt")
+
+        with patch.object(handler, "_process_file") as mock_process:
+            handler._awaiting_close[path] = (0.0, None)
+            handler._check_awaiting_close()
+
+        mock_process.assert_not_called()
+        assert handler._awaiting_close == {}
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify は Linux のみ")
+    def test_inotify_processes_file_moved_in(self, temp_test_dirs, tmp_path):
+        """監視外から移動してきたファイル（クローズの通知が無い）も期限の後に移動する"""
+        from watchdog.observers.inotify import InotifyObserver
+
+        outside = tmp_path / "outside.csv"
+        outside.write_text("a,b")
+        observer = InotifyObserver()
+        handler = FileRenameHandler(
+            [make_rule(temp_test_dirs["target"], suffix="")], wait_time=0.05, close_events=True
+        )
+        observer.schedule(handler, str(temp_test_dirs["src"]), recursive=False)
+        observer.start()
+        try:
+            with patch("service.file_rename_handler.refresh_windows_folder"):
+                os.rename(outside, temp_test_dirs["src"] / "report.csv")
+                deadline = time.monotonic() + 5
+                while handler.stats()["polled"] == 0 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+        finally:
+            observer.stop()
+            observer.join()
+
+        assert (temp_test_dirs["target"] / "report.csv").exists()
+        assert handler.stats()["close_write"] == 0
+        assert handler._awaiting_close == {}
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify は Linux のみ")
+    def test_inotify_dispatches_without_waiting(self, temp_test_dirs):
+        """inotify ではクローズの通知で wait_time を待たずに移動する"""
+        from watchdog.observers.inotify import InotifyObserver
+
+        observer = InotifyObserver()
+        assert reports_close_write(observer) is True
+        handler = FileRenameHandler(
+            [make_rule(temp_test_dirs["target"], suffix="")], wait_time=30, close_events=True
+        )
+        observer.schedule(handler, str(temp_test_dirs["src"]), recursive=False)
+        observer.start()
+        try:
+            with patch("service.file_rename_handler.refresh_windows_folder"):
+                (temp_test_dirs["src"] / "report.csv").write_text("a,b")
+                deadline = time.monotonic() + 5
+                while handler.stats()["close_write"] == 0 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+        finally:
+            observer.stop()
+            observer.join()
+
+        assert (temp_test_dirs["target"] / "report.csv").exists()
+        assert handler.stats()["polled"] == 0
+
+    def test_other_observers_do_not_report_close(self):
+        """inotify 以外のオブザーバーではクローズの通知を使わない"""
+        assert reports_close_write(MagicMock()) is False
+
+
 class TestFileRenameHandlerProcessFile:
     """_process_fileメソッドのテスト"""
 
@@ -503,62 +1165,1052 @@ class TestFileRenameHandlerProcessFile:
         assert (temp_test_dirs["target"] / "other_magnate.txt").exists()
 
 
-class TestFileRenameHandlerMoveFile:
-    """_move_fileメソッドのテスト"""
+class TestFileRenameHandlerDispatch:
+    """デバイスごとのキューへの振り分けテスト"""
 
-    def test_move_file_renames_and_moves(self, make_handler, temp_test_dirs, caplog):
-        """ファイルを正しくリネームして移動"""
-        handler = make_handler()
-        rule = make_rule(temp_test_dirs["target"])
-        test_file = temp_test_dirs["src"] / "original.txt"
+    def test_moves_via_io_scheduler(self, make_handler, temp_test_dirs):
+        """スケジューラがある場合は移動先のキューに積む"""
+        handler = make_handler([make_rule(temp_test_dirs["target"], suffix="")])
+        handler.io_scheduler = MagicMock()
+        test_file = temp_test_dirs["src"] / "file.txt"
         test_file.write_text("content")
 
-        with patch("service.file_rename_handler.refresh_windows_folder") as mock_refresh:
-            with caplog.at_level(logging.INFO):
-                handler._move_file(test_file, rule)
+        with patch.object(handler, "_wait_for_file_ready", return_value=True):
+            handler._process_file(str(test_file))
 
-        assert (temp_test_dirs["target"] / "original_renamed.txt").exists()
-        assert not test_file.exists()
-        assert "ファイルを移動しました" in caplog.text
-        # refresh_windows_folderが2回呼ばれる（ソースとターゲット）
-        assert mock_refresh.call_count == 2
+        rule, task = handler.io_scheduler.submit.call_args.args
+        assert rule.directory == temp_test_dirs["target"]
+        assert test_file.exists()
 
-    def test_move_file_without_pattern(self, make_handler, temp_test_dirs):
-        """パターンが未設定の場合はリネームせず移動"""
-        handler = make_handler()
-        rule = make_rule(temp_test_dirs["target"], suffix="")
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            task()
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+
+    def test_duplicate_events_are_queued_once(self, make_handler, temp_test_dirs):
+        """処理待ちのファイルへのイベントは重複して積まない"""
+        handler = make_handler([make_rule(temp_test_dirs["target"], suffix="")])
+        handler.io_scheduler = MagicMock()
         test_file = temp_test_dirs["src"] / "file.txt"
         test_file.write_text("content")
 
-        with patch("service.file_rename_handler.refresh_windows_folder"):
-            handler._move_file(test_file, rule)
+        with patch.object(handler, "_wait_for_file_ready", return_value=True):
+            handler._process_file(str(test_file))
+            handler._process_file(str(test_file))
 
-        assert (temp_test_dirs["target"] / "file.txt").exists()
+        assert handler.io_scheduler.submit.call_count == 1
 
-    def test_move_file_overwrites_existing(self, make_handler, temp_test_dirs, caplog):
-        """既存ファイルを上書き"""
-        handler = make_handler()
-        rule = make_rule(temp_test_dirs["target"], suffix="")
+    def test_file_can_be_queued_again_after_completion(self, make_handler, temp_test_dirs):
+        """処理が終わったファイルは再び積める"""
+        handler = make_handler([make_rule(temp_test_dirs["target"], suffix="")])
+        handler.io_scheduler = MagicMock()
         test_file = temp_test_dirs["src"] / "file.txt"
-        test_file.write_text("new content")
-        existing_file = temp_test_dirs["target"] / "file.txt"
-        existing_file.write_text("old content")
+        test_file.write_text("content")
+
+        with (
+            patch.object(handler, "_wait_for_file_ready", return_value=True),
+            patch.object(handler, "_move_file"),
+        ):
+            handler._process_file(str(test_file))
+            handler.io_scheduler.submit.call_args.args[1]()
+            handler._process_file(str(test_file))
+
+        assert handler.io_scheduler.submit.call_count == 2
+
+    def test_retry_via_io_scheduler_counts_attempts(self, make_handler, temp_test_dirs, tmp_path):
+        """キューで移動する場合も再試行の回数を数え続け、上限に達したら隔離する"""
+        quarantine_dir = tmp_path / "quarantine"
+        handler = make_handler([make_rule(temp_test_dirs["target"], suffix="")])
+        handler.io_scheduler = DeviceScheduler(workers_per_device=1)
+        handler.retry_scheduler = RetryScheduler(
+            tmp_path / "retry.json",
+            quarantine_dir=quarantine_dir,
+            max_attempts=3,
+            base_delay=0.01,
+            max_delay=0.02,
+        )
+        handler.retry_scheduler.register(temp_test_dirs["src"], handler.retry_file)
+        handler.retry_scheduler.start()
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        try:
+            with patch(
+                "service.file_rename_handler.move_file", side_effect=PermissionError("locked")
+            ) as mock_move:
+                handler._dispatch(test_file, handler._resolve_rules("file.txt", test_file))
+                deadline = time.monotonic() + 5.0
+                while test_file.exists() and time.monotonic() < deadline:
+                    time.sleep(0.01)
+        finally:
+            handler.retry_scheduler.close()
+            handler.io_scheduler.close()
+
+        assert not test_file.exists()
+        assert [path.name for path in quarantine_dir.iterdir()][0].endswith("_file.txt")
+        # 最初の移動と、上限までの再試行
+        assert mock_move.call_count == 4
+        assert handler.retry_scheduler.pending() == []
+
+
+class TestFileRenameHandlerFanOut:
+    """複数の移動先への配信テスト"""
+
+    def make_fanout_handler(self, make_handler, temp_test_dirs):
+        handler = make_handler(
+            [
+                make_rule(temp_test_dirs["target"], suffix=""),
+                make_rule(temp_test_dirs["other"], regex=r"\.txt$"),
+            ]
+        )
+        handler.fanout = True
+        return handler
+
+    def test_fan_out_keep_both_per_target(self, make_handler, temp_test_dirs):
+        """keep_both の移動先だけ連番を付けて届ける"""
+        handler = make_handler(
+            [
+                make_rule(temp_test_dirs["target"], suffix="", collision="keep_both"),
+                make_rule(temp_test_dirs["other"], suffix=""),
+            ]
+        )
+        handler.fanout = True
+        for directory in (temp_test_dirs["target"], temp_test_dirs["other"]):
+            (directory / "file.txt").write_text("old")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("new")
 
         with patch("service.file_rename_handler.refresh_windows_folder"):
-            with caplog.at_level(logging.INFO):
-                handler._move_file(test_file, rule)
+            handler._fan_out(test_file, handler._resolve_rules(test_file.name))
 
-        assert existing_file.read_text() == "new content"
-        assert "既存ファイルを上書きします" in caplog.text
+        assert (temp_test_dirs["target"] / "file.txt").read_text() == "old"
+        assert (temp_test_dirs["target"] / "file_1.txt").read_text() == "new"
+        assert (temp_test_dirs["other"] / "file.txt").read_text() == "new"
+        assert not test_file.exists()
 
-    def test_move_file_handles_exception(self, make_handler, temp_test_dirs, caplog):
-        """移動時の例外を処理"""
-        handler = make_handler()
-        rule = make_rule(temp_test_dirs["target"])
+    def test_fan_out_all_skipped_keeps_source(self, make_handler, temp_test_dirs):
+        """全ての移動先の方が新しい場合は移動元を残す"""
+        handler = make_handler(
+            [
+                make_rule(temp_test_dirs["target"], suffix="", collision="skip_if_newer"),
+                make_rule(temp_test_dirs["other"], suffix="", collision="skip_if_newer"),
+            ]
+        )
+        handler.fanout = True
+        for directory in (temp_test_dirs["target"], temp_test_dirs["other"]):
+            (directory / "file.txt").write_text("newer")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("older")
+        os.utime(test_file, ns=(1_000_000_000, 1_000_000_000))
+
+        handler._fan_out(test_file, handler._resolve_rules(test_file.name))
+
+        assert test_file.read_text() == "older"
+        assert (temp_test_dirs["target"] / "file.txt").read_text() == "newer"
+
+    def test_resolve_rules_returns_first_match_without_fanout(self, make_handler):
+        """fanoutでない場合は最初に一致した1件のみ"""
+        handler = make_handler([make_rule(r"C:\test\A", ["a.txt"]), make_rule(r"C:\test\B")])
+
+        rules = handler._resolve_rules("a.txt")
+
+        assert [rule.directory for rule in rules] == [Path(r"C:\test\A")]
+
+    def test_resolve_rules_returns_all_matches_with_fanout(self, make_handler):
+        """fanoutの場合は一致する全てのルールを優先順に返す"""
+        handler = make_handler(
+            [
+                make_rule(r"C:\test\A"),
+                make_rule(r"C:\test\B", regex=r"\.txt$"),
+                make_rule(r"C:\test\C", ["a.txt"]),
+                make_rule(r"C:\test\D", ["b.txt"]),
+            ]
+        )
+        handler.fanout = True
+
+        rules = handler._resolve_rules("a.txt")
+
+        assert [rule.directory for rule in rules] == [
+            Path(r"C:\test\C"),
+            Path(r"C:\test\B"),
+            Path(r"C:\test\A"),
+        ]
+
+    def test_delivers_to_every_matching_target(self, make_handler, temp_test_dirs):
+        """一致する全ての移動先へ届けてから移動元を削除する"""
+        handler = self.make_fanout_handler(make_handler, temp_test_dirs)
+        handler.ledger = MagicMock()
         test_file = temp_test_dirs["src"] / "file.txt"
         test_file.write_text("content")
 
-        with patch("shutil.move", side_effect=Exception("Test error")):
-            with caplog.at_level(logging.ERROR):
+        with (
+            patch.object(handler, "_wait_for_file_ready", return_value=True),
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            handler._process_file(str(test_file))
+
+        assert not test_file.exists()
+        assert (temp_test_dirs["target"] / "file.txt").read_text() == "content"
+        assert (temp_test_dirs["other"] / "file_renamed.txt").read_text() == "content"
+        assert handler.ledger.record.call_count == 2
+
+    def test_failure_keeps_source_and_schedules_retry(self, make_handler, temp_test_dirs):
+        """いずれかの移動先へ届かない場合は移動元を残して再試行に回す"""
+        handler = self.make_fanout_handler(make_handler, temp_test_dirs)
+        handler.retry_scheduler = MagicMock()
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.fan_out_file", side_effect=OSError("disk full")):
+            handler._fan_out(test_file, handler._resolve_rules(test_file.name))
+
+        assert test_file.exists()
+        handler.retry_scheduler.schedule.assert_called_once_with(test_file, "disk full")
+
+    def test_skips_identical_targets(self, make_handler, temp_test_dirs):
+        """同じ内容のファイルがある移動先へは書き込まない"""
+        handler = make_handler(
+            [
+                make_rule(temp_test_dirs["target"], suffix="", dedup=True),
+                make_rule(temp_test_dirs["other"], suffix=""),
+            ]
+        )
+        handler.fanout = True
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+        (temp_test_dirs["target"] / "file.txt").write_text("content")
+
+        with (
+            patch("service.file_rename_handler.fan_out_file") as mock_fan_out,
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            handler._fan_out(test_file, handler._resolve_rules(test_file.name))
+
+        destinations = mock_fan_out.call_args.args[1]
+        assert [d.path for d in destinations] == [temp_test_dirs["other"] / "file.txt"]
+
+    def test_passes_delivery_mode_per_target(self, make_handler, temp_test_dirs):
+        """移動先ごとの配信方法を渡す"""
+        handler = make_handler(
+            [
+                make_rule(temp_test_dirs["target"], suffix="", delivery="reflink"),
+                make_rule(temp_test_dirs["other"], suffix="", delivery="copy"),
+            ]
+        )
+        handler.fanout = True
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with (
+            patch("service.file_rename_handler.fan_out_file") as mock_fan_out,
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            handler._fan_out(test_file, handler._resolve_rules(test_file.name))
+
+        destinations = mock_fan_out.call_args.args[1]
+        assert [d.delivery for d in destinations] == ["reflink", "copy"]
+
+    def test_offline_target_gets_spooled_copy(self, make_handler, temp_test_dirs):
+        """到達できない移動先へは複製を退避し、残りの移動先へ届ける"""
+        handler = self.make_fanout_handler(make_handler, temp_test_dirs)
+        handler.spool = MagicMock()
+        handler.spool.is_available.side_effect = lambda d: d != temp_test_dirs["other"]
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._fan_out(test_file, handler._resolve_rules(test_file.name))
+
+        handler.spool.hold.assert_called_once_with(
+            test_file,
+            temp_test_dirs["other"] / "file_renamed.txt",
+            copy=True,
+            directory=temp_test_dirs["other"],
+            collision="overwrite",
+        )
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+        assert not test_file.exists()
+
+    def test_failed_fan_out_does_not_spool(self, make_handler, temp_test_dirs):
+        """到達できる移動先への配信に失敗した場合は退避せず、再試行のたびに重ねて退避しない"""
+        handler = self.make_fanout_handler(make_handler, temp_test_dirs)
+        handler.spool = MagicMock()
+        handler.spool.is_available.side_effect = lambda d: d != temp_test_dirs["other"]
+        handler.retry_scheduler = MagicMock()
+        handler.ledger = MagicMock()
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.fan_out_file", side_effect=OSError("locked")):
+            for _ in range(3):
+                handler._fan_out(test_file, handler._resolve_rules(test_file.name))
+
+        handler.spool.hold.assert_not_called()
+        handler.ledger.record.assert_not_called()
+        assert handler.retry_scheduler.schedule.call_count == 3
+        assert test_file.exists()
+
+    def test_source_is_kept_when_spool_is_full(self, make_handler, temp_test_dirs):
+        """退避できなかった場合は移動元を残して再試行する"""
+        handler = self.make_fanout_handler(make_handler, temp_test_dirs)
+        handler.spool = MagicMock()
+        handler.spool.is_available.side_effect = lambda d: d != temp_test_dirs["other"]
+        handler.spool.hold.return_value = False
+        handler.retry_scheduler = MagicMock()
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._fan_out(test_file, handler._resolve_rules(test_file.name))
+
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+        assert test_file.exists()
+        handler.retry_scheduler.schedule.assert_called_once()
+
+
+class TestFileRenameHandlerNegativeCache:
+    """移動先なしの判定結果キャッシュのテスト"""
+
+    def test_known_unmatched_file_skips_wait(self, make_handler, temp_test_dirs):
+        """判定済みで内容が変わらないファイルは待たずに飛ばす"""
+        handler = make_handler([make_rule(temp_test_dirs["other"], filenames=["test1.md"])])
+        test_file = temp_test_dirs["src"] / "other.txt"
+        test_file.write_text("content")
+
+        with patch.object(handler, "_wait_for_file_ready", return_value=True) as mock_wait:
+            handler._process_file(str(test_file))
+            handler._process_file(str(test_file))
+
+        assert mock_wait.call_count == 1
+
+    def test_changed_file_is_evaluated_again(self, make_handler, temp_test_dirs):
+        """サイズが変わったファイルは改めて判定する"""
+        handler = make_handler([make_rule(temp_test_dirs["other"], filenames=["test1.md"])])
+        test_file = temp_test_dirs["src"] / "other.txt"
+        test_file.write_text("content")
+
+        with patch.object(handler, "_wait_for_file_ready", return_value=True) as mock_wait:
+            handler._process_file(str(test_file))
+            test_file.write_text("longer content")
+            handler._process_file(str(test_file))
+
+        assert mock_wait.call_count == 2
+
+    def test_cache_is_bounded(self, make_handler, temp_test_dirs):
+        """上限を超えると古い判定結果から捨てる"""
+        handler = make_handler([make_rule(temp_test_dirs["other"], filenames=["test1.md"])])
+        handler.negative_cache_size = 2
+        for name in ("a.txt", "b.txt", "c.txt"):
+            (temp_test_dirs["src"] / name).write_text("content")
+
+        with patch.object(handler, "_wait_for_file_ready", return_value=True):
+            for name in ("a.txt", "b.txt", "c.txt"):
+                handler._process_file(str(temp_test_dirs["src"] / name))
+
+        assert [key[0] for key in handler._unmatched] == ["b.txt", "c.txt"]
+
+    def test_cache_is_kept_across_restart(self, temp_test_dirs, tmp_path):
+        """保存した判定結果は次回の起動時に引き継ぎ、既存ファイルを待機せずに飛ばす"""
+        rules = [make_rule(temp_test_dirs["other"], filenames=["test1.md"])]
+        test_file = temp_test_dirs["src"] / "other.txt"
+        test_file.write_text("content")
+        first = FileRenameHandler(
+            rules, wait_time=0.01, source=temp_test_dirs["src"], negative_cache_dir=tmp_path
+        )
+        with patch.object(first, "_wait_for_file_ready", return_value=True):
+            first._process_file(str(test_file))
+        first.save_unmatched()
+
+        second = FileRenameHandler(
+            rules, wait_time=0.01, source=temp_test_dirs["src"], negative_cache_dir=tmp_path
+        )
+        with patch.object(second, "_wait_for_file_ready", return_value=True) as mock_wait:
+            second.process_existing_files(temp_test_dirs["src"])
+
+        assert second.negative_cache_path == first.negative_cache_path
+        mock_wait.assert_not_called()
+
+    def test_changed_rules_discard_saved_cache(self, temp_test_dirs, tmp_path):
+        """ルールを変えて起動した場合は保存した判定結果を使わず、移動される"""
+        test_file = temp_test_dirs["src"] / "other.txt"
+        test_file.write_text("content")
+        first = FileRenameHandler(
+            [make_rule(temp_test_dirs["other"], filenames=["test1.md"])],
+            wait_time=0.01,
+            source=temp_test_dirs["src"],
+            negative_cache_dir=tmp_path,
+        )
+        with patch.object(first, "_wait_for_file_ready", return_value=True):
+            first._process_file(str(test_file))
+        first.save_unmatched()
+
+        second = FileRenameHandler(
+            [make_rule(temp_test_dirs["target"], suffix="")],
+            wait_time=0.01,
+            source=temp_test_dirs["src"],
+            negative_cache_dir=tmp_path,
+        )
+        with (
+            patch.object(second, "_wait_for_file_ready", return_value=True),
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            second._process_file(str(test_file))
+
+        assert second.negative_cache_path != first.negative_cache_path
+        assert (temp_test_dirs["target"] / "other.txt").exists()
+
+    def test_fingerprint_ignores_set_order(self, make_handler):
+        """ファイル名の集合の並び順が変わってもハッシュ値は同じ"""
+        first = make_handler([make_rule(r"C:\test\a", filenames=("a.txt", "b.txt", "c.txt"))])
+        second = make_handler([make_rule(r"C:\test\a", filenames=("c.txt", "a.txt", "b.txt"))])
+
+        assert first._rules_fingerprint() == second._rules_fingerprint()
+
+    def test_early_rule_check_skips_wait(self, make_handler, temp_test_dirs, caplog):
+        """一致し得ないファイル名は書き込み完了を待たずに判定する"""
+        handler = make_handler([make_rule(temp_test_dirs["other"], filenames=["test1.md"])])
+        handler.early_rule_check = True
+        test_file = temp_test_dirs["src"] / "other.txt"
+        test_file.write_text("content")
+
+        with patch.object(handler, "_wait_for_file_ready") as mock_wait:
+            with caplog.at_level(logging.INFO):
+                handler._process_file(str(test_file))
+
+        mock_wait.assert_not_called()
+        assert "移動先が見つかりませんでした" in caplog.text
+        assert test_file.exists()
+
+    def test_early_rule_check_still_waits_for_matching_file(self, make_handler, temp_test_dirs):
+        """一致するファイル名は書き込み完了を待ってから移動する"""
+        handler = make_handler([make_rule(temp_test_dirs["other"], filenames=["test1.md"])])
+        handler.early_rule_check = True
+        test_file = temp_test_dirs["src"] / "test1.md"
+        test_file.write_text("content")
+
+        with (
+            patch.object(handler, "_wait_for_file_ready", return_value=True) as mock_wait,
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            handler._process_file(str(test_file))
+
+        mock_wait.assert_called_once()
+
+
+class TestFileRenameHandlerMoveFile:
+    """_move_fileメソッドのテスト"""
+
+    def test_move_file_renames_and_moves(self, make_handler, temp_test_dirs, caplog):
+        """ファイルを正しくリネームして移動"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"])
+        test_file = temp_test_dirs["src"] / "original.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder") as mock_refresh:
+            with caplog.at_level(logging.INFO):
+                handler._move_file(test_file, rule)
+
+        assert (temp_test_dirs["target"] / "original_renamed.txt").exists()
+        assert not test_file.exists()
+        assert "ファイルを移動しました" in caplog.text
+        # refresh_windows_folderが2回呼ばれる（ソースとターゲット）
+        assert mock_refresh.call_count == 2
+
+    def test_move_file_without_pattern(self, make_handler, temp_test_dirs):
+        """パターンが未設定の場合はリネームせず移動"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+
+    def test_move_file_overwrites_existing(self, make_handler, temp_test_dirs, caplog):
+        """既存ファイルを上書き"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("new content")
+        existing_file = temp_test_dirs["target"] / "file.txt"
+        existing_file.write_text("old content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            with caplog.at_level(logging.INFO):
+                handler._move_file(test_file, rule)
+
+        assert existing_file.read_text() == "new content"
+        assert "既存ファイルを上書きします" in caplog.text
+
+    def test_move_file_handles_exception(self, make_handler, temp_test_dirs, caplog):
+        """移動時の例外を処理"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"])
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("shutil.move", side_effect=Exception("Test error")):
+            with caplog.at_level(logging.ERROR):
                 handler._move_file(test_file, rule)
             assert "ファイルの移動に失敗しました" in caplog.text
+
+    def test_move_file_samples_info_logs(self, make_handler, temp_test_dirs, caplog):
+        """ログ集計が有効な場合は移動ログを間引く"""
+        handler = make_handler()
+        handler.log_summary = LogAggregator(interval=60, sample_every={"moved": 2})
+        rule = make_rule(temp_test_dirs["target"], suffix="")
+        for name in ("a.txt", "b.txt", "c.txt"):
+            (temp_test_dirs["src"] / name).write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            with caplog.at_level(logging.INFO):
+                for name in ("a.txt", "b.txt", "c.txt"):
+                    handler._move_file(temp_test_dirs["src"] / name, rule)
+
+        assert caplog.text.count("ファイルを移動しました") == 2
+        assert (temp_test_dirs["target"] / "b.txt").exists()
+
+    def test_move_file_errors_are_not_sampled(self, make_handler, temp_test_dirs, caplog):
+        """移動失敗のエラーは集計せず毎回出力する"""
+        handler = make_handler()
+        handler.log_summary = LogAggregator(interval=60, sample_every={"moved": 0})
+        rule = make_rule(temp_test_dirs["target"])
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("shutil.move", side_effect=Exception("Test error")):
+            with caplog.at_level(logging.ERROR):
+                handler._move_file(test_file, rule)
+                handler._move_file(test_file, rule)
+
+        assert caplog.text.count("ファイルの移動に失敗しました") == 2
+
+    def test_move_file_failure_schedules_retry(self, make_handler, temp_test_dirs):
+        """移動に失敗したファイルは再試行を予約する"""
+        handler = make_handler()
+        handler.retry_scheduler = MagicMock()
+        rule = make_rule(temp_test_dirs["target"])
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("shutil.move", side_effect=Exception("Test error")):
+            handler._move_file(test_file, rule)
+
+        handler.retry_scheduler.schedule.assert_called_once_with(test_file, "Test error")
+
+    def test_retry_file_moves_file(self, make_handler, temp_test_dirs):
+        """再試行時はルールを解決し直して移動する"""
+        handler = make_handler([make_rule(temp_test_dirs["target"], suffix="")])
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        done = MagicMock()
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler.retry_file(test_file, done)
+
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+        done.assert_called_once()
+
+    def test_retry_file_ignores_vanished_file(self, make_handler, temp_test_dirs):
+        """再試行前にファイルが無くなっていれば何もしない"""
+        handler = make_handler()
+
+        done = MagicMock()
+
+        with patch.object(handler, "_move_file") as mock_move:
+            handler.retry_file(temp_test_dirs["src"] / "gone.txt", done)
+
+        mock_move.assert_not_called()
+        done.assert_called_once()
+
+    def test_move_file_skips_identical_target(self, make_handler, temp_test_dirs, caplog):
+        """重複判定が有効で同じ内容のファイルがある場合は書き込まずに移動元を削除する"""
+        handler = make_handler()
+        handler.ledger = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="", dedup=True)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+        existing = temp_test_dirs["target"] / "file.txt"
+        existing.write_text("content")
+        mtime = existing.stat().st_mtime_ns
+
+        with (
+            patch("service.file_rename_handler.move_file") as mock_move,
+            patch("service.file_rename_handler.refresh_windows_folder"),
+            caplog.at_level(logging.INFO),
+        ):
+            handler._move_file(test_file, rule)
+
+        mock_move.assert_not_called()
+        assert not test_file.exists()
+        assert existing.stat().st_mtime_ns == mtime
+        assert "同じ内容のファイルが移動先にあるため移動を省略しました" in caplog.text
+        assert handler.ledger.record.call_args.kwargs["status"] == "duplicate"
+
+    def test_move_file_overwrites_different_content_with_dedup(self, make_handler, temp_test_dirs):
+        """内容が違う場合は重複判定が有効でも上書きする"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="", dedup=True)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("new content")
+        (temp_test_dirs["target"] / "file.txt").write_text("old content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        assert (temp_test_dirs["target"] / "file.txt").read_text() == "new content"
+
+    def test_move_file_ignores_identical_target_without_dedup(self, make_handler, temp_test_dirs):
+        """重複判定が無効な場合はハッシュ値を求めずに上書きする"""
+        handler = make_handler()
+        handler.hash_cache = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+        (temp_test_dirs["target"] / "file.txt").write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        handler.hash_cache.is_duplicate.assert_not_called()
+        assert not test_file.exists()
+
+    def test_move_file_spools_for_offline_target(self, make_handler, temp_test_dirs):
+        """到達不能と判定済みの移動先へは移動せずに退避する"""
+        handler = make_handler()
+        handler.spool = MagicMock()
+        handler.spool.is_available.return_value = False
+        rule = make_rule(temp_test_dirs["target"], suffix="")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("shutil.move") as mock_move:
+            handler._move_file(test_file, rule)
+
+        mock_move.assert_not_called()
+        handler.spool.hold.assert_called_once_with(
+            test_file,
+            temp_test_dirs["target"] / "file.txt",
+            directory=temp_test_dirs["target"],
+            collision="overwrite",
+        )
+
+    def test_move_file_spools_with_collision_policy(self, make_handler, temp_test_dirs):
+        """退避する場合は、復旧後に届ける時の衝突の扱いを退避領域に渡す"""
+        handler = make_handler()
+        handler.spool = MagicMock()
+        handler.spool.is_available.return_value = False
+        rule = make_rule(temp_test_dirs["target"], suffix="", collision="keep_both")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        handler._move_file(test_file, rule)
+
+        assert handler.spool.hold.call_args.kwargs["collision"] == "keep_both"
+
+    def test_move_file_spools_when_target_disappears(self, make_handler, temp_test_dirs):
+        """移動先が消えて失敗した場合は到達不能にして退避する"""
+        handler = make_handler()
+        handler.spool = MagicMock()
+        handler.spool.is_available.return_value = True
+        handler.retry_scheduler = MagicMock()
+        missing = temp_test_dirs["target"] / "offline"
+        rule = make_rule(missing, suffix="")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        handler._move_file(test_file, rule)
+
+        handler.spool.mark_offline.assert_called_once_with(missing)
+        handler.spool.hold.assert_called_once_with(
+            test_file, missing / "file.txt", directory=missing, collision="overwrite"
+        )
+        handler.retry_scheduler.schedule.assert_not_called()
+
+    def test_move_file_retries_when_spool_is_full(self, make_handler, temp_test_dirs):
+        """退避できない場合は再試行に回す"""
+        handler = make_handler()
+        handler.spool = MagicMock()
+        handler.spool.is_available.return_value = False
+        handler.spool.hold.return_value = False
+        handler.retry_scheduler = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        handler._move_file(test_file, rule)
+
+        handler.retry_scheduler.schedule.assert_called_once()
+
+    def test_move_file_applies_target_throttle(self, make_handler, temp_test_dirs):
+        """移動先に制限がある場合はその制限の下で移動する"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="", max_concurrency=1, bandwidth=1024)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with (
+            patch("service.file_rename_handler.move_file") as mock_move,
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            handler._move_file(test_file, rule)
+
+        throttle = mock_move.call_args.args[2]
+        assert throttle is handler.throttles.get(rule)
+        assert throttle.bandwidth == 1024
+
+    def test_move_file_records_to_ledger(self, make_handler, temp_test_dirs):
+        """移動に成功すると台帳に記録される"""
+        handler = make_handler()
+        handler.ledger = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        handler.ledger.record.assert_called_once_with(
+            test_file, temp_test_dirs["target"] / "file.txt", len("content"), digest=None
+        )
+
+    def test_move_file_records_digest_of_verified_copy(self, make_handler, temp_test_dirs):
+        """検証付きでコピーした場合はハッシュ値も台帳に記録される"""
+        handler = make_handler()
+        handler.ledger = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="", verify="reread")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with (
+            patch("service.file_rename_handler.move_file", return_value="abc123") as mock_move,
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            handler._move_file(test_file, rule)
+
+        assert mock_move.call_args.args[3] == "reread"
+        assert handler.ledger.record.call_args.kwargs["digest"] == "abc123"
+
+    def test_move_file_appends_to_manifest(self, make_handler, temp_test_dirs):
+        """マニフェストが有効な場合は届けたファイルを追記する"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="", manifest=True)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        entries = handler.manifests.get(temp_test_dirs["target"]).entries()
+        assert entries["file.txt"]["size"] == len("content")
+        assert entries["file.txt"]["digest"] == hashlib.sha256(b"content").hexdigest()
+
+    def test_move_file_uses_digest_from_copy(self, make_handler, temp_test_dirs):
+        """コピー中に求めたハッシュ値を使い、移動先を読み直さない"""
+        handler = make_handler()
+        handler.hash_cache = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="", manifest=True)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        def fake_move(src, dst, *args, **kwargs):
+            src.rename(dst)
+            return "abc123"
+
+        with (
+            patch("service.file_rename_handler.move_file", side_effect=fake_move) as mock_move,
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            handler._move_file(test_file, rule)
+
+        assert mock_move.call_args.kwargs["compute_digest"] is True
+        handler.hash_cache.digest.assert_not_called()
+        entries = handler.manifests.get(temp_test_dirs["target"]).entries()
+        assert entries["file.txt"]["digest"] == "abc123"
+
+    def test_manifest_failure_does_not_fail_move(self, make_handler, temp_test_dirs, caplog):
+        """マニフェストに書けなくても移動は成功扱い"""
+        handler = make_handler()
+        handler.retry_scheduler = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="", manifest=True)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with (
+            patch.object(handler.manifests, "get") as mock_get,
+            patch("service.file_rename_handler.refresh_windows_folder"),
+        ):
+            mock_get.return_value.append.side_effect = OSError("read-only")
+            handler._move_file(test_file, rule)
+
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+        assert "マニフェストへの追記に失敗しました" in caplog.text
+        handler.retry_scheduler.schedule.assert_not_called()
+
+    def test_move_file_compresses_with_extension(self, make_handler, temp_test_dirs):
+        """圧縮が有効な場合は圧縮して拡張子を付け、移動元を削除する"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], compress="gzip")
+        test_file = temp_test_dirs["src"] / "report.md"
+        test_file.write_text("content" * 100)
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        compressed = temp_test_dirs["target"] / "report_renamed.md.gz"
+        assert gzip.decompress(compressed.read_bytes()) == b"content" * 100
+        assert not test_file.exists()
+
+    def test_compressed_file_is_spooled_compressed(self, make_handler, temp_test_dirs, tmp_path):
+        """到達できない移動先へは圧縮したものを退避する"""
+        handler = make_handler()
+        handler.spool = MagicMock()
+        handler.spool.spool_dir = tmp_path / "spool"
+        handler.spool.is_available.return_value = False
+        held = {}
+
+        def hold(path, target_path, directory, collision):
+            held[target_path] = gzip.decompress(path.read_bytes())
+            return True
+
+        handler.spool.hold.side_effect = hold
+        rule = make_rule(temp_test_dirs["target"], suffix="", compress="gzip")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        handler._move_file(test_file, rule)
+
+        assert held == {temp_test_dirs["target"] / "file.txt.gz": b"content"}
+        assert not test_file.exists()
+        assert list((tmp_path / "spool").iterdir()) == []
+
+    def test_small_file_is_bundled(self, make_handler, temp_test_dirs):
+        """まとめて送る移動先へは小さなファイルを圧縮の拡張子を付けずに溜める"""
+        handler = make_handler()
+        handler.bundler = MagicMock()
+        handler.bundler.add.return_value = "file_renamed.txt"
+        handler.ledger = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], compress="gzip", bundle_seconds=10.0)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        handler.bundler.add.assert_called_once_with(test_file, rule, "file_renamed.txt")
+        assert handler.ledger.record.call_args.kwargs["status"] == "bundled"
+        assert list(temp_test_dirs["target"].iterdir()) == []
+
+    def test_bundled_file_skipped_when_staged_copy_is_newer(self, make_handler, temp_test_dirs):
+        """skip_if_newer で溜めている同じ名前のファイルの方が新しい場合は移動元を残す"""
+        handler = make_handler()
+        handler.bundler = MagicMock()
+        handler.bundler.add.return_value = None
+        handler.ledger = MagicMock()
+        rule = make_rule(
+            temp_test_dirs["target"], suffix="", bundle_seconds=10.0, collision="skip_if_newer"
+        )
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        assert test_file.exists()
+        assert handler.ledger.record.call_args.kwargs["status"] == "skipped"
+
+    def test_large_file_is_not_bundled(self, make_handler, temp_test_dirs):
+        """上限サイズを超えるファイルはまとめずに個別に届ける"""
+        handler = make_handler()
+        handler.bundler = MagicMock()
+        rule = make_rule(
+            temp_test_dirs["target"], suffix="", bundle_seconds=10.0, bundle_file_limit=4
+        )
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        handler.bundler.add.assert_not_called()
+        assert (temp_test_dirs["target"] / "file.txt").read_text() == "content"
+
+    def test_bundle_rule_without_bundler_moves_file(self, make_handler, temp_test_dirs):
+        """まとめる処理が無い場合はまとめる指定があっても個別に届ける"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="", bundle_seconds=10.0)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+
+    def test_move_file_into_hash_shard(self, make_handler, temp_test_dirs):
+        """hash の場合はファイル名のハッシュ値の先頭のサブディレクトリへ移動する"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="", layout="hash")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+        digest = hashlib.sha1(b"file.txt").hexdigest()
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        moved = temp_test_dirs["target"] / digest[:2] / digest[2:4] / "file.txt"
+        assert moved.read_text() == "content"
+        assert len(handler.directories) == 1
+
+    def test_sharded_manifest_records_relative_name(self, make_handler, temp_test_dirs):
+        """サブディレクトリに分けた場合はマニフェストに相対パスで記録する"""
+        handler = make_handler()
+        rule = make_rule(
+            temp_test_dirs["target"], suffix="", layout="hash", shard_levels=1, manifest=True
+        )
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+        prefix = hashlib.sha1(b"file.txt").hexdigest()[:2]
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        entries = handler.manifests.get(temp_test_dirs["target"]).entries()
+        assert list(entries) == [f"{prefix}/file.txt"]
+
+    def test_removed_shard_is_recreated(self, make_handler, temp_test_dirs):
+        """作成済みのサブディレクトリが削除されても、失敗後の再試行で作り直す"""
+        handler = make_handler()
+        handler.retry_scheduler = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="", layout="date", shard_levels=1)
+        first = temp_test_dirs["src"] / "first.txt"
+        first.write_text("content")
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(first, rule)
+        shard = next(temp_test_dirs["target"].iterdir())
+        (shard / "first.txt").unlink()
+        shard.rmdir()
+
+        second = temp_test_dirs["src"] / "second.txt"
+        second.write_text("content")
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(second, rule)
+            handler.retry_scheduler.schedule.assert_called_once()
+            handler._move_file(second, rule)
+
+        assert (shard / "second.txt").exists()
+
+    def test_sharded_file_is_spooled_with_subdirectory(self, make_handler, temp_test_dirs):
+        """到達できない移動先へは移動先ディレクトリを渡して退避する"""
+        handler = make_handler()
+        handler.spool = MagicMock()
+        handler.spool.is_available.return_value = False
+        rule = make_rule(temp_test_dirs["target"], suffix="", layout="hash", shard_levels=1)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+        prefix = hashlib.sha1(b"file.txt").hexdigest()[:2]
+
+        handler._move_file(test_file, rule)
+
+        handler.spool.hold.assert_called_once_with(
+            test_file,
+            temp_test_dirs["target"] / prefix / "file.txt",
+            directory=temp_test_dirs["target"],
+            collision="overwrite",
+        )
+
+    def test_target_index_replaces_exists_check(self, make_handler, temp_test_dirs):
+        """一覧がある場合は移動先の存在確認をせず、移動したファイルを一覧に加える"""
+        handler = make_handler()
+        handler.target_index = TargetIndex()
+        rule = make_rule(temp_test_dirs["target"], suffix="")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with (
+            patch("service.file_rename_handler.refresh_windows_folder"),
+            patch.object(Path, "exists", side_effect=AssertionError("exists() called")),
+        ):
+            handler._move_file(test_file, rule)
+
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+        assert handler.target_index.contains(temp_test_dirs["target"] / "file.txt") is True
+
+    def test_target_index_skips_dedup_for_new_name(self, make_handler, temp_test_dirs):
+        """一覧に無い名前はハッシュ値を比べずに移動する"""
+        handler = make_handler()
+        handler.target_index = TargetIndex()
+        handler.hash_cache = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="", dedup=True)
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        handler.hash_cache.is_duplicate.assert_not_called()
+        assert (temp_test_dirs["target"] / "file.txt").exists()
+
+    def test_keep_both_adds_version(self, make_handler, temp_test_dirs):
+        """keep_both の場合は既存のファイルを残し、連番を付けて移動する"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="", collision="keep_both")
+        (temp_test_dirs["target"] / "file.txt").write_text("old")
+        for content in ("new1", "new2"):
+            test_file = temp_test_dirs["src"] / "file.txt"
+            test_file.write_text(content)
+            with patch("service.file_rename_handler.refresh_windows_folder"):
+                handler._move_file(test_file, rule)
+
+        assert (temp_test_dirs["target"] / "file.txt").read_text() == "old"
+        assert (temp_test_dirs["target"] / "file_1.txt").read_text() == "new1"
+        assert (temp_test_dirs["target"] / "file_2.txt").read_text() == "new2"
+
+    def test_skip_if_newer_keeps_source(self, make_handler, temp_test_dirs):
+        """skip_if_newer で移動先の方が新しい場合は移動せず、移動元を残す"""
+        handler = make_handler()
+        handler.ledger = MagicMock()
+        rule = make_rule(temp_test_dirs["target"], suffix="", collision="skip_if_newer")
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("older")
+        existing = temp_test_dirs["target"] / "file.txt"
+        existing.write_text("newer")
+        os.utime(test_file, ns=(1_000_000_000, 1_000_000_000))
+
+        handler._move_file(test_file, rule)
+
+        assert existing.read_text() == "newer"
+        assert test_file.exists()
+        assert handler.ledger.record.call_args.kwargs["status"] == "skipped"
+
+    def test_skip_if_newer_overwrites_older_target(self, make_handler, temp_test_dirs):
+        """skip_if_newer でも移動先の方が古い場合は上書きする"""
+        handler = make_handler()
+        rule = make_rule(temp_test_dirs["target"], suffix="", collision="skip_if_newer")
+        existing = temp_test_dirs["target"] / "file.txt"
+        existing.write_text("older")
+        os.utime(existing, ns=(1_000_000_000, 1_000_000_000))
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("newer")
+
+        with patch("service.file_rename_handler.refresh_windows_folder"):
+            handler._move_file(test_file, rule)
+
+        assert existing.read_text() == "newer"
+        assert not test_file.exists()
+
+    def test_move_file_failure_is_not_recorded(self, make_handler, temp_test_dirs):
+        """移動に失敗した場合は台帳に記録しない"""
+        handler = make_handler()
+        handler.ledger = MagicMock()
+        rule = make_rule(temp_test_dirs["target"])
+        test_file = temp_test_dirs["src"] / "file.txt"
+        test_file.write_text("content")
+
+        with patch("shutil.move", side_effect=Exception("Test error")):
+            handler._move_file(test_file, rule)
+
+        handler.ledger.record.assert_not_called()
@@ -0,0 +1,318 @@
+import hashlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from service.file_transfer import (
+    CHUNK_SIZE,
+    Destination,
+    VerificationError,
+    _reflink,
+    copy_stream,
+    fan_out_file,
+    move_file,
+)
+from service.throttle import TransferThrottle
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    """3チャンク弱の大きさのファイル"""
+    path = tmp_path / "source.bin"
+    path.write_bytes(b"a" * (CHUNK_SIZE * 2 + 10))
+    return path
+
+
+class TestCopyStream:
+    """copy_stream関数のテスト"""
+
+    def test_copies_content_and_returns_size(self, source_file, tmp_path):
+        """内容をコピーしてバイト数を返す"""
+        dst = tmp_path / "copy.bin"
+
+        copied = copy_stream(source_file, dst)
+
+        assert copied == source_file.stat().st_size
+        assert dst.read_bytes() == source_file.read_bytes()
+        assert source_file.exists()
+
+    def test_consumes_bandwidth_per_chunk(self, source_file, tmp_path):
+        """チャンクごとに転送量の制限を受ける"""
+        throttle = MagicMock()
+
+        copy_stream(source_file, tmp_path / "copy.bin", throttle)
+
+        sizes = [call.args[0] for call in throttle.consume.call_args_list]
+        assert sizes == [CHUNK_SIZE, CHUNK_SIZE, 10]
+
+    def test_failure_keeps_existing_target(self, source_file, tmp_path):
+        """途中で失敗しても既存のコピー先は壊さず、一時ファイルも残さない"""
+        dst = tmp_path / "copy.bin"
+        dst.write_bytes(b"old")
+        throttle = MagicMock()
+        throttle.consume.side_effect = [None, OSError("network")]
+
+        with pytest.raises(OSError):
+            copy_stream(source_file, dst, throttle)
+
+        assert dst.read_bytes() == b"old"
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["copy.bin", "source.bin"]
+
+
+class TestMoveFile:
+    """move_file関数のテスト"""
+
+    def test_without_throttle_uses_shutil_move(self, source_file, tmp_path):
+        """制限が無い場合はshutil.moveで移動する"""
+        with patch("shutil.move") as mock_move:
+            move_file(source_file, tmp_path / "dest.bin")
+
+        mock_move.assert_called_once_with(str(source_file), str(tmp_path / "dest.bin"))
+
+    def test_same_device_is_renamed_without_bandwidth(self, source_file, tmp_path):
+        """同じボリューム内では転送量を消費せずに名前の変更で済ませる"""
+        throttle = TransferThrottle(max_concurrency=1, bandwidth=1)
+
+        with patch("service.file_transfer.copy_stream") as mock_copy:
+            move_file(source_file, tmp_path / "dest.bin", throttle)
+
+        mock_copy.assert_not_called()
+        assert (tmp_path / "dest.bin").exists()
+
+    def test_cross_device_is_streamed_with_throttle(self, source_file, tmp_path):
+        """別のボリュームへは転送量を制限しながらコピーして元を削除する"""
+        throttle = TransferThrottle(bandwidth=10**12)
+        data = source_file.read_bytes()
+
+        with patch("service.file_transfer._same_device", return_value=False):
+            move_file(source_file, tmp_path / "dest.bin", throttle)
+
+        assert not source_file.exists()
+        assert (tmp_path / "dest.bin").read_bytes() == data
+
+
+class TestVerifiedMove:
+    """検証付きの移動のテスト"""
+
+    @pytest.mark.parametrize("verify", ["fsync", "reread"])
+    def test_returns_digest_of_streamed_data(self, source_file, tmp_path, verify):
+        """コピー中に求めたハッシュ値を返し、移動元を削除する"""
+        expected = hashlib.sha256(source_file.read_bytes()).hexdigest()
+
+        with patch("service.file_transfer._same_device", return_value=False):
+            digest = move_file(source_file, tmp_path / "dest.bin", verify=verify)
+
+        assert digest == expected
+        assert not source_file.exists()
+        assert hashlib.sha256((tmp_path / "dest.bin").read_bytes()).hexdigest() == expected
+
+    def test_source_is_read_once(self, source_file, tmp_path):
+        """fsyncでは移動元もコピー先も読み直さない"""
+        with (
+            patch("service.file_transfer._same_device", return_value=False),
+            patch("service.file_transfer.file_digest") as mock_digest,
+            patch("service.file_transfer.os.fsync") as mock_fsync,
+        ):
+            move_file(source_file, tmp_path / "dest.bin", verify="fsync")
+
+        mock_digest.assert_not_called()
+        mock_fsync.assert_called_once()
+
+    def test_mismatch_keeps_source_and_target(self, source_file, tmp_path):
+        """読み直した内容が一致しない場合は移動元も既存のコピー先も残す"""
+        dst = tmp_path / "dest.bin"
+        dst.write_bytes(b"old")
+
+        with (
+            patch("service.file_transfer._same_device", return_value=False),
+            patch("service.file_transfer.file_digest", return_value="corrupted"),
+            pytest.raises(VerificationError),
+        ):
+            move_file(source_file, dst, verify="reread")
+
+        assert source_file.exists()
+        assert dst.read_bytes() == b"old"
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["dest.bin", "source.bin"]
+
+    def test_compute_digest_without_verify(self, source_file, tmp_path):
+        """検証なしでもハッシュ値を求められる（fsyncはしない）"""
+        expected = hashlib.sha256(source_file.read_bytes()).hexdigest()
+
+        with (
+            patch("service.file_transfer._same_device", return_value=False),
+            patch("service.file_transfer.os.fsync") as mock_fsync,
+        ):
+            digest = move_file(source_file, tmp_path / "dest.bin", compute_digest=True)
+
+        assert digest == expected
+        mock_fsync.assert_not_called()
+
+    def test_same_device_is_renamed_without_digest(self, source_file, tmp_path):
+        """同じボリューム内では名前の変更で済ませ、ハッシュ値は返さない"""
+        with patch("service.file_transfer.copy_stream") as mock_copy:
+            digest = move_file(source_file, tmp_path / "dest.bin", verify="reread")
+
+        assert digest is None
+        mock_copy.assert_not_called()
+        assert (tmp_path / "dest.bin").exists()
+
+
+class TestFanOutFile:
+    """fan_out_file関数のテスト"""
+
+    def test_delivers_to_all_and_removes_source(self, source_file, tmp_path):
+        """全ての移動先へ届けてから移動元を削除する"""
+        data = source_file.read_bytes()
+        destinations = [tmp_path / "a.bin", tmp_path / "b.bin"]
+
+        fan_out_file(source_file, [Destination(dst) for dst in destinations])
+
+        assert not source_file.exists()
+        assert [dst.read_bytes() for dst in destinations] == [data, data]
+
+    def test_keeps_source_when_requested(self, source_file, tmp_path):
+        """remove_source=False の場合は届けた後も移動元を残す"""
+        fan_out_file(source_file, [Destination(tmp_path / "a.bin")], remove_source=False)
+
+        assert source_file.exists()
+        assert (tmp_path / "a.bin").read_bytes() == source_file.read_bytes()
+
+    def test_same_device_uses_hardlinks(self, source_file, tmp_path):
+        """同じボリュームの移動先にはハードリンクを作り、データを読まない"""
+        with patch("service.file_transfer._tee_stream") as mock_tee:
+            fan_out_file(
+                source_file, [Destination(tmp_path / "a.bin"), Destination(tmp_path / "b.bin")]
+            )
+
+        mock_tee.assert_not_called()
+        assert (tmp_path / "a.bin").stat().st_ino == (tmp_path / "b.bin").stat().st_ino
+
+    def test_other_devices_read_source_once(self, source_file, tmp_path):
+        """別のボリュームへは移動元を1回だけ読んで全ての移動先へ書き込む"""
+        data = source_file.read_bytes()
+        real_open = open
+        opened = []
+
+        def tracking_open(path, mode="r", *args, **kwargs):
+            opened.append((str(path), mode))
+            return real_open(path, mode, *args, **kwargs)
+
+        with (
+            patch("service.file_transfer._same_device", return_value=False),
+            patch("builtins.open", side_effect=tracking_open),
+        ):
+            fan_out_file(
+                source_file, [Destination(tmp_path / "a.bin"), Destination(tmp_path / "b.bin")]
+            )
+
+        assert opened.count((str(source_file), "rb")) == 1
+        assert (tmp_path / "a.bin").read_bytes() == data
+        assert (tmp_path / "b.bin").read_bytes() == data
+
+    def test_throttles_each_streamed_target(self, source_file, tmp_path):
+        """移動先ごとの転送量の制限を受ける"""
+        throttle = MagicMock()
+
+        with patch("service.file_transfer._same_device", return_value=False):
+            fan_out_file(
+                source_file,
+                [Destination(tmp_path / "a.bin", throttle), Destination(tmp_path / "b.bin")],
+            )
+
+        sizes = [call.args[0] for call in throttle.consume.call_args_list]
+        assert sizes == [CHUNK_SIZE, CHUNK_SIZE, 10]
+        throttle.slot.assert_called_once()
+
+    def test_failure_keeps_source_and_leaves_no_copies(self, source_file, tmp_path):
+        """1つでも失敗した場合は移動元を残し、どの移動先にもファイルを置かない"""
+        throttle = MagicMock()
+        throttle.consume.side_effect = [None, OSError("network")]
+
+        with (
+            patch("service.file_transfer._same_device", return_value=False),
+            pytest.raises(OSError),
+        ):
+            fan_out_file(
+                source_file,
+                [Destination(tmp_path / "a.bin"), Destination(tmp_path / "b.bin", throttle)],
+            )
+
+        assert source_file.exists()
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["source.bin"]
+
+    def test_copy_delivery_streams_on_same_device(self, source_file, tmp_path):
+        """copyを指定した移動先は同じボリュームでも独立したファイルにする"""
+        fan_out_file(
+            source_file,
+            [Destination(tmp_path / "a.bin", delivery="copy"), Destination(tmp_path / "b.bin")],
+        )
+
+        assert (tmp_path / "a.bin").stat().st_nlink == 1
+        assert (tmp_path / "b.bin").read_bytes() == b"a" * (CHUNK_SIZE * 2 + 10)
+
+    def test_reflink_delivery_clones_without_reading(self, source_file, tmp_path):
+        """reflinkを指定した移動先はデータを読まずに複製する"""
+        with (
+            patch("service.file_transfer._ficlone", return_value=True) as mock_clone,
+            patch("service.file_transfer._tee_stream") as mock_tee,
+        ):
+            fan_out_file(source_file, [Destination(tmp_path / "a.bin", delivery="reflink")])
+
+        mock_clone.assert_called_once()
+        mock_tee.assert_not_called()
+        assert (tmp_path / "a.bin").exists()
+
+
+class TestReflink:
+    """_reflink関数のテスト"""
+
+    def test_falls_back_to_copy_file_range(self, source_file, tmp_path):
+        """FICLONEに対応しない場合はcopy_file_rangeで複製する"""
+        with patch("service.file_transfer._ficlone", return_value=False):
+            assert _reflink(source_file, tmp_path / "clone.bin") is True
+
+        assert (tmp_path / "clone.bin").read_bytes() == source_file.read_bytes()
+
+    def test_returns_false_when_unsupported(self, source_file, tmp_path):
+        """どちらにも対応しない場合はFalseを返し、一時ファイルを残さない"""
+        with (
+            patch("service.file_transfer._ficlone", return_value=False),
+            patch("service.file_transfer._copy_file_range", return_value=False),
+        ):
+            assert _reflink(source_file, tmp_path / "clone.bin") is False
+
+        assert not (tmp_path / "clone.bin").exists()
+
+    def test_unsupported_reflink_falls_back_to_stream(self, source_file, tmp_path):
+        """複製できない場合は読み込んでコピーする"""
+        data = source_file.read_bytes()
+        with patch("service.file_transfer._reflink", return_value=False):
+            fan_out_file(source_file, [Destination(tmp_path / "a.bin", delivery="reflink")])
+
+        assert (tmp_path / "a.bin").read_bytes() == data
+
+    def test_verified_fan_out_returns_digest(self, source_file, tmp_path):
+        """検証付きで書き込んだ場合は内容のハッシュ値を返す"""
+        expected = hashlib.sha256(source_file.read_bytes()).hexdigest()
+
+        with patch("service.file_transfer._same_device", return_value=False):
+            digest = fan_out_file(
+                source_file,
+                [Destination(tmp_path / "a.bin", verify="reread"), Destination(tmp_path / "b.bin")],
+            )
+
+        assert digest == expected
+
+    def test_fan_out_mismatch_leaves_no_copies(self, source_file, tmp_path):
+        """いずれかの移動先の内容が一致しない場合は全て取り消す"""
+        with (
+            patch("service.file_transfer._same_device", return_value=False),
+            patch("service.file_transfer.file_digest", return_value="corrupted"),
+            pytest.raises(VerificationError),
+        ):
+            fan_out_file(
+                source_file,
+                [Destination(tmp_path / "a.bin"), Destination(tmp_path / "b.bin", verify="reread")],
+            )
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["source.bin"]
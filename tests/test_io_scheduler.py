@@ -0,0 +1,134 @@
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from service.io_scheduler import DeviceScheduler
+from utils.config_manager import TargetRule
+
+
+def make_rule(directory, device_workers=0) -> TargetRule:
+    """テスト用のTargetRuleを生成"""
+    return TargetRule(
+        directory=Path(directory),
+        filenames=frozenset(),
+        suffix="",
+        pattern=None,
+        device_workers=device_workers,
+    )
+
+
+@pytest.fixture
+def scheduler():
+    """テスト後にワーカーを停止するスケジューラ"""
+    scheduler = DeviceScheduler(workers_per_device=2)
+    yield scheduler
+    scheduler.close()
+
+
+class ConcurrencyProbe:
+    """同時に実行された処理数の最大値を記録する"""
+
+    def __init__(self) -> None:
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def task(self) -> None:
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self._lock:
+            self.active -= 1
+
+
+class TestDeviceSchedulerKeys:
+    """デバイスの判定テスト"""
+
+    def test_directories_on_same_device_share_key(self, scheduler, tmp_path):
+        """同じボリュームのディレクトリは同じキー"""
+        (tmp_path / "a").mkdir()
+        (tmp_path / "b").mkdir()
+
+        assert scheduler.device_key(tmp_path / "a") == scheduler.device_key(tmp_path / "b")
+
+    def test_device_key_is_cached(self, scheduler, tmp_path):
+        """同じディレクトリのstatは1回だけ"""
+        with patch("service.io_scheduler.os.stat", wraps=__import__("os").stat) as mock_stat:
+            scheduler.device_key(tmp_path)
+            scheduler.device_key(tmp_path)
+
+        assert mock_stat.call_count == 1
+
+    def test_unreachable_directory_uses_directory_key(self, scheduler, tmp_path):
+        """到達できないディレクトリはディレクトリ自体をキーにする"""
+        missing = tmp_path / "missing"
+
+        assert scheduler.device_key(missing) == f"dir:{missing}"
+
+
+class TestDeviceSchedulerSubmit:
+    """処理の実行テスト"""
+
+    def test_limits_concurrency_per_device(self, scheduler, tmp_path):
+        """同じデバイスへの処理はワーカー数までしか同時に動かない"""
+        (tmp_path / "a").mkdir()
+        (tmp_path / "b").mkdir()
+        probe = ConcurrencyProbe()
+
+        for i in range(6):
+            scheduler.submit(make_rule(tmp_path / ("a" if i % 2 else "b")), probe.task)
+        scheduler.close()
+
+        assert probe.peak == 2
+
+    def test_devices_run_independently(self, scheduler):
+        """別のデバイスへの処理は互いを待たない"""
+        probes = {"dev:1": ConcurrencyProbe(), "dev:2": ConcurrencyProbe()}
+        started = threading.Barrier(2, timeout=1)
+
+        def task(key):
+            started.wait()
+            probes[key].task()
+
+        with patch.object(DeviceScheduler, "device_key", side_effect=lambda d: f"dev:{d.name}"):
+            scheduler.submit(make_rule("/mnt/1"), lambda: task("dev:1"))
+            scheduler.submit(make_rule("/mnt/2"), lambda: task("dev:2"))
+            scheduler.close()
+
+        assert probes["dev:1"].peak == 1
+        assert probes["dev:2"].peak == 1
+
+    def test_rule_can_override_worker_count(self, scheduler, tmp_path):
+        """デバイスを最初に使うルールの指定でワーカー数が決まる"""
+        scheduler.submit(make_rule(tmp_path, device_workers=4), lambda: None)
+
+        stats = scheduler.stats()
+        assert [device["workers"] for device in stats.values()] == [4]
+
+    def test_close_drains_queue(self, scheduler, tmp_path):
+        """停止時は積まれた処理を全て終える"""
+        done = []
+        for i in range(20):
+            scheduler.submit(make_rule(tmp_path), lambda i=i: done.append(i))
+
+        scheduler.close()
+
+        assert sorted(done) == list(range(20))
+
+    def test_task_error_does_not_stop_worker(self, scheduler, tmp_path, caplog):
+        """処理の例外はログに残してワーカーは続行する"""
+        done = []
+
+        def failing():
+            raise RuntimeError("boom")
+
+        scheduler.submit(make_rule(tmp_path), failing)
+        scheduler.submit(make_rule(tmp_path), lambda: done.append(True))
+        scheduler.close()
+
+        assert done == [True]
+        assert "boom" in caplog.text
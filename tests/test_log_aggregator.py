@@ -0,0 +1,104 @@
+import configparser
+import logging
+
+from utils.log_aggregator import LogAggregator, create_log_aggregator
+
+
+class TestLogAggregatorShouldLog:
+    """should_logメソッドのテスト"""
+
+    def test_disabled_logs_everything(self):
+        """集計間隔が0の場合は全件を個別に出力する"""
+        aggregator = LogAggregator()
+
+        assert all(aggregator.should_log("moved", "C:/dest") for _ in range(5))
+
+    def test_samples_every_nth_message(self):
+        """指定件数ごとに1件だけ個別に出力する"""
+        aggregator = LogAggregator(interval=60, sample_every={"moved": 3})
+
+        results = [aggregator.should_log("moved", "C:/dest") for _ in range(7)]
+        assert results == [True, False, False, True, False, False, True]
+
+    def test_zero_sample_suppresses_individual_messages(self):
+        """0を指定すると個別には出力しない"""
+        aggregator = LogAggregator(interval=60, sample_every={"unmatched": 0})
+
+        assert not any(aggregator.should_log("unmatched", "C:/src") for _ in range(3))
+
+    def test_sampling_is_per_key(self):
+        """サンプリングは移動先ごとに数える"""
+        aggregator = LogAggregator(interval=60, sample_every={"moved": 2})
+
+        assert aggregator.should_log("moved", "C:/a") is True
+        assert aggregator.should_log("moved", "C:/b") is True
+        assert aggregator.should_log("moved", "C:/a") is False
+
+
+class TestLogAggregatorFlush:
+    """集計結果の出力テスト"""
+
+    def test_flush_summarises_per_target(self, caplog):
+        """移動先ごとの件数をまとめて出力する"""
+        aggregator = LogAggregator(interval=60, sample_every={"moved": 0})
+        for _ in range(4812):
+            aggregator.should_log("moved", "C:/dest")
+        aggregator.should_log("moved", "C:/other")
+
+        with caplog.at_level(logging.INFO):
+            aggregator.flush()
+
+        assert "ファイルを移動しました: 4,812件 -> C:/dest" in caplog.text
+        assert "ファイルを移動しました: 1件 -> C:/other" in caplog.text
+
+    def test_flush_resets_counts(self, caplog):
+        """出力後は件数がリセットされる"""
+        aggregator = LogAggregator(interval=60)
+        aggregator.should_log("moved", "C:/dest")
+        aggregator.flush()
+
+        with caplog.at_level(logging.INFO):
+            aggregator.flush()
+
+        assert caplog.text == ""
+
+    def test_close_flushes_pending_counts(self, caplog):
+        """close時に未出力の件数を出力する"""
+        aggregator = LogAggregator(interval=60)
+        aggregator.start()
+        aggregator.should_log("unmatched", "C:/src")
+
+        with caplog.at_level(logging.INFO):
+            aggregator.close()
+
+        assert "移動先が見つかりませんでした: 1件 (C:/src)" in caplog.text
+
+
+class TestCreateLogAggregator:
+    """create_log_aggregator関数のテスト"""
+
+    def test_reads_logging_section(self):
+        """[LOGGING]の設定が反映される"""
+        config = configparser.ConfigParser()
+        config.read_string("""
+[LOGGING]
+summary_interval = 30
+sample_moved = 100
+sample_unmatched = 0
+""")
+        aggregator = create_log_aggregator(config)
+
+        assert aggregator.interval == 30.0
+        assert aggregator.sample_every == {
+            "moved": 100,
+            "overwrite": 1,
+            "unmatched": 0,
+            "duplicate": 1,
+            "skipped": 1,
+        }
+
+    def test_defaults_disable_aggregation(self):
+        """設定が無い場合は集計しない"""
+        aggregator = create_log_aggregator(configparser.ConfigParser())
+
+        assert aggregator.enabled is False
@@ -0,0 +1,189 @@
+import gzip
+import logging
+import os
+import threading
+import time
+import weakref
+from unittest.mock import patch
+
+import pytest
+
+from utils.log_rotation import (
+    LogCompressor,
+    SizedTimedRotatingFileHandler,
+    cleanup_old_logs,
+    compress_log_file,
+)
+
+
+def write_log(path, size: int, age_days: float = 0) -> None:
+    """指定サイズ・経過日数のログファイルを作成"""
+    path.write_bytes(b"x" * size)
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def make_logger(tmp_path):
+    """SizedTimedRotatingFileHandlerを付けたロガーのファクトリ"""
+    handlers = []
+
+    def _factory(max_bytes: int, compressor=None) -> logging.Logger:
+        handler = SizedTimedRotatingFileHandler(
+            str(tmp_path / "FileTransfer.log"), max_bytes=max_bytes, compressor=compressor
+        )
+        handlers.append(handler)
+        logger = logging.getLogger(f"test_log_rotation_{len(handlers)}")
+        logger.propagate = False
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        return logger
+
+    yield _factory
+
+    for handler in handlers:
+        handler.close()
+
+
+class TestSizedTimedRotatingFileHandler:
+    """サイズ上限付きローテーションのテスト"""
+
+    def test_rotates_when_size_exceeded(self, tmp_path, make_logger):
+        """サイズ上限を超えるとローテーションされる"""
+        logger = make_logger(max_bytes=100)
+        for _ in range(10):
+            logger.info("x" * 40)
+
+        rotated = [p for p in tmp_path.iterdir() if p.name.startswith("FileTransfer.log.")]
+        assert len(rotated) >= 2
+        assert (tmp_path / "FileTransfer.log").stat().st_size < 200
+
+    def test_rotated_names_are_unique(self, tmp_path, make_logger):
+        """同じ秒に複数回ローテーションしても上書きされない"""
+        logger = make_logger(max_bytes=1)
+        for i in range(5):
+            logger.info(f"line {i}")
+
+        rotated = sorted(p for p in tmp_path.iterdir() if p.name.startswith("FileTransfer.log."))
+        contents = {p.read_text(encoding="utf-8").strip() for p in rotated}
+        assert contents == {f"line {i}" for i in range(4)}
+
+    def test_zero_max_bytes_disables_size_rotation(self, tmp_path, make_logger):
+        """サイズ上限が0の場合はサイズでローテーションしない"""
+        logger = make_logger(max_bytes=0)
+        for _ in range(10):
+            logger.info("x" * 40)
+
+        assert [p.name for p in tmp_path.iterdir()] == ["FileTransfer.log"]
+
+    def test_rotated_files_are_compressed_in_background(self, tmp_path, make_logger):
+        """ローテーション済みファイルは圧縮される"""
+        compressor = LogCompressor(str(tmp_path), "FileTransfer", 7, 0)
+        logger = make_logger(max_bytes=1, compressor=compressor)
+        logger.info("first")
+        logger.info("second")
+        compressor.close()
+
+        compressed = [p for p in tmp_path.iterdir() if p.name.endswith(".log.gz")]
+        assert len(compressed) == 1
+        with gzip.open(compressed[0], "rt", encoding="utf-8") as f:
+            assert f.read().strip() == "first"
+
+
+    def test_shutdown_does_not_wait_for_compressor(self, tmp_path):
+        """後処理のスレッドがログを出力していても logging.shutdown() が止まらない"""
+        write_log(tmp_path / "FileTransfer.log.old.log.gz", 10, age_days=30)
+        compressor = LogCompressor(str(tmp_path), "FileTransfer", 7, 0)
+        handler = SizedTimedRotatingFileHandler(
+            str(tmp_path / "FileTransfer.log"), max_bytes=1, compressor=compressor
+        )
+        root = logging.getLogger()
+        level = root.level
+        root.setLevel(logging.INFO)
+        root.addHandler(handler)
+
+        def slow_compress(path: str) -> None:
+            # shutdown() がハンドラのロックを取った後に、古いログの削除をログに出力させる
+            time.sleep(0.2)
+
+        try:
+            with patch("utils.log_rotation.compress_log_file", side_effect=slow_compress):
+                root.warning("first")
+                root.warning("second")
+                shutdown = threading.Thread(
+                    target=logging.shutdown, args=([weakref.ref(handler)],), daemon=True
+                )
+                shutdown.start()
+                shutdown.join(timeout=5)
+                assert not shutdown.is_alive()
+                compressor.close()
+        finally:
+            root.removeHandler(handler)
+            root.setLevel(level)
+            handler.close()
+
+        assert not (tmp_path / "FileTransfer.log.old.log.gz").exists()
+
+
+class TestCompressLogFile:
+    """compress_log_file関数のテスト"""
+
+    def test_replaces_file_with_gzip(self, tmp_path):
+        """gzipファイルを作成し元のファイルを削除する"""
+        path = tmp_path / "FileTransfer.log.2026-10-19_000000.log"
+        path.write_text("content", encoding="utf-8")
+
+        compress_log_file(str(path))
+
+        assert not path.exists()
+        with gzip.open(f"{path}.gz", "rt", encoding="utf-8") as f:
+            assert f.read() == "content"
+
+
+class TestCleanupOldLogs:
+    """cleanup_old_logs関数のテスト"""
+
+    def test_deletes_logs_older_than_retention(self, tmp_path):
+        """保持日数を過ぎたローテーション済みログを削除する"""
+        write_log(tmp_path / "FileTransfer.log.2026-10-01.log", 10, age_days=10)
+        write_log(tmp_path / "FileTransfer.log.2026-10-18_000000.log.gz", 10, age_days=1)
+
+        cleanup_old_logs(str(tmp_path), 7, "FileTransfer")
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "FileTransfer.log.2026-10-18_000000.log.gz"
+        ]
+
+    def test_keeps_main_and_unrelated_logs(self, tmp_path):
+        """現在のログと他のファイルは削除しない"""
+        write_log(tmp_path / "FileTransfer.log", 10, age_days=30)
+        write_log(tmp_path / "debug.log", 10, age_days=30)
+
+        cleanup_old_logs(str(tmp_path), 7, "FileTransfer", max_total_bytes=1)
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["FileTransfer.log", "debug.log"]
+
+    def test_budget_ignores_other_files(self, tmp_path):
+        """移動記録などログ以外のファイルは上限サイズに数えない"""
+        write_log(tmp_path / "FileTransfer.log", 100)
+        write_log(tmp_path / "FileTransfer.log.a.log.gz", 100, age_days=1)
+        write_log(tmp_path / "transfers.db", 1000)
+        write_log(tmp_path / "retry_queue.json", 1000)
+
+        cleanup_old_logs(str(tmp_path), 7, "FileTransfer", max_total_bytes=250)
+
+        assert (tmp_path / "FileTransfer.log.a.log.gz").exists()
+
+    def test_deletes_oldest_until_within_budget(self, tmp_path):
+        """合計サイズが上限以下になるまで古い順に削除する"""
+        write_log(tmp_path / "FileTransfer.log", 100)
+        write_log(tmp_path / "FileTransfer.log.a.log.gz", 100, age_days=3)
+        write_log(tmp_path / "FileTransfer.log.b.log.gz", 100, age_days=2)
+        write_log(tmp_path / "FileTransfer.log.c.log.gz", 100, age_days=1)
+
+        cleanup_old_logs(str(tmp_path), 7, "FileTransfer", max_total_bytes=250)
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "FileTransfer.log",
+            "FileTransfer.log.c.log.gz",
+        ]
@@ -0,0 +1,80 @@
+import pytest
+
+from service.readiness import ReadinessEstimator
+
+
+class TestReadinessEstimator:
+    """書き込み完了までの時間の学習テスト"""
+
+    def test_first_delay_starts_from_initial(self):
+        """未学習の拡張子は initial だけ待つ"""
+        estimator = ReadinessEstimator(0.5)
+
+        assert estimator.first_delay(".txt") == 0.5
+
+    def test_learns_per_extension(self):
+        """拡張子（大文字・小文字は区別しない）ごとに完了までの時間を学習する"""
+        estimator = ReadinessEstimator(0.5, floor=0.01)
+
+        estimator.observe(".TXT", 0.0, 10)
+        estimator.observe(".pdf", 2.0, 2_000_000)
+
+        assert estimator.first_delay(".txt") == 0.01
+        assert estimator.first_delay(".pdf") == 2.0
+        assert estimator.first_delay(".csv") == 0.5
+
+    def test_settled_file_is_learned_as_floor(self):
+        """最初の確認で書き終わっていた（完了までの時間が0の）場合は下限として学習する"""
+        estimator = ReadinessEstimator(0.5, floor=0.25)
+
+        estimator.observe(".txt", 0.0, 10)
+
+        assert estimator.stats()[".txt"] == {"settle": 0.25, "rate": 0.0, "samples": 1}
+
+    def test_backoff_is_capped_at_initial(self):
+        """ロック中のファイルの待ち時間は initial より延ばさない"""
+        estimator = ReadinessEstimator(0.5, floor=0.1, ceiling=30.0)
+
+        assert estimator.backoff(0.1) == 0.2
+        assert estimator.backoff(0.4) == 0.5
+        assert estimator.backoff(8.0) == 0.5
+
+    def test_settle_is_moving_average(self):
+        """完了までの時間は指数移動平均で更新する"""
+        estimator = ReadinessEstimator(0.5, floor=0.0, alpha=0.5)
+
+        estimator.observe(".pdf", 2.0, 0)
+        estimator.observe(".pdf", 1.0, 0)
+
+        assert estimator.first_delay(".pdf") == pytest.approx(1.5)
+
+    def test_next_delay_is_proportional_to_size(self):
+        """書き込み中のファイルは学習した速さでサイズに比例した時間を待つ"""
+        estimator = ReadinessEstimator(0.5, floor=0.01, ceiling=60)
+        # 10MB を2秒で書き込む（5MB/秒）
+        estimator.observe(".tif", 2.0, 10_000_000)
+
+        assert estimator.next_delay(".tif", 25_000_000, 0.5) == pytest.approx(5.0)
+        assert estimator.next_delay(".tif", 1_000, 0.5) == 0.01
+
+    def test_next_delay_doubles_without_rate(self):
+        """速さが分からない場合は倍々に延ばす"""
+        estimator = ReadinessEstimator(0.5)
+
+        assert estimator.next_delay(".bin", 1_000_000, 0.5) == 1.0
+
+    def test_delays_are_clamped(self):
+        """待ち時間は下限・上限の範囲に収める"""
+        estimator = ReadinessEstimator(0.5, floor=0.1, ceiling=3.0)
+        estimator.observe(".iso", 100.0, 1)
+
+        assert estimator.first_delay(".iso") == 3.0
+        assert estimator.next_delay(".iso", 10**9, 2.0) == 3.0
+        assert estimator.next_delay(".iso", 0, 0.01) == 0.1
+
+    def test_stats(self):
+        """拡張子ごとの学習結果を返す"""
+        estimator = ReadinessEstimator(0.5)
+        estimator.observe(".pdf", 2.0, 1000)
+
+        assert estimator.stats() == {".pdf": {"settle": 2.0, "rate": 500.0, "samples": 1}}
@@ -0,0 +1,134 @@
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from utils.rename_template import RenameTemplate
+
+
+class TestRenameTemplateRender:
+    """テンプレートからのファイル名の組み立てテスト"""
+
+    def test_path_fields(self):
+        """ファイル名・拡張子を除いた部分・拡張子を使える"""
+        template = RenameTemplate("{stem}_copy{ext}|{name}")
+
+        assert template.render(Path("report.csv")) == "report_copy.csv|report.csv"
+
+    def test_regex_groups(self):
+        """regexN の番号付き・名前付きのグループを使える"""
+        regex = re.compile(r"^(\w+)-(?P<id>\d+)")
+        template = RenameTemplate("{id}_{g1}{ext}", regex)
+        path = Path("invoice-0042.pdf")
+
+        assert template.render(path, regex.search(path.name)) == "0042_invoice.pdf"
+        assert template.uses_match is True
+
+    def test_unmatched_optional_group_is_empty(self):
+        """一致しなかったグループは空文字になる"""
+        regex = re.compile(r"^(a)?(\w+)")
+        template = RenameTemplate("{g1}{g2}", regex)
+
+        assert template.render(Path("bcd"), regex.search("bcd")) == "bcd"
+
+    def test_date_with_format(self):
+        """処理した日時を strftime の書式で使える（既定は %Y%m%d）"""
+        fixed = datetime(2024, 3, 9, 15, 30).timestamp()
+        with patch("utils.rename_template.time.time", return_value=fixed):
+            assert RenameTemplate("{date:%Y-%m-%d_%H%M}").render(Path("a")) == "2024-03-09_1530"
+            assert RenameTemplate("{date}").render(Path("a")) == "20240309"
+
+    def test_mtime(self, tmp_path):
+        """ファイルの更新日時を使える"""
+        path = tmp_path / "a.txt"
+        path.write_text("a")
+        mtime = datetime(2023, 12, 31, 8, 0).timestamp()
+        os.utime(path, (mtime, mtime))
+
+        assert RenameTemplate("{mtime:%Y%m%d}_{name}").render(path) == "20231231_a.txt"
+
+    def test_date_follows_clock(self):
+        """秒が変われば日時を書式化し直す"""
+        template = RenameTemplate("{date:%H%M%S}")
+        first = datetime(2024, 3, 9, 15, 30, 0).timestamp()
+        with patch("utils.rename_template.time.time", side_effect=[first, first + 0.5, first + 1]):
+            names = [template.render(Path("a")) for _ in range(3)]
+
+        assert names == ["153000", "153000", "153001"]
+
+    def test_counter_with_format(self):
+        """連番は1から増え、書式を指定できる"""
+        template = RenameTemplate("{counter:04d}{ext}")
+
+        assert [template.render(Path("a.txt")) for _ in range(3)] == [
+            "0001.txt",
+            "0002.txt",
+            "0003.txt",
+        ]
+
+    def test_counter_is_unique_across_threads(self):
+        """複数のスレッドから使っても連番は重複しない"""
+        template = RenameTemplate("{counter}")
+        names: list[str] = []
+
+        def render() -> None:
+            names.extend(template.render(Path("a")) for _ in range(1000))
+
+        threads = [threading.Thread(target=render) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(set(names)) == 4000
+
+    def test_literal_braces(self):
+        """{{ と }} で波括弧そのものを書ける"""
+        assert RenameTemplate("{{{stem}}}{ext}").render(Path("a.txt")) == "{a}.txt"
+
+
+class TestRenameTemplateValidation:
+    """テンプレートの検証テスト"""
+
+    def test_unknown_field_raises(self):
+        """不明な項目はValueError"""
+        with pytest.raises(ValueError, match="不明な項目があります"):
+            RenameTemplate("{unknown}")
+
+    def test_group_without_regex_raises(self):
+        """regexN が無い、またはグループが足りない場合はValueError"""
+        with pytest.raises(ValueError, match="グループ 1 がありません"):
+            RenameTemplate("{g1}")
+        with pytest.raises(ValueError, match="グループ 2 がありません"):
+            RenameTemplate("{g2}", re.compile(r"(a)"))
+
+    def test_format_mismatch_raises_at_parse(self):
+        """項目の値に合わない書式は、ファイルごとではなく解析の時点でValueError"""
+        with pytest.raises(ValueError, match="書式が項目の値に合いません"):
+            RenameTemplate("{g1:04d}{ext}", re.compile(r"(\d+)"))
+        with pytest.raises(ValueError, match="書式が項目の値に合いません"):
+            RenameTemplate("{counter:%Y}")
+
+    def test_valid_format_is_accepted(self):
+        """値に合う書式は受け付ける"""
+        assert RenameTemplate("{counter:04d}_{g1:>5}", re.compile(r"(\d+)")).uses_counter is True
+        assert RenameTemplate("{name}").uses_counter is False
+
+    def test_empty_name_raises_at_render(self):
+        """組み立てた名前が空、または . だけの場合はValueError"""
+        regex = re.compile(r"^(a)?")
+        with pytest.raises(ValueError, match="有効なファイル名を組み立てられません"):
+            RenameTemplate("{g1}", regex).render(Path("bcd"), regex.search("bcd"))
+        with pytest.raises(ValueError, match="有効なファイル名を組み立てられません"):
+            RenameTemplate("{g1}..", regex).render(Path("bcd"), regex.search("bcd"))
+
+    def test_separator_raises(self):
+        """パスの区切り文字はValueError"""
+        with pytest.raises(ValueError, match="区切り文字"):
+            RenameTemplate("{date:%Y/%m}_{name}")
+        with pytest.raises(ValueError, match="区切り文字"):
+            RenameTemplate("sub\\\\{name}")
@@ -0,0 +1,226 @@
+import json
+import logging
+import time
+from pathlib import Path
+from unittest.mock import ANY, MagicMock, patch
+
+import pytest
+
+from service.retry_scheduler import RetryScheduler
+
+
+@pytest.fixture
+def make_scheduler(tmp_path):
+    """待ち時間を短くした再試行スケジューラのファクトリ"""
+    schedulers = []
+
+    def _factory(**kwargs) -> RetryScheduler:
+        kwargs.setdefault("base_delay", 0.01)
+        kwargs.setdefault("max_delay", 0.02)
+        scheduler = RetryScheduler(tmp_path / "retry.json", **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield _factory
+
+    for scheduler in schedulers:
+        scheduler.close()
+
+
+def wait_until(predicate, timeout: float = 2.0) -> bool:
+    """条件が満たされるまで待つ"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return predicate()
+
+
+class TestRetrySchedulerBackoff:
+    """待ち時間の計算テスト"""
+
+    def test_backoff_grows_exponentially_with_jitter(self, make_scheduler):
+        """待ち時間は倍々に延び、半分から全体の間でばらつく"""
+        scheduler = make_scheduler(base_delay=1.0, max_delay=1000.0)
+
+        for attempts, delay in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0)):
+            backoff = scheduler._backoff(attempts)
+            assert delay / 2 <= backoff <= delay
+
+    def test_backoff_is_capped(self, make_scheduler):
+        """待ち時間はmax_delayで頭打ちになる"""
+        scheduler = make_scheduler(base_delay=1.0, max_delay=10.0)
+
+        assert scheduler._backoff(20) <= 10.0
+
+
+class TestRetrySchedulerSchedule:
+    """再試行の予約と実行のテスト"""
+
+    def test_due_item_is_retried(self, make_scheduler, tmp_path):
+        """期限が来ると登録した処理が呼ばれる"""
+        scheduler = make_scheduler()
+        callback = MagicMock(side_effect=lambda path, done: done())
+        scheduler.register(tmp_path, callback)
+        scheduler.start()
+
+        scheduler.schedule(tmp_path / "file.txt", "locked")
+
+        assert wait_until(lambda: callback.called)
+        callback.assert_called_once_with(tmp_path / "file.txt", ANY)
+        assert wait_until(lambda: scheduler.pending() == [])
+
+    def test_item_stays_pending_until_done(self, make_scheduler, tmp_path):
+        """処理から完了を知らされるまでは再試行待ちに残り、失敗すれば試行回数を引き継ぐ"""
+        scheduler = make_scheduler(base_delay=60.0, max_delay=60.0)
+        finished = []
+        scheduler.register(tmp_path, lambda path, done: finished.append(done))
+        scheduler.start()
+        scheduler.schedule(tmp_path / "file.txt", "locked")
+        with scheduler._condition:
+            # 期限を過ぎたことにして、すぐに再試行させる
+            scheduler._heap = [(0.0, str(tmp_path / "file.txt"))]
+            scheduler._pending[str(tmp_path / "file.txt")].due = 0.0
+            scheduler._condition.notify()
+
+        assert wait_until(lambda: len(finished) == 1)
+        assert [item.attempts for item in scheduler.pending()] == [1]
+
+        # 別のスレッドでの移動が再び失敗した
+        scheduler.schedule(tmp_path / "file.txt", "still locked")
+        finished[0]()
+
+        assert [item.attempts for item in scheduler.pending()] == [2]
+
+    def test_rescheduled_item_counts_attempts(self, make_scheduler, tmp_path):
+        """再試行中に再び失敗すると試行回数が増える"""
+        scheduler = make_scheduler(max_attempts=10)
+        calls = []
+
+        def callback(path: Path, done) -> None:
+            calls.append(path)
+            if len(calls) < 3:
+                scheduler.schedule(path, "still locked")
+            done()
+
+        scheduler.register(tmp_path, callback)
+        scheduler.start()
+        scheduler.schedule(tmp_path / "file.txt", "locked")
+
+        assert wait_until(lambda: len(calls) == 3)
+        assert wait_until(lambda: scheduler.pending() == [])
+
+    def test_nested_file_uses_nearest_source(self, make_scheduler, tmp_path):
+        """サブディレクトリ内のファイルは最も近い監視元の処理で再試行する"""
+        scheduler = make_scheduler()
+        outer = MagicMock(side_effect=lambda path, done: done())
+        inner = MagicMock(side_effect=lambda path, done: done())
+        scheduler.register(tmp_path, outer)
+        scheduler.register(tmp_path / "a", inner)
+        scheduler.start()
+
+        scheduler.schedule(tmp_path / "a" / "2024" / "file.txt", "locked")
+        scheduler.schedule(tmp_path / "b" / "file.txt", "locked")
+
+        assert wait_until(lambda: inner.called and outer.called)
+        inner.assert_called_once_with(tmp_path / "a" / "2024" / "file.txt", ANY)
+        outer.assert_called_once_with(tmp_path / "b" / "file.txt", ANY)
+
+    def test_unregistered_source_is_dropped(self, make_scheduler, tmp_path, caplog):
+        """監視対象外のファイルは再試行を取り消す"""
+        scheduler = make_scheduler()
+        scheduler.start()
+
+        with caplog.at_level(logging.WARNING):
+            scheduler.schedule(tmp_path / "file.txt", "locked")
+            assert wait_until(lambda: scheduler.pending() == [])
+
+        assert "監視対象外のため再試行を取り消しました" in caplog.text
+
+
+class TestRetrySchedulerQuarantine:
+    """上限回数に達した場合のテスト"""
+
+    def test_moves_to_quarantine_after_max_attempts(self, make_scheduler, tmp_path):
+        """上限回数を超えると隔離ディレクトリへ移す"""
+        quarantine_dir = tmp_path / "quarantine"
+        scheduler = make_scheduler(quarantine_dir=quarantine_dir, max_attempts=2)
+        test_file = tmp_path / "file.txt"
+        test_file.write_text("content")
+
+        for _ in range(3):
+            scheduler.schedule(test_file, "locked")
+
+        assert not test_file.exists()
+        quarantined = list(quarantine_dir.iterdir())
+        assert len(quarantined) == 1
+        assert quarantined[0].name.endswith("_file.txt")
+        assert scheduler.pending() == []
+
+    def test_without_quarantine_dir_leaves_file(self, make_scheduler, tmp_path, caplog):
+        """隔離先が未設定の場合はファイルを残してエラーログ"""
+        scheduler = make_scheduler(max_attempts=1)
+        test_file = tmp_path / "file.txt"
+        test_file.write_text("content")
+
+        with caplog.at_level(logging.ERROR):
+            scheduler.schedule(test_file, "locked")
+            scheduler.schedule(test_file, "locked")
+
+        assert test_file.exists()
+        assert "移動を諦めました" in caplog.text
+
+
+class TestRetrySchedulerPersistence:
+    """再起動をまたいだ引き継ぎのテスト"""
+
+    def test_pending_items_are_saved(self, make_scheduler, tmp_path):
+        """再試行待ちはファイルに保存される"""
+        scheduler = make_scheduler(base_delay=60.0, max_delay=60.0)
+        scheduler.schedule(tmp_path / "file.txt", "locked")
+
+        saved = json.loads((tmp_path / "retry.json").read_text(encoding="utf-8"))
+        assert saved[0]["path"] == str(tmp_path / "file.txt")
+        assert saved[0]["attempts"] == 1
+        assert saved[0]["last_error"] == "locked"
+
+    def test_saved_items_are_resumed_on_start(self, make_scheduler, tmp_path):
+        """起動時に保存済みの再試行待ちを引き継ぎ、試行回数も継続する"""
+        (tmp_path / "retry.json").write_text(
+            json.dumps(
+                [{"path": str(tmp_path / "file.txt"), "attempts": 3, "due": 0.0, "last_error": ""}]
+            ),
+            encoding="utf-8",
+        )
+        scheduler = make_scheduler(base_delay=60.0, max_delay=60.0)
+        callback = MagicMock(side_effect=lambda path, done: scheduler.schedule(path, "locked"))
+        scheduler.register(tmp_path, callback)
+        scheduler.start()
+
+        assert wait_until(lambda: callback.called)
+        assert wait_until(lambda: [item.attempts for item in scheduler.pending()] == [4])
+
+    def test_broken_state_file_is_ignored(self, make_scheduler, tmp_path, caplog):
+        """保存ファイルが壊れている場合はエラーログを出して空で開始する"""
+        (tmp_path / "retry.json").write_text("{broken", encoding="utf-8")
+        scheduler = make_scheduler()
+
+        with caplog.at_level(logging.ERROR):
+            scheduler.start()
+
+        assert scheduler.pending() == []
+        assert "再試行待ちの読み込みに失敗しました" in caplog.text
+
+    def test_close_does_not_wait_for_pending(self, make_scheduler, tmp_path):
+        """停止時は期限を待たずに終了する"""
+        scheduler = make_scheduler(base_delay=60.0, max_delay=60.0)
+        scheduler.start()
+        scheduler.schedule(tmp_path / "file.txt", "locked")
+
+        with patch("service.retry_scheduler.time.sleep") as mock_sleep:
+            started = time.monotonic()
+            scheduler.close()
+
+        assert time.monotonic() - started < 1.0
+        mock_sleep.assert_not_called()
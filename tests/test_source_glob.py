@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pytest
+
+from utils.source_glob import SourceGlob, split_source_glob
+
+
+class TestSplitSourceGlob:
+    """processing_dir のワイルドカードの分割テスト"""
+
+    def test_plain_path_has_no_glob(self):
+        """ワイルドカードを含まない場合はパスのまま"""
+        assert split_source_glob(r"C:\drops\PC-01") == (Path(r"C:\drops\PC-01"), None)
+
+    def test_windows_path(self):
+        """ワイルドカードより前を基準ディレクトリ、以降を / 区切りのパターンにする"""
+        base, glob = split_source_glob(r"C:\drops\PC-*\inbox")
+
+        assert base == Path(r"C:\drops")
+        assert glob is not None
+        assert glob.pattern == "PC-*/inbox"
+        assert glob.depth == 2
+
+    def test_posix_path(self):
+        """/ 区切りのパスも分ける"""
+        base, glob = split_source_glob("/srv/drops/*/")
+
+        assert base == Path("/srv/drops")
+        assert glob is not None
+        assert glob.pattern == "*"
+
+    def test_existing_bracketed_directory_is_literal(self, tmp_path):
+        """角括弧を名前に含むディレクトリが実在する場合はワイルドカードとして扱わない"""
+        source = tmp_path / "scans [work]" / "in"
+        source.mkdir(parents=True)
+
+        assert split_source_glob(str(source)) == (source, None)
+
+    def test_escaped_bracket_matches_literally(self):
+        """まだ無いディレクトリの角括弧は [[] と書けば文字として一致する"""
+        base, glob = split_source_glob("/srv/scans [[]work]/in")
+
+        assert base == Path("/srv")
+        assert glob is not None
+        assert glob.split("scans [work]/in/a.pdf") == ("scans [work]/in", "a.pdf")
+
+    def test_glob_without_base_raises(self):
+        """ワイルドカードより前にディレクトリが無い場合はValueError"""
+        with pytest.raises(ValueError, match="ワイルドカードより前にディレクトリがありません"):
+            split_source_glob(r"*\inbox")
+
+
+class TestSourceGlob:
+    """監視元のパターンの照合・展開のテスト"""
+
+    def test_split_relative_path(self):
+        """基準ディレクトリからの相対パスを監視元と監視元からの相対パスに分ける"""
+        glob = SourceGlob("PC-*/inbox")
+
+        assert glob.split("PC-01/inbox/a.txt") == ("PC-01/inbox", "a.txt")
+        assert glob.split("pc-02/INBOX/sub/a.txt") == ("pc-02/INBOX", "sub/a.txt")
+        assert glob.split("PC-01/inbox") == ("PC-01/inbox", "")
+        assert glob.split("PC-01/outbox/a.txt") is None
+        assert glob.split("PC-01") is None
+
+    def test_wildcard_does_not_cross_separator(self):
+        """* は区切り文字をまたがない"""
+        assert SourceGlob("*").split("a/b/c.txt") == ("a", "b/c.txt")
+        assert SourceGlob("PC-?").split("PC-1/x") == ("PC-1", "x")
+        assert SourceGlob("PC-?").split("PC-10/x") is None
+
+    def test_expand_lists_matching_directories_in_order(self, tmp_path):
+        """今ある一致するディレクトリだけを名前順に返す（ファイル・一致しない名前は除く）"""
+        for name in ("PC-02/inbox", "PC-01/inbox", "PC-03", "server/inbox"):
+            (tmp_path / name).mkdir(parents=True)
+        (tmp_path / "PC-04").write_text("not a directory")
+
+        assert SourceGlob("PC-*/inbox").expand(tmp_path) == [
+            tmp_path / "PC-01" / "inbox",
+            tmp_path / "PC-02" / "inbox",
+        ]
+
+    def test_expand_missing_base(self, tmp_path):
+        """基準ディレクトリが無い場合は空"""
+        assert SourceGlob("*").expand(tmp_path / "missing") == []
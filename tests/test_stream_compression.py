@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from service.file_transfer import VerificationError
+from service.stream_compression import (
+    BLOCK_SIZE,
+    CompressionPool,
+    compress_file,
+    resolve_codec,
+    zstd_available,
+)
+
+
+@pytest.fixture
+def pool():
+    """テスト後に停止する圧縮スレッドプール"""
+    pool = CompressionPool(workers=2)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    """複数ブロックにまたがる、圧縮の効くファイル"""
+    path = tmp_path / "source.txt"
+    path.write_bytes(b"0123456789abcdef" * (BLOCK_SIZE // 16 * 3 + 10))
+    return path
+
+
+class TestCompressFile:
+    """compress_file関数のテスト"""
+
+    def test_output_is_valid_gzip(self, pool, source_file, tmp_path):
+        """ブロックごとに圧縮した結果を通常のgzipとして展開できる"""
+        dst = tmp_path / "source.txt.gz"
+
+        written, digest = compress_file(source_file, dst, "gzip", 0, pool)
+
+        assert gzip.decompress(dst.read_bytes()) == source_file.read_bytes()
+        assert written == dst.stat().st_size < source_file.stat().st_size
+        assert digest is None
+        assert source_file.exists()
+
+    def test_digest_is_of_compressed_output(self, pool, source_file, tmp_path):
+        """ハッシュ値はコピー先（圧縮後）の内容のもの"""
+        dst = tmp_path / "source.txt.gz"
+
+        _, digest = compress_file(source_file, dst, "gzip", 1, pool, compute_digest=True)
+
+        assert digest == hashlib.sha256(dst.read_bytes()).hexdigest()
+
+    def test_consumes_bandwidth_by_compressed_size(self, pool, source_file, tmp_path):
+        """転送量の制限は圧縮後のバイト数で受ける"""
+        throttle = MagicMock()
+
+        written, _ = compress_file(source_file, tmp_path / "out.gz", "gzip", 0, pool, throttle)
+
+        assert sum(call.args[0] for call in throttle.consume.call_args_list) == written
+        throttle.slot.assert_called_once()
+
+    def test_reread_mismatch_keeps_existing_target(self, pool, source_file, tmp_path):
+        """読み直した内容が一致しない場合は既存のコピー先を残す"""
+        dst = tmp_path / "source.txt.gz"
+        dst.write_bytes(b"old")
+
+        with (
+            patch("service.file_transfer.file_digest", return_value="corrupted"),
+            pytest.raises(VerificationError),
+        ):
+            compress_file(source_file, dst, "gzip", 0, pool, verify="reread")
+
+        assert dst.read_bytes() == b"old"
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["source.txt", "source.txt.gz"]
+
+
+class TestResolveCodec:
+    """resolve_codec関数のテスト"""
+
+    def test_gzip_is_always_available(self):
+        """gzipはそのまま使う"""
+        assert resolve_codec("gzip") == "gzip"
+
+    def test_zstd_falls_back_to_gzip_when_unavailable(self):
+        """zstdが使えない環境ではgzipを使う"""
+        with patch("service.stream_compression._zstd_compress", None):
+            assert resolve_codec("zstd") == "gzip"
+
+    @pytest.mark.skipif(not zstd_available(), reason="zstdが使えない環境")
+    def test_zstd_when_available(self, pool, source_file, tmp_path):
+        """zstdが使える環境ではzstdで圧縮する"""
+        assert resolve_codec("zstd") == "zstd"
+        compress_file(source_file, tmp_path / "out.zst", "zstd", 0, pool)
+
+        assert (tmp_path / "out.zst").read_bytes()[:4] == b"\x28\xb5\x2f\xfd"
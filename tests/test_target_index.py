@@ -0,0 +1,110 @@
+from pathlib import Path
+
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileMovedEvent
+
+from service.target_index import TargetIndex, TargetIndexEventHandler
+
+
+class FakeClock:
+    """テスト用の時計"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTargetIndexContains:
+    """存在確認のテスト"""
+
+    def test_scans_directory_once(self, tmp_path):
+        """ディレクトリは最初の確認時に1回だけ読み込む"""
+        (tmp_path / "a.txt").write_text("a")
+        index = TargetIndex()
+
+        assert index.contains(tmp_path / "a.txt") is True
+        assert index.contains(tmp_path / "b.txt") is False
+        assert index.scans == 1
+
+    def test_missing_directory_is_empty(self, tmp_path):
+        """まだ無い移動先は空とみなす"""
+        index = TargetIndex()
+
+        assert index.contains(tmp_path / "missing" / "a.txt") is False
+
+    def test_add_and_discard(self, tmp_path):
+        """自分の書き込み・削除を一覧に反映する"""
+        index = TargetIndex()
+        index.contains(tmp_path / "a.txt")
+
+        index.add(tmp_path / "a.txt")
+        assert index.contains(tmp_path / "a.txt") is True
+        index.discard(tmp_path / "a.txt")
+        assert index.contains(tmp_path / "a.txt") is False
+        assert index.scans == 1
+
+    def test_external_change_is_seen_after_refresh(self, tmp_path):
+        """一覧が古くなったら読み直し、外部で作成されたファイルも分かる"""
+        clock = FakeClock()
+        index = TargetIndex(refresh_interval=60.0, clock=clock)
+        assert index.contains(tmp_path / "a.txt") is False
+
+        (tmp_path / "a.txt").write_text("a")
+        assert index.contains(tmp_path / "a.txt") is False
+
+        clock.now = 60.0
+        assert index.contains(tmp_path / "a.txt") is True
+        assert index.scans == 2
+
+    def test_zero_interval_never_rescans(self, tmp_path):
+        """読み直す間隔が0の場合は読み直さない"""
+        clock = FakeClock()
+        index = TargetIndex(refresh_interval=0, clock=clock)
+        index.contains(tmp_path / "a.txt")
+
+        clock.now = 10_000.0
+        index.contains(tmp_path / "a.txt")
+
+        assert index.scans == 1
+
+    def test_invalidate_rescans(self, tmp_path):
+        """捨てた一覧は次の確認時に読み直す"""
+        index = TargetIndex()
+        index.contains(tmp_path / "a.txt")
+        (tmp_path / "a.txt").write_text("a")
+
+        index.invalidate(tmp_path)
+
+        assert index.contains(tmp_path / "a.txt") is True
+
+
+class TestTargetIndexEventHandler:
+    """移動先のイベントによる更新テスト"""
+
+    def test_events_update_index(self, tmp_path):
+        """作成・移動・削除のイベントで一覧を更新する"""
+        index = TargetIndex()
+        index.contains(tmp_path / "a.txt")
+        handler = TargetIndexEventHandler(index)
+
+        handler.on_created(FileCreatedEvent(str(tmp_path / "a.txt")))
+        assert index.contains(tmp_path / "a.txt") is True
+
+        handler.on_moved(FileMovedEvent(str(tmp_path / "a.txt"), str(tmp_path / "b.txt")))
+        assert index.contains(tmp_path / "a.txt") is False
+        assert index.contains(tmp_path / "b.txt") is True
+
+        handler.on_deleted(FileDeletedEvent(str(tmp_path / "b.txt")))
+        assert index.contains(tmp_path / "b.txt") is False
+        assert index.scans == 1
+
+    def test_path_type(self, tmp_path):
+        """イベントのパスは Path として扱う"""
+        index = TargetIndex()
+        handler = TargetIndexEventHandler(index)
+        index.contains(Path(tmp_path) / "a.txt")
+
+        handler.on_created(FileCreatedEvent(str(tmp_path / "a.txt").encode()))
+
+        assert index.contains(tmp_path / "a.txt") is True
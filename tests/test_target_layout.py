@@ -0,0 +1,96 @@
+import hashlib
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from unittest.mock import patch
+
+from service.target_layout import DirectoryCache, shard_dir
+from utils.config_manager import TargetRule
+
+
+def make_rule(**kwargs) -> TargetRule:
+    """テスト用のTargetRuleを生成"""
+    return TargetRule(
+        directory=Path("target"), filenames=frozenset(), suffix="", pattern=None, **kwargs
+    )
+
+
+class TestShardDir:
+    """サブディレクトリの決定テスト"""
+
+    def test_flat_has_no_subdirectory(self):
+        """flat の場合は移動先ディレクトリ直下"""
+        assert shard_dir(make_rule(), "file.txt", 0.0) == PurePosixPath()
+
+    def test_date_uses_mtime(self):
+        """date の場合は更新日時の年/月/日で分ける"""
+        mtime = datetime(2024, 3, 9, 15, 30).timestamp()
+
+        assert shard_dir(make_rule(layout="date"), "file.txt", mtime) == PurePosixPath(
+            "2024/03/09"
+        )
+
+    def test_date_levels(self):
+        """階層数を指定した場合は年から順にその階層まで"""
+        mtime = datetime(2024, 3, 9, 15, 30).timestamp()
+
+        rule = make_rule(layout="date", shard_levels=4)
+        assert shard_dir(rule, "file.txt", mtime) == PurePosixPath("2024/03/09/15")
+        rule = make_rule(layout="date", shard_levels=1)
+        assert shard_dir(rule, "file.txt", mtime) == PurePosixPath("2024")
+
+    def test_hash_uses_name_prefix(self):
+        """hash の場合はファイル名の SHA-1 の先頭を階層ごとに区切る"""
+        digest = hashlib.sha1(b"file.txt").hexdigest()
+
+        assert shard_dir(make_rule(layout="hash"), "file.txt", 0.0) == PurePosixPath(
+            digest[0:2], digest[2:4]
+        )
+        rule = make_rule(layout="hash", shard_levels=1, shard_width=3)
+        assert shard_dir(rule, "file.txt", 0.0) == PurePosixPath(digest[0:3])
+
+    def test_hash_is_stable(self):
+        """同じ名前は常に同じサブディレクトリになる"""
+        rule = make_rule(layout="hash")
+
+        assert shard_dir(rule, "file.txt", 1.0) == shard_dir(rule, "file.txt", 2.0)
+
+
+class TestDirectoryCache:
+    """作成済みディレクトリのキャッシュテスト"""
+
+    def test_ensure_creates_directory(self, tmp_path):
+        """ディレクトリを親も含めて作成する"""
+        cache = DirectoryCache()
+
+        cache.ensure(tmp_path / "ab" / "cd")
+
+        assert (tmp_path / "ab" / "cd").is_dir()
+
+    def test_ensure_skips_known_directory(self, tmp_path):
+        """作成済みのディレクトリは2回目以降は確認しない"""
+        cache = DirectoryCache()
+        cache.ensure(tmp_path / "ab")
+
+        with patch.object(Path, "mkdir") as mock_mkdir:
+            cache.ensure(tmp_path / "ab")
+
+        mock_mkdir.assert_not_called()
+
+    def test_discard_recreates(self, tmp_path):
+        """忘れたディレクトリは次回作り直す"""
+        cache = DirectoryCache()
+        cache.ensure(tmp_path / "ab")
+        (tmp_path / "ab").rmdir()
+
+        cache.discard(tmp_path / "ab")
+        cache.ensure(tmp_path / "ab")
+
+        assert (tmp_path / "ab").is_dir()
+
+    def test_oldest_entries_are_evicted(self, tmp_path):
+        """上限を超えたら古いものから忘れる"""
+        cache = DirectoryCache(max_entries=2)
+        for name in ("a", "b", "c"):
+            cache.ensure(tmp_path / name)
+
+        assert len(cache) == 2
@@ -0,0 +1,79 @@
+import json
+
+from service.target_manifest import MANIFEST_NAME, ManifestRegistry, TargetManifest
+
+
+def read_lines(directory):
+    """マニフェストの各行を読み込む"""
+    with open(directory / MANIFEST_NAME, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestTargetManifestAppend:
+    """マニフェストへの追記テスト"""
+
+    def test_appends_one_line_per_delivery(self, tmp_path):
+        """届けたファイルごとに1行追記する"""
+        manifest = TargetManifest(tmp_path)
+
+        manifest.append("a.txt", 3, 100, "digest-a")
+        manifest.append("b.txt", 5, 200, "digest-b")
+
+        lines = read_lines(tmp_path)
+        assert [(e["name"], e["size"], e["mtime_ns"], e["digest"]) for e in lines] == [
+            ("a.txt", 3, 100, "digest-a"),
+            ("b.txt", 5, 200, "digest-b"),
+        ]
+
+    def test_loads_existing_manifest(self, tmp_path):
+        """再起動後は既存のマニフェストに追記する"""
+        TargetManifest(tmp_path).append("a.txt", 3, 100, "digest-a")
+
+        manifest = TargetManifest(tmp_path)
+        manifest.append("b.txt", 5, 200, "digest-b")
+
+        assert sorted(manifest.entries()) == ["a.txt", "b.txt"]
+        assert len(read_lines(tmp_path)) == 2
+
+    def test_ignores_truncated_line(self, tmp_path):
+        """書き込み途中で止まった行は読み飛ばす"""
+        (tmp_path / MANIFEST_NAME).write_text('{"name": "a.txt"', encoding="utf-8")
+
+        assert TargetManifest(tmp_path).entries() == {}
+
+
+class TestTargetManifestCompaction:
+    """マニフェストの詰め直しテスト"""
+
+    def test_compacts_to_latest_entries(self, tmp_path):
+        """行が溜まったら、残っているファイルの最新の記録だけに詰め直す"""
+        (tmp_path / "a.txt").write_text("a")
+        manifest = TargetManifest(tmp_path, compact_min_lines=4, compact_ratio=2)
+
+        for i in range(4):
+            manifest.append("a.txt", 1, i, f"digest-{i}")
+        manifest.append("gone.txt", 1, 0, "digest-gone")
+
+        lines = read_lines(tmp_path)
+        assert [(e["name"], e["digest"]) for e in lines] == [("a.txt", "digest-3")]
+        assert not (tmp_path / f"{MANIFEST_NAME}.tmp").exists()
+
+    def test_does_not_compact_below_threshold(self, tmp_path):
+        """行数が少ないうちは詰め直さない"""
+        manifest = TargetManifest(tmp_path, compact_min_lines=100)
+
+        for i in range(10):
+            manifest.append("a.txt", 1, i, f"digest-{i}")
+
+        assert len(read_lines(tmp_path)) == 10
+
+
+class TestManifestRegistry:
+    """ManifestRegistryクラスのテスト"""
+
+    def test_same_directory_shares_manifest(self, tmp_path):
+        """同じ移動先ディレクトリには同じマニフェストを返す"""
+        registry = ManifestRegistry()
+
+        assert registry.get(tmp_path) is registry.get(tmp_path)
+        assert registry.get(tmp_path) is not registry.get(tmp_path / "other")
@@ -0,0 +1,273 @@
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from service.content_hash import file_digest
+from service.file_transfer import move_file
+from service.target_index import TargetIndex
+from service.target_manifest import ManifestRegistry
+from service.target_spool import TargetSpool
+from service.throttle import ThrottleRegistry
+from utils.config_manager import TargetRule
+
+
+def make_rule(directory: Path, **kwargs) -> TargetRule:
+    """退避のテスト用のTargetRuleを生成"""
+    return TargetRule(directory=directory, filenames=frozenset(), suffix="", pattern=None, **kwargs)
+
+
+@pytest.fixture
+def make_spool(tmp_path):
+    """確認間隔を短くした退避領域のファクトリ"""
+    spools = []
+
+    def _factory(max_bytes: int = 0, **kwargs) -> TargetSpool:
+        kwargs.setdefault("probe_base_delay", 0.01)
+        kwargs.setdefault("probe_max_delay", 0.02)
+        spool = TargetSpool(tmp_path / "spool", max_bytes, **kwargs)
+        spools.append(spool)
+        return spool
+
+    yield _factory
+
+    for spool in spools:
+        spool.close()
+
+
+def wait_until(predicate, timeout: float = 2.0) -> bool:
+    """条件が満たされるまで待つ"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return predicate()
+
+
+class TestTargetSpoolHealth:
+    """移動先の到達状態のテスト"""
+
+    def test_unknown_target_is_available(self, make_spool, tmp_path):
+        """一度も失敗していない移動先は到達可能とみなす"""
+        assert make_spool().is_available(tmp_path / "target") is True
+
+    def test_mark_offline(self, make_spool, tmp_path):
+        """到達不能にした移動先は利用不可になる"""
+        spool = make_spool()
+        spool.mark_offline(tmp_path / "target")
+
+        assert spool.is_available(tmp_path / "target") is False
+        assert spool.stats()[str(tmp_path / "target")]["online"] is False
+
+
+class TestTargetSpoolHold:
+    """ファイルの退避テスト"""
+
+    def test_hold_moves_file_into_spool(self, make_spool, tmp_path):
+        """ファイルを退避領域へ移す"""
+        spool = make_spool()
+        source = tmp_path / "file.txt"
+        source.write_text("content")
+
+        assert spool.hold(source, tmp_path / "target" / "file_renamed.txt") is True
+
+        assert not source.exists()
+        stats = spool.stats()[str(tmp_path / "target")]
+        assert stats["spooled_files"] == 1
+        assert stats["spooled_bytes"] == len("content")
+
+    def test_hold_copy_keeps_source(self, make_spool, tmp_path):
+        """複製を退避する場合は移動元を残す"""
+        spool = make_spool()
+        source = tmp_path / "file.txt"
+        source.write_text("content")
+
+        assert spool.hold(source, tmp_path / "target" / "file.txt", copy=True) is True
+
+        assert source.exists()
+        assert spool.stats()[str(tmp_path / "target")]["spooled_files"] == 1
+
+    def test_hold_keeps_same_name_unless_overwrite(self, make_spool, tmp_path):
+        """overwrite 以外では同じ名前で退避済みのファイルも残す"""
+        spool = make_spool()
+        target = tmp_path / "target"
+        for content in ("first", "second"):
+            (tmp_path / "file.txt").write_text(content)
+            spool.hold(tmp_path / "file.txt", target / "file.txt", collision="keep_both")
+
+        assert spool.stats()[str(target)]["spooled_files"] == 2
+
+    def test_duplicate_names_come_from_counter(self, make_spool, tmp_path):
+        """重ねて退避した名前は退避ディレクトリを1回読んだカウンタから決める"""
+        spool = make_spool()
+        target = tmp_path / "target"
+        for content in ("first", "second", "third", "fourth"):
+            (tmp_path / "file.txt").write_text(content)
+            spool.hold(tmp_path / "file.txt", target / "file.txt", collision="keep_both")
+
+        spool_dir = spool._health(target).spool_dir
+        assert sorted(p.name for p in spool_dir.iterdir() if p.name != ".target") == [
+            "file.txt",
+            "file.txt.1.dup",
+            "file.txt.2.dup",
+            "file.txt.3.dup",
+        ]
+        assert spool._duplicates.scans == 1
+
+    def test_hold_rejects_when_full(self, make_spool, tmp_path):
+        """上限を超える場合は退避せずFalse"""
+        spool = make_spool(max_bytes=10)
+        source = tmp_path / "file.txt"
+        source.write_text("more than ten bytes")
+
+        assert spool.hold(source, tmp_path / "target" / "file.txt") is False
+        assert source.exists()
+
+
+class TestTargetSpoolFlush:
+    """復旧後の送信テスト"""
+
+    def test_flushes_when_target_returns(self, make_spool, tmp_path):
+        """移動先が復旧すると退避済みのファイルを送る"""
+        target = tmp_path / "target"
+        spool = make_spool()
+        spool.start()
+        spool.mark_offline(target)
+        for name in ("a.txt", "b.txt"):
+            (tmp_path / name).write_text(name)
+            spool.hold(tmp_path / name, target / name)
+
+        time.sleep(0.05)
+        assert not target.exists()
+
+        target.mkdir()
+        assert wait_until(lambda: spool.is_available(target))
+        assert sorted(p.name for p in target.iterdir()) == ["a.txt", "b.txt"]
+        stats = spool.stats()[str(target)]
+        assert stats["spooled_files"] == 0
+        assert stats["flushed_files"] == 2
+
+    def test_flushes_into_subdirectory(self, make_spool, tmp_path):
+        """移動先ディレクトリ配下のサブディレクトリ宛てのファイルは同じ場所へ送る"""
+        target = tmp_path / "target"
+        spool = make_spool()
+        spool.start()
+        spool.mark_offline(target)
+        (tmp_path / "file.txt").write_text("content")
+        spool.hold(tmp_path / "file.txt", target / "ab" / "file.txt", directory=target)
+
+        assert spool.stats()[str(target)]["spooled_files"] == 1
+
+        target.mkdir()
+        assert wait_until(lambda: (target / "ab" / "file.txt").exists())
+
+    def test_flush_keep_both_keeps_every_copy(self, make_spool, tmp_path):
+        """keep_both の場合は移動先の既存ファイルも、同じ名前で退避した各ファイルも残す"""
+        target = tmp_path / "target"
+        spool = make_spool()
+        spool.start()
+        spool.mark_offline(target)
+        for content in ("first", "second"):
+            (tmp_path / "file.txt").write_text(content)
+            spool.hold(tmp_path / "file.txt", target / "file.txt", collision="keep_both")
+
+        target.mkdir()
+        (target / "file.txt").write_text("existing")
+        assert wait_until(lambda: spool.is_available(target))
+        assert (target / "file.txt").read_text() == "existing"
+        assert sorted((target / name).read_text() for name in ("file_1.txt", "file_2.txt")) == [
+            "first",
+            "second",
+        ]
+        assert spool.stats()[str(target)]["spooled_files"] == 0
+
+    def test_flush_skip_if_newer_keeps_newer_target(self, make_spool, tmp_path):
+        """skip_if_newer の場合は移動先の方が新しければ退避したものを届けない"""
+        target = tmp_path / "target"
+        spool = make_spool()
+        spool.start()
+        spool.mark_offline(target)
+        (tmp_path / "file.txt").write_text("old")
+        os.utime(tmp_path / "file.txt", (1_000_000, 1_000_000))
+        spool.hold(tmp_path / "file.txt", target / "file.txt", collision="skip_if_newer")
+
+        target.mkdir()
+        (target / "file.txt").write_text("new")
+        assert wait_until(lambda: spool.is_available(target))
+        assert (target / "file.txt").read_text() == "new"
+        stats = spool.stats()[str(target)]
+        assert stats["spooled_files"] == 0
+        assert stats["flushed_files"] == 0
+
+    def test_collision_policy_survives_restart(self, make_spool, tmp_path):
+        """再起動後に送る場合も退避した時の衝突の扱いに従う"""
+        target = tmp_path / "target"
+        first = make_spool()
+        first.mark_offline(target)
+        (tmp_path / "file.txt").write_text("spooled")
+        first.hold(tmp_path / "file.txt", target / "file.txt", collision="keep_both")
+
+        second = make_spool()
+        target.mkdir()
+        (target / "file.txt").write_text("existing")
+        second.start()
+
+        assert wait_until(lambda: (target / "file_1.txt").exists())
+        assert (target / "file.txt").read_text() == "existing"
+
+    def test_flush_updates_target_index(self, make_spool, tmp_path):
+        """送り出したファイルは移動先のファイル名の一覧に反映される"""
+        target = tmp_path / "target"
+        index = TargetIndex()
+        spool = make_spool(target_index=index)
+        spool.start()
+        spool.mark_offline(target)
+        assert index.contains(target / "file.txt") is False
+        (tmp_path / "file.txt").write_text("content")
+        spool.hold(tmp_path / "file.txt", target / "file.txt")
+
+        target.mkdir()
+        assert wait_until(lambda: spool.is_available(target))
+        assert index.contains(target / "file.txt") is True
+        assert index.scans == 1
+
+    def test_flush_follows_rule_and_records_manifest(self, make_spool, tmp_path):
+        """送り出しは移動先のルールの制限・検証に従い、マニフェストに追記する"""
+        target = tmp_path / "target"
+        throttles = ThrottleRegistry()
+        manifests = ManifestRegistry()
+        rule = make_rule(target, max_concurrency=1, verify="reread", manifest=True)
+        spool = make_spool(throttles=throttles, manifests=manifests)
+        spool.start([rule])
+        spool.mark_offline(target)
+        (tmp_path / "file.txt").write_text("content")
+        spool.hold(tmp_path / "file.txt", target / "file.txt")
+
+        with patch("service.target_spool.move_file", wraps=move_file) as mock_move:
+            target.mkdir()
+            assert wait_until(lambda: spool.is_available(target))
+
+        args = mock_move.call_args
+        assert args.args[2] is throttles.get(rule)
+        assert args.args[3] == "reread"
+        assert args.kwargs["compute_digest"] is True
+        entries = manifests.get(target).entries()
+        assert entries["file.txt"]["digest"] == file_digest(target / "file.txt")
+
+    def test_spooled_files_survive_restart(self, make_spool, tmp_path):
+        """再起動後も退避済みのファイルを引き継いで送る"""
+        target = tmp_path / "target"
+        first = make_spool()
+        first.mark_offline(target)
+        (tmp_path / "file.txt").write_text("content")
+        first.hold(tmp_path / "file.txt", target / "file.txt")
+
+        second = make_spool()
+        target.mkdir()
+        second.start()
+
+        assert wait_until(lambda: (target / "file.txt").exists())
+        assert (target / "file.txt").read_text() == "content"
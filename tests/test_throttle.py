@@ -0,0 +1,142 @@
+import threading
+import time
+from pathlib import Path
+
+from service.throttle import ThrottleRegistry, TokenBucket, TransferThrottle
+from utils.config_manager import TargetRule
+
+
+class FakeClock:
+    """sleepすると時刻が進む時計"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.slept: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def make_rule(directory, max_concurrency=0, bandwidth=0) -> TargetRule:
+    """テスト用のTargetRuleを生成"""
+    return TargetRule(
+        directory=Path(directory),
+        filenames=frozenset(),
+        suffix="",
+        pattern=None,
+        max_concurrency=max_concurrency,
+        bandwidth=bandwidth,
+    )
+
+
+class TestTokenBucket:
+    """TokenBucketのテスト"""
+
+    def test_burst_within_capacity_does_not_wait(self):
+        """溜まっているトークンの範囲内なら待たない"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1000, clock=clock, sleep=clock.sleep)
+
+        bucket.consume(1000)
+
+        assert clock.slept == []
+
+    def test_waits_for_deficit(self):
+        """足りない分が溜まるまで待つ"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1000, clock=clock, sleep=clock.sleep)
+
+        bucket.consume(1000)
+        bucket.consume(500)
+
+        assert clock.slept == [0.5]
+
+    def test_total_rate_is_enforced(self):
+        """合計の転送量がrateを超えない"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1000, clock=clock, sleep=clock.sleep)
+
+        for _ in range(10):
+            bucket.consume(500)
+
+        # 最初の1秒分を除いた4,000バイトに4秒かかる
+        assert clock.now == 4.0
+
+    def test_refills_over_time(self):
+        """時間が経つとトークンが溜まる"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1000, clock=clock, sleep=clock.sleep)
+        bucket.consume(1000)
+
+        clock.now += 1.0
+        bucket.consume(1000)
+
+        assert clock.slept == []
+
+
+class TestTransferThrottle:
+    """TransferThrottleのテスト"""
+
+    def test_slot_limits_concurrency(self):
+        """同時に確保できる枠は上限まで"""
+        throttle = TransferThrottle(max_concurrency=2)
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def worker():
+            nonlocal active, peak
+            with throttle.slot():
+                with lock:
+                    active += 1
+                    peak = max(peak, active)
+                time.sleep(0.02)
+                with lock:
+                    active -= 1
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert peak == 2
+
+    def test_unlimited_throttle(self):
+        """上限0の場合は制限しない"""
+        throttle = TransferThrottle()
+
+        with throttle.slot():
+            throttle.consume(10**9)
+
+        assert throttle.limits_bandwidth is False
+
+
+class TestThrottleRegistry:
+    """ThrottleRegistryのテスト"""
+
+    def test_no_limits_returns_none(self):
+        """制限の無いルールにはNone"""
+        assert ThrottleRegistry().get(make_rule(r"C:\test\a")) is None
+
+    def test_same_directory_shares_throttle(self):
+        """同じ移動先のルールは制限を共有する"""
+        registry = ThrottleRegistry()
+        first = registry.get(make_rule(r"C:\test\a", max_concurrency=1))
+        second = registry.get(make_rule(r"C:\test\a", max_concurrency=5))
+
+        assert first is second
+        assert first is not None
+        assert first.max_concurrency == 1
+
+    def test_different_directories_are_independent(self):
+        """移動先が違えば別の制限"""
+        registry = ThrottleRegistry()
+
+        assert registry.get(make_rule(r"C:\test\a", bandwidth=100)) is not registry.get(
+            make_rule(r"C:\test\b", bandwidth=100)
+        )
@@ -0,0 +1,160 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+from service.transfer_ledger import TransferLedger, query_transfers
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    """書き込みスレッドを開始した台帳を提供"""
+    ledger = TransferLedger(tmp_path / "transfers.db", retention_days=90, flush_interval=0.01)
+    ledger.start()
+    yield ledger
+    ledger.close()
+
+
+def insert_raw(db_path: Path, moved_at: float, name: str) -> None:
+    """任意の時刻の記録を直接書き込む"""
+    conn = sqlite3.connect(str(db_path))
+    with conn:
+        conn.execute(
+            "INSERT INTO transfers (moved_at, name, source, target, target_name, size, status) "
+            "VALUES (?, ?, 'src', 'dest', ?, 0, 'moved')",
+            (moved_at, name, name),
+        )
+    conn.close()
+
+
+class TestTransferLedgerRecord:
+    """記録の書き込みテスト"""
+
+    def test_record_is_written_on_close(self, ledger):
+        """close時に未書き込みの記録が書き出される"""
+        ledger.record(Path("/src/report.md"), Path("/dest/report_renamed.md"), 12)
+        ledger.close()
+
+        records = query_transfers(ledger.db_path)
+        assert len(records) == 1
+        assert records[0].name == "report.md"
+        assert records[0].source == str(Path("/src"))
+        assert records[0].target == str(Path("/dest"))
+        assert records[0].target_name == "report_renamed.md"
+        assert records[0].size == 12
+        assert records[0].status == "moved"
+
+    def test_record_with_digest(self, ledger):
+        """検証付きのコピーではハッシュ値も記録される"""
+        ledger.record(Path("/src/report.md"), Path("/dest/report.md"), 12, digest="abc123")
+        ledger.close()
+
+        assert query_transfers(ledger.db_path)[0].digest == "abc123"
+
+    def test_adds_digest_column_to_existing_ledger(self, tmp_path):
+        """以前の版で作成した台帳にはハッシュ値の列を追加する"""
+        db_path = tmp_path / "transfers.db"
+        conn = sqlite3.connect(str(db_path))
+        conn.execute(
+            "CREATE TABLE transfers (id INTEGER PRIMARY KEY, moved_at REAL NOT NULL, "
+            "name TEXT NOT NULL COLLATE NOCASE, source TEXT NOT NULL, target TEXT NOT NULL, "
+            "target_name TEXT NOT NULL, size INTEGER, status TEXT NOT NULL)"
+        )
+        conn.close()
+        insert_raw(db_path, time.time(), "old.txt")
+
+        ledger = TransferLedger(db_path)
+        ledger.start()
+        ledger.record(Path("/src/new.txt"), Path("/dest/new.txt"), digest="abc123")
+        ledger.close()
+
+        digests = {r.name: r.digest for r in query_transfers(db_path)}
+        assert digests == {"old.txt": None, "new.txt": "abc123"}
+
+    def test_records_are_batched_in_one_transaction(self, tmp_path):
+        """キューに溜まった記録はまとめて書き込まれる"""
+        ledger = TransferLedger(tmp_path / "transfers.db", batch_size=1000)
+        ledger.start()
+        for i in range(250):
+            ledger.record(Path(f"/src/file{i}.txt"), Path(f"/dest/file{i}.txt"))
+        ledger.close()
+
+        assert len(query_transfers(ledger.db_path, limit=1000)) == 250
+
+    def test_close_without_start(self, tmp_path):
+        """開始前にcloseしても例外にならない"""
+        TransferLedger(tmp_path / "transfers.db").close()
+
+
+class TestQueryTransfers:
+    """記録の検索テスト"""
+
+    def test_query_by_name_ignores_case(self, ledger):
+        """ファイル名は大文字小文字を区別せずに検索できる"""
+        ledger.record(Path("/src/Report.md"), Path("/dest/Report.md"))
+        ledger.record(Path("/src/other.md"), Path("/dest/other.md"))
+        ledger.close()
+
+        records = query_transfers(ledger.db_path, name="report.md")
+        assert [record.name for record in records] == ["Report.md"]
+
+    def test_query_by_time_range(self, ledger):
+        """期間を指定して検索できる"""
+        ledger.close()
+        insert_raw(ledger.db_path, 1000.0, "old.txt")
+        insert_raw(ledger.db_path, 2000.0, "mid.txt")
+        insert_raw(ledger.db_path, 3000.0, "new.txt")
+
+        records = query_transfers(ledger.db_path, since=1500.0, until=3000.0)
+        assert [record.name for record in records] == ["mid.txt"]
+
+    def test_query_returns_newest_first_with_limit(self, ledger):
+        """新しい順に指定件数まで返す"""
+        ledger.close()
+        for moved_at in (1000.0, 2000.0, 3000.0):
+            insert_raw(ledger.db_path, moved_at, f"{int(moved_at)}.txt")
+
+        records = query_transfers(ledger.db_path, limit=2)
+        assert [record.name for record in records] == ["3000.txt", "2000.txt"]
+
+    def test_query_uses_name_index(self, ledger):
+        """ファイル名検索はインデックスを使う"""
+        ledger.close()
+        conn = sqlite3.connect(str(ledger.db_path))
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM transfers WHERE name = ? ORDER BY moved_at DESC",
+            ("a.txt",),
+        ).fetchall()
+        conn.close()
+
+        assert any("idx_transfers_name" in row[-1] for row in plan)
+
+
+class TestTransferLedgerRetention:
+    """保持期間のテスト"""
+
+    def test_expired_records_are_purged_on_start(self, tmp_path):
+        """開始時に保持期間を過ぎた記録が削除される"""
+        db_path = tmp_path / "transfers.db"
+        TransferLedger(db_path).start()
+        insert_raw(db_path, time.time() - 10 * 86400, "expired.txt")
+        insert_raw(db_path, time.time(), "recent.txt")
+
+        ledger = TransferLedger(db_path, retention_days=7)
+        ledger.start()
+        ledger.close()
+
+        assert [record.name for record in query_transfers(db_path)] == ["recent.txt"]
+
+    def test_zero_retention_keeps_everything(self, tmp_path):
+        """保持日数が0の場合は削除しない"""
+        db_path = tmp_path / "transfers.db"
+        TransferLedger(db_path).start()
+        insert_raw(db_path, 0.0, "ancient.txt")
+
+        ledger = TransferLedger(db_path, retention_days=0)
+        ledger.start()
+        ledger.close()
+
+        assert len(query_transfers(db_path)) == 1
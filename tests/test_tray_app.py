@@ -1,13 +1,25 @@
 import logging
+import re
+from dataclasses import replace
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, call, patch
 
 import pytest
 from PIL import Image
 from watchdog.observers import Observer
 
 from app.tray_app import TrayApp
-from utils.config_manager import TargetRule, WatchRule
+from service.readiness import ReadinessEstimator
+from utils.config_manager import (
+    HandlerSettings,
+    LedgerSettings,
+    RetrySettings,
+    SpoolSettings,
+    TargetRule,
+    WatchRule,
+)
+from utils.log_aggregator import LogAggregator
+from utils.source_glob import SourceGlob
 
 
 def make_watch_rule(source, targets=(r"C:\test\target",)) -> WatchRule:
@@ -21,15 +33,42 @@ def make_watch_rule(source, targets=(r"C:\test\target",)) -> WatchRule:
     )
 
 
+RETRY_DISABLED = RetrySettings(
+    enabled=False,
+    max_attempts=5,
+    base_delay=5.0,
+    max_delay=600.0,
+    state_path=Path("retry_queue.json"),
+    quarantine_dir=None,
+)
+
+SPOOL_DISABLED = SpoolSettings(
+    enabled=False,
+    spool_dir=Path("spool"),
+    max_bytes=0,
+    probe_base_delay=5.0,
+    probe_max_delay=300.0,
+    flush_workers=2,
+)
+
+
 @pytest.fixture
 def mock_config():
     """設定のモックを提供"""
     with (
         patch("app.tray_app.get_watch_rules") as mock_rules,
         patch("app.tray_app.get_wait_time") as mock_wait,
+        patch("app.tray_app.get_ledger_settings") as mock_ledger,
+        patch("app.tray_app.create_log_aggregator", return_value=LogAggregator()),
+        patch("app.tray_app.get_handler_settings", return_value=HandlerSettings()),
+        patch("app.tray_app.get_retry_settings", return_value=RETRY_DISABLED),
+        patch("app.tray_app.get_spool_settings", return_value=SPOOL_DISABLED),
     ):
         mock_rules.return_value = [make_watch_rule(r"C:\test\src")]
         mock_wait.return_value = 0.5
+        mock_ledger.return_value = LedgerSettings(
+            enabled=False, db_path=Path("transfers.db"), retention_days=90
+        )
         yield mock_rules
 
 
@@ -143,6 +182,33 @@ class TestTrayAppMoveLoop:
         app = TrayApp()
         assert len(app.watch_rules) == 1
 
+    def test_target_matching_source_glob_exits(self, mock_config, existing_dirs, tmp_path, caplog):
+        """監視元のパターンに一致する移動先は終了し、一致しないフォルダは許容する"""
+        drops = tmp_path / "drops"
+        rule = make_watch_rule(drops, targets=(drops / "PC-done", drops / "done"))
+        mock_config.return_value = [replace(rule, source_glob=SourceGlob("PC-*"))]
+
+        with caplog.at_level(logging.ERROR):
+            with pytest.raises(SystemExit):
+                TrayApp()
+
+        assert [record.getMessage() for record in caplog.records] == [
+            f"移動先が監視フォルダと同一です: {drops / 'PC-done'}"
+        ]
+
+    def test_target_under_recursive_source_exits(
+        self, mock_config, existing_dirs, tmp_path, caplog
+    ):
+        """サブディレクトリも監視するフォルダの配下の移動先は終了"""
+        rule = make_watch_rule(tmp_path / "src", targets=(tmp_path / "src" / "done",))
+        mock_config.return_value = [replace(rule, recursive=True)]
+
+        with caplog.at_level(logging.ERROR):
+            with pytest.raises(SystemExit):
+                TrayApp()
+
+        assert "移動先がサブディレクトリも監視するフォルダの配下です" in caplog.text
+
 
 class TestTrayAppIconCreation:
     """アイコン作成のテスト"""
@@ -312,6 +378,425 @@ class TestTrayAppWatching:
         observer.join.assert_called_once()
         assert "フォルダ監視を停止しました" in caplog.text
 
+    def test_start_watching_passes_ledger_to_handlers(
+        self, mock_config, existing_dirs, mock_observer, tmp_path
+    ):
+        """台帳が有効な場合は各ハンドラに同じ台帳が渡される"""
+        settings = LedgerSettings(enabled=True, db_path=tmp_path / "t.db", retention_days=7)
+        with (
+            patch("app.tray_app.get_ledger_settings", return_value=settings),
+            patch("app.tray_app.TransferLedger") as mock_ledger,
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        mock_ledger.assert_called_once_with(tmp_path / "t.db", 7)
+        mock_ledger.return_value.start.assert_called_once()
+        assert mock_handler.call_args.kwargs["ledger"] is mock_ledger.return_value
+
+    def test_stop_watching_closes_ledger(self, mock_config, existing_dirs):
+        """監視停止時に台帳を閉じる"""
+        app = TrayApp()
+        ledger = MagicMock()
+        app.ledger = ledger
+
+        app.stop_watching()
+
+        ledger.close.assert_called_once()
+        assert app.ledger is None
+
+    def test_start_watching_passes_handler_settings(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """[App]の設定がハンドラに渡される"""
+        settings = HandlerSettings(
+            negative_cache_size=5, negative_cache_dir=Path("cache"), early_rule_check=True
+        )
+        with (
+            patch("app.tray_app.get_handler_settings", return_value=settings),
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        kwargs = mock_handler.call_args.kwargs
+        assert kwargs["negative_cache_size"] == 5
+        assert kwargs["negative_cache_dir"] == Path("cache")
+        assert kwargs["early_rule_check"] is True
+
+    def test_start_watching_shares_target_index(self, mock_config, existing_dirs, mock_observer):
+        """移動先のファイル名の一覧は全ハンドラで共有される"""
+        mock_config.return_value = [
+            make_watch_rule(r"C:\test\src1"),
+            make_watch_rule(r"C:\test\src2", targets=(r"C:\test\target2",)),
+        ]
+        with (
+            patch(
+                "app.tray_app.get_handler_settings",
+                return_value=HandlerSettings(target_index=True),
+            ),
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        indexes = {id(call.kwargs["target_index"]) for call in mock_handler.call_args_list}
+        assert len(indexes) == 1
+        versions = {id(call.kwargs["versions"]) for call in mock_handler.call_args_list}
+        assert len(versions) == 1
+        sniffers = {id(call.kwargs["sniffer"]) for call in mock_handler.call_args_list}
+        assert len(sniffers) == 1
+        assert mock_handler.call_args.kwargs["target_index"] is not None
+
+    def test_start_watching_without_target_index(self, mock_config, existing_dirs, mock_observer):
+        """target_indexが無効（既定）の場合は一覧を使わない"""
+        with patch("app.tray_app.FileRenameHandler") as mock_handler:
+            app = TrayApp()
+            app.start_watching()
+
+        assert mock_handler.call_args.kwargs["target_index"] is None
+
+    def test_start_watching_uses_close_events_when_supported(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """オブザーバーがクローズを通知する場合はその通知で書き込み完了を判定する"""
+        with (
+            patch(
+                "app.tray_app.get_handler_settings",
+                return_value=HandlerSettings(close_write=True),
+            ),
+            patch("app.tray_app.reports_close_write", return_value=True),
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        assert mock_handler.call_args.kwargs["close_events"] is True
+
+    def test_start_watching_learns_readiness_per_source(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """書き込み完了までの時間は監視元ごとに学習し、無効（既定）の場合は学習しない"""
+        mock_config.return_value = [
+            make_watch_rule(r"C:\test\src1"),
+            make_watch_rule(r"C:\test\src2", targets=(r"C:\test\target2",)),
+        ]
+        with (
+            patch(
+                "app.tray_app.get_handler_settings",
+                return_value=HandlerSettings(adaptive_wait=True),
+            ),
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            TrayApp().start_watching()
+
+        estimators = [call.kwargs["readiness"] for call in mock_handler.call_args_list]
+        assert all(isinstance(estimator, ReadinessEstimator) for estimator in estimators)
+        assert estimators[0] is not estimators[1]
+
+        with patch("app.tray_app.FileRenameHandler") as mock_handler:
+            TrayApp().start_watching()
+
+        assert mock_handler.call_args.kwargs["readiness"] is None
+
+    def test_start_watching_passes_ignore_patterns(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """監視元ごとの無視するパターンがハンドラに渡される"""
+        ignore = re.compile(r".*\.tmp\Z")
+        mock_config.return_value = [replace(make_watch_rule(r"C:\test\src"), ignore=ignore)]
+        with patch("app.tray_app.FileRenameHandler") as mock_handler:
+            TrayApp().start_watching()
+
+        assert mock_handler.call_args.kwargs["ignore"] is ignore
+
+    def test_start_watching_source_glob(self, mock_config, existing_dirs, mock_observer):
+        """監視元のパターンはパターンより前のフォルダを1つのハンドラでサブディレクトリまで監視する"""
+        rule = replace(make_watch_rule(r"C:\test\drops"), source_glob=SourceGlob("PC-*"))
+        mock_config.return_value = [rule]
+        with patch("app.tray_app.FileRenameHandler") as mock_handler:
+            TrayApp().start_watching()
+
+        mock_observer.return_value.schedule.assert_called_once()
+        schedule = mock_observer.return_value.schedule.call_args
+        assert schedule.args[1] == r"C:\test\drops"
+        assert schedule.kwargs["recursive"] is True
+        assert mock_handler.call_args.kwargs["source_glob"] is rule.source_glob
+        assert mock_handler.call_args.kwargs["recursive"] is False
+
+    def test_start_watching_recursive_source(self, mock_config, existing_dirs, mock_observer):
+        """recursiveの監視元はサブディレクトリも監視し、監視元をハンドラに渡す"""
+        mock_config.return_value = [replace(make_watch_rule(r"C:\test\src"), recursive=True)]
+        with patch("app.tray_app.FileRenameHandler") as mock_handler:
+            TrayApp().start_watching()
+
+        schedule = mock_observer.return_value.schedule.call_args
+        assert schedule.kwargs["recursive"] is True
+        assert mock_handler.call_args.kwargs["source"] == Path(r"C:\test\src")
+        assert mock_handler.call_args.kwargs["recursive"] is True
+
+    def test_start_watching_close_events_can_be_disabled(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """close_writeが無効（既定）の場合は対応する環境でも待機して確認する"""
+        with (
+            patch("app.tray_app.reports_close_write", return_value=True),
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        assert mock_handler.call_args.kwargs["close_events"] is False
+
+    def test_start_watching_watches_targets_for_index(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """target_index_watchが有効な場合は移動先もサブディレクトリを含めて監視する"""
+        with (
+            patch(
+                "app.tray_app.get_handler_settings",
+                return_value=HandlerSettings(target_index=True, target_index_watch=True),
+            ),
+            patch("app.tray_app.FileRenameHandler"),
+            patch.object(Path, "is_dir", return_value=True),
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        schedule_calls = mock_observer.return_value.schedule.call_args_list
+        target_calls = [c for c in schedule_calls if c.args[1] == str(Path(r"C:\test\target"))]
+        assert len(target_calls) == 1
+        assert target_calls[0].kwargs["recursive"] is True
+
+    def test_start_watching_registers_handlers_for_retry(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """再試行が有効な場合は監視元ごとにハンドラを登録して開始する"""
+        settings = RetrySettings(
+            enabled=True,
+            max_attempts=3,
+            base_delay=1.0,
+            max_delay=10.0,
+            state_path=Path("retry_queue.json"),
+            quarantine_dir=Path(r"C:\test\quarantine"),
+        )
+        with (
+            patch("app.tray_app.get_retry_settings", return_value=settings),
+            patch("app.tray_app.RetryScheduler") as mock_scheduler,
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        scheduler = mock_scheduler.return_value
+        scheduler.register.assert_called_once_with(
+            app.watch_rules[0].source, mock_handler.return_value.retry_file
+        )
+        scheduler.start.assert_called_once()
+        assert mock_handler.call_args.kwargs["retry_scheduler"] is scheduler
+
+    def test_start_watching_shares_throttles(self, mock_config, existing_dirs, mock_observer):
+        """移動先ごとの制限は全ハンドラで共有される"""
+        mock_config.return_value = [
+            make_watch_rule(r"C:\test\src1"),
+            make_watch_rule(r"C:\test\src2", targets=(r"C:\test\target2",)),
+        ]
+        with patch("app.tray_app.FileRenameHandler") as mock_handler:
+            app = TrayApp()
+            app.start_watching()
+
+        registries = {id(call.kwargs["throttles"]) for call in mock_handler.call_args_list}
+        assert len(registries) == 1
+
+    def test_start_watching_shares_io_scheduler(self, mock_config, existing_dirs, mock_observer):
+        """デバイスごとのスケジューラは全ハンドラで共有される"""
+        mock_config.return_value = [
+            make_watch_rule(r"C:\test\src1"),
+            make_watch_rule(r"C:\test\src2", targets=(r"C:\test\target2",)),
+        ]
+        with (
+            patch(
+                "app.tray_app.get_handler_settings",
+                return_value=HandlerSettings(workers_per_device=2),
+            ),
+            patch("app.tray_app.DeviceScheduler") as mock_scheduler,
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        mock_scheduler.assert_called_once_with(2)
+        schedulers = {id(call.kwargs["io_scheduler"]) for call in mock_handler.call_args_list}
+        assert schedulers == {id(mock_scheduler.return_value)}
+
+    def test_start_watching_without_workers_moves_inline(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """workers_per_deviceが0の場合はスケジューラを使わない"""
+        with (
+            patch(
+                "app.tray_app.get_handler_settings",
+                return_value=HandlerSettings(workers_per_device=0),
+            ),
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        assert mock_handler.call_args.kwargs["io_scheduler"] is None
+
+    def test_stop_watching_closes_compressor(self, mock_config, existing_dirs):
+        """監視停止時に圧縮スレッドを停止する"""
+        app = TrayApp()
+        compressor = MagicMock()
+        app.compressor = compressor
+
+        app.stop_watching()
+
+        compressor.close.assert_called_once()
+        assert app.compressor is None
+
+    def test_start_watching_without_bundle_rules_has_no_bundler(
+        self, mock_config, existing_dirs, mock_observer
+    ):
+        """まとめて送る移動先が無い場合はまとめる処理を開始しない"""
+        with patch("app.tray_app.FileRenameHandler") as mock_handler:
+            app = TrayApp()
+            app.start_watching()
+
+        assert app.bundler is None
+        assert mock_handler.call_args.kwargs["bundler"] is None
+
+    def test_start_watching_starts_bundler(self, mock_config, existing_dirs, mock_observer):
+        """まとめて送る移動先がある場合は共有のまとめる処理を開始する"""
+        target = TargetRule(
+            directory=Path(r"C:\test\target"),
+            filenames=frozenset(),
+            suffix="",
+            pattern=None,
+            bundle_seconds=10.0,
+        )
+        mock_config.return_value = [WatchRule(source=Path(r"C:\test\src"), targets=(target,))]
+        with (
+            patch("app.tray_app.Bundler") as mock_bundler,
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        mock_bundler.return_value.start.assert_called_once_with([target])
+        assert mock_handler.call_args.kwargs["bundler"] is mock_bundler.return_value
+
+    def test_stop_watching_flushes_bundler_before_compressor(self, mock_config, existing_dirs):
+        """監視停止時に溜めたファイルを送ってから圧縮スレッドを停止する"""
+        app = TrayApp()
+        calls = MagicMock()
+        app.bundler = calls.bundler
+        app.compressor = calls.compressor
+
+        app.stop_watching()
+
+        assert calls.mock_calls == [call.bundler.close(), call.compressor.close()]
+        assert app.bundler is None
+
+    def test_stop_watching_drains_io_scheduler(self, mock_config, existing_dirs):
+        """監視停止時に積まれた移動を終えてから停止する"""
+        app = TrayApp()
+        scheduler = MagicMock()
+        app.io_scheduler = scheduler
+
+        app.stop_watching()
+
+        scheduler.close.assert_called_once()
+        assert app.io_scheduler is None
+
+    def test_start_watching_shares_log_summary(self, mock_config, existing_dirs, mock_observer):
+        """ログ集計は全ハンドラで共有される"""
+        mock_config.return_value = [
+            make_watch_rule(r"C:\test\src1"),
+            make_watch_rule(r"C:\test\src2", targets=(r"C:\test\target2",)),
+        ]
+        with patch("app.tray_app.FileRenameHandler") as mock_handler:
+            app = TrayApp()
+            app.start_watching()
+
+        summaries = {id(call.kwargs["log_summary"]) for call in mock_handler.call_args_list}
+        assert summaries == {id(app.log_summary)}
+
+    def test_stop_watching_closes_retry_scheduler(self, mock_config, existing_dirs):
+        """監視停止時に再試行スケジューラを停止する"""
+        app = TrayApp()
+        scheduler = MagicMock()
+        app.retry_scheduler = scheduler
+
+        app.stop_watching()
+
+        scheduler.close.assert_called_once()
+        assert app.retry_scheduler is None
+
+    def test_start_watching_passes_spool_to_handlers(
+        self, mock_config, existing_dirs, mock_observer, tmp_path
+    ):
+        """退避が有効な場合は開始した退避領域がハンドラに渡される"""
+        settings = SpoolSettings(
+            enabled=True,
+            spool_dir=tmp_path / "spool",
+            max_bytes=1024,
+            probe_base_delay=1.0,
+            probe_max_delay=10.0,
+            flush_workers=3,
+        )
+        with (
+            patch("app.tray_app.get_spool_settings", return_value=settings),
+            patch("app.tray_app.TargetSpool") as mock_spool,
+            patch("app.tray_app.FileRenameHandler") as mock_handler,
+        ):
+            app = TrayApp()
+            app.start_watching()
+
+        assert mock_spool.call_args.args == (tmp_path / "spool", 1024)
+        assert mock_spool.call_args.kwargs["flush_workers"] == 3
+        mock_spool.return_value.start.assert_called_once()
+        assert mock_handler.call_args.kwargs["spool"] is mock_spool.return_value
+
+    def test_stop_watching_reports_remaining_spool(self, mock_config, existing_dirs, caplog):
+        """監視停止時に退避中のファイルが残っていれば警告して停止する"""
+        app = TrayApp()
+        spool = MagicMock()
+        spool.stats.return_value = {r"C:\test\target": {"spooled_files": 2}}
+        app.spool = spool
+
+        with caplog.at_level(logging.WARNING):
+            app.stop_watching()
+
+        spool.close.assert_called_once()
+        assert "退避中のファイルを残して終了します: 2件" in caplog.text
+
+    def test_stop_watching_reports_readiness(self, mock_config, existing_dirs, caplog):
+        """監視停止時に書き込み完了をどの方法で判定したかの件数を出力する"""
+        app = TrayApp()
+        handler = MagicMock()
+        handler.stats.return_value = {"close_write": 3, "settled": 2, "polled": 1, "not_ready": 0}
+        app.handlers = [(handler, Path(r"C:\test\src"))]
+
+        with caplog.at_level(logging.INFO):
+            app.stop_watching()
+
+        assert "クローズの通知 3件 / 更新なし 2件 / 待機 1件 / 準備できず 0件" in caplog.text
+        assert app.handlers == []
+
+    def test_stop_watching_flushes_log_summary(self, mock_config, existing_dirs):
+        """監視停止時にログ集計を出力して閉じる"""
+        app = TrayApp()
+        log_summary = MagicMock()
+        app.log_summary = log_summary
+
+        app.stop_watching()
+
+        log_summary.close.assert_called_once()
+        assert app.log_summary is None
+
     def test_stop_watching_without_observer(self, mock_config, existing_dirs):
         """observerがNoneの場合でも正常終了"""
         app = TrayApp()
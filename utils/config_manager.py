@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import configparser
+import fnmatch
 import os
 import re
 import sys
@@ -8,9 +9,27 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Optional, Pattern
 
+from utils.rename_template import RenameTemplate
+from utils.source_glob import SourceGlob, split_source_glob
 
 TARGET_DIR_KEY = re.compile(r"^target_dir(\d+)$")
+SIZE_VALUE = re.compile(r"^(\d+(?:\.\d+)?)\s*([KMG]?)B?$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
 WATCH_SECTION = re.compile(r"^Watch(\d+)$")
+DELIVERY_MODES = ("copy", "link", "reflink")
+VERIFY_MODES = ("off", "fsync", "reread")
+COMPRESS_CODECS = ("gzip", "zstd")
+LAYOUTS = ("flat", "date", "hash")
+COLLISION_POLICIES = ("overwrite", "keep_both", "skip_if_newer")
+# 監視元で無視するファイル（ダウンロード中・編集中の一時ファイルなど）の既定のパターン
+DEFAULT_IGNORE_PATTERNS = (
+    "*.crdownload", "*.part", "*.partial", "*.download", "*.tmp", "*.temp", "~$*", ".~lock.*#",
+    "*.swp", ".DS_Store", "Thumbs.db", "desktop.ini",
+)
+CONTENT_TYPES = (
+    "pdf", "png", "jpeg", "gif", "tiff", "webp", "zip", "gzip", "zstd", "bzip2", "xz", "7z",
+    "tar", "sqlite", "ole", "exe", "elf", "wav", "avi", "xml", "text",
+)
 
 
 @dataclass(frozen=True)
@@ -26,6 +45,46 @@ class TargetRule:
     pattern: Optional[Pattern[str]]
     # 移動対象のファイル名を判定する正規表現。未設定の場合はNone
     filename_regex: Optional[Pattern[str]] = None
+    # 移動先への同時転送数の上限。0の場合は無制限
+    max_concurrency: int = 0
+    # 移動先への転送量の上限（バイト/秒）。0の場合は無制限
+    bandwidth: int = 0
+    # 移動先のデバイスへ同時に書き込むワーカー数。0の場合は[App]の workers_per_device
+    device_workers: int = 0
+    # 複数の移動先へ届ける際、移動元と同じボリュームでの届け方（copy / link / reflink）
+    delivery: str = "link"
+    # 移動先に同じ内容のファイルがある場合は書き込まずに移動元を削除するか
+    dedup: bool = False
+    # 別ボリュームへコピーする際の検証方法（off / fsync / reread）
+    verify: str = "off"
+    # 届けたファイルの一覧（マニフェスト）を移動先ディレクトリに残すか
+    manifest: bool = False
+    # 圧縮して届ける形式（gzip / zstd）。Noneの場合は圧縮しない
+    compress: Optional[str] = None
+    # 圧縮レベル。0の場合は形式ごとの既定値
+    compress_level: int = 0
+    # 小さなファイルを溜めて1つの tar にまとめる最長時間（秒）。0の場合はまとめない
+    bundle_seconds: float = 0.0
+    # 溜めたファイルの合計がこのバイト数に達したら時間を待たずにまとめて送る
+    bundle_max_bytes: int = 64 * 1024 * 1024
+    # まとめる対象とするファイルの上限サイズ（バイト）。超えるファイルは個別に届ける
+    bundle_file_limit: int = 1024 * 1024
+    # 移動先でのファイルの置き方（flat / date / hash）。flat 以外はサブディレクトリに分ける
+    layout: str = "flat"
+    # サブディレクトリの階層数。0の場合は layout ごとの既定値（date: 3, hash: 2）
+    shard_levels: int = 0
+    # hash の場合に1階層あたりに使うハッシュ値の文字数（16のN乗に分かれる）
+    shard_width: int = 2
+    # 移動先に同じ名前のファイルがある場合の扱い（overwrite / keep_both / skip_if_newer）
+    collision: str = "overwrite"
+    # 移動先でのファイル名のテンプレート。指定した場合は suffix の代わりに使う
+    template: Optional[RenameTemplate] = None
+    # 移動対象のファイルの種類（先頭のバイト列で判定）。空の場合は種類を問わない
+    content_types: frozenset[str] = frozenset()
+    # 移動対象の監視元からの相対パス（/ 区切り）を判定する正規表現。未設定の場合はNone
+    path_regex: Optional[Pattern[str]] = None
+    # 監視元からの相対ディレクトリを移動先でも保つか（Falseの場合は移動先直下に置く）
+    keep_tree: bool = False
 
 
 @dataclass(frozen=True)
@@ -34,6 +93,92 @@ class WatchRule:
 
     source: Path
     targets: tuple[TargetRule, ...]
+    # 一致する全ての移動先へ届けるか。Falseの場合は最初に一致した移動先のみ
+    fanout: bool = False
+    # 無視するファイル名のパターンを1つにまとめた正規表現。Noneの場合は無視しない
+    ignore: Optional[Pattern[str]] = None
+    # サブディレクトリも監視するか
+    recursive: bool = False
+    # processing_dir にワイルドカードを指定した場合の、source（ワイルドカードより前の
+    # ディレクトリ）配下で監視元とするディレクトリのパターン。Noneの場合は source のみ
+    source_glob: Optional[SourceGlob] = None
+
+
+@dataclass(frozen=True)
+class HandlerSettings:
+    """ファイル処理（[App]セクション）の設定"""
+
+    # 移動先が無いと判定したファイルを覚えておく件数
+    negative_cache_size: int = 1024
+    # 判定結果を保存し、次回の起動時に引き継ぐディレクトリ。Noneの場合は保存しない
+    negative_cache_dir: Optional[Path] = None
+    # 書き込み完了を待つ前にファイル名だけで移動先の有無を判定するか
+    early_rule_check: bool = False
+    # 移動先のデバイスごとのワーカー数。0の場合はイベントを受けたスレッドで移動する
+    workers_per_device: int = 0
+    # 重複判定のために覚えておく移動先ファイルのハッシュ値の件数
+    hash_cache_size: int = 4096
+    # 圧縮に使うスレッド数。0の場合はCPUのコア数
+    compression_workers: int = 0
+    # まとめて送るファイルを溜めておくディレクトリ
+    bundle_dir: Path = Path("bundles")
+    # 移動先のファイル名の一覧をメモリに持ち、ファイルごとの存在確認を省くか
+    target_index: bool = False
+    # 一覧を読み直す間隔（秒）。0の場合は自分の書き込みとイベントだけで更新する
+    target_index_refresh: float = 300.0
+    # 移動先ディレクトリも監視し、他のプロセスによる変更を一覧に反映するか
+    target_index_watch: bool = False
+    # 監視元・拡張子ごとに書き込み完了までの時間を学習して待ち時間を決めるか
+    adaptive_wait: bool = False
+    # 学習した待ち時間の下限・上限（秒）。下限はサイズ・更新時刻が変わらないことを確かめる最短の時間
+    wait_min: float = 0.25
+    wait_max: float = 30.0
+    # 対応する環境（Linux）では書き込み後のクローズの通知で書き込み完了を判定するか
+    close_write: bool = False
+    # ファイルの種類の判定に読む先頭のバイト数
+    sniff_bytes: int = 4096
+    # ファイルの種類の判定結果を覚えておく件数
+    sniff_cache_size: int = 4096
+
+
+@dataclass(frozen=True)
+class LedgerSettings:
+    """移動記録（SQLite台帳）の設定"""
+
+    enabled: bool
+    db_path: Path
+    # この日数より古い記録は削除する。0以下の場合は削除しない
+    retention_days: int
+
+
+@dataclass(frozen=True)
+class RetrySettings:
+    """移動失敗時の再試行の設定"""
+
+    enabled: bool
+    max_attempts: int
+    # 1回目の再試行までの待ち時間（秒）。以降は倍々に延び、max_delayで頭打ちになる
+    base_delay: float
+    max_delay: float
+    # 再試行待ちを保存するファイル
+    state_path: Path
+    # 上限回数まで失敗したファイルの移動先。Noneの場合は監視元に残す
+    quarantine_dir: Optional[Path]
+
+
+@dataclass(frozen=True)
+class SpoolSettings:
+    """到達できない移動先へのファイルを退避する設定"""
+
+    enabled: bool
+    spool_dir: Path
+    # 退避領域の上限（バイト）。0以下の場合は無制限
+    max_bytes: int
+    # 到達できない移動先を確認する間隔（秒）。倍々に延び、probe_max_delayで頭打ちになる
+    probe_base_delay: float
+    probe_max_delay: float
+    # 復旧後に退避済みのファイルを送る並列数
+    flush_workers: int
 
 
 def get_config_path() -> str:
@@ -106,6 +251,85 @@ def _compile_filename_regex(value: str) -> Optional[Pattern[str]]:
         raise
 
 
+def _parse_size(value: str) -> int:
+    """10M や 512K のようなサイズ指定をバイト数に変換（空欄は0）"""
+    if not value:
+        return 0
+
+    matched = SIZE_VALUE.match(value)
+    if matched is None:
+        raise ValueError(f"サイズの指定が無効です: {value}")
+    return int(float(matched.group(1)) * SIZE_UNITS[matched.group(2).upper()])
+
+
+def _parse_choice(value: str, choices: tuple[str, ...], label: str) -> str:
+    """選択肢から選ぶ設定値を検証し、小文字にして返す"""
+    choice = value.lower()
+    if choice not in choices:
+        raise ValueError(f"{label}の指定が無効です: {value}（{' / '.join(choices)} のいずれか）")
+    return choice
+
+
+def _parse_compress(value: str) -> Optional[str]:
+    """圧縮形式の指定を検証する（空欄は圧縮しない）"""
+    if not value:
+        return None
+    return _parse_choice(value, COMPRESS_CODECS, "圧縮形式")
+
+
+def _parse_content_types(value: str) -> frozenset[str]:
+    """カンマ区切りのファイルの種類の指定を検証して集合に変換"""
+    return frozenset(
+        _parse_choice(name.strip(), CONTENT_TYPES, "ファイルの種類")
+        for name in value.split(",")
+        if name.strip()
+    )
+
+
+def _compile_ignore(value: str, use_defaults: bool) -> Optional[Pattern[str]]:
+    """カンマ区切りのワイルドカード指定（と既定のパターン）を1つの正規表現にまとめる"""
+    patterns = list(DEFAULT_IGNORE_PATTERNS) if use_defaults else []
+    patterns += [pattern.strip() for pattern in value.split(",") if pattern.strip()]
+    if not patterns:
+        return None
+    # Windows ではファイル名の大文字・小文字を区別しないため、無視するかの判定も同様にする
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns), re.IGNORECASE)
+
+
+def _compile_template(
+    value: str, filename_regex: Optional[Pattern[str]], collision: str, index: str
+) -> Optional[RenameTemplate]:
+    """名前のテンプレートを解析する（空欄はテンプレートを使わない）"""
+    if not value:
+        return None
+    template = RenameTemplate(value, filename_regex)
+    # 連番は起動ごとに1から数え直すため、上書きすると以前に届けたファイルが失われる
+    if template.uses_counter and collision != "keep_both":
+        raise ValueError(
+            f"template{index} の {{counter}} は collision{index} = keep_both の場合のみ使えます:"
+            f" {value}"
+        )
+    return template
+
+
+def _parse_layout(section: configparser.SectionProxy, index: str) -> tuple[str, int, int]:
+    """layoutN / shard_levelsN / shard_widthN を検証して返す"""
+    layout = _parse_choice(
+        section.get(f"layout{index}", "").strip() or "flat", LAYOUTS, "ファイルの置き方"
+    )
+    levels = section.getint(f"shard_levels{index}", fallback=0)
+    width = section.getint(f"shard_width{index}", fallback=2)
+    if layout == "date" and not 0 <= levels <= 4:
+        raise ValueError(f"shard_levels{index} の指定が無効です: {levels}（date は1〜4）")
+    # SHA-1 の16進表記（40文字）の範囲に収める。階層数0は既定の2階層
+    if layout == "hash" and not (0 <= levels and 1 <= width and (levels or 2) * width <= 40):
+        raise ValueError(
+            f"shard_levels{index} / shard_width{index} の指定が無効です: {levels} / {width}"
+            "（hash は階層数×文字数が40以下）"
+        )
+    return layout, levels, width
+
+
 def _build_target_rule(section: configparser.SectionProxy, index: str) -> TargetRule:
     """target_dirN に対応する振り分けルールを組み立てる"""
     filenames = _parse_filenames(section.get(f"filename{index}", ""))
@@ -113,6 +337,12 @@ def _build_target_rule(section: configparser.SectionProxy, index: str) -> Target
 
     # 設定値が$付きでもサフィックスとしては$を除いた文字列を使う
     suffix = section.get(f"pattern{index}", "").strip().rstrip("$")
+    layout, shard_levels, shard_width = _parse_layout(section, index)
+    collision = _parse_choice(
+        section.get(f"collision{index}", "").strip() or "overwrite",
+        COLLISION_POLICIES,
+        "同じ名前のファイルがある場合の扱い",
+    )
 
     return TargetRule(
         directory=Path(section[f"target_dir{index}"]),
@@ -120,6 +350,35 @@ def _build_target_rule(section: configparser.SectionProxy, index: str) -> Target
         suffix=suffix,
         pattern=_compile_pattern(suffix),
         filename_regex=filename_regex,
+        max_concurrency=section.getint(f"max_concurrency{index}", fallback=0),
+        bandwidth=_parse_size(section.get(f"bandwidth{index}", "").strip()),
+        device_workers=section.getint(f"device_workers{index}", fallback=0),
+        delivery=_parse_choice(
+            section.get(f"delivery{index}", "").strip() or "link", DELIVERY_MODES, "配信方法"
+        ),
+        dedup=section.getboolean(f"dedup{index}", fallback=False),
+        verify=_parse_choice(
+            section.get(f"verify{index}", "").strip() or "off", VERIFY_MODES, "検証方法"
+        ),
+        manifest=section.getboolean(f"manifest{index}", fallback=False),
+        compress=_parse_compress(section.get(f"compress{index}", "").strip()),
+        compress_level=section.getint(f"compress_level{index}", fallback=0),
+        bundle_seconds=section.getfloat(f"bundle_seconds{index}", fallback=0.0),
+        bundle_max_bytes=_parse_size(section.get(f"bundle_max_size{index}", "").strip() or "64M"),
+        bundle_file_limit=_parse_size(
+            section.get(f"bundle_file_limit{index}", "").strip() or "1M"
+        ),
+        layout=layout,
+        shard_levels=shard_levels,
+        shard_width=shard_width,
+        collision=collision,
+        # 日時の書式（%Y など）をそのまま書けるよう、補間せずに読む
+        template=_compile_template(
+            section.get(f"template{index}", "", raw=True).strip(), filename_regex, collision, index
+        ),
+        content_types=_parse_content_types(section.get(f"content_type{index}", "")),
+        path_regex=_compile_filename_regex(section.get(f"path_regex{index}", "").strip()),
+        keep_tree=section.getboolean(f"keep_tree{index}", fallback=False),
     )
 
 
@@ -144,7 +403,23 @@ def _build_watch_rule(section: configparser.SectionProxy) -> WatchRule:
         )
 
     indexed_targets.sort(key=lambda item: item[0])
-    return WatchRule(source=Path(source), targets=tuple(rule for _, rule in indexed_targets))
+    source_dir, source_glob = split_source_glob(source)
+    fanout = section.getboolean("fanout", fallback=False)
+    if fanout and any(rule.compress is not None for _, rule in indexed_targets):
+        # 複数の移動先へは同じデータを書き込むため、移動先ごとの圧縮には対応しない
+        raise ValueError(f"[{section.name}] の fanout と compressN は同時に指定できません")
+    if fanout and any(rule.bundle_seconds > 0 for _, rule in indexed_targets):
+        raise ValueError(f"[{section.name}] の fanout と bundle_secondsN は同時に指定できません")
+    return WatchRule(
+        source=source_dir,
+        targets=tuple(rule for _, rule in indexed_targets),
+        fanout=fanout,
+        ignore=_compile_ignore(
+            section.get("ignore", ""), section.getboolean("ignore_defaults", fallback=True)
+        ),
+        recursive=section.getboolean("recursive", fallback=False),
+        source_glob=source_glob,
+    )
 
 
 def get_watch_rules() -> list[WatchRule]:
@@ -170,6 +445,84 @@ def get_wait_time() -> float:
     return config.getfloat("App", "wait_time", fallback=0.5)
 
 
+def get_handler_settings() -> HandlerSettings:
+    """ファイル処理（[App]セクション）の設定を取得"""
+    config = load_config()
+    negative_cache_dir = config.get("App", "negative_cache_dir", fallback="logs/unmatched").strip()
+    return HandlerSettings(
+        negative_cache_size=config.getint("App", "negative_cache_size", fallback=1024),
+        negative_cache_dir=(
+            _resolve_project_path(negative_cache_dir) if negative_cache_dir else None
+        ),
+        early_rule_check=config.getboolean("App", "early_rule_check", fallback=False),
+        workers_per_device=config.getint("App", "workers_per_device", fallback=0),
+        hash_cache_size=config.getint("App", "hash_cache_size", fallback=4096),
+        compression_workers=config.getint("App", "compression_workers", fallback=0),
+        bundle_dir=_resolve_project_path(
+            config.get("App", "bundle_dir", fallback="bundles").strip()
+        ),
+        target_index=config.getboolean("App", "target_index", fallback=False),
+        target_index_refresh=config.getfloat("App", "target_index_refresh", fallback=300.0),
+        target_index_watch=config.getboolean("App", "target_index_watch", fallback=False),
+        adaptive_wait=config.getboolean("App", "adaptive_wait", fallback=False),
+        wait_min=config.getfloat("App", "wait_min", fallback=0.25),
+        wait_max=config.getfloat("App", "wait_max", fallback=30.0),
+        close_write=config.getboolean("App", "close_write", fallback=False),
+        sniff_bytes=_parse_size(config.get("App", "sniff_bytes", fallback="").strip() or "4K"),
+        sniff_cache_size=config.getint("App", "sniff_cache_size", fallback=4096),
+    )
+
+
+def _resolve_project_path(value: str) -> Path:
+    """相対パスをプロジェクトルート基準の絶対パスに変換"""
+    path = Path(value)
+    if path.is_absolute():
+        return path
+
+    project_root = Path(os.path.dirname(os.path.dirname(__file__)))
+    return project_root / path
+
+
+def get_ledger_settings() -> LedgerSettings:
+    """移動記録（[Ledger]セクション）の設定を取得"""
+    config = load_config()
+    db_path = config.get("Ledger", "db_path", fallback="logs/transfers.db").strip()
+    return LedgerSettings(
+        enabled=config.getboolean("Ledger", "enabled", fallback=True),
+        db_path=_resolve_project_path(db_path),
+        retention_days=config.getint("Ledger", "retention_days", fallback=90),
+    )
+
+
+def get_retry_settings() -> RetrySettings:
+    """移動失敗時の再試行（[Retry]セクション）の設定を取得"""
+    config = load_config()
+    state_path = config.get("Retry", "state_path", fallback="logs/retry_queue.json").strip()
+    quarantine_dir = config.get("Retry", "quarantine_dir", fallback="").strip()
+    return RetrySettings(
+        enabled=config.getboolean("Retry", "enabled", fallback=True),
+        max_attempts=config.getint("Retry", "max_attempts", fallback=5),
+        base_delay=config.getfloat("Retry", "base_delay", fallback=5.0),
+        max_delay=config.getfloat("Retry", "max_delay", fallback=600.0),
+        state_path=_resolve_project_path(state_path),
+        quarantine_dir=Path(quarantine_dir) if quarantine_dir else None,
+    )
+
+
+def get_spool_settings() -> SpoolSettings:
+    """到達できない移動先への退避（[Spool]セクション）の設定を取得"""
+    config = load_config()
+    spool_dir = config.get("Spool", "spool_dir", fallback="spool").strip()
+    return SpoolSettings(
+        enabled=config.getboolean("Spool", "enabled", fallback=True),
+        spool_dir=_resolve_project_path(spool_dir),
+        max_bytes=int(config.getfloat("Spool", "max_size_mb", fallback=1024.0) * 1024 * 1024),
+        probe_base_delay=config.getfloat("Spool", "probe_base_delay", fallback=5.0),
+        probe_max_delay=config.getfloat("Spool", "probe_max_delay", fallback=300.0),
+        flush_workers=config.getint("Spool", "flush_workers", fallback=2),
+    )
+
+
 def get_config_value(
     config: configparser.ConfigParser, section: str, key: str, default: Any = None
 ) -> Any:
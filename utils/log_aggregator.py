@@ -0,0 +1,99 @@
+import configparser
+import logging
+import threading
+import time
+from collections import Counter
+
+from utils.config_manager import get_config_value, load_config
+
+logger = logging.getLogger(__name__)
+
+# 集計対象のメッセージ種別と、集計結果の出力形式
+SUMMARY_MESSAGES = {
+    'moved': "ファイルを移動しました: {count:,}件 -> {key}（{elapsed:.0f}秒間）",
+    'overwrite': "既存ファイルを上書きしました: {count:,}件 -> {key}（{elapsed:.0f}秒間）",
+    'unmatched': "移動先が見つかりませんでした: {count:,}件 ({key})（{elapsed:.0f}秒間）",
+    'duplicate': "同じ内容のため移動を省略しました: {count:,}件 -> {key}（{elapsed:.0f}秒間）",
+    'skipped': "移動先が新しいため移動を省略しました: {count:,}件 -> {key}（{elapsed:.0f}秒間）",
+}
+
+
+class LogAggregator:
+    """ファイルごとに出るINFOログを間引き、一定間隔ごとに件数をまとめて出力する
+
+    interval が0以下の場合は集計せず、全てのメッセージを個別に出力する。
+    エラーは集計対象にせず、呼び出し元で個別に出力すること。
+    """
+
+    def __init__(self, interval: float = 0.0, sample_every: dict[str, int] | None = None) -> None:
+        self.interval = interval
+        # 種別ごとに何件に1件を個別に出力するか（1で全件、0で個別出力なし）
+        self.sample_every = sample_every or {}
+        self._counts: Counter[tuple[str, str]] = Counter()
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def should_log(self, kind: str, key: str) -> bool:
+        """件数を数え、このメッセージを個別に出力すべきかを返す"""
+        if not self.enabled:
+            return True
+
+        with self._lock:
+            self._counts[(kind, key)] += 1
+            count = self._counts[(kind, key)]
+
+        every = self.sample_every.get(kind, 1)
+        return every > 0 and (count - 1) % every == 0
+
+    def start(self) -> None:
+        """集計結果を定期的に出力するスレッドを開始する"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='LogAggregator', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """スレッドを停止し、未出力の集計結果を出力する"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> None:
+        """前回の出力以降の件数を出力してリセットする"""
+        with self._lock:
+            counts = self._counts
+            self._counts = Counter()
+            now = time.monotonic()
+            elapsed = now - self._started_at
+            self._started_at = now
+
+        for (kind, key), count in sorted(counts.items()):
+            message = SUMMARY_MESSAGES.get(kind, "{key}: {count:,}件（{elapsed:.0f}秒間）")
+            logger.info(message.format(count=count, key=key, elapsed=elapsed))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+def create_log_aggregator(config: configparser.ConfigParser | None = None) -> LogAggregator:
+    """[LOGGING] セクションの設定からLogAggregatorを生成する"""
+    if config is None:
+        config = load_config()
+
+    interval = float(get_config_value(config, 'LOGGING', 'summary_interval', 0.0))
+    sample_every = {
+        kind: int(get_config_value(config, 'LOGGING', f'sample_{kind}', 1))
+        for kind in SUMMARY_MESSAGES
+    }
+    return LogAggregator(interval, sample_every)
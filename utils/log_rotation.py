@@ -1,11 +1,138 @@
+import atexit
 import configparser
+import gzip
 import logging
 import os
-import re
+import queue
+import shutil
+import threading
+import time
 from datetime import datetime, timedelta
 from logging.handlers import TimedRotatingFileHandler
 
-from utils.config_manager import load_config, get_config_value
+from utils.config_manager import get_config_value, load_config
+
+MEGABYTE = 1024 * 1024
+
+
+class LogCompressor:
+    """ローテーション済みのログを別スレッドでgzip圧縮し、古いログを整理する"""
+
+    def __init__(self, log_directory: str, project_name: str, retention_days: int,
+                 max_total_bytes: int, compress: bool = True) -> None:
+        self.log_directory = log_directory
+        self.project_name = project_name
+        self.retention_days = retention_days
+        self.max_total_bytes = max_total_bytes
+        self.compress = compress
+        self._queue: queue.Queue[str | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+
+    def submit(self, rotated_path: str) -> None:
+        """ローテーション済みファイルの後処理を依頼する（呼び出し元は待たない）"""
+        if self._stopping:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='LogCompressor', daemon=True)
+            self._thread.start()
+            # 終了時は logging.shutdown()（より先に登録済み）の前に後処理を終える
+            atexit.register(self.close)
+        self._queue.put(rotated_path)
+
+    def stop(self) -> None:
+        """依頼済みの後処理を終えたらスレッドを停止するよう依頼する（終わるのを待たない）"""
+        if self._thread is not None and not self._stopping:
+            self._stopping = True
+            self._queue.put(None)
+
+    def close(self) -> None:
+        """依頼済みの後処理を終えてからスレッドを停止する"""
+        thread = self._thread
+        if thread is None:
+            return
+        self.stop()
+        thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            rotated_path = self._queue.get()
+            if rotated_path is None:
+                return
+            if self.compress:
+                compress_log_file(rotated_path)
+            cleanup_old_logs(self.log_directory, self.retention_days, self.project_name,
+                             self.max_total_bytes)
+
+
+def compress_log_file(path: str) -> None:
+    """ログファイルをgzip圧縮して元のファイルを削除する"""
+    try:
+        with open(path, 'rb') as src, gzip.open(f'{path}.gz', 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, MEGABYTE)
+        os.remove(path)
+    except OSError as e:
+        logging.error(f"ログファイルの圧縮中にエラーが発生しました {path}: {str(e)}")
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """日付の変わり目に加えてサイズ上限でもローテーションするハンドラー
+
+    ローテーションはファイル名の変更のみで済ませ、圧縮と削除は LogCompressor に任せる。
+    """
+
+    def __init__(self, filename: str, max_bytes: int, compressor: LogCompressor | None = None,
+                 encoding: str = 'utf-8') -> None:
+        super().__init__(filename=filename, when='midnight', backupCount=0, encoding=encoding)
+        self.max_bytes = max_bytes
+        self.compressor = compressor
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes <= 0 or self.stream is None:
+            return False
+        # 1レコード分の超過は許容し、判定のために書式化を二重に行わない
+        return self.stream.tell() >= self.max_bytes
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None  # type: ignore[assignment]
+
+        now = time.time()
+        if os.path.exists(self.baseFilename):
+            rotated_path = self._rotated_filename(now)
+            os.replace(self.baseFilename, rotated_path)
+            if self.compressor is not None:
+                self.compressor.submit(rotated_path)
+
+        if not self.delay:
+            self.stream = self._open()
+
+        if now >= self.rolloverAt:
+            new_rollover_at = self.computeRollover(int(now))
+            while new_rollover_at <= now:
+                new_rollover_at += self.interval
+            self.rolloverAt = new_rollover_at
+
+    def _rotated_filename(self, now: float) -> str:
+        """同じ日に複数回ローテーションしても重複しないファイル名を返す"""
+        stamp = time.strftime('%Y-%m-%d_%H%M%S', time.localtime(now))
+        candidate = f'{self.baseFilename}.{stamp}.log'
+        counter = 1
+        while os.path.exists(candidate) or os.path.exists(f'{candidate}.gz'):
+            candidate = f'{self.baseFilename}.{stamp}_{counter}.log'
+            counter += 1
+        return candidate
+
+    def close(self) -> None:
+        super().close()
+        if self.compressor is not None:
+            # logging.shutdown() はこのハンドラのロックを持ったまま close() を呼ぶため、ここで
+            # 後処理のスレッド（ログを出力する）を待つと互いに待ち続ける。停止の依頼のみ行う
+            self.compressor.stop()
 
 
 def setup_logging(config: configparser.ConfigParser | None = None) -> None:
@@ -17,6 +144,10 @@ def setup_logging(config: configparser.ConfigParser | None = None) -> None:
         log_retention_days = int(get_config_value(config, 'LOGGING', 'log_retention_days', 7))
         project_name = str(get_config_value(config, 'LOGGING', 'project_name', 'VoiceScribe'))
         log_level = str(get_config_value(config, 'LOGGING', 'log_level', 'INFO'))
+        log_max_size_mb = float(get_config_value(config, 'LOGGING', 'log_max_size_mb', 50.0))
+        log_total_size_mb = float(get_config_value(config, 'LOGGING', 'log_total_size_mb', 500.0))
+        log_compress = bool(get_config_value(config, 'LOGGING', 'log_compress', True))
+        max_total_bytes = int(log_total_size_mb * MEGABYTE)
 
         if not os.path.isabs(log_directory):
             project_root = os.path.dirname(os.path.dirname(__file__))
@@ -27,13 +158,14 @@ def setup_logging(config: configparser.ConfigParser | None = None) -> None:
 
         log_file = os.path.join(log_directory, f'{project_name}.log')
 
-        file_handler = TimedRotatingFileHandler(
+        compressor = LogCompressor(log_directory, project_name, log_retention_days,
+                                   max_total_bytes, compress=log_compress)
+        file_handler = SizedTimedRotatingFileHandler(
             filename=log_file,
-            when='midnight',
-            backupCount=log_retention_days,
+            max_bytes=int(log_max_size_mb * MEGABYTE),
+            compressor=compressor,
             encoding='utf-8'
         )
-        file_handler.suffix = "%Y-%m-%d.log"
 
         formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         file_handler.setFormatter(formatter)
@@ -54,7 +186,7 @@ def setup_logging(config: configparser.ConfigParser | None = None) -> None:
         console_handler.setLevel(logging.WARNING)
         root_logger.addHandler(console_handler)
 
-        cleanup_old_logs(log_directory, log_retention_days, project_name)
+        cleanup_old_logs(log_directory, log_retention_days, project_name, max_total_bytes)
 
         logging.info(f"ログシステムが初期化されました: {log_file}")
 
@@ -64,26 +196,41 @@ def setup_logging(config: configparser.ConfigParser | None = None) -> None:
         raise Exception(f"ログ設定の初期化中にエラーが発生しました: {e}")
 
 
-def cleanup_old_logs(log_directory: str, retention_days: int, project_name: str) -> None:
+def cleanup_old_logs(log_directory: str, retention_days: int, project_name: str,
+                     max_total_bytes: int = 0) -> None:
+    """保持日数を過ぎたログと、合計サイズの上限を超えた分の古いログを削除する"""
     try:
-        now = datetime.now()
-        main_log_file = f'{project_name}.log'
-
-        rotated_log_pattern = rf'{re.escape(project_name)}\.log\.\d{{4}}-\d{{2}}-\d{{2}}\.log$'
-
+        cutoff = (datetime.now() - timedelta(days=retention_days)).timestamp()
+        log_prefix = f'{project_name}.log'
+        rotated_prefix = f'{log_prefix}.'
+
+        rotated_logs = []
+        total_size = 0
+        with os.scandir(log_directory) as entries:
+            for entry in entries:
+                # 移動記録（transfers.db）など、同じディレクトリの他のファイルは数えない
+                if not entry.name.startswith(log_prefix) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                total_size += stat.st_size
+                # ローテーション済みのログ（FileTransfer.log.<日時>.log / .log.gz）のみ削除対象
+                if entry.name.startswith(rotated_prefix):
+                    rotated_logs.append((stat.st_mtime, stat.st_size, entry.name, entry.path))
+
+        # 古い順に、保持期限切れか合計サイズが上限を超えている間は削除する
+        rotated_logs.sort()
         deleted_count = 0
-        for filename in os.listdir(log_directory):
-            if filename.endswith('.log') and filename != main_log_file:
-                if re.match(rotated_log_pattern, filename):
-                    file_path = os.path.join(log_directory, filename)
-                    try:
-                        file_modification_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                        if now - file_modification_time >= timedelta(days=retention_days):
-                            os.remove(file_path)
-                            logging.info(f"古いログファイルを削除しました: {filename}")
-                            deleted_count += 1
-                    except OSError as e:
-                        logging.error(f"ログファイルの削除中にエラーが発生しました {filename}: {str(e)}")
+        for mtime, size, filename, file_path in rotated_logs:
+            over_budget = max_total_bytes > 0 and total_size > max_total_bytes
+            if mtime > cutoff and not over_budget:
+                break
+            try:
+                os.remove(file_path)
+                total_size -= size
+                logging.info(f"古いログファイルを削除しました: {filename}")
+                deleted_count += 1
+            except OSError as e:
+                logging.error(f"ログファイルの削除中にエラーが発生しました {filename}: {str(e)}")
 
         if deleted_count > 0:
             logging.info(f"合計 {deleted_count} 個の古いログファイルを削除しました")
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import itertools
+import string
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Match, Optional, Pattern
+
+# 項目の値を取り出す関数（移動元のパスと、regexN に一致した結果を受け取る）
+Getter = Callable[[Path, Optional[Match[str]]], object]
+
+# {date} / {mtime} に書式を指定しない場合の書式
+DEFAULT_DATE_FORMAT = "%Y%m%d"
+
+
+class RenameTemplate:
+    """移動先でのファイル名のテンプレート（例: {date:%Y%m%d}_{g1}{ext}）
+
+    設定の読み込み時に1回だけ解析し、項目を位置引数に置き換えた書式文字列と、
+    各項目の値を取り出す関数の組に変換しておく。ファイルごとの処理は値を取り出して
+    str.format を1回呼ぶだけになる。
+
+    使える項目:
+        {name} 元のファイル名 / {stem} 拡張子を除いた部分 / {ext} 拡張子（. を含む）
+        {date:書式} 処理した日時 / {mtime:書式} ファイルの更新日時（書式は strftime）
+        {counter:書式} 移動先ごとの連番（起動ごとに1から）
+        {g1}, {g2}, ... regexN のグループ / {グループ名} regexN の名前付きグループ
+
+    書式（04d など）が項目の値に合わない場合も、解析の時点で試しに組み立ててエラーにする。
+    """
+
+    def __init__(self, template: str, regex: Optional[Pattern[str]] = None) -> None:
+        self.template: str = template
+        # regexN のグループを使うか（使わない場合は一致した結果を求めなくてよい）
+        self.uses_match: bool = False
+        # {counter} を使うか（連番は起動ごとに1から数え直す）
+        self.uses_counter: bool = False
+        self._counter = itertools.count(1)
+        # 項目ごとの値の例（書式が値の型に合うかを解析の時点で確かめる）
+        self._samples: list[object] = []
+        self._format, self._getters = self._compile(template, regex)
+        try:
+            self._format(*self._samples)
+        except (ValueError, TypeError) as e:
+            raise ValueError(
+                f"名前のテンプレートの書式が項目の値に合いません: {template}（{e}）"
+            ) from e
+
+    def render(self, path: Path, match: Optional[Match[str]] = None) -> str:
+        """移動元のファイルから移動先でのファイル名を組み立てる
+
+        組み立てた名前が空、または . / .. のように移動先ディレクトリ自体を指す場合
+        （regexN のグループが一致しなかった場合など）は ValueError。
+        """
+        name = self._format(*[getter(path, match) for getter in self._getters])
+        if not name.strip(" .") or "/" in name or "\\" in name:
+            raise ValueError(
+                f"名前のテンプレートから有効なファイル名を組み立てられません: {path.name}"
+                f" -> {name!r}（{self.template}）"
+            )
+        return name
+
+    def __repr__(self) -> str:
+        return f"RenameTemplate({self.template!r})"
+
+    def _compile(
+        self, template: str, regex: Optional[Pattern[str]]
+    ) -> tuple[Callable[..., str], list[Getter]]:
+        parts: list[str] = []
+        getters: list[Getter] = []
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            _check_separator(literal, template)
+            parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is None:
+                continue
+            if conversion or "{" in (spec or ""):
+                raise ValueError(f"名前のテンプレートに変換・入れ子の指定は使えません: {template}")
+            spec = spec or ""
+            _check_separator(spec, template)
+            if field in _TIMESTAMPS:
+                # 日時は書式化した文字列を取り出す（書式化は秒ごとに1回で済ませる）
+                getters.append(_timestamp_getter(_TIMESTAMPS[field], spec or DEFAULT_DATE_FORMAT))
+                self._samples.append("")
+                spec = ""
+            else:
+                getters.append(self._getter(field, regex, template))
+                # 連番は整数、それ以外（ファイル名・グループ）は文字列
+                self._samples.append(1 if field == "counter" else "")
+            parts.append(f"{{{len(getters) - 1}:{spec}}}" if spec else f"{{{len(getters) - 1}}}")
+        return "".join(parts).format, getters
+
+    def _getter(self, field: str, regex: Optional[Pattern[str]], template: str) -> Getter:
+        if field in _PATH_FIELDS:
+            return _PATH_FIELDS[field]
+        if field == "counter":
+            self.uses_counter = True
+            counter = self._counter
+            # itertools.count の next() はスレッド間で重複しない
+            return lambda path, match: next(counter)
+
+        group: int | str = field
+        if field.startswith("g") and field[1:].isdigit():
+            group = int(field[1:])
+            if regex is None or group > regex.groups:
+                raise ValueError(f"regexN にグループ {group} がありません: {template}")
+        elif regex is None or field not in regex.groupindex:
+            raise ValueError(f"名前のテンプレートに不明な項目があります: {{{field}}}（{template}）")
+        self.uses_match = True
+        return lambda path, match: (match.group(group) or "") if match is not None else ""
+
+
+_PATH_FIELDS: dict[str, Getter] = {
+    "name": lambda path, match: path.name,
+    "stem": lambda path, match: path.stem,
+    "ext": lambda path, match: path.suffix,
+}
+
+# 日時の項目と、その時刻（UNIX 時間）を取り出す関数
+_TIMESTAMPS: dict[str, Callable[[Path], float]] = {
+    "date": lambda path: time.time(),
+    "mtime": lambda path: path.stat().st_mtime,
+}
+
+
+def _timestamp_getter(timestamp: Callable[[Path], float], spec: str) -> Getter:
+    """時刻を書式化して返す関数を作る
+
+    strftime はファイル名の組み立てで最も重い処理のため、秒未満（%f）を含まない書式では
+    直前と同じ秒の結果を使い回す。同じ秒に処理したファイルや、同じ秒に更新された
+    ファイルが続く場合は書式化を省ける。
+    """
+    if "%f" in spec:
+        return lambda path, match: datetime.fromtimestamp(timestamp(path)).strftime(spec)
+
+    # (秒, 書式化した文字列)。タプルごと置き換えるためロックは不要
+    last: tuple[int, str] = (-1, "")
+
+    def getter(path: Path, match: Optional[Match[str]]) -> str:
+        nonlocal last
+        value = timestamp(path)
+        second = int(value)
+        cached = last
+        if cached[0] == second:
+            return cached[1]
+        text = datetime.fromtimestamp(value).strftime(spec)
+        last = (second, text)
+        return text
+
+    return getter
+
+
+def _check_separator(text: str, template: str) -> None:
+    # 移動先ディレクトリの外に出られないよう、区切り文字は使えない
+    if "/" in text or "\\" in text:
+        raise ValueError(f"名前のテンプレートにパスの区切り文字は使えません: {template}")
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+from pathlib import Path
+from typing import Optional, Pattern
+
+# ワイルドカードとして扱う文字（glob と同じ）
+GLOB_CHARS = re.compile(r"[*?\[]")
+PATH_SEPARATOR = re.compile(r"[\\/]")
+
+
+def split_source_glob(value: str) -> tuple[Path, Optional[SourceGlob]]:
+    """processing_dir をワイルドカードより前の基準ディレクトリと、それ以降のパターンに分ける
+
+    ワイルドカードを含まない場合は (そのパス, None) を返す。`scans [work]` のように
+    ワイルドカードの文字を名前に含むディレクトリが実在する場合も、そのまま監視元とする
+    （まだ無いディレクトリは `[[]` のように角括弧で囲んで書く）。
+    """
+    if os.path.isdir(value):
+        return Path(value), None
+
+    parts = PATH_SEPARATOR.split(value)
+    position = next((i for i, part in enumerate(parts) if GLOB_CHARS.search(part)), None)
+    if position is None:
+        return Path(value), None
+
+    prefix = value[: sum(len(part) + 1 for part in parts[:position])]
+    base = prefix.rstrip("\\/") or prefix
+    if not base:
+        raise ValueError(
+            f"processing_dir のワイルドカードより前にディレクトリがありません: {value}"
+        )
+    pattern = [part for part in parts[position:] if part]
+    return Path(base), SourceGlob("/".join(pattern))
+
+
+class SourceGlob:
+    """基準ディレクトリ配下で監視元とするディレクトリのパターン（例: */inbox）
+
+    設定の読み込み時に階層ごとの正規表現に変換しておき、イベントのパスが監視元に
+    含まれるかは階層ごとの照合だけで判定する。* や ? は区切り文字をまたがない。
+    Windows と同じく大文字・小文字は区別しない。
+    """
+
+    def __init__(self, pattern: str) -> None:
+        self.pattern: str = pattern
+        self._parts: tuple[Pattern[str], ...] = tuple(
+            re.compile(fnmatch.translate(part), re.IGNORECASE) for part in pattern.split("/")
+        )
+        # 基準ディレクトリから監視元までの階層数
+        self.depth: int = len(self._parts)
+
+    def split(self, relative: str) -> Optional[tuple[str, str]]:
+        """基準ディレクトリからの相対パス（/ 区切り）を (監視元, 監視元からの相対パス) に分ける
+
+        監視元のパターンに一致しない場合はNone。監視元そのものの場合、後者は空文字。
+        """
+        parts = relative.split("/")
+        if len(parts) < self.depth:
+            return None
+        # 監視元より深い階層は照合しない（parts の方が長くてよい）
+        for regex, part in zip(self._parts, parts, strict=False):
+            if not regex.match(part):
+                return None
+        return "/".join(parts[: self.depth]), "/".join(parts[self.depth :])
+
+    def expand(self, base: Path) -> list[Path]:
+        """基準ディレクトリ配下で、今あるパターンに一致するディレクトリを名前順に返す
+
+        階層ごとに os.scandir で一致する名前だけを辿るため、監視元より深いディレクトリは
+        読まない。読めないディレクトリは飛ばす。
+        """
+        current = [str(base)]
+        for regex in self._parts:
+            found: list[str] = []
+            for directory in current:
+                try:
+                    with os.scandir(directory) as iterator:
+                        found.extend(
+                            entry.path
+                            for entry in iterator
+                            if regex.match(entry.name) and entry.is_dir()
+                        )
+                except OSError:
+                    continue
+            current = sorted(found)
+        return [Path(path) for path in current]
+
+    def __repr__(self) -> str:
+        return f"SourceGlob({self.pattern!r})"